@@ -1,7 +1,9 @@
 from flask import Flask
 from config import Config
-from .extensions import db, migrate, ma, jwt, bcrypt, cors
+from .extensions import db, ma, jwt, bcrypt, cors
 from .routes import register_blueprints
+from .services import concurrency_limiter, request_profiler, upstream_guard, identity_cache, revocation_list, play_buffer, change_broker, playlist_cache, compressor, shard_map, playback_urls, segment_cache, variant_filter
+from .commands import register_commands
 # Import models here to ensure they are known to SQLAlchemy before migrate/create_all
 from . import models
 
@@ -11,18 +13,36 @@ def create_app(config_class=Config):
 
     # Initialize extensions
     db.init_app(app)
-    migrate.init_app(app, db)
+    if app.config.get('MIGRATIONS_ENABLED', True):
+        from flask_migrate import Migrate # Pulls in alembic, which only `flask db` needs
+        Migrate(app, db)
     ma.init_app(app)
     jwt.init_app(app)
     bcrypt.init_app(app)
     # Configure CORS more specifically in production if needed
     # cors.init_app(app, resources={r"/api/*": {"origins": "http://yourfrontend.com"}})
     cors.init_app(app) # Allow all origins for now (development)
+    concurrency_limiter.init_app(app) # First before_request: sheds load before auth or DB work
+    request_profiler.init_app(app) # Samples requests picked by X-Profile or /api/profiler rules
+    identity_cache.init_app(app) # Backs jwt.user_lookup_loader
+    revocation_list.init_app(app) # Backs jwt.token_in_blocklist_loader
+    upstream_guard.init_app(app) # Keeps fetches of user-supplied URLs off internal addresses
+    play_buffer.init_app(app) # Batches POST /api/plays inserts
+    change_broker.init_app(app) # Backs GET /api/events
+    playlist_cache.init_app(app) # Serialised playlists for GET /api/playlists/<id>
+    compressor.init_app(app) # gzip/br/zstd for JSON and manifest responses
+    shard_map.init_app(app) # Routes each request to its user's shard when SHARDS are configured
+    playback_urls.init_app(app) # Signs the URLs served by GET /api/play/<token>
+    segment_cache.init_app(app) # Disk cache behind the optional segment proxy
+    variant_filter.init_app(app) # Manifests trimmed to the client's declared bandwidth/codecs/resolution
 
 
     # Register Blueprints (API routes)
     register_blueprints(app)
 
+    # Register CLI commands (maintenance jobs, run via `flask <command>`)
+    register_commands(app)
+
     # Optional: Add a simple root route
     @app.route('/')
     def index():
@@ -0,0 +1,48 @@
+import contextlib
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.routing import Mount
+from config import Config
+from app import create_app
+from app.services.manifests import upstream_guard
+from .db import AsyncDatabase
+from .routes import routes as async_routes
+
+
+def create_asgi_app(config_class=Config, flask_app=None):
+    """ASGI app serving the async routes, with the Flask app mounted behind them.
+
+    Paths not matched by app/aio/routes.py fall through to the regular
+    (sync) blueprints, which run in asgiref's thread pool.
+    """
+    flask_app = flask_app or create_app(config_class)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        await app.state.http.aclose()
+        await app.state.db.dispose()
+
+    async def http_exception(request, exc):
+        # Same shape as flask_jwt_extended's error responses
+        return JSONResponse({"msg": exc.detail}, exc.status_code)
+
+    asgi_app = Starlette(
+        routes=async_routes + [Mount('', app=WsgiToAsgi(flask_app))],
+        exception_handlers={HTTPException: http_exception},
+        lifespan=lifespan,
+    )
+    asgi_app.state.flask_app = flask_app
+    asgi_app.state.db = AsyncDatabase(flask_app.config)
+    asgi_app.state.http = httpx.AsyncClient(
+        timeout=flask_app.config.get('MANIFEST_FETCH_TIMEOUT', 10),
+        follow_redirects=True,
+        event_hooks={'request': [upstream_guard.ahook]}, # Every hop, redirects included
+        transport=upstream_guard.async_transport(
+            limits=httpx.Limits(max_connections=flask_app.config.get('UPSTREAM_MAX_CONNECTIONS', 100)),
+        ),
+    )
+    return asgi_app
@@ -0,0 +1,55 @@
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+# Sync dialect -> async driver used in ASGI mode
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+
+def async_database_uri(config, uri=None):
+    """The async driver URL for the main database, or for `uri` (a shard's)."""
+    if uri is None and config.get('ASYNC_DATABASE_URI'):
+        return config['ASYNC_DATABASE_URI']
+    url = make_url(uri or config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for '{backend}', set ASYNC_DATABASE_URI")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def _create_engine(config, uri):
+    engine_options = {}
+    if not uri.startswith('sqlite'):
+        engine_options.update(
+            pool_size=config.get('ASYNC_DB_POOL_SIZE', 10),
+            max_overflow=config.get('ASYNC_DB_MAX_OVERFLOW', 20),
+            pool_pre_ping=True,
+        )
+    return create_async_engine(uri, **engine_options)
+
+
+class AsyncDatabase:
+    """Async engine + session factory over the same tables as app.models.
+
+    With SHARDS configured there's an engine per shard too; use engine_for()
+    with the user's shard (app/services/shards.py) for user data.
+    """
+
+    def __init__(self, config):
+        self.engine = _create_engine(config, async_database_uri(config))
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.shards = {
+            name: _create_engine(config, async_database_uri(config, uri))
+            for name, uri in (config.get('SHARDS') or {}).items()
+        }
+
+    def engine_for(self, shard):
+        return self.shards.get(shard, self.engine) # 'default' is the main database
+
+    async def dispose(self):
+        await self.engine.dispose()
+        for engine in self.shards.values():
+            await engine.dispose()
@@ -0,0 +1,134 @@
+import json
+from sqlalchemy import select, text
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+from starlette.routing import Route
+from app.models import Track
+from app.schemas import ManifestProfileSchema, TrackSchema
+from marshmallow import ValidationError
+from app.services.manifests import MEDIA_TYPES, ManifestFetchError, afetch_manifest
+from app.services.playback import PlaybackTokenError, playback_urls
+from app.services.segments import segment_cache
+from app.services.variants import variant_filter
+from app.services.shards import shard_map
+from .auth import authenticate
+
+track_schema = TrackSchema()
+manifest_profile_schema = ManifestProfileSchema()
+
+
+async def user_engine(request, user_id):
+    """The async engine holding `user_id`'s data."""
+    database = request.app.state.db
+    if not shard_map.enabled:
+        return database.engine
+    placement = shard_map.cache.get(user_id)
+    if placement is None:
+        flask_app = request.app.state.flask_app
+
+        def lookup():
+            with flask_app.app_context():
+                return shard_map.placement(user_id)
+
+        placement = await run_in_threadpool(lookup) # A sync query on a miss, keep it off the event loop
+    return database.engine_for(placement.shard)
+
+
+def manifest_profile(request):
+    """The client profile declared in the query string (ManifestProfileSchema), or None. Raises ValidationError."""
+    return variant_filter.profile(manifest_profile_schema.load(dict(request.query_params)))
+
+
+async def get_track_manifest(request):
+    user_id = await authenticate(request)
+    track_id = request.path_params['track_id']
+    try:
+        profile = manifest_profile(request)
+    except ValidationError as err:
+        return JSONResponse(err.messages, 400)
+    async with (await user_engine(request, user_id)).connect() as conn:
+        track = (await conn.execute(
+            # Core connection, so the soft-delete criteria on db.session don't apply here
+            select(Track.manifest_url, Track.manifest_type).where(
+                Track.id == track_id, Track.user_id == user_id, Track.deleted_at.is_(None)
+            )
+        )).first()
+    if track is None:
+        return JSONResponse({"message": "Track not found or access denied"}, 404)
+
+    try:
+        body = await afetch_manifest(
+            request.app.state.http, track.manifest_url,
+            max_bytes=request.app.state.flask_app.config.get('MANIFEST_MAX_BYTES', 5 * 1024 * 1024)
+        )
+        body = variant_filter.apply(body, track.manifest_type, profile)
+        body = segment_cache.rewrite(body, track.manifest_type, track.manifest_url)
+    except ManifestFetchError as e:
+        return JSONResponse({"message": "Could not fetch manifest", "error": str(e)}, 502)
+    return Response(body, media_type=MEDIA_TYPES[track.manifest_type])
+
+
+async def play(request):
+    # Signed playback URL: no auth, no database, see app/services/playback.py
+    try:
+        playback = playback_urls.verify(request.path_params['token'])
+    except PlaybackTokenError as e:
+        return JSONResponse({"message": str(e)}, 403)
+    try:
+        profile = manifest_profile(request)
+    except ValidationError as err:
+        return JSONResponse(err.messages, 400)
+    headers = {'Cache-Control': playback_urls.cache_control(playback)}
+
+    config = request.app.state.flask_app.config
+    if config.get('PLAYBACK_URL_MODE', 'redirect') == 'redirect' and not segment_cache.enabled and profile is None:
+        return RedirectResponse(playback.manifest_url, 302, headers=headers)
+    try:
+        body = await afetch_manifest(request.app.state.http, playback.manifest_url,
+                                     max_bytes=config.get('MANIFEST_MAX_BYTES', 5 * 1024 * 1024))
+        body = variant_filter.apply(body, playback.manifest_type, profile)
+        body = segment_cache.rewrite(body, playback.manifest_type, playback.manifest_url)
+    except ManifestFetchError as e:
+        return JSONResponse({"message": "Could not fetch manifest", "error": str(e)}, 502)
+    return Response(body, media_type=MEDIA_TYPES[playback.manifest_type], headers=headers)
+
+
+async def export_tracks(request):
+    # Streams the whole library as NDJSON without materialising it
+    user_id = await authenticate(request)
+    engine = await user_engine(request, user_id)
+
+    async def lines():
+        async with request.app.state.db.session(bind=engine) as session:
+            result = await session.stream_scalars(
+                select(Track).where(Track.user_id == user_id, Track.deleted_at.is_(None)).order_by(Track.id)
+                .execution_options(yield_per=500)
+            )
+            async for track in result:
+                yield json.dumps(track_schema.dump(track)) + '\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def readiness(request):
+    try:
+        database = request.app.state.db
+        for engine in (database.engine, *database.shards.values()):
+            async with engine.connect() as conn:
+                await conn.execute(text('SELECT 1'))
+    except Exception as e:
+        return JSONResponse({"status": "unavailable", "error": str(e)}, 503)
+    return JSONResponse({"status": "ok", "database": "ok"})
+
+
+routes = [
+    Route('/api/health', health, methods=['GET']),
+    Route('/api/health/ready', readiness, methods=['GET']),
+    Route('/api/tracks/export', export_tracks, methods=['GET']),
+    Route('/api/tracks/{track_id:int}/manifest', get_track_manifest, methods=['GET']),
+    Route('/api/play/{token}', play, methods=['GET']),
+]
@@ -0,0 +1,240 @@
+import functools
+import click
+from flask import current_app
+from datetime import datetime, timedelta
+from app.extensions import db
+from sqlalchemy import text
+from app.models import RevokedToken
+from app.services.rollups import aggregate_plays, backfill_rollups
+from app.services.shards import shard_map
+
+
+def register_commands(app):
+    app.cli.add_command(prune_revoked_tokens)
+    app.cli.add_command(prune_idempotency_keys_command)
+    app.cli.add_command(check_manifests_command)
+    app.cli.add_command(create_play_partitions)
+    app.cli.add_command(aggregate_plays_command)
+    app.cli.add_command(backfill_rollups_command)
+    app.cli.add_command(build_recommendations)
+    app.cli.add_command(refresh_smart_playlists_command)
+    app.cli.add_command(find_duplicates_command)
+    app.cli.add_command(purge_accounts_command)
+    app.cli.add_command(purge_trash_command)
+    app.cli.add_command(shards_command)
+
+
+def per_shard(command):
+    """Run a job on each shard in turn (just once without SHARDS), see app/services/shards.py."""
+    @functools.wraps(command)
+    def run(*args, **kwargs):
+        for name in shard_map.names:
+            if shard_map.enabled:
+                click.echo(f"[{name}]")
+            with shard_map.use(name):
+                command(*args, **kwargs)
+    return run
+
+
+@click.command('prune-revoked-tokens')
+def prune_revoked_tokens():
+    """Delete revoked_tokens rows whose token has expired anyway."""
+    deleted = RevokedToken.query.filter(RevokedToken.expires_at < datetime.utcnow()).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Pruned {deleted} expired revoked tokens")
+
+
+@click.command('prune-idempotency-keys')
+def prune_idempotency_keys_command():
+    """Delete stored Idempotency-Key responses past IDEMPOTENCY_KEY_TTL."""
+    from app.services.idempotency import prune_idempotency_keys
+    deleted = prune_idempotency_keys()
+    click.echo(f"Pruned {deleted} expired idempotency keys")
+
+
+@click.command('check-manifests')
+@click.option('--chunk-size', default=500, show_default=True, help='Tracks probed per batch.')
+@click.option('--concurrency', default=50, show_default=True, help='Concurrent probes overall.')
+@click.option('--per-host', default=4, show_default=True, help='Concurrent probes per origin host.')
+@click.option('--stale-after', default=None, type=float, help='Only re-check tracks older than this many hours.')
+@per_shard
+def check_manifests_command(chunk_size, concurrency, per_host, stale_after):
+    """Probe every track's manifest_url and record the results.
+
+    Meant to be scheduled (cron, k8s CronJob) rather than run per request.
+    """
+    from app.services.health_check import ManifestProber, check_manifests # httpx is an optional dependency
+    prober = ManifestProber(
+        concurrency=concurrency, per_host=per_host,
+        timeout=current_app.config.get('MANIFEST_FETCH_TIMEOUT', 10)
+    )
+    checked, broken = check_manifests(
+        chunk_size=chunk_size,
+        stale_after=timedelta(hours=stale_after) if stale_after else None,
+        prober=prober
+    )
+    click.echo(f"Checked {checked} manifests, {broken} broken")
+
+
+@click.command('create-play-partitions')
+@click.option('--months', default=3, show_default=True, help='Months ahead to create partitions for.')
+@per_shard
+def create_play_partitions(months):
+    """Create monthly play_events partitions ahead of time (PostgreSQL only).
+
+    Plays already in the default partition for a new partition's month (the
+    command ran late, or clients sent future timestamps) would make it fail
+    to attach, so they're moved into the new partition first.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        click.echo("play_events is only partitioned on PostgreSQL, nothing to do")
+        return
+    start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(months + 1):
+        end = (start + timedelta(days=32)).replace(day=1)
+        name = f"play_events_{start:%Y_%m}"
+        if db.session.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar() is None:
+            db.session.execute(text(f"CREATE TABLE {name} (LIKE play_events INCLUDING DEFAULTS)"))
+            # No new plays land in the default partition between the move and the attach
+            db.session.execute(text("LOCK TABLE play_events_default IN EXCLUSIVE MODE"))
+            moved = db.session.execute(text(
+                f"WITH moved AS (DELETE FROM play_events_default WHERE played_at >= :start AND played_at < :end "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+            ), {'start': start, 'end': end}).rowcount
+            db.session.execute(text(
+                f"ALTER TABLE play_events ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            ))
+            db.session.commit() # One month at a time, the lock holds up play inserts
+            click.echo(f"Created partition {name}, {moved} plays moved from the default partition")
+        else:
+            click.echo(f"Ensured partition {name}")
+        start = end
+    db.session.commit()
+
+
+@click.command('aggregate-plays')
+@click.option('--chunk-size', default=10000, show_default=True, help='Play events folded per transaction.')
+@per_shard
+def aggregate_plays_command(chunk_size):
+    """Fold new play events into the stats rollups (run on a schedule)."""
+    from app.services import play_buffer
+    play_buffer.flush() # Include anything this process still has buffered
+    total = aggregate_plays(chunk_size=chunk_size)
+    click.echo(f"Aggregated {total} play events")
+
+
+@click.command('backfill-rollups')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Rebuild from this day on (default: everything).')
+@per_shard
+def backfill_rollups_command(since):
+    """Rebuild stats rollups from raw play events."""
+    total = backfill_rollups(since=since)
+    click.echo(f"Rebuilt rollups from {total} play events")
+
+
+@click.command('build-recommendations')
+@click.option('--full', is_flag=True, help='Rebuild every user, not just those whose playlists changed.')
+@click.option('--top-k', default=20, show_default=True, help='Neighbours kept per track.')
+@click.option('--block-size', default=2048, show_default=True, help='Tracks per similarity block (bounds memory).')
+@per_shard
+def build_recommendations(full, top_k, block_size):
+    """Precompute similar tracks from playlist co-occurrence."""
+    from app.models import RecommendationRefresh
+    from app.services.recommendations import build_neighbours, refresh_neighbours
+    if full:
+        written = build_neighbours(top_k=top_k, block_size=block_size)
+        RecommendationRefresh.query.delete()
+        db.session.commit()
+        click.echo(f"Rebuilt all neighbours ({written} rows)")
+    else:
+        users, written = refresh_neighbours(top_k=top_k, block_size=block_size)
+        click.echo(f"Refreshed {users} users ({written} rows)")
+
+
+@click.command('refresh-smart-playlists')
+@per_shard
+def refresh_smart_playlists_command():
+    """Re-evaluate every smart playlist's rules (run daily, for rules like "added in the last 30 days")."""
+    from app.services.smart_playlists import refresh_smart_playlists
+    playlists, changed = refresh_smart_playlists()
+    click.echo(f"Refreshed {playlists} smart playlists, {changed} changed")
+
+
+@click.command('find-duplicates')
+@click.option('--batch-size', default=1000, show_default=True, help='Tracks fingerprinted per transaction.')
+@click.option('--merge', is_flag=True, help='Merge each cluster into its oldest track.')
+@per_shard
+def find_duplicates_command(batch_size, merge):
+    """Fingerprint older tracks and report (or merge) duplicate clusters in every library."""
+    from app.models import Track
+    from app.services.duplicates import backfill_fingerprints, duplicate_clusters, merge_tracks
+    fingerprinted = backfill_fingerprints(batch_size=batch_size)
+    clusters = duplicate_clusters()
+    duplicates = sum(len(cluster['track_ids']) - 1 for cluster in clusters)
+    click.echo(f"Fingerprinted {fingerprinted} tracks; {len(clusters)} duplicate clusters "
+               f"({duplicates} extra tracks) in {len({cluster['user_id'] for cluster in clusters})} libraries")
+    if merge:
+        for cluster in clusters: # One transaction per cluster
+            keep, *duplicate_ids = cluster['track_ids']
+            merge_tracks(db.session.get(Track, keep), duplicate_ids)
+            db.session.commit()
+        click.echo(f"Merged {duplicates} tracks")
+
+
+@click.command('purge-accounts')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows deleted per transaction.')
+@click.option('--limit', default=None, type=int, help='Purge at most this many accounts.')
+def purge_accounts_command(chunk_size, limit):
+    """Delete accounts queued by DELETE /api/auth/me (run on a schedule)."""
+    from app.services.accounts import purge_accounts
+    accounts, rows = purge_accounts(chunk_size=chunk_size, limit=limit)
+    click.echo(f"Purged {accounts} accounts ({rows} rows)")
+
+
+@click.command('purge-trash')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows deleted per transaction.')
+@per_shard
+def purge_trash_command(batch_size):
+    """Hard-delete trashed tracks and playlists past TRASH_RETENTION_DAYS (run on a schedule)."""
+    from app.services.trash import purge_trash
+    purged = purge_trash(retention_days=current_app.config.get('TRASH_RETENTION_DAYS', 30), batch_size=batch_size)
+    click.echo(f"Purged {purged['tracks']} tracks and {purged['playlists']} playlists from the trash")
+
+
+@click.group('shards')
+def shards_command():
+    """Horizontal sharding of user data across SHARDS."""
+
+
+@shards_command.command('init')
+@click.argument('names', nargs=-1)
+def shards_init(names):
+    """Create the tables on new shards and reserve their id ranges (default: every shard)."""
+    for name in names or shard_map.names[1:]:
+        shard_map.create_schema(name)
+        click.echo(f"Initialised shard {name}")
+
+
+@shards_command.command('move')
+@click.argument('user_id', type=int)
+@click.argument('shard')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows copied per transaction.')
+@click.option('--settle', default=None, type=float, help='Seconds to wait for workers to see each switch '
+                                                         '(default: SHARD_MOVE_SETTLE).')
+def shards_move(user_id, shard, batch_size, settle):
+    """Move a user's data to another shard while they keep using the app."""
+    from app.services.shards import ShardMoveError, move_user
+    try:
+        moved = move_user(user_id, shard, batch_size=batch_size, settle=settle)
+    except (KeyError, ShardMoveError) as e:
+        raise click.ClickException(str(e).strip("'"))
+    click.echo(f"Moved user {user_id} to {shard} ({moved['copied']} rows copied, {moved['synced']} synced)")
+
+
+@shards_command.command('stats')
+def shards_stats():
+    """Users, tracks and playlists on each shard."""
+    for name, counts in shard_map.counts().items():
+        click.echo(f"{name}: {counts['users']} users, {counts['tracks']} tracks, {counts['playlists']} playlists")
@@ -1,13 +1,42 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_sqlalchemy.session import Session
 from flask_marshmallow import Marshmallow
 from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
-db = SQLAlchemy()
-migrate = Migrate()
+
+class ShardedSession(Session):
+    """db.session, with user data routed to the current user's shard.
+
+    `router` is set by app/services/shards.py when SHARDS are configured;
+    without it every statement goes to the main database as usual.
+    """
+    router = None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.router is not None:
+            engine = self.router(self, mapper, clause)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': ShardedSession})
 ma = Marshmallow()
 jwt = JWTManager()
 bcrypt = Bcrypt()
 cors = CORS()
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys (and so ON DELETE CASCADE) unless they are
+    # switched on for each connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
@@ -1,3 +1,12 @@
+from .soft_delete import SoftDeleteMixin
 from .user import User
 from .track import Track, ManifestType
-from .playlist import Playlist, playlist_tracks # Import the join table too
+from .library import Artist, Album
+from .playlist import Playlist, PlaylistMember, playlist_tracks # Import the join table too
+from .token import RevokedToken
+from .idempotency import IdempotencyKey
+from .health import ManifestHealth
+from .play import PlayEvent
+from .stats import TrackPlayRollup, ArtistPlayRollup, RollupWatermark
+from .recommendation import TrackNeighbour, RecommendationRefresh
+from .shard import UserShard
@@ -0,0 +1,19 @@
+from app.extensions import db
+from datetime import datetime
+
+class ManifestHealth(db.Model):
+    __tablename__ = 'manifest_health'
+
+    track_id = db.Column(db.Integer, db.ForeignKey('tracks.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(10), nullable=False, index=True) # 'ok' or 'broken'
+    http_status = db.Column(db.Integer, nullable=True) # None when the origin couldn't be reached
+    error = db.Column(db.String(500), nullable=True)
+    latency_ms = db.Column(db.Integer, nullable=True)
+    etag = db.Column(db.String(200), nullable=True) # Validators for the next conditional probe
+    last_modified = db.Column(db.String(100), nullable=True)
+    checked_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    track = db.relationship('Track', backref=db.backref('health', uselist=False, lazy=True, cascade='all, delete-orphan', passive_deletes=True))
+
+    def __repr__(self):
+        return f'<ManifestHealth {self.track_id} {self.status}>'
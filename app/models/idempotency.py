@@ -0,0 +1,25 @@
+from app.extensions import db
+from datetime import datetime
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    # One row per (caller, Idempotency-Key header), written by the
+    # @idempotent decorator in app/services/idempotency.py. status_code is
+    # NULL while the first request is still running.
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_keys_scope_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(50), nullable=False) # 'user:<id>', or 'anonymous' for unauthenticated routes
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False) # sha256 of method, path and body
+    status_code = db.Column(db.Integer, nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_headers = db.Column(db.JSON(none_as_null=True), nullable=True) # The REPLAYED_HEADERS it set, name -> value
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True) # Row can be pruned after this
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.scope} {self.key}>'
@@ -0,0 +1,43 @@
+from app.extensions import db
+
+# Per-user artist/album entities derived from Track.artist / Track.album,
+# maintained by app/services/library.py. `key` is the normalised name
+# (NFKC, whitespace collapsed, case-folded) so "The Band" and "the  band"
+# are one artist; `name` is the first spelling seen, for display.
+
+class Artist(db.Model):
+    __tablename__ = 'artists'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_artists_user_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    key = db.Column(db.String(200), nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    track_count = db.Column(db.Integer, nullable=False, default=0)
+    album_count = db.Column(db.Integer, nullable=False, default=0)
+
+    albums = db.relationship('Album', backref='artist', lazy=True, passive_deletes=True)
+
+    def __repr__(self):
+        return f'<Artist {self.name}>'
+
+
+class Album(db.Model):
+    __tablename__ = 'albums'
+    __table_args__ = (
+        # artist_id is NULL for albums whose tracks have no artist
+        db.UniqueConstraint('user_id', 'artist_id', 'key', name='uq_albums_user_artist_key'),
+        db.Index('ix_albums_artist_key', 'artist_id', 'key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), nullable=True)
+    key = db.Column(db.String(200), nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    track_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<Album {self.name}>'
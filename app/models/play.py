@@ -0,0 +1,21 @@
+from app.extensions import db
+from datetime import datetime
+
+class PlayEvent(db.Model):
+    __tablename__ = 'play_events'
+    # Append-only and written in bulk by PlayEventBuffer (app/services/plays.py).
+    # On PostgreSQL the migration creates this table range-partitioned by
+    # played_at (one partition per month), so no foreign keys here.
+    __table_args__ = (
+        db.Index('ix_play_events_user_played', 'user_id', 'played_at'),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    track_id = db.Column(db.Integer, nullable=False)
+    played_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ms_played = db.Column(db.Integer, nullable=True)
+    source = db.Column(db.String(20), nullable=True) # e.g. 'playlist', 'library', 'queue'
+
+    def __repr__(self):
+        return f'<PlayEvent {self.user_id}:{self.track_id}>'
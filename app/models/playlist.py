@@ -1,30 +1,69 @@
 from app.extensions import db
 from datetime import datetime
+from .soft_delete import SoftDeleteMixin
 
 # Association table for the many-to-many relationship between Playlist and Track
 playlist_tracks = db.Table('playlist_tracks',
-    db.Column('playlist_id', db.Integer, db.ForeignKey('playlists.id'), primary_key=True),
-    db.Column('track_id', db.Integer, db.ForeignKey('tracks.id'), primary_key=True),
+    db.Column('playlist_id', db.Integer, db.ForeignKey('playlists.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('track_id', db.Integer, db.ForeignKey('tracks.id', ondelete='CASCADE'), primary_key=True),
     db.Column('track_order', db.Integer) # To maintain order within playlist
 )
 
-class Playlist(db.Model):
+class Playlist(SoftDeleteMixin, db.Model):
     __tablename__ = 'playlists'
+    __table_args__ = (
+        # Partial indexes: live rows by name, and the trash for the purge job
+        db.Index('ix_playlists_user_live', 'user_id', 'name',
+                 postgresql_where=db.text('deleted_at IS NULL'), sqlite_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_playlists_trash', 'deleted_at',
+                 postgresql_where=db.text('deleted_at IS NOT NULL'), sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     name = db.Column(db.String(150), nullable=False)
     description = db.Column(db.String(500), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by every write to the playlist or its track list and sent as the
+    # ETag; writes with If-Match compare-and-swap it (see routes/playlists.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Secret for the public read-only link, NULL when the playlist isn't shared publicly
+    share_token = db.Column(db.String(32), unique=True, nullable=True)
+    # Smart playlists only: the rules their tracks match (SmartRulesSchema). The
+    # matching tracks are kept in playlist_tracks like any other playlist's,
+    # see app/services/smart_playlists.py
+    rules = db.Column(db.JSON(none_as_null=True), nullable=True)
 
     # Define the many-to-many relationship
     # Use secondary=playlist_tracks to link via the association table
     # Use order_by to fetch tracks in the specified order
+    # passive_deletes: playlist_tracks rows go with ON DELETE CASCADE, so
+    # deleting a playlist or track doesn't load the other side first
     tracks = db.relationship('Track', secondary=playlist_tracks,
                              # lazy='dynamic', # Use dynamic for querying later
-                             backref=db.backref('playlists', lazy=True),
-                             order_by="playlist_tracks.c.track_order")
+                             backref=db.backref('playlists', lazy=True, passive_deletes=True),
+                             order_by="playlist_tracks.c.track_order",
+                             passive_deletes=True)
+    members = db.relationship('PlaylistMember', backref='playlist', lazy=True,
+                              cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f'<Playlist {self.name}>'
+
+
+class PlaylistMember(db.Model):
+    __tablename__ = 'playlist_members'
+    # Users a playlist is shared with. The owner (Playlist.user_id) has no
+    # row here. The primary key serves the per-request permission lookup,
+    # ix_playlist_members_user_id the "shared with me" list.
+
+    ROLES = ('viewer', 'editor')
+
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True, index=True)
+    role = db.Column(db.String(20), nullable=False) # One of ROLES
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PlaylistMember {self.playlist_id} {self.user_id} {self.role}>'
@@ -0,0 +1,28 @@
+from app.extensions import db
+from datetime import datetime
+
+class TrackNeighbour(db.Model):
+    __tablename__ = 'track_neighbours'
+    # Top-K co-listening neighbours per track, precomputed by
+    # app/services/recommendations.py from playlist co-occurrence
+    __table_args__ = (
+        db.Index('ix_track_neighbours_track_score', 'track_id', 'score'),
+    )
+
+    track_id = db.Column(db.Integer, db.ForeignKey('tracks.id', ondelete='CASCADE'), primary_key=True)
+    neighbour_id = db.Column(db.Integer, db.ForeignKey('tracks.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False) # Cosine similarity of playlist membership
+
+    def __repr__(self):
+        return f'<TrackNeighbour {self.track_id}->{self.neighbour_id}>'
+
+
+class RecommendationRefresh(db.Model):
+    __tablename__ = 'recommendation_refreshes'
+    # Users whose playlists changed since their neighbours were last built
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    requested_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RecommendationRefresh {self.user_id}>'
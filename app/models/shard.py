@@ -0,0 +1,14 @@
+from app.extensions import db
+
+class UserShard(db.Model):
+    __tablename__ = 'user_shards'
+    # Which database holds a user's data, see app/services/shards.py. Lives
+    # in the main database with the accounts; users without a row are on
+    # the main database itself (shard 'default').
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    shard = db.Column(db.String(64), nullable=False, index=True)
+    locked_at = db.Column(db.DateTime, nullable=True) # Set while a move copies the last changes, writes get 503
+
+    def __repr__(self):
+        return f'<UserShard {self.user_id} {self.shard}>'
@@ -0,0 +1,25 @@
+from app.extensions import db
+from sqlalchemy import event
+from sqlalchemy.orm import with_loader_criteria
+
+class SoftDeleteMixin:
+    # Trashed rows keep deleted_at until `flask purge-trash` removes them.
+    # Models pair this with partial indexes over the live rows
+    # (WHERE deleted_at IS NULL), so the trash doesn't slow normal queries.
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _exclude_deleted(execute_state):
+    # Every ORM SELECT on db.session, including lazy and eager relationship
+    # loads (e.g. playlist.tracks), skips trashed rows. Opt out per query
+    # with .execution_options(include_deleted=True), as the trash views do.
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get('include_deleted', False)
+    ):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(SoftDeleteMixin, lambda cls: cls.deleted_at.is_(None), include_aliases=True)
+        )
@@ -0,0 +1,51 @@
+from app.extensions import db
+
+# Pre-aggregated play counts, maintained from play_events by
+# app/services/rollups.py. granularity is 'hour' or 'day' and bucket_start
+# is the UTC start of that hour/day.
+
+class TrackPlayRollup(db.Model):
+    __tablename__ = 'track_play_rollups'
+    __table_args__ = (
+        db.Index('ix_track_play_rollups_user_bucket', 'user_id', 'granularity', 'bucket_start'),
+    )
+
+    granularity = db.Column(db.String(4), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    track_id = db.Column(db.Integer, primary_key=True)
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    ms_played = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<TrackPlayRollup {self.granularity} {self.bucket_start} {self.track_id}>'
+
+
+class ArtistPlayRollup(db.Model):
+    __tablename__ = 'artist_play_rollups'
+    __table_args__ = (
+        db.Index('ix_artist_play_rollups_user_bucket', 'user_id', 'granularity', 'bucket_start'),
+    )
+
+    granularity = db.Column(db.String(4), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    artist_key = db.Column(db.String(200), primary_key=True) # Case-folded artist name
+    artist = db.Column(db.String(200), nullable=False) # Display name
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    ms_played = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ArtistPlayRollup {self.granularity} {self.bucket_start} {self.artist}>'
+
+
+class RollupWatermark(db.Model):
+    __tablename__ = 'rollup_watermarks'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.BigInteger, nullable=False, default=0) # play_events.id already aggregated
+    gaps = db.Column(db.JSON(none_as_null=True), nullable=True) # Unseen [first_id, last_id, seen_at] ranges below it
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<RollupWatermark {self.name} {self.last_event_id}>'
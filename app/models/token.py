@@ -0,0 +1,15 @@
+from app.extensions import db
+from datetime import datetime
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True) # Monotonic, used as the sync watermark
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    token_type = db.Column(db.String(10), nullable=False) # 'access' or 'refresh'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True) # Row can be pruned after this
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
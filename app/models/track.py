@@ -1,24 +1,48 @@
 import enum
 from app.extensions import db
 from datetime import datetime
+from .soft_delete import SoftDeleteMixin
 
 class ManifestType(enum.Enum):
     HLS = 'HLS'
     DASH = 'DASH'
 
-class Track(db.Model):
+class Track(SoftDeleteMixin, db.Model):
     __tablename__ = 'tracks'
+    __table_args__ = (
+        db.Index('ix_tracks_album_order', 'album_id', 'track_number', 'title'), # Serves GET /api/albums/<id>/tracks
+        # Partial indexes: live rows in library order, and the trash for the purge job
+        db.Index('ix_tracks_user_live', 'user_id', 'artist', 'album', 'track_number', 'title',
+                 postgresql_where=db.text('deleted_at IS NULL'), sqlite_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_tracks_user_added', 'user_id', 'added_at', # Smart playlist "added in the last N days" rules
+                 postgresql_where=db.text('deleted_at IS NULL'), sqlite_where=db.text('deleted_at IS NULL')),
+        # Duplicate checks on ingest, see app/services/duplicates.py
+        db.Index('ix_tracks_user_url_fingerprint', 'user_id', 'url_fingerprint',
+                 postgresql_where=db.text('deleted_at IS NULL'), sqlite_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_tracks_user_metadata_fingerprint', 'user_id', 'metadata_fingerprint',
+                 postgresql_where=db.text('deleted_at IS NULL'), sqlite_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_tracks_trash', 'deleted_at',
+                 postgresql_where=db.text('deleted_at IS NOT NULL'), sqlite_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     artist = db.Column(db.String(200), nullable=True)
     album = db.Column(db.String(200), nullable=True)
+    # Normalised entities for artist/album, kept in sync by app/services/library.py
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='SET NULL'), nullable=True, index=True)
+    album_id = db.Column(db.Integer, db.ForeignKey('albums.id', ondelete='SET NULL'), nullable=True)
     track_number = db.Column(db.Integer, nullable=True)
     duration_ms = db.Column(db.Integer, nullable=True) # Optional: store duration if known
     manifest_url = db.Column(db.String(1024), nullable=False) # URL provided by the user
     manifest_type = db.Column(db.Enum(ManifestType), nullable=False)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # Shard moves sync by it
+    # Hashes of the canonical manifest_url and of the case-folded title/artist/album,
+    # set by app/services/duplicates.py (metadata_fingerprint is NULL without an artist)
+    url_fingerprint = db.Column(db.String(32), nullable=True)
+    metadata_fingerprint = db.Column(db.String(32), nullable=True)
 
     # Add other fields like genre, cover_art_url (user provided?) if needed
 
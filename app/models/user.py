@@ -9,9 +9,15 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    roles = db.Column(db.String(200), nullable=False, default='', server_default='') # Comma-separated, e.g. "admin"
+    deletion_requested_at = db.Column(db.DateTime, nullable=True, index=True) # Set by DELETE /api/auth/me, see app/services/accounts.py
 
-    tracks = db.relationship('Track', backref='owner', lazy=True, cascade="all, delete-orphan")
-    playlists = db.relationship('Playlist', backref='owner', lazy=True, cascade="all, delete-orphan")
+    # The database cascades deletes from users (ON DELETE CASCADE), so with
+    # passive_deletes deleting a user doesn't load their whole library first
+    tracks = db.relationship('Track', backref='owner', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    playlists = db.relationship('Playlist', backref='owner', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    artists = db.relationship('Artist', backref='owner', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    albums = db.relationship('Album', backref='owner', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
 
     def set_password(self, password):
         self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
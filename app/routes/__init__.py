@@ -4,8 +4,24 @@ from flask import Blueprint
 from .auth import bp as auth_bp
 from .tracks import bp as tracks_bp
 from .playlists import bp as playlists_bp
+from .queue import bp as queue_bp
+from .plays import bp as plays_bp
+from .stats import bp as stats_bp
+from .library import bp as library_bp
+from .events import bp as events_bp
+from .metrics import bp as metrics_bp
+from .playback import bp as playback_bp
+from .profiler import bp as profiler_bp
 
 def register_blueprints(app):
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(tracks_bp, url_prefix='/api/tracks')
     app.register_blueprint(playlists_bp, url_prefix='/api/playlists')
+    app.register_blueprint(queue_bp, url_prefix='/api/queue')
+    app.register_blueprint(plays_bp, url_prefix='/api/plays')
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')
+    app.register_blueprint(library_bp, url_prefix='/api') # /api/artists, /api/albums
+    app.register_blueprint(events_bp, url_prefix='/api/events')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+    app.register_blueprint(playback_bp, url_prefix='/api/play') # Signed URLs, no auth
+    app.register_blueprint(profiler_bp, url_prefix='/api/profiler') # Admin only
@@ -2,14 +2,21 @@ from flask import Blueprint, request, jsonify
 from app.models import User
 from app.schemas import UserSchema
 from app.extensions import db, bcrypt
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import (
+    create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt, current_user
+)
+from app.services import revocation_list, shard_map
+from app.services.accounts import request_deletion
+from app.services.idempotency import idempotent
 from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
 
 bp = Blueprint('auth', __name__)
 user_schema = UserSchema()
 users_schema = UserSchema(many=True) # For listing (admin only?)
 
 @bp.route('/register', methods=['POST'])
+@idempotent
 def register():
     json_data = request.get_json()
     if not json_data:
@@ -32,6 +39,7 @@ def register():
         new_user.set_password(json_data['password']) # Hash password
 
         db.session.add(new_user)
+        shard_map.assign(new_user) # Same transaction: no account without a shard
         db.session.commit()
 
         # Don't return password hash
@@ -54,20 +62,67 @@ def login():
 
     user = User.query.filter_by(username=json_data['username']).first()
 
-    if user and user.check_password(json_data['password']):
+    if user and user.deletion_requested_at is None and user.check_password(json_data['password']):
         # Identity can be user ID or any unique identifier
         access_token = create_access_token(identity=str(user.id))
-        return jsonify(access_token=access_token), 200
+        refresh_token = create_refresh_token(identity=str(user.id))
+        return jsonify(access_token=access_token, refresh_token=refresh_token), 200
     else:
         return jsonify({"message": "Invalid username or password"}), 401
 
 @bp.route('/me', methods=['GET'])
 @jwt_required() # Protect this route
 def get_current_user():
-    current_user_id = int(get_jwt_identity())
-    user = db.session.get(User, current_user_id)
-    if not user:
-         return jsonify({"message": "User not found"}), 404
-    return jsonify(user_schema.dump(user)), 200
+    # current_user comes from the identity cache (see app/services/identity.py),
+    # a missing user is answered with 404 by jwt.user_lookup_error_loader
+    return jsonify(current_user.profile), 200
 
-# Add refresh token endpoint if needed
+@bp.route('/me', methods=['DELETE'])
+@jwt_required()
+def delete_current_user():
+    # Only flags the account: the data is removed in chunks by the
+    # `flask purge-accounts` job (app/services/accounts.py), so deleting a
+    # large library never ties up a request worker
+    user = db.session.get(User, current_user.id)
+    try:
+        request_deletion(user)
+        revocation_list.revoke(get_jwt())
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not delete account", "error": str(e)}), 500
+    return jsonify({"message": "Account scheduled for deletion"}), 202
+
+@bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    # Rotate: the presented refresh token is revoked and a new pair is issued,
+    # so a stolen refresh token stops working as soon as the owner uses theirs
+    identity = get_jwt_identity()
+    try:
+        revocation_list.revoke(get_jwt())
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent refresh with the same token won; only one may rotate it
+        db.session.rollback()
+        return jsonify({"message": "Token has been revoked"}), 401
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not refresh token", "error": str(e)}), 500
+    return jsonify(
+        access_token=create_access_token(identity=identity),
+        refresh_token=create_refresh_token(identity=identity)
+    ), 200
+
+@bp.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False) # Accepts either an access or a refresh token
+def logout():
+    try:
+        revocation_list.revoke(get_jwt())
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback() # Revoked by a concurrent logout already
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not revoke token", "error": str(e)}), 500
+    return jsonify({"message": "Token revoked"}), 200
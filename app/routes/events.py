@@ -0,0 +1,31 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.services.events import change_broker
+
+bp = Blueprint('events', __name__)
+
+# Clients keep one stream open per device instead of polling
+# GET /api/playlists/<id>; each event carries enough (ids, version, new
+# order) to patch the local copy. Streams end after EVENTS_MAX_STREAM_SECONDS
+# and the client reconnects with Last-Event-ID to pick up where it left off.
+
+
+@bp.route('', methods=['GET'])
+@jwt_required()
+def stream_events():
+    current_user_id = int(get_jwt_identity())
+    # Browsers' EventSource sends the header on reconnect; the query
+    # parameter is for clients resuming from a stored id on a fresh page
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    # The generator runs after the request context is gone, so it gets
+    # plain values only and never touches the database
+    chunks = change_broker.open_stream(current_user_id, last_event_id)
+    if chunks is None:
+        response = jsonify({"message": "Too many open event streams, try again shortly"})
+        response.headers['Retry-After'] = str(current_app.config.get('EVENTS_RETRY_AFTER', 10))
+        return response, 503
+    return Response(
+        chunks,
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}, # No proxy buffering (nginx)
+    )
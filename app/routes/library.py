@@ -0,0 +1,41 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models import Artist, Album, Track
+from app.schemas import ArtistSchema, AlbumSchema, TrackSchema
+
+bp = Blueprint('library', __name__)
+artists_schema = ArtistSchema(many=True)
+albums_schema = AlbumSchema(many=True)
+tracks_schema = TrackSchema(many=True)
+
+# Browse by artist/album. Each listing walks one index (uq_artists_user_key,
+# ix_albums_artist_key, ix_tracks_album_order) instead of sorting the whole
+# library by its free-text artist/album columns.
+
+
+@bp.route('/artists', methods=['GET'])
+@jwt_required()
+def get_artists():
+    current_user_id = int(get_jwt_identity())
+    artists = Artist.query.filter_by(user_id=current_user_id).order_by(Artist.key).all()
+    return jsonify(artists_schema.dump(artists)), 200
+
+@bp.route('/artists/<int:artist_id>/albums', methods=['GET'])
+@jwt_required()
+def get_artist_albums(artist_id):
+    current_user_id = int(get_jwt_identity())
+    artist = Artist.query.filter_by(id=artist_id, user_id=current_user_id).first()
+    if not artist:
+        return jsonify({"message": "Artist not found or access denied"}), 404
+    albums = Album.query.filter_by(artist_id=artist.id).order_by(Album.key).all()
+    return jsonify(albums_schema.dump(albums)), 200
+
+@bp.route('/albums/<int:album_id>/tracks', methods=['GET'])
+@jwt_required()
+def get_album_tracks(album_id):
+    current_user_id = int(get_jwt_identity())
+    album = Album.query.filter_by(id=album_id, user_id=current_user_id).first()
+    if not album:
+        return jsonify({"message": "Album not found or access denied"}), 404
+    tracks = Track.query.filter_by(album_id=album.id).order_by(Track.track_number, Track.title).all()
+    return jsonify(tracks_schema.dump(tracks)), 200
@@ -0,0 +1,17 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, current_user
+from app.services.compression import compressor
+from app.services.limiter import concurrency_limiter
+from app.services.segments import segment_cache
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.route('', methods=['GET'])
+@jwt_required()
+def get_metrics():
+    # Process-local counters, so each worker reports its own
+    if not current_user.has_role('admin'):
+        return jsonify({"message": "Admin role required"}), 403
+    return jsonify({"compression": compressor.stats(), "segments": segment_cache.stats(),
+                    "concurrency": concurrency_limiter.stats()}), 200
@@ -0,0 +1,114 @@
+import os
+from urllib.parse import quote
+from flask import Blueprint, Response, current_app, jsonify, redirect, request, send_file
+from werkzeug.datastructures import ContentRange
+from marshmallow import ValidationError
+from app.schemas import ManifestProfileSchema
+from app.services import MEDIA_TYPES, ManifestFetchError, fetch_manifest
+from app.services.playback import PlaybackTokenError, playback_urls
+from app.services.segments import playlist_type, segment_cache, segment_media_type
+from app.services.variants import variant_filter
+
+bp = Blueprint('playback', __name__)
+manifest_profile_schema = ManifestProfileSchema()
+
+
+def _fetch(url):
+    return fetch_manifest(
+        url,
+        timeout=current_app.config.get('MANIFEST_FETCH_TIMEOUT', 10),
+        max_bytes=current_app.config.get('MANIFEST_MAX_BYTES', 5 * 1024 * 1024)
+    )
+
+
+def _send_segment(f, mimetype):
+    # Takes ownership of the open segment file `f`. Whole files go out
+    # through the server's wsgi.file_wrapper (sendfile under gunicorn).
+    # Werkzeug's own Range support would read and discard everything before
+    # the range there, so single ranges are streamed from a seek instead.
+    stat = os.fstat(f.fileno())
+    size = stat.st_size
+    if request.range is None or len(request.range.ranges) != 1:
+        return send_file(f, mimetype=mimetype, conditional=True, last_modified=stat.st_mtime,
+                         etag=f'{stat.st_ino:x}-{stat.st_mtime_ns:x}-{size:x}')
+    byte_range = request.range.range_for_length(size)
+    if byte_range is None:
+        f.close()
+        response = Response(status=416)
+        response.content_range = ContentRange('bytes', None, None, size)
+        return response
+    start, stop = byte_range
+    response = Response(_read_range(f, start, stop), 206, mimetype=mimetype, direct_passthrough=True)
+    response.call_on_close(f.close)
+    response.content_length = stop - start
+    response.content_range = ContentRange('bytes', start, stop, size)
+    response.accept_ranges = 'bytes'
+    return response
+
+
+def _read_range(f, start, stop, chunk_size=256 * 1024):
+    f.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        chunk = f.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+@bp.route('/<string:token>', methods=['GET'])
+def play(token):
+    # No JWT and no database: the signed token says which manifest this is.
+    # Under ASGI (asgi.py) this path is served by app/aio/routes.py instead.
+    try:
+        playback = playback_urls.verify(token)
+    except PlaybackTokenError as e:
+        return jsonify({"message": str(e)}), 403
+    try:
+        profile = variant_filter.profile(manifest_profile_schema.load(request.args))
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    # Served rather than redirected when it has to be rewritten: for the
+    # segment proxy or the client's declared profile
+    if current_app.config.get('PLAYBACK_URL_MODE', 'redirect') == 'redirect' and not segment_cache.enabled and profile is None:
+        response = redirect(playback.manifest_url, 302)
+    else:
+        try:
+            body = variant_filter.apply(_fetch(playback.manifest_url), playback.manifest_type, profile)
+            body = segment_cache.rewrite(body, playback.manifest_type, playback.manifest_url)
+        except ManifestFetchError as e:
+            return jsonify({"message": "Could not fetch manifest", "error": str(e)}), 502
+        response = Response(body, mimetype=MEDIA_TYPES[playback.manifest_type])
+    response.headers['Cache-Control'] = playback_urls.cache_control(playback)
+    return response
+
+
+@bp.route('/segments/<string:token>/<path:path>', methods=['GET'])
+def segment(token, path):
+    # Segments (and HLS media playlists) of manifests rewritten by
+    # app/services/segments.py; the token signs the upstream directory
+    if not segment_cache.enabled:
+        return jsonify({"message": "Segment proxy is disabled"}), 404
+    try:
+        grant = playback_urls.verify_prefix(token)
+    except PlaybackTokenError as e:
+        return jsonify({"message": str(e)}), 403
+    if '..' in path.split('/'):
+        return jsonify({"message": "Invalid segment path"}), 400
+    url = grant.prefix + quote(path, safe="/!$&'()*+,;=:@-._~")
+    if request.query_string:
+        url += '?' + request.query_string.decode()
+
+    try:
+        manifest_type = playlist_type(path)
+        if manifest_type is not None:
+            response = Response(segment_cache.rewrite(_fetch(url), manifest_type, url),
+                                mimetype=MEDIA_TYPES[manifest_type])
+        else:
+            response = _send_segment(segment_cache.get(url), segment_media_type(path))
+    except ManifestFetchError as e:
+        return jsonify({"message": "Could not fetch segment", "error": str(e)}), 502
+    response.headers['Cache-Control'] = playback_urls.cache_control(grant)
+    return response
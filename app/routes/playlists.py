@@ -1,15 +1,24 @@
-from flask import Blueprint, request, jsonify
+import secrets
+from datetime import datetime
+from flask import Blueprint, request, jsonify, make_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Playlist, Track, playlist_tracks
+from app.models import Playlist, PlaylistMember, Track, User, playlist_tracks
 from app.schemas import (
     PlaylistSchema, PlaylistCreateSchema, PlaylistUpdateSchema,
-    PlaylistTrackSchema, PlaylistTrackOrderSchema, TrackSchema
+    PlaylistTrackSchema, PlaylistTrackOrderSchema, PlaylistMemberSchema, TrackSchema
 )
 from app.extensions import db
+from app.services.recommendations import mark_stale
+from app.services.idempotency import idempotent
+from app.services.limiter import priority
+from app.services.events import change_broker
+from app.services.sharing import audience, can_edit, playlist_cache, resolve_access
+from app.services.compression import compressor
+from app.services.shards import shard_map
+from app.services.playback import playback_urls
+from app.services.smart_playlists import refresh_playlist
 from marshmallow import ValidationError
-# from sqlalchemy.orm import joinedload # To eager load tracks efficiently
-from sqlalchemy.orm import subqueryload
-from sqlalchemy import delete, insert
+from sqlalchemy import bindparam, delete, func, insert, select, update
 
 bp = Blueprint('playlists', __name__)
 playlist_schema = PlaylistSchema()
@@ -19,10 +28,76 @@ playlist_update_schema = PlaylistUpdateSchema()
 playlist_track_schema = PlaylistTrackSchema()
 playlist_track_order_schema = PlaylistTrackOrderSchema()
 track_schema = TrackSchema() # For returning tracks within a playlist
+playlist_member_schema = PlaylistMemberSchema()
+
+
+# --- Optimistic concurrency ---
+# Every write to a playlist (metadata or its track list) bumps
+# Playlist.version, which clients see as the ETag. Writes sent with
+# If-Match only apply if the version still matches, checked and bumped in
+# one conditional UPDATE so two devices can't both win. The UPDATE also
+# takes the playlist's row lock, so the track-list reads that follow it in
+# the same transaction can't interleave with another writer's.
+
+def _versioned(payload, status, version):
+    response = jsonify(payload)
+    response.set_etag(str(version))
+    return response, status
+
+def _bump_version(playlist_id, access, *criteria, **values):
+    """Compare-and-swap the version (and set `values`).
+
+    `access` is the permission check (Playlist.user_id == ... for owner-only
+    actions, can_edit() otherwise), evaluated in the same statement.
+    Returns (new version, owner id), or None if nothing matched.
+    """
+    criteria = criteria or (Playlist.deleted_at.is_(None),)
+    stmt = update(Playlist).where(Playlist.id == playlist_id, access, *criteria)
+    if request.if_match and not request.if_match.star_tag:
+        versions = [int(tag) for tag in request.if_match.as_set() if tag.isdigit()]
+        stmt = stmt.where(Playlist.version.in_(versions))
+    stmt = stmt.values(version=Playlist.version + 1, **values).returning(Playlist.version, Playlist.user_id)
+    return db.session.execute(stmt).first()
+
+def _version_conflict(playlist_id, user_id, access, *criteria):
+    # The CAS matched nothing: the playlist isn't there, the user may only
+    # read it, or If-Match is stale
+    db.session.rollback()
+    criteria = criteria or (Playlist.deleted_at.is_(None),)
+    current = db.session.execute(
+        select(Playlist.version).where(Playlist.id == playlist_id, access, *criteria)
+        .execution_options(include_deleted=True)
+    ).scalar()
+    if current is None:
+        if resolve_access(playlist_id, user_id) is not None:
+            return jsonify({"message": "You don't have permission to change this playlist"}), 403
+        return jsonify({"message": "Playlist not found or access denied"}), 404
+    return _versioned({"message": "Playlist was modified by another request", "version": current}, 412, current)
+
+@bp.before_request
+def _route_to_owner():
+    # A playlist lives on its owner's shard, members read and edit it there
+    if request.view_args and 'playlist_id' in request.view_args:
+        return shard_map.route_to_owner(Playlist, request.view_args['playlist_id'])
+
+def _smart_playlist_conflict(playlist_id):
+    # A smart playlist's tracks follow its rules, see app/services/smart_playlists.py.
+    # Called after _bump_version: only editors learn the playlist is smart, and
+    # rules are set by a version bump too, so they can't change before commit
+    if db.session.scalar(select(Playlist.rules.isnot(None)).where(Playlist.id == playlist_id)):
+        db.session.rollback() # Undo the version bump
+        return jsonify({"message": "Tracks of a smart playlist follow its rules, change those instead"}), 409
+    return None
+
+def _publish(playlist_id, owner_id, event_type, **data):
+    # Everyone the playlist is shared with sees the change, see app/services/events.py
+    for user_id in audience(playlist_id, owner_id):
+        change_broker.publish(user_id, event_type, playlist_id=playlist_id, **data)
 
 
 @bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_playlist():
     current_user_id = int(get_jwt_identity())
     json_data = request.get_json()
@@ -37,14 +112,19 @@ def create_playlist():
     new_playlist = Playlist(
         user_id=current_user_id,
         name=data['name'],
-        description=data.get('description')
+        description=data.get('description'),
+        rules=data.get('rules')
     )
 
     try:
         db.session.add(new_playlist)
+        db.session.flush() # Assigns the id for the event
+        refresh_playlist(new_playlist.id, bump=False) # Smart playlists start out with every matching track
+        change_broker.publish(current_user_id, 'playlist.created', playlist_id=new_playlist.id,
+                              version=new_playlist.version)
         db.session.commit()
         # Return the created playlist (without tracks initially)
-        return jsonify(PlaylistSchema(exclude=("tracks",)).dump(new_playlist)), 201
+        return _versioned(PlaylistSchema(exclude=("tracks",)).dump(new_playlist), 201, new_playlist.version)
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Could not create playlist", "error": str(e)}), 500
@@ -57,33 +137,125 @@ def get_playlists():
     # Use schema that excludes tracks for efficiency
     return jsonify(playlists_schema.dump(user_playlists)), 200
 
+@bp.route('/trash', methods=['GET'])
+@jwt_required()
+def get_trashed_playlists():
+    current_user_id = int(get_jwt_identity())
+    trashed = Playlist.query.execution_options(include_deleted=True).filter(
+        Playlist.user_id == current_user_id, Playlist.deleted_at.isnot(None)
+    ).order_by(Playlist.deleted_at.desc()).all()
+    return jsonify(playlists_schema.dump(trashed)), 200
+
+@bp.route('/<int:playlist_id>/restore', methods=['POST'])
+@jwt_required()
+@idempotent
+def restore_playlist(playlist_id):
+    current_user_id = int(get_jwt_identity())
+    owner_only = Playlist.user_id == current_user_id
+    bumped = _bump_version(playlist_id, owner_only, Playlist.deleted_at.isnot(None), deleted_at=None)
+    if bumped is None:
+        response, status = _version_conflict(playlist_id, current_user_id, owner_only, Playlist.deleted_at.isnot(None))
+        if status != 412:
+            return jsonify({"message": "Playlist not found in trash"}), 404
+        return response, status
+    version = bumped.version
+
+    try:
+        mark_stale(current_user_id)
+        refresh_playlist(playlist_id, bump=False) # Smart playlists missed the track changes while in the trash
+        _publish(playlist_id, current_user_id, 'playlist.restored', version=version)
+        db.session.commit()
+        playlist = db.session.get(Playlist, playlist_id)
+        return _versioned(PlaylistSchema(exclude=("tracks",)).dump(playlist), 200, version)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not restore playlist", "error": str(e)}), 500
+
 @bp.route('/<int:playlist_id>', methods=['GET'])
 @jwt_required()
 def get_playlist_details(playlist_id):
     current_user_id = int(get_jwt_identity())
-    # Eager load tracks using joinedload and order them
-    playlist = Playlist.query.options(
-        # joinedload(Playlist.tracks) # This tells SQLAlchemy to fetch tracks in the same query
-        subqueryload(Playlist.tracks)
-    ).filter_by(
-        id=playlist_id, user_id=current_user_id
-    ).first()
-
-    if not playlist:
+    access = resolve_access(playlist_id, current_user_id) # Owner, or a member of any role
+    if access is None:
+        return jsonify({"message": "Playlist not found or access denied"}), 404
+    role, version = access
+    return _cached_details(playlist_id, version, role)
+
+def _cached_details(playlist_id, version, role=None):
+    # Conditional GETs are answered from the version alone, everything else
+    # from playlist_cache; the tracks are only loaded and serialised once
+    # per version however many followers read it
+    if request.if_none_match.contains(str(version)):
+        response = make_response('', 304)
+        response.set_etag(str(version))
+        return response
+    # Finished (compressed) bodies are cached per version too, so a repeat
+    # fetch skips serialisation and compression as well
+    cached = compressor.cached_response(f'playlist:{playlist_id}:{version}:{role or "public"}')
+    if cached is not None:
+        cached.set_etag(str(version))
+        return cached
+    payload = playlist_cache.get_payload(playlist_id, version)
+    if payload is None:
         return jsonify({"message": "Playlist not found or access denied"}), 404
+    if role is not None:
+        payload = dict(payload, role=role)
+    return _versioned(payload, 200, version)
 
-    # The PlaylistSchema includes nested TrackSchema, so tracks will be serialized
-    # The relationship already includes ordering based on playlist_tracks.c.track_order
-    return jsonify(playlist_schema.dump(playlist)), 200
+@bp.route('/<int:playlist_id>/playback', methods=['GET'])
+@priority('playback')
+@jwt_required()
+def get_playlist_playback(playlist_id):
+    # Signed playback URLs for every track, in playlist order. Kept out of
+    # the details payload, which is cached per version for longer than a
+    # URL may live.
+    current_user_id = int(get_jwt_identity())
+    if resolve_access(playlist_id, current_user_id) is None:
+        return jsonify({"message": "Playlist not found or access denied"}), 404
+    rows = db.session.execute(
+        select(Track.id, Track.manifest_url, Track.manifest_type)
+        .join(playlist_tracks, playlist_tracks.c.track_id == Track.id)
+        .where(playlist_tracks.c.playlist_id == playlist_id)
+        .order_by(playlist_tracks.c.track_order)
+    ).all()
+    expires = playback_urls.expiry()
+    return jsonify({
+        "expires": expires, # Unix time
+        "tracks": [{"track_id": row.id, "playback_url": playback_urls.url(*row, expires=expires)} for row in rows]
+    }), 200
+
+@bp.route('/shared', methods=['GET'])
+@jwt_required()
+def get_shared_playlists():
+    current_user_id = int(get_jwt_identity())
+    stmt = (
+        select(Playlist, PlaylistMember.role)
+        .join(PlaylistMember, PlaylistMember.playlist_id == Playlist.id)
+        .where(PlaylistMember.user_id == current_user_id) # ix_playlist_members_user_id
+        .order_by(Playlist.name)
+    )
+    # Memberships are stored with the playlist, so on its owner's shard
+    rows = [row for _, row in shard_map.scan(stmt)]
+    if shard_map.enabled:
+        rows.sort(key=lambda row: row.Playlist.name)
+    dumped = playlists_schema.dump([playlist for playlist, _ in rows])
+    return jsonify([dict(playlist, role=role) for playlist, (_, role) in zip(dumped, rows)]), 200
+
+@bp.route('/shared/<string:share_token>', methods=['GET'])
+def get_public_playlist(share_token):
+    # Public, read-only; anyone with the link can read it without an account
+    stmt = select(Playlist.id, Playlist.version).where(Playlist.share_token == share_token)
+    shard, row = shard_map.locate(stmt) # On the owner's shard
+    if row is None:
+        return jsonify({"message": "Playlist not found"}), 404
+    with shard_map.use(shard):
+        return _cached_details(row.id, row.version)
 
 @bp.route('/<int:playlist_id>', methods=['PUT'])
 @jwt_required()
+@idempotent
 def update_playlist(playlist_id):
     current_user_id = int(get_jwt_identity())
-    playlist = Playlist.query.filter_by(id=playlist_id, user_id=current_user_id).first()
-    if not playlist:
-        return jsonify({"message": "Playlist not found or access denied"}), 404
-
     json_data = request.get_json()
     if not json_data:
         return jsonify({"message": "No input data provided"}), 400
@@ -93,33 +265,42 @@ def update_playlist(playlist_id):
     except ValidationError as err:
         return jsonify(err.messages), 400
 
-    # Update fields if they are provided
-    if 'name' in data:
-        playlist.name = data['name']
-    if 'description' in data:
-        playlist.description = data['description']
+    # Only the provided fields are set, in the same statement as the version check
+    bumped = _bump_version(playlist_id, can_edit(current_user_id), **data)
+    if bumped is None:
+        return _version_conflict(playlist_id, current_user_id, can_edit(current_user_id))
+    version, owner_id = bumped
 
     try:
+        if data.get('rules') is not None:
+            refresh_playlist(playlist_id, bump=False)
+        _publish(playlist_id, owner_id, 'playlist.updated', version=version, **data)
         db.session.commit()
+        playlist = db.session.get(Playlist, playlist_id)
         # Return updated playlist (without tracks for consistency with create/list)
-        return jsonify(PlaylistSchema(exclude=("tracks",)).dump(playlist)), 200
+        return _versioned(PlaylistSchema(exclude=("tracks",)).dump(playlist), 200, version)
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Could not update playlist", "error": str(e)}), 500
 
 @bp.route('/<int:playlist_id>', methods=['DELETE'])
 @jwt_required()
+@idempotent
 def delete_playlist(playlist_id):
     current_user_id = int(get_jwt_identity())
-    playlist = Playlist.query.filter_by(id=playlist_id, user_id=current_user_id).first()
-    if not playlist:
-        return jsonify({"message": "Playlist not found or access denied"}), 404
+    # Soft delete: see delete_track. `flask purge-trash` removes it (and its
+    # playlist_tracks rows, via ON DELETE CASCADE) after TRASH_RETENTION_DAYS
+    owner_only = Playlist.user_id == current_user_id
+    bumped = _bump_version(playlist_id, owner_only, deleted_at=datetime.utcnow())
+    if bumped is None:
+        return _version_conflict(playlist_id, current_user_id, owner_only)
+    version = bumped.version
 
     try:
-        # Relationship cascade should handle deleting entries from playlist_tracks
-        db.session.delete(playlist)
+        mark_stale(current_user_id) # Co-occurrence changed, see app/services/recommendations.py
+        _publish(playlist_id, current_user_id, 'playlist.deleted', version=version)
         db.session.commit()
-        return jsonify({"message": "Playlist deleted successfully"}), 200
+        return _versioned({"message": "Playlist moved to trash"}, 200, version)
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Could not delete playlist", "error": str(e)}), 500
@@ -128,12 +309,9 @@ def delete_playlist(playlist_id):
 
 @bp.route('/<int:playlist_id>/tracks', methods=['POST'])
 @jwt_required()
+@idempotent
 def add_track_to_playlist(playlist_id):
     current_user_id = int(get_jwt_identity())
-    playlist = Playlist.query.filter_by(id=playlist_id, user_id=current_user_id).first()
-    if not playlist:
-        return jsonify({"message": "Playlist not found or access denied"}), 404
-
     json_data = request.get_json()
     if not json_data:
         return jsonify({"message": "No input data provided"}), 400
@@ -144,32 +322,45 @@ def add_track_to_playlist(playlist_id):
     except ValidationError as err:
         return jsonify(err.messages), 400
 
-    # Verify the track exists and belongs to the user
+    bumped = _bump_version(playlist_id, can_edit(current_user_id))
+    if bumped is None:
+        return _version_conflict(playlist_id, current_user_id, can_edit(current_user_id))
+    version, owner_id = bumped
+    conflict = _smart_playlist_conflict(playlist_id)
+    if conflict:
+        return conflict
+
+    # Verify the track exists and belongs to the user (editors add from their own library)
     track = Track.query.filter_by(id=track_id, user_id=current_user_id).first()
     if not track:
+        db.session.rollback() # Undo the version bump
         return jsonify({"message": "Track not found or access denied"}), 404
 
-    # Check if track is already in the playlist (working with the list directly)
-    # playlist.tracks directly gives the list of Track objects
-    if any(t.id == track_id for t in playlist.tracks):
-         return jsonify({"message": "Track already in playlist"}), 409
+    # Read the membership after the bump, so it can't change under us before the insert
+    in_playlist = select(playlist_tracks.c.track_id).where(playlist_tracks.c.playlist_id == playlist_id)
+    if db.session.execute(in_playlist.where(playlist_tracks.c.track_id == track_id)).first():
+        db.session.rollback()
+        return jsonify({"message": "Track already in playlist"}), 409
 
-    # Determine the order for the new track (append to the end)
-    # Use len() on the list
-    current_track_count = len(playlist.tracks)
-    new_order = current_track_count # 0-based index for the next item
+    # Append to the end (0-based), leaving any gaps from removals alone
+    new_order = db.session.execute(
+        select(func.coalesce(func.max(playlist_tracks.c.track_order) + 1, 0))
+        .where(playlist_tracks.c.playlist_id == playlist_id)
+    ).scalar()
 
     # Manually insert into the association table
     try:
         stmt = insert(playlist_tracks).values(
-            playlist_id=playlist.id,
+            playlist_id=playlist_id,
             track_id=track.id,
             track_order=new_order
         )
         db.session.execute(stmt)
+        mark_stale(owner_id)
+        _publish(playlist_id, owner_id, 'playlist.track_added', version=version, track_id=track.id, track_order=new_order)
         db.session.commit()
         # You could return the updated playlist details or just a success message
-        return jsonify({"message": "Track added to playlist"}), 201
+        return _versioned({"message": "Track added to playlist"}, 201, version)
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Could not add track to playlist", "error": str(e)}), 500
@@ -177,13 +368,18 @@ def add_track_to_playlist(playlist_id):
 
 @bp.route('/<int:playlist_id>/tracks/<int:track_id>', methods=['DELETE'])
 @jwt_required()
+@idempotent
 def remove_track_from_playlist(playlist_id, track_id):
     current_user_id = int(get_jwt_identity())
 
-    # Verify playlist exists and belongs to user
-    playlist_exists = db.session.query(Playlist.id).filter_by(id=playlist_id, user_id=current_user_id).first() is not None
-    if not playlist_exists:
-        return jsonify({"message": "Playlist not found or access denied"}), 404
+    # Verify playlist exists, the user may edit it and it matches If-Match
+    bumped = _bump_version(playlist_id, can_edit(current_user_id))
+    if bumped is None:
+        return _version_conflict(playlist_id, current_user_id, can_edit(current_user_id))
+    version, owner_id = bumped
+    conflict = _smart_playlist_conflict(playlist_id)
+    if conflict:
+        return conflict
 
     # Directly delete from the association table
     try:
@@ -195,14 +391,17 @@ def remove_track_from_playlist(playlist_id, track_id):
 
         # Check if any row was actually deleted
         if result.rowcount == 0:
+            db.session.rollback() # Undo the version bump
             return jsonify({"message": "Track not found in this playlist"}), 404
 
         # Optional: Re-order remaining tracks if necessary (e.g., fill gaps)
         # This can be complex. A simpler approach is to let gaps exist or re-order on fetch/update.
         # For now, we just remove. Re-ordering can be a separate endpoint.
 
+        mark_stale(owner_id)
+        _publish(playlist_id, owner_id, 'playlist.track_removed', version=version, track_id=track_id)
         db.session.commit()
-        return jsonify({"message": "Track removed from playlist"}), 200
+        return _versioned({"message": "Track removed from playlist"}, 200, version)
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Could not remove track from playlist", "error": str(e)}), 500
@@ -210,12 +409,9 @@ def remove_track_from_playlist(playlist_id, track_id):
 
 @bp.route('/<int:playlist_id>/tracks/order', methods=['PUT'])
 @jwt_required()
+@idempotent
 def reorder_playlist_tracks(playlist_id):
     current_user_id = int(get_jwt_identity())
-    playlist = Playlist.query.filter_by(id=playlist_id, user_id=current_user_id).first()
-    if not playlist:
-        return jsonify({"message": "Playlist not found or access denied"}), 404
-
     json_data = request.get_json()
     if not json_data:
         return jsonify({"message": "No input data provided"}), 400
@@ -226,25 +422,156 @@ def reorder_playlist_tracks(playlist_id):
     except ValidationError as err:
         return jsonify(err.messages), 400
 
-    # Get current tracks in the playlist to verify IDs are valid
-    # Use a set for efficient lookup
-    current_track_ids = {track.id for track in playlist.tracks}
+    # Bump first: validating against the track list and then writing is only
+    # safe once no concurrent add/remove can land in between
+    bumped = _bump_version(playlist_id, can_edit(current_user_id))
+    if bumped is None:
+        return _version_conflict(playlist_id, current_user_id, can_edit(current_user_id))
+    version, owner_id = bumped
 
-    if set(ordered_track_ids) != current_track_ids:
+    # Get current tracks in the playlist to verify IDs are valid (trashed
+    # ones are hidden from clients, so they aren't expected here either)
+    # Use a set for efficient lookup
+    current_track_ids = set(db.session.execute(
+        select(playlist_tracks.c.track_id)
+        .join(Track, Track.id == playlist_tracks.c.track_id)
+        .where(playlist_tracks.c.playlist_id == playlist_id, Track.deleted_at.is_(None))
+    ).scalars())
+
+    if len(ordered_track_ids) != len(current_track_ids) or set(ordered_track_ids) != current_track_ids:
+        db.session.rollback() # Undo the version bump
         return jsonify({"message": "Provided track IDs do not match the tracks currently in the playlist"}), 400
 
-    # Update the order in the association table
-    try:
-        with db.session.begin_nested(): # Use nested transaction for updating multiple rows
-            for index, track_id in enumerate(ordered_track_ids):
-                # Update the track_order for each entry in the association table
-                stmt = db.update(playlist_tracks).where(
-                    (playlist_tracks.c.playlist_id == playlist_id) &
-                    (playlist_tracks.c.track_id == track_id)
-                ).values(track_order=index)
-                db.session.execute(stmt)
-        db.session.commit() # Commit the main transaction
-        return jsonify({"message": "Playlist order updated"}), 200
+    # Update the order in the association table, one executemany for all rows
+    try:
+        stmt = update(playlist_tracks).where(
+            (playlist_tracks.c.playlist_id == playlist_id) &
+            (playlist_tracks.c.track_id == bindparam('b_track_id'))
+        ).values(track_order=bindparam('b_track_order'))
+        # Entries of trashed tracks keep their relative order after the
+        # visible ones, so restoring a track never duplicates a position
+        trashed_track_ids = db.session.execute(
+            select(playlist_tracks.c.track_id)
+            .join(Track, Track.id == playlist_tracks.c.track_id)
+            .where(playlist_tracks.c.playlist_id == playlist_id, Track.deleted_at.isnot(None))
+            .order_by(playlist_tracks.c.track_order)
+            .execution_options(include_deleted=True)
+        ).scalars().all()
+        db.session.execute(stmt, [
+            {"b_track_id": track_id, "b_track_order": index}
+            for index, track_id in enumerate([*ordered_track_ids, *trashed_track_ids])
+        ])
+        _publish(playlist_id, owner_id, 'playlist.reordered', version=version, track_ids=ordered_track_ids)
+        db.session.commit()
+        return _versioned({"message": "Playlist order updated"}, 200, version)
     except Exception as e:
-        db.session.rollback() # Rollback both nested and main transaction on error
+        db.session.rollback()
         return jsonify({"message": "Could not update playlist order", "error": str(e)}), 500
+
+
+# --- Sharing ---
+
+@bp.route('/<int:playlist_id>/share', methods=['POST'])
+@jwt_required()
+@idempotent
+def create_share_link(playlist_id):
+    current_user_id = int(get_jwt_identity())
+    playlist = Playlist.query.filter_by(id=playlist_id, user_id=current_user_id).first()
+    if not playlist:
+        return jsonify({"message": "Playlist not found or access denied"}), 404
+
+    try:
+        if playlist.share_token is None: # Reuse an existing link, it may already be out there
+            playlist.share_token = secrets.token_urlsafe(16)
+        db.session.commit()
+        return jsonify({"share_token": playlist.share_token}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not share playlist", "error": str(e)}), 500
+
+@bp.route('/<int:playlist_id>/share', methods=['DELETE'])
+@jwt_required()
+@idempotent
+def revoke_share_link(playlist_id):
+    current_user_id = int(get_jwt_identity())
+    playlist = Playlist.query.filter_by(id=playlist_id, user_id=current_user_id).first()
+    if not playlist:
+        return jsonify({"message": "Playlist not found or access denied"}), 404
+
+    try:
+        playlist.share_token = None
+        db.session.commit()
+        return jsonify({"message": "Share link revoked"}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not revoke share link", "error": str(e)}), 500
+
+@bp.route('/<int:playlist_id>/members', methods=['GET'])
+@jwt_required()
+def get_playlist_members(playlist_id):
+    current_user_id = int(get_jwt_identity())
+    if resolve_access(playlist_id, current_user_id) is None:
+        return jsonify({"message": "Playlist not found or access denied"}), 404
+    members = PlaylistMember.query.filter_by(playlist_id=playlist_id).order_by(PlaylistMember.created_at).all()
+    return jsonify([playlist_member_schema.dump(member) for member in members]), 200
+
+@bp.route('/<int:playlist_id>/members/<int:user_id>', methods=['PUT'])
+@jwt_required()
+@idempotent
+def set_playlist_member(playlist_id, user_id):
+    current_user_id = int(get_jwt_identity())
+    playlist = Playlist.query.filter_by(id=playlist_id, user_id=current_user_id).first()
+    if not playlist:
+        return jsonify({"message": "Playlist not found or access denied"}), 404
+    if user_id == current_user_id:
+        return jsonify({"message": "The owner can't also be a member"}), 400
+    if db.session.get(User, user_id) is None:
+        return jsonify({"message": "User not found"}), 404
+
+    json_data = request.get_json()
+    if not json_data:
+        return jsonify({"message": "No input data provided"}), 400
+
+    try:
+        data = playlist_member_schema.load(json_data)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+    if data['role'] == 'editor' and shard_map.shard_for(user_id) != shard_map.shard_for(current_user_id):
+        # Editors add tracks from their own library, which has to be on the same shard
+        return jsonify({"message": "This user's library is stored elsewhere, they can only be a viewer"}), 409
+
+    try:
+        member = db.session.get(PlaylistMember, (playlist_id, user_id))
+        status = 200 if member else 201
+        if member is None:
+            member = PlaylistMember(playlist_id=playlist_id, user_id=user_id)
+            db.session.add(member)
+            change_broker.publish(user_id, 'playlist.shared', playlist_id=playlist_id, version=playlist.version)
+        member.role = data['role']
+        db.session.commit()
+        return jsonify(playlist_member_schema.dump(member)), status
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not share playlist", "error": str(e)}), 500
+
+@bp.route('/<int:playlist_id>/members/<int:user_id>', methods=['DELETE'])
+@jwt_required()
+@idempotent
+def remove_playlist_member(playlist_id, user_id):
+    current_user_id = int(get_jwt_identity())
+    # The owner can remove anyone, members can remove themselves
+    owner_id = db.session.execute(select(Playlist.user_id).where(Playlist.id == playlist_id)).scalar()
+    if owner_id is None or current_user_id not in (owner_id, user_id):
+        return jsonify({"message": "Playlist not found or access denied"}), 404
+
+    try:
+        result = db.session.execute(delete(PlaylistMember).where(
+            PlaylistMember.playlist_id == playlist_id, PlaylistMember.user_id == user_id
+        ))
+        if result.rowcount == 0:
+            return jsonify({"message": "User is not a member of this playlist"}), 404
+        db.session.commit()
+        return jsonify({"message": "Member removed"}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not remove member", "error": str(e)}), 500
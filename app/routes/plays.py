@@ -0,0 +1,61 @@
+import math
+from datetime import datetime, timezone
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models import Track
+from app.schemas import PlayEventSchema, PlayEventBatchSchema
+from app.extensions import db
+from app.services import play_buffer, PlayBufferFull
+from marshmallow import ValidationError
+
+bp = Blueprint('plays', __name__)
+play_event_schema = PlayEventSchema()
+play_event_batch_schema = PlayEventBatchSchema()
+
+
+def _utc(played_at):
+    # Stored as naive UTC; clients may send any offset (naive ones are taken as UTC)
+    if played_at is None or played_at.tzinfo is None:
+        return played_at
+    return played_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@bp.route('', methods=['POST'])
+@jwt_required()
+def record_plays():
+    current_user_id = int(get_jwt_identity())
+    json_data = request.get_json(silent=True)
+    if not json_data:
+        return jsonify({"message": "No input data provided"}), 400
+
+    try:
+        if 'events' in json_data:
+            events = play_event_batch_schema.load(json_data)['events']
+        else:
+            events = [play_event_schema.load(json_data)]
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    # One ownership check per request rather than per event
+    requested_ids = {event['track_id'] for event in events}
+    owned_ids = {row.id for row in db.session.query(Track.id).filter(
+        Track.user_id == current_user_id, Track.id.in_(requested_ids)
+    )}
+
+    now = datetime.utcnow()
+    rows = [{
+        "user_id": current_user_id,
+        "track_id": event['track_id'],
+        "played_at": _utc(event.get('played_at')) or now,
+        "ms_played": event.get('ms_played'),
+        "source": event.get('source')
+    } for event in events if event['track_id'] in owned_ids]
+
+    # Accepted means buffered; the rows are written by the next bulk flush
+    try:
+        play_buffer.add(rows)
+    except PlayBufferFull:
+        response = jsonify({"message": "Too many play events waiting to be written, try again shortly"})
+        response.headers['Retry-After'] = str(max(1, math.ceil(play_buffer.flush_interval or 1)))
+        return response, 503
+    return jsonify({"accepted": len(rows), "rejected": len(events) - len(rows)}), 202
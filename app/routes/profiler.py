@@ -0,0 +1,63 @@
+import json
+from flask import Blueprint, Response, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, current_user
+from marshmallow import ValidationError
+from app.schemas import ProfileRuleSchema
+from app.services.profiler import request_profiler
+
+bp = Blueprint('profiler', __name__)
+profile_rule_schema = ProfileRuleSchema()
+
+# Rules and captures live in the worker that served the request, like
+# /api/metrics. With several workers a rule only samples its own worker's
+# share of the traffic; X-Profile on the request itself works anywhere.
+
+
+@bp.before_request
+@jwt_required()
+def _require_admin():
+    if not current_user.has_role('admin'):
+        return jsonify({"message": "Admin role required"}), 403
+    return None
+
+@bp.route('', methods=['GET'])
+def get_profiler():
+    return jsonify(request_profiler.state()), 200
+
+@bp.route('/rules', methods=['POST'])
+def add_profile_rule():
+    try:
+        data = profile_rule_schema.load(request.get_json(silent=True) or {})
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+    if data['endpoint'] is not None and data['endpoint'] not in current_app.view_functions:
+        return jsonify({"message": f"Unknown endpoint: {data['endpoint']}"}), 400
+    rule = request_profiler.add_rule(**data)
+    return jsonify(rule.to_dict()), 201
+
+@bp.route('/rules/<int:rule_id>', methods=['DELETE'])
+def delete_profile_rule(rule_id):
+    if not request_profiler.remove_rule(rule_id):
+        return jsonify({"message": "Rule not found"}), 404
+    return jsonify({"message": "Rule removed"}), 200
+
+@bp.route('/captures/<int:capture_id>', methods=['GET'])
+def get_capture(capture_id):
+    # ?format=speedscope (default, open at speedscope.app), collapsed (flamegraph.pl) or allocations
+    capture = request_profiler.capture(capture_id)
+    if capture is None:
+        return jsonify({"message": "Capture not found, or not taken by this worker"}), 404
+    output = request.args.get('format', 'speedscope')
+    if output == 'speedscope':
+        body, mimetype, extension = json.dumps(capture.speedscope()), 'application/json', 'speedscope.json'
+    elif output == 'collapsed':
+        body, mimetype, extension = capture.collapsed(), 'text/plain', 'folded'
+    elif output == 'allocations':
+        if capture.memory is None:
+            return jsonify({"message": "Capture has no allocation data"}), 404
+        return jsonify(dict(capture.summary(), allocations=capture.memory)), 200
+    else:
+        return jsonify({"message": "format must be speedscope, collapsed or allocations"}), 400
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=profile-{capture.id}.{extension}',
+    })
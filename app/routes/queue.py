@@ -0,0 +1,71 @@
+import secrets
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models import Playlist, Track, playlist_tracks
+from app.schemas import QueueArgsSchema
+from app.extensions import db
+from app.services.playback import playback_urls
+from marshmallow import ValidationError
+from sqlalchemy import select
+
+bp = Blueprint('queue', __name__)
+queue_args_schema = QueueArgsSchema()
+
+
+@bp.route('', methods=['GET'])
+@jwt_required()
+def get_queue():
+    current_user_id = int(get_jwt_identity())
+    try:
+        args = queue_args_schema.load(request.args)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    # Only the columns the ordering needs, not whole Track objects
+    columns = select(Track.id, Track.artist, Track.album, Track.track_number)
+    if 'playlist_id' in args:
+        playlist_exists = db.session.query(Playlist.id).filter_by(id=args['playlist_id'], user_id=current_user_id).first() is not None
+        if not playlist_exists:
+            return jsonify({"message": "Playlist not found or access denied"}), 404
+        stmt = columns.join(playlist_tracks, playlist_tracks.c.track_id == Track.id).where(
+            playlist_tracks.c.playlist_id == args['playlist_id']
+        ).order_by(playlist_tracks.c.track_order)
+    else:
+        stmt = columns.where(Track.user_id == current_user_id).order_by(
+            Track.artist, Track.album, Track.track_number, Track.title
+        )
+    rows = db.session.execute(stmt).all()
+    track_ids, artists, albums, track_numbers = zip(*rows) if rows else ((), (), (), ())
+
+    seed = args.get('seed', secrets.randbits(32))
+    from app.services.queue import build_queue # numpy, imported on first use rather than at startup
+    order = build_queue(track_ids, artists, albums, track_numbers, args['mode'], seed)
+
+    # Manifest details only for the requested window
+    offset, limit = args['offset'], args['limit']
+    window = order[offset:offset + limit].tolist()
+    details = {
+        row.id: row for row in db.session.execute(
+            select(Track.id, Track.manifest_url, Track.manifest_type).where(Track.id.in_(window))
+        )
+    } if window else {}
+    expires = playback_urls.expiry() # Signed in one go, so playing the window needs no further lookups
+    items = [{
+        "track_id": track_id,
+        "manifest_url": details[track_id].manifest_url,
+        "manifest_type": details[track_id].manifest_type.value,
+        "playback_url": playback_urls.url(track_id, details[track_id].manifest_url,
+                                          details[track_id].manifest_type, expires)
+    } for track_id in window]
+
+    next_offset = offset + limit
+    return jsonify({
+        "mode": args['mode'],
+        "seed": seed,
+        "total": len(order),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset if next_offset < len(order) else None,
+        "playback_expires": expires, # Unix time; fetch the window again for fresh playback URLs after this
+        "items": items
+    }), 200
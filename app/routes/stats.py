@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models import Track, TrackPlayRollup, ArtistPlayRollup
+from app.schemas import StatsArgsSchema, STATS_PERIODS
+from app.extensions import db
+from marshmallow import ValidationError
+from sqlalchemy import func
+
+bp = Blueprint('stats', __name__)
+stats_args_schema = StatsArgsSchema()
+
+# Everything here reads the rollup tables only (see app/services/rollups.py),
+# never play_events, so cost doesn't grow with listening history.
+
+
+def _window(model, user_id, period):
+    # Hourly buckets give the last 24h precisely, daily buckets cover longer periods
+    days = STATS_PERIODS[period]
+    granularity = 'hour' if period == 'day' else 'day'
+    filters = [model.user_id == user_id, model.granularity == granularity]
+    if days is not None:
+        start = datetime.utcnow() - timedelta(days=days)
+        if granularity == 'hour':
+            start = start.replace(minute=0, second=0, microsecond=0)
+        else:
+            start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        filters.append(model.bucket_start >= start)
+    return filters
+
+
+@bp.route('/top-tracks', methods=['GET'])
+@jwt_required()
+def get_top_tracks():
+    current_user_id = int(get_jwt_identity())
+    try:
+        args = stats_args_schema.load(request.args)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    plays = func.sum(TrackPlayRollup.plays).label('plays')
+    ms_played = func.sum(TrackPlayRollup.ms_played).label('ms_played')
+    top = db.session.query(TrackPlayRollup.track_id, plays, ms_played).filter(
+        *_window(TrackPlayRollup, current_user_id, args['period'])
+    ).group_by(TrackPlayRollup.track_id).order_by(plays.desc(), TrackPlayRollup.track_id).limit(args['limit']).all()
+
+    titles = {t.id: t for t in db.session.query(Track.id, Track.title, Track.artist).filter(
+        Track.id.in_([row.track_id for row in top])
+    )} if top else {}
+    return jsonify({
+        "period": args['period'],
+        "items": [{
+            "track_id": row.track_id,
+            "title": titles[row.track_id].title if row.track_id in titles else None, # None once deleted
+            "artist": titles[row.track_id].artist if row.track_id in titles else None,
+            "plays": int(row.plays),
+            "ms_played": int(row.ms_played)
+        } for row in top]
+    }), 200
+
+
+@bp.route('/top-artists', methods=['GET'])
+@jwt_required()
+def get_top_artists():
+    current_user_id = int(get_jwt_identity())
+    try:
+        args = stats_args_schema.load(request.args)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    plays = func.sum(ArtistPlayRollup.plays).label('plays')
+    ms_played = func.sum(ArtistPlayRollup.ms_played).label('ms_played')
+    top = db.session.query(func.min(ArtistPlayRollup.artist).label('artist'), plays, ms_played).filter(
+        *_window(ArtistPlayRollup, current_user_id, args['period'])
+    ).group_by(ArtistPlayRollup.artist_key).order_by(plays.desc(), ArtistPlayRollup.artist_key).limit(args['limit']).all()
+
+    return jsonify({
+        "period": args['period'],
+        "items": [{"artist": row.artist, "plays": int(row.plays), "ms_played": int(row.ms_played)} for row in top]
+    }), 200
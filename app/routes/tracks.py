@@ -1,18 +1,39 @@
-from flask import Blueprint, request, jsonify
+from datetime import datetime
+from flask import Blueprint, Response, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Track, ManifestType
-from app.schemas import TrackSchema, TrackLoadSchema, TrackUpdateSchema
+from app.models import Track, ManifestType, ManifestHealth, TrackNeighbour, playlist_tracks
+from app.schemas import TrackSchema, TrackLoadSchema, TrackUpdateSchema, TrackMergeSchema, ManifestProfileSchema, BrokenTrackSchema
 from app.extensions import db
+from app.services import MEDIA_TYPES, ManifestFetchError, fetch_manifest
+from app.services.recommendations import mark_stale
+from app.services.library import sync_track, release_track
+from app.services.idempotency import idempotent
+from app.services.limiter import priority
+from app.services.events import change_broker
+from app.services.sharing import bump_playlists_containing
+from app.services.smart_playlists import refresh_track
+from app.services.duplicates import duplicate_clusters, find_duplicate, fingerprint, merge_tracks
+from app.services.segments import segment_cache
+from app.services.variants import variant_filter
 from marshmallow import ValidationError
+from sqlalchemy.orm import contains_eager
 
 bp = Blueprint('tracks', __name__)
 track_schema = TrackSchema()
 tracks_schema = TrackSchema(many=True)
 track_load_schema = TrackLoadSchema()
 track_update_schema = TrackUpdateSchema()
+track_merge_schema = TrackMergeSchema()
+manifest_profile_schema = ManifestProfileSchema()
+broken_tracks_schema = BrokenTrackSchema(many=True)
+
+def _in_playlists(track_id):
+    # Checked without loading track.playlists
+    return db.session.query(playlist_tracks.c.track_id).filter_by(track_id=track_id).first() is not None
 
 @bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def add_track():
     current_user_id = int(get_jwt_identity())
     json_data = request.get_json()
@@ -39,8 +60,18 @@ def add_track():
         manifest_type=data['manifest_type'] # Marshmallow handles enum conversion
     )
 
+    # Bulk imports tend to repeat tracks; ?allow_duplicate=true adds it anyway
+    fingerprint(new_track)
+    if request.args.get('allow_duplicate', '').lower() not in ('1', 'true'):
+        duplicate_id = find_duplicate(new_track)
+        if duplicate_id is not None:
+            return jsonify({"message": "This track is already in your library", "duplicate_id": duplicate_id}), 409
+
     try:
-        db.session.add(new_track)
+        sync_track(new_track) # Adds it, linked to its Artist/Album rows
+        db.session.flush() # Assigns the id for the event
+        refresh_track(new_track) # Into the smart playlists it matches
+        change_broker.publish(current_user_id, 'track.created', track_id=new_track.id)
         db.session.commit()
         return jsonify(track_schema.dump(new_track)), 201
     except Exception as e:
@@ -55,7 +86,65 @@ def get_tracks():
     user_tracks = Track.query.filter_by(user_id=current_user_id).order_by(Track.artist, Track.album, Track.track_number, Track.title).all()
     return jsonify(tracks_schema.dump(user_tracks)), 200
 
+@bp.route('/duplicates', methods=['GET'])
+@priority('bulk')
+@jwt_required()
+def get_duplicate_tracks():
+    # Clusters of tracks with the same manifest URL or title/artist/album, oldest first
+    current_user_id = int(get_jwt_identity())
+    clusters = duplicate_clusters(current_user_id)
+    tracks = {track.id: track for track in Track.query.filter(
+        Track.id.in_([track_id for cluster in clusters for track_id in cluster['track_ids']])
+    )} if clusters else {}
+    return jsonify([tracks_schema.dump([tracks[track_id] for track_id in cluster['track_ids']])
+                    for cluster in clusters]), 200
+
+@bp.route('/broken', methods=['GET'])
+@jwt_required()
+def get_broken_tracks():
+    # Results of the last `flask check-manifests` run, see app/services/health_check.py
+    current_user_id = int(get_jwt_identity())
+    broken = Track.query.join(Track.health).options(contains_eager(Track.health)).filter(
+        Track.user_id == current_user_id, ManifestHealth.status == 'broken'
+    ).order_by(Track.artist, Track.album, Track.track_number, Track.title).all()
+    return jsonify(broken_tracks_schema.dump(broken)), 200
+
+@bp.route('/trash', methods=['GET'])
+@jwt_required()
+def get_trashed_tracks():
+    current_user_id = int(get_jwt_identity())
+    trashed = Track.query.execution_options(include_deleted=True).filter(
+        Track.user_id == current_user_id, Track.deleted_at.isnot(None)
+    ).order_by(Track.deleted_at.desc()).all()
+    return jsonify(tracks_schema.dump(trashed)), 200
+
+@bp.route('/<int:track_id>/restore', methods=['POST'])
+@jwt_required()
+@idempotent
+def restore_track(track_id):
+    current_user_id = int(get_jwt_identity())
+    track = Track.query.execution_options(include_deleted=True).filter(
+        Track.id == track_id, Track.user_id == current_user_id, Track.deleted_at.isnot(None)
+    ).first()
+    if not track:
+        return jsonify({"message": "Track not found in trash"}), 404
+
+    try:
+        track.deleted_at = None
+        sync_track(track) # Back into its artist/album
+        refresh_track(track)
+        if _in_playlists(track.id):
+            mark_stale(current_user_id)
+            bump_playlists_containing(track.id) # It reappears in them
+        change_broker.publish(current_user_id, 'track.restored', track_id=track.id)
+        db.session.commit()
+        return jsonify(track_schema.dump(track)), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not restore track", "error": str(e)}), 500
+
 @bp.route('/<int:track_id>', methods=['GET'])
+@priority('playback')
 @jwt_required()
 def get_track(track_id):
     current_user_id = int(get_jwt_identity())
@@ -64,8 +153,55 @@ def get_track(track_id):
         return jsonify({"message": "Track not found or access denied"}), 404
     return jsonify(track_schema.dump(track)), 200
 
+@bp.route('/<int:track_id>/manifest', methods=['GET'])
+@priority('playback')
+@jwt_required()
+def get_track_manifest(track_id):
+    # Blocking proxy of the user-supplied manifest. Under ASGI (asgi.py) this
+    # path is served by the async version in app/aio/routes.py instead.
+    current_user_id = int(get_jwt_identity())
+    try:
+        profile = variant_filter.profile(manifest_profile_schema.load(request.args)) # e.g. ?max_height=720
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+    track = Track.query.filter_by(id=track_id, user_id=current_user_id).first()
+    if not track:
+        return jsonify({"message": "Track not found or access denied"}), 404
+
+    try:
+        body = fetch_manifest(
+            track.manifest_url,
+            timeout=current_app.config.get('MANIFEST_FETCH_TIMEOUT', 10),
+            max_bytes=current_app.config.get('MANIFEST_MAX_BYTES', 5 * 1024 * 1024)
+        )
+        body = variant_filter.apply(body, track.manifest_type, profile)
+        body = segment_cache.rewrite(body, track.manifest_type, track.manifest_url) # When the segment proxy is on
+    except ManifestFetchError as e:
+        return jsonify({"message": "Could not fetch manifest", "error": str(e)}), 502
+    return Response(body, mimetype=MEDIA_TYPES[track.manifest_type])
+
+@bp.route('/<int:track_id>/similar', methods=['GET'])
+@jwt_required()
+def get_similar_tracks(track_id):
+    # Served from track_neighbours, built offline by `flask build-recommendations`
+    current_user_id = int(get_jwt_identity())
+    track_exists = db.session.query(Track.id).filter_by(id=track_id, user_id=current_user_id).first() is not None
+    if not track_exists:
+        return jsonify({"message": "Track not found or access denied"}), 404
+
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    neighbours = db.session.query(Track, TrackNeighbour.score).join(
+        TrackNeighbour, TrackNeighbour.neighbour_id == Track.id
+    ).filter(TrackNeighbour.track_id == track_id).order_by(
+        TrackNeighbour.score.desc(), Track.id
+    ).limit(limit).all()
+    return jsonify([
+        dict(track_schema.dump(track), score=round(score, 4)) for track, score in neighbours
+    ]), 200
+
 @bp.route('/<int:track_id>', methods=['PUT'])
 @jwt_required()
+@idempotent
 def update_track(track_id):
     current_user_id = int(get_jwt_identity())
     track = Track.query.filter_by(id=track_id, user_id=current_user_id).first()
@@ -85,8 +221,15 @@ def update_track(track_id):
     # Update fields if they are provided in the validated data
     for key, value in data.items():
         setattr(track, key, value)
+    if {'title', 'artist', 'album'} & set(data):
+        fingerprint(track)
 
     try:
+        if 'artist' in data or 'album' in data:
+            sync_track(track)
+        refresh_track(track) # It may now match different smart playlists
+        bump_playlists_containing(track.id) # Their cached payloads embed this track
+        change_broker.publish(current_user_id, 'track.updated', track_id=track.id, fields=sorted(data))
         db.session.commit()
         return jsonify(track_schema.dump(track)), 200
     except Exception as e:
@@ -96,6 +239,7 @@ def update_track(track_id):
 
 @bp.route('/<int:track_id>', methods=['DELETE'])
 @jwt_required()
+@idempotent
 def delete_track(track_id):
     current_user_id = int(get_jwt_identity())
     track = Track.query.filter_by(id=track_id, user_id=current_user_id).first()
@@ -103,13 +247,51 @@ def delete_track(track_id):
         return jsonify({"message": "Track not found or access denied"}), 404
 
     try:
-        # Note: Cascading delete should handle removal from playlists if configured correctly
-        # Or, you might need to manually remove from playlist_tracks association table first
-        # depending on cascade settings and DB constraints. SQLAlchemy cascade should handle this.
-        db.session.delete(track)
+        # Soft delete: the track moves to the trash and disappears from every
+        # query (see app/models/soft_delete.py) until restored, or hard-deleted
+        # by `flask purge-trash` after TRASH_RETENTION_DAYS
+        track.deleted_at = datetime.utcnow()
+        refresh_track(track) # Out of smart playlists, back in when restored
+        if _in_playlists(track.id):
+            mark_stale(current_user_id) # Its playlists' co-occurrence changed
+            bump_playlists_containing(track.id) # ...and their contents
+        release_track(track) # Drops now-empty albums/artists
+        change_broker.publish(current_user_id, 'track.deleted', track_id=track.id)
         db.session.commit()
-        return jsonify({"message": "Track deleted successfully"}), 200
+        return jsonify({"message": "Track moved to trash"}), 200
     except Exception as e:
         db.session.rollback()
         # Check for specific integrity errors if needed (e.g., foreign key constraints if cascade fails)
         return jsonify({"message": "Could not delete track", "error": str(e)}), 500
+
+
+@bp.route('/<int:track_id>/merge', methods=['POST'])
+@priority('bulk')
+@jwt_required()
+@idempotent
+def merge_duplicate_tracks(track_id):
+    # Keeps this track; the duplicates' playlist entries, plays and stats move onto it
+    current_user_id = int(get_jwt_identity())
+    track = Track.query.filter_by(id=track_id, user_id=current_user_id).first()
+    if not track:
+        return jsonify({"message": "Track not found or access denied"}), 404
+
+    try:
+        data = track_merge_schema.load(request.get_json() or {})
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+    duplicate_ids = set(data['duplicate_ids']) - {track_id}
+    found = db.session.scalars(db.select(Track.id).where(Track.id.in_(duplicate_ids), Track.user_id == current_user_id)).all()
+    if len(found) != len(duplicate_ids):
+        return jsonify({"message": "Duplicate tracks not found or access denied",
+                        "missing": sorted(duplicate_ids - set(found))}), 404
+
+    try:
+        playlists = merge_tracks(track, sorted(duplicate_ids))
+        change_broker.publish(current_user_id, 'track.updated', track_id=track.id, fields=[])
+        db.session.commit()
+        return jsonify({"message": "Tracks merged", "merged": len(duplicate_ids), "playlists": playlists,
+                        "track": track_schema.dump(track)}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Could not merge tracks", "error": str(e)}), 500
@@ -1,3 +1,7 @@
 from .user import UserSchema
-from .track import TrackSchema, TrackLoadSchema, TrackUpdateSchema
-from .playlist import PlaylistSchema, PlaylistTrackSchema, PlaylistCreateSchema, PlaylistUpdateSchema, PlaylistTrackOrderSchema
+from .track import TrackSchema, TrackLoadSchema, TrackUpdateSchema, TrackMergeSchema, ManifestProfileSchema, ManifestHealthSchema, BrokenTrackSchema, ArtistSchema, AlbumSchema
+from .playlist import PlaylistSchema, PlaylistTrackSchema, PlaylistCreateSchema, PlaylistUpdateSchema, PlaylistTrackOrderSchema, PlaylistMemberSchema, SmartRulesSchema
+from .queue import QueueArgsSchema
+from .play import PlayEventSchema, PlayEventBatchSchema
+from .stats import StatsArgsSchema, STATS_PERIODS
+from .profiler import ProfileRuleSchema
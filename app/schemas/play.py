@@ -0,0 +1,12 @@
+from app.extensions import ma
+from marshmallow import fields, validate
+
+class PlayEventSchema(ma.Schema):
+    track_id = fields.Int(required=True)
+    played_at = fields.DateTime() # When playback started; defaults to receipt time
+    ms_played = fields.Int(validate=validate.Range(min=0))
+    source = fields.Str(validate=validate.Length(max=20))
+
+# Batched form: {"events": [...]}
+class PlayEventBatchSchema(ma.Schema):
+    events = fields.List(fields.Nested(PlayEventSchema), required=True, validate=validate.Length(min=1, max=500))
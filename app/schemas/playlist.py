@@ -1,7 +1,7 @@
 from app.extensions import ma
-from app.models import Playlist, Track
+from app.models import Playlist, PlaylistMember, Track
 from .track import TrackSchema
-from marshmallow import fields
+from marshmallow import ValidationError, fields, validate, validates_schema
 
 class PlaylistSchema(ma.SQLAlchemyAutoSchema):
     # Nest tracks within the playlist schema for detailed view
@@ -12,16 +12,69 @@ class PlaylistSchema(ma.SQLAlchemyAutoSchema):
         model = Playlist
         load_instance = True
         include_fk = True # Include user_id
+        exclude = ("share_token",) # Only shown to the owner, by POST /<id>/share
+
+# Smart playlist rules, compiled to SQL by app/services/smart_playlists.py:
+# track field -> its kind, and the operators each kind supports
+SMART_RULE_FIELDS = {
+    'title': 'text', 'artist': 'text', 'album': 'text',
+    'duration_ms': 'number', 'track_number': 'number',
+    'added_at': 'date',
+    'manifest_type': 'choice',
+}
+SMART_RULE_OPERATORS = {
+    'text': ('eq', 'ne', 'contains', 'starts_with'),
+    'number': ('eq', 'ne', 'lt', 'lte', 'gt', 'gte'),
+    'date': ('in_last_days', 'before', 'after'),
+    'choice': ('eq', 'ne'),
+}
+
+# One condition, e.g. {"field": "duration_ms", "op": "lt", "value": 180000}
+class SmartRuleSchema(ma.Schema):
+    field = fields.Str(required=True, validate=validate.OneOf(SMART_RULE_FIELDS))
+    op = fields.Str(required=True)
+    value = fields.Raw(required=True)
+
+    @validates_schema
+    def validate_condition(self, data, **kwargs):
+        kind = SMART_RULE_FIELDS[data['field']]
+        if data['op'] not in SMART_RULE_OPERATORS[kind]:
+            raise ValidationError(f"Must be one of: {', '.join(SMART_RULE_OPERATORS[kind])}.", 'op')
+        value = data['value']
+        if kind == 'number' or data['op'] == 'in_last_days':
+            valid = isinstance(value, int) and not isinstance(value, bool) and value >= 0
+        elif kind == 'date':
+            valid = isinstance(value, str) and _is_datetime(value)
+        elif kind == 'choice':
+            valid = value in ('HLS', 'DASH')
+        else:
+            valid = isinstance(value, str)
+        if not valid:
+            raise ValidationError(f"Not a valid value for {data['field']} {data['op']}.", 'value')
+
+def _is_datetime(value):
+    try:
+        fields.DateTime().deserialize(value)
+    except ValidationError:
+        return False
+    return True
+
+# A smart playlist's rules: its tracks are the owner's tracks matching all (or any) of them
+class SmartRulesSchema(ma.Schema):
+    match = fields.Str(load_default='all', validate=validate.OneOf(('all', 'any')))
+    conditions = fields.List(fields.Nested(SmartRuleSchema), required=True, validate=validate.Length(min=1, max=20))
 
 # Schema for creating a playlist (only needs name, maybe description)
 class PlaylistCreateSchema(ma.Schema):
     name = fields.Str(required=True)
     description = fields.Str()
+    rules = fields.Nested(SmartRulesSchema) # Makes it a smart playlist
 
 # Schema for updating playlist metadata (name, description)
 class PlaylistUpdateSchema(ma.Schema):
     name = fields.Str()
     description = fields.Str()
+    rules = fields.Nested(SmartRulesSchema, allow_none=True) # None turns a smart playlist back into a normal one
 
 # Schema for adding/removing tracks (needs track ID)
 class PlaylistTrackSchema(ma.Schema):
@@ -32,3 +85,12 @@ class PlaylistTrackSchema(ma.Schema):
 class PlaylistTrackOrderSchema(ma.Schema):
     # Expects a list of track IDs in the desired order
     track_ids = fields.List(fields.Int(), required=True)
+
+# Schema for sharing a playlist with another user
+class PlaylistMemberSchema(ma.SQLAlchemyAutoSchema):
+    role = fields.Str(required=True, validate=validate.OneOf(PlaylistMember.ROLES))
+
+    class Meta:
+        model = PlaylistMember
+        include_fk = True
+        dump_only = ("playlist_id", "user_id", "created_at")
@@ -0,0 +1,10 @@
+from app.extensions import ma
+from marshmallow import fields, validate
+
+# Body of POST /api/profiler/rules
+class ProfileRuleSchema(ma.Schema):
+    endpoint = fields.Str(load_default=None) # e.g. "tracks.get_track"; omit for every route
+    sample_rate = fields.Float(load_default=1.0, validate=validate.Range(min=0, max=1, min_inclusive=False))
+    max_requests = fields.Int(load_default=10, validate=validate.Range(min=1, max=1000))
+    memory = fields.Bool(load_default=False) # Also record tracemalloc allocation diffs
+    duration = fields.Int(load_default=600, validate=validate.Range(min=1, max=86400)) # Seconds until the rule lapses
@@ -0,0 +1,13 @@
+from app.extensions import ma
+from marshmallow import fields, validate
+
+# Orderings implemented by app/services/queue.py
+QUEUE_MODES = ('shuffle', 'artist_spread', 'album')
+
+# Query string arguments for GET /api/queue
+class QueueArgsSchema(ma.Schema):
+    playlist_id = fields.Int() # Omit to queue the whole library
+    mode = fields.Str(load_default='shuffle', validate=validate.OneOf(QUEUE_MODES))
+    seed = fields.Int(validate=validate.Range(min=0, max=2**32 - 1)) # Pass back to resume the same queue
+    offset = fields.Int(load_default=0, validate=validate.Range(min=0))
+    limit = fields.Int(load_default=100, validate=validate.Range(min=1, max=500))
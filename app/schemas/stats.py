@@ -0,0 +1,10 @@
+from app.extensions import ma
+from marshmallow import fields, validate
+
+# Rolling windows served by the stats endpoints, in days
+STATS_PERIODS = {'day': 1, 'week': 7, 'month': 30, 'year': 365, 'all': None}
+
+# Query string arguments for GET /api/stats/*
+class StatsArgsSchema(ma.Schema):
+    period = fields.Str(load_default='week', validate=validate.OneOf(STATS_PERIODS))
+    limit = fields.Int(load_default=10, validate=validate.Range(min=1, max=100))
@@ -1,6 +1,7 @@
 from app.extensions import ma
-from app.models import Track, ManifestType
-from marshmallow import fields
+from app.models import Track, ManifestType, ManifestHealth, Artist, Album
+from urllib.parse import urlsplit
+from marshmallow import ValidationError, fields, post_load, validate
 
 class TrackSchema(ma.SQLAlchemyAutoSchema):
     # Convert Enum to string for JSON serialization
@@ -10,12 +11,22 @@ class TrackSchema(ma.SQLAlchemyAutoSchema):
         model = Track
         # load_instance = True
         include_fk = True # Include user_id if needed, or handle via context
+        exclude = ("url_fingerprint", "metadata_fingerprint") # Internal, for duplicate detection
+
+def _http_url(value):
+    # Manifest URLs are fetched server-side (proxy, health checks), so nothing but http(s)
+    parts = urlsplit(value)
+    if parts.scheme.lower() not in ('http', 'https') or not parts.hostname:
+        raise ValidationError("Must be an http or https URL.")
 
 # You might want separate schemas for input (loading) vs output (dumping)
 class TrackLoadSchema(TrackSchema):
+     manifest_url = fields.Str(required=True, validate=[validate.Length(max=1024), _http_url])
+
      class Meta(TrackSchema.Meta):
         # Fields required when *adding* a track via API
-        exclude = ("id", "added_at", "user_id") # user_id will be set from logged-in user
+        exclude = ("id", "added_at", "user_id", "artist_id", "album_id", "deleted_at", # user_id will be set from logged-in user
+                   "url_fingerprint", "metadata_fingerprint")
         # Add required=True to essential fields if not nullable in model
         # title = fields.Str(required=True)
         # manifest_url = fields.Str(required=True)
@@ -31,3 +42,39 @@ class TrackUpdateSchema(ma.Schema):
      # Probably don't allow changing manifest_url or type easily? Or maybe yes?
      # manifest_url = fields.Str()
      # manifest_type = fields.Enum(enum=Track.ManifestType, by_value=True)
+
+# Body of POST /api/tracks/<id>/merge
+class TrackMergeSchema(ma.Schema):
+    duplicate_ids = fields.List(fields.Int(), required=True, validate=validate.Length(min=1, max=500))
+
+# Query string of the manifest routes: what the client can play, see app/services/variants.py
+class ManifestProfileSchema(ma.Schema):
+    max_bandwidth = fields.Int(validate=validate.Range(min=1)) # Bits per second the client can sustain
+    max_width = fields.Int(validate=validate.Range(min=1))
+    max_height = fields.Int(validate=validate.Range(min=1))
+    codecs = fields.Str(validate=validate.Length(max=500)) # Comma separated, e.g. "avc1,mp4a.40.2,opus"
+
+    @post_load
+    def split_codecs(self, data, **kwargs):
+        if 'codecs' in data:
+            data['codecs'] = [codec.strip().lower() for codec in data['codecs'].split(',') if codec.strip()]
+        return data
+
+class ManifestHealthSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = ManifestHealth
+        exclude = ("etag", "last_modified") # Probe validators, not useful to clients
+
+class BrokenTrackSchema(TrackSchema):
+    health = fields.Nested(ManifestHealthSchema, dump_only=True)
+
+class ArtistSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = Artist
+        exclude = ("key",) # Internal grouping key
+
+class AlbumSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = Album
+        include_fk = True # artist_id
+        exclude = ("key",)
@@ -0,0 +1,14 @@
+from .cache import LocalCache, RedisCache, make_cache
+from .identity import identity_cache, CurrentUser, UserIdentityCache
+from .revocation import revocation_list, BloomFilter, RevocationList
+from .manifests import MEDIA_TYPES, ManifestFetchError, UnsafeURLError, fetch_manifest, upstream_guard
+from .plays import play_buffer, PlayEventBuffer, PlayBufferFull
+from .events import change_broker, ChangeBroker, LocalChangeBackend, RedisChangeBackend, make_change_backend
+from .sharing import playlist_cache, PlaylistReadCache, resolve_access
+from .compression import compressor, ResponseCompressor
+from .shards import shard_map, ShardMap, ShardMoveError, move_user
+from .playback import playback_urls, PlaybackSigner, PlaybackTokenError
+from .segments import segment_cache, SegmentCache, rewrite_manifest
+from .variants import variant_filter, VariantFilter
+from .limiter import concurrency_limiter, ConcurrencyLimiter, priority
+from .profiler import request_profiler, RequestProfiler
@@ -0,0 +1,78 @@
+from datetime import datetime
+from sqlalchemy import delete, select, tuple_
+from app.extensions import db
+from app.models import (
+    User, Track, Playlist, PlaylistMember, Artist, Album, PlayEvent, TrackPlayRollup, ArtistPlayRollup,
+    RecommendationRefresh, playlist_tracks
+)
+from .shards import shard_map
+
+# Tables holding a user's data, in deletion order. Rows that reference
+# these (members of their playlists, manifest_health, track_neighbours)
+# go with them through ON DELETE CASCADE, as do revoked_tokens and
+# user_shards in the main database. play_events and the rollups have no
+# foreign keys, and on a shard nothing references users, so those are
+# listed here. So are the entries of their playlists, which would
+# otherwise all cascade from one chunk of playlists.
+USER_TABLES = (
+    PlayEvent, TrackPlayRollup, ArtistPlayRollup, RecommendationRefresh, PlaylistMember, playlist_tracks, Playlist,
+    Track, Album, Artist
+)
+
+
+def request_deletion(user):
+    """Flag an account for purge_accounts(). Joins the caller's transaction.
+
+    The user can't log in or use existing tokens from here on, see
+    load_current_user in app/services/identity.py.
+    """
+    user.deletion_requested_at = datetime.utcnow()
+
+
+def _delete_chunk(model, user_id, chunk_size):
+    table = getattr(model, '__table__', model)
+    if table is playlist_tracks:
+        owned = table.c.playlist_id.in_(select(Playlist.__table__.c.id).where(Playlist.__table__.c.user_id == user_id))
+    else:
+        owned = table.c.user_id == user_id
+    pk = list(table.primary_key.columns)
+    chunk = select(*pk).where(owned).limit(chunk_size)
+    target = pk[0].in_(chunk) if len(pk) == 1 else tuple_(*pk).in_(chunk)
+    return db.session.execute(delete(table).where(target).execution_options(synchronize_session=False)).rowcount
+
+
+def purge_account(user_id, chunk_size=1000):
+    """Delete a user and everything they own, `chunk_size` rows per transaction.
+
+    Each chunk commits on its own, so no single transaction holds locks on
+    (or a worker spends minutes on) a large library. Safe to re-run after
+    an interruption. Returns the number of rows deleted, not counting rows
+    removed by ON DELETE CASCADE.
+    """
+    shard = shard_map.shard_for(user_id)
+    deleted = 0
+    for model in USER_TABLES:
+        # Memberships are stored with the playlist, on its owner's shard
+        for name in shard_map.names if model is PlaylistMember else (shard,):
+            with shard_map.use(name):
+                while True:
+                    count = _delete_chunk(model, user_id, chunk_size)
+                    db.session.commit()
+                    deleted += count
+                    if count < chunk_size:
+                        break
+    deleted += db.session.execute(delete(User).where(User.id == user_id)).rowcount
+    db.session.commit()
+    return deleted
+
+
+def purge_accounts(chunk_size=1000, limit=None):
+    """Purge every account flagged by request_deletion(). Returns (accounts, rows)."""
+    pending = select(User.id).where(User.deletion_requested_at.isnot(None)).order_by(User.deletion_requested_at)
+    if limit is not None:
+        pending = pending.limit(limit)
+    user_ids = db.session.scalars(pending).all()
+    rows = 0
+    for user_id in user_ids:
+        rows += purge_account(user_id, chunk_size=chunk_size)
+    return len(user_ids), rows
@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with a per-entry TTL.
+
+    Good enough for a single worker; use RedisCache when several workers
+    need to see the same entries (and the same invalidations).
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """Shared cache backend for multi-worker deployments.
+
+    Values must be JSON serialisable. Requires the optional `redis` package.
+    """
+
+    def __init__(self, url, ttl=300, prefix=''):
+        import redis  # Optional dependency, only needed for this backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + str(key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.setex(self.prefix + str(key), self.ttl if ttl is None else ttl, json.dumps(value))
+
+    def delete(self, key):
+        self._client.delete(self.prefix + str(key))
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self.prefix + '*'):
+            self._client.delete(key)
+
+
+def make_cache(backend='local', url=None, maxsize=10000, ttl=300, prefix=''):
+    """Build a cache backend from config values ('local' or 'redis')."""
+    if backend == 'redis':
+        return RedisCache(url, ttl=ttl, prefix=prefix)
+    if backend == 'local':
+        return LocalCache(maxsize=maxsize, ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -0,0 +1,118 @@
+import gzip
+import threading
+from flask import g, make_response, request
+from .cache import LocalCache
+
+
+def _load_codecs(level):
+    """encoding -> compress(bytes) for every codec whose library is installed, best first."""
+    codecs = {}
+    try:
+        import zstandard  # Optional dependency
+        codecs['zstd'] = zstandard.ZstdCompressor(level=min(level, 19)).compress
+    except ImportError:
+        pass
+    try:
+        import brotli  # Optional dependency
+        codecs['br'] = lambda data: brotli.compress(data, quality=min(level, 11))
+    except ImportError:
+        pass
+    codecs['gzip'] = lambda data: gzip.compress(data, compresslevel=min(level, 9), mtime=0)
+    return codecs
+
+
+class ResponseCompressor:
+    """Negotiated response compression (zstd, br, gzip), applied after every request.
+
+    Only bodies of COMPRESS_MIMETYPES of at least COMPRESS_MIN_SIZE bytes
+    are compressed; streamed responses (SSE, file passthrough) never are.
+    zstd and br are used when the `zstandard`/`brotli` packages are
+    installed and the client accepts them, gzip otherwise.
+
+    Routes whose body is fully determined by a resource version can also
+    opt in to a cache of finished bodies with `cached_response(key)`: a
+    repeat fetch is then served without serialising or compressing again.
+    """
+
+    def __init__(self, app=None):
+        self.min_size = 500
+        self.mimetypes = {'application/json'}
+        self.codecs = _load_codecs(6)
+        self.cache = LocalCache(maxsize=1000)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', ('application/json',)))
+        self.codecs = _load_codecs(app.config.get('COMPRESS_LEVEL', 6))
+        self.cache = LocalCache(maxsize=app.config.get('COMPRESS_CACHE_MAXSIZE', 1000),
+                                ttl=app.config.get('COMPRESS_CACHE_TTL', 300))
+        app.after_request(self.after_request)
+
+    def negotiate(self):
+        """The encoding to use for the current request, or None to send it as is."""
+        return request.accept_encodings.best_match(list(self.codecs))
+
+    def cached_response(self, key):
+        """A prebuilt response for `key` (which must change whenever the body would), or None.
+
+        On a miss the response the route goes on to build is stored under
+        `key` once compressed, so call this before doing the work.
+        """
+        encoding = self.negotiate() or 'identity'
+        g.compression_cache_key = key
+        entry = self.cache.get((key, encoding))
+        if entry is None:
+            return None
+        body, mimetype = entry
+        response = make_response(body)
+        response.mimetype = mimetype
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        g.compression_cache_hit = True
+        self._count(cache_hits=1)
+        return response
+
+    def after_request(self, response):
+        key = g.pop('compression_cache_key', None)
+        if (response.direct_passthrough or response.is_streamed or response.mimetype not in self.mimetypes
+                or g.pop('compression_cache_hit', False)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = None
+        if (200 <= response.status_code < 300 and response.status_code not in (204, 206)
+                and 'Content-Encoding' not in response.headers):
+            encoding = self.negotiate()
+        data = response.get_data()
+        if encoding is not None and len(data) >= self.min_size:
+            compressed = self.codecs[encoding](data)
+            response.set_data(compressed)
+            response.headers['Content-Encoding'] = encoding
+            self._count(**{'responses': 1, 'bytes_in': len(data), 'bytes_out': len(compressed),
+                           'bytes_saved': len(data) - len(compressed), f'responses_{encoding}': 1})
+        else:
+            encoding = None
+        if key is not None and response.status_code == 200:
+            self.cache.set((key, encoding or 'identity'), (response.get_data(), response.mimetype))
+        return response
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._stats[name] = self._stats.get(name, 0) + amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'bytes_saved': 0, 'cache_hits': 0}
+
+
+compressor = ResponseCompressor()
@@ -0,0 +1,43 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+
+# Readers that follow a table by id (id > last seen) miss rows whose insert
+# took its id before a newer one but committed after the reader went past
+# it. Those ids are kept as gaps, [first_id, last_id, seen_at] lists
+# (seen_at an ISO timestamp, so they store as JSON), and read again until
+# GAP_TIMEOUT: longer than any such transaction stays open, so by then a
+# missing id was rolled back.
+GAP_TIMEOUT = timedelta(minutes=10)
+
+
+def open_gaps(gaps, now, timeout=GAP_TIMEOUT):
+    """The gaps younger than `timeout`."""
+    return [gap for gap in gaps or [] if datetime.fromisoformat(gap[2]) > now - timeout]
+
+
+def in_gaps(column, gaps):
+    """SQL condition matching `column` ids inside any of `gaps`."""
+    return or_(*(column.between(first, last) for first, last, _ in gaps))
+
+
+def fill_gaps(gaps, ids):
+    """`gaps` split around the (sorted) ids that turned up in them."""
+    result = []
+    for first, last, seen_at in gaps:
+        for row_id in ids[bisect_left(ids, first):bisect_right(ids, last)]:
+            if row_id > first:
+                result.append([first, row_id - 1, seen_at])
+            first = row_id + 1
+        if first <= last:
+            result.append([first, last, seen_at])
+    return result
+
+
+def advance(last_id, gaps, ids, now):
+    """Move past the (sorted) new `ids`, appending any skipped over to `gaps`. Returns the new last id."""
+    for row_id in ids:
+        if last_id and row_id > last_id + 1: # Not before the first id ever seen
+            gaps.append([last_id + 1, row_id - 1, now.isoformat()])
+        last_id = row_id
+    return last_id
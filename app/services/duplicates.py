@@ -0,0 +1,166 @@
+import hashlib
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from sqlalchemy import and_, delete, exists, func, or_, select, update
+from app.extensions import db
+from app.models import PlayEvent, Playlist, Track, playlist_tracks
+from .events import change_broker
+from .library import normalize_key, release_track
+from .recommendations import mark_stale
+from .rollups import merge_track_rollups
+from .sharing import audience
+from .smart_playlists import refresh_track
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonical_url(url):
+    """manifest_url as compared for duplicates.
+
+    Scheme and host are case-insensitive, default ports, credentials and
+    fragments don't select a different resource, and query parameters are
+    compared in sorted order without utm_* tracking parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith('utm_'))
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def fingerprint(track):
+    """Set a new or edited track's url_fingerprint and metadata_fingerprint."""
+    track.url_fingerprint = _digest(canonical_url(track.manifest_url))
+    title, artist = normalize_key(track.title), normalize_key(track.artist)
+    # A title alone ("Intro", "Track 1") says too little to call two tracks the same
+    track.metadata_fingerprint = (
+        _digest('\x1f'.join((title, artist, normalize_key(track.album) or ''))) if title and artist else None
+    )
+
+
+def find_duplicate(track):
+    """Id of another live track in the owner's library with the same URL or metadata, or None.
+
+    Needs fingerprint(track) first. One lookup on the fingerprint indexes,
+    whatever the library size.
+    """
+    same = Track.url_fingerprint == track.url_fingerprint
+    if track.metadata_fingerprint is not None:
+        same = or_(same, Track.metadata_fingerprint == track.metadata_fingerprint)
+    stmt = select(Track.id).where(Track.user_id == track.user_id, same)
+    if track.id is not None:
+        stmt = stmt.where(Track.id != track.id)
+    return db.session.scalar(stmt.limit(1))
+
+
+def duplicate_clusters(user_id=None):
+    """Groups of live tracks that are duplicates of each other, for one user or everyone.
+
+    Tracks sharing either fingerprint end up in one cluster, also
+    transitively (A has B's URL, B has C's metadata). Returns
+    [{'user_id', 'track_ids'}], track ids oldest first.
+    """
+    parent = {}
+
+    def find(track_id):
+        while parent.setdefault(track_id, track_id) != track_id:
+            parent[track_id] = parent[parent[track_id]]
+            track_id = parent[track_id]
+        return track_id
+
+    owners = {}
+    for column in (Track.url_fingerprint, Track.metadata_fingerprint):
+        shared = select(Track.user_id, column.label('fingerprint')).where(column.isnot(None))
+        if user_id is not None:
+            shared = shared.where(Track.user_id == user_id)
+        shared = shared.group_by(Track.user_id, column).having(func.count() > 1).subquery()
+        rows = db.session.execute(
+            select(Track.user_id, column, Track.id)
+            .join(shared, and_(shared.c.user_id == Track.user_id, shared.c.fingerprint == column))
+            .order_by(Track.user_id, column, Track.id)
+        )
+        first_of = {}
+        for owner_id, value, track_id in rows:
+            owners[track_id] = owner_id
+            first = first_of.setdefault((owner_id, value), track_id)
+            parent[find(track_id)] = find(first)
+
+    clusters = {}
+    for track_id in sorted(owners):
+        clusters.setdefault(find(track_id), []).append(track_id)
+    return [{'user_id': owners[track_ids[0]], 'track_ids': track_ids} for track_ids in clusters.values()]
+
+
+def merge_tracks(keep, duplicate_ids):
+    """Fold duplicates into the track `keep`, then move them to the trash. Joins the caller's transaction.
+
+    Playlist entries are rewritten in bulk: a playlist that already has
+    `keep` (or more than one of the duplicates) keeps its earliest entry.
+    Play history and track rollups move over too. `duplicate_ids` must be
+    other live tracks of the same user. Returns the number of playlists changed.
+    """
+    duplicate_ids = [track_id for track_id in duplicate_ids if track_id != keep.id]
+    changed = db.session.scalars(
+        select(playlist_tracks.c.playlist_id).distinct().where(playlist_tracks.c.track_id.in_(duplicate_ids))
+    ).all()
+
+    if changed:
+        # One entry per playlist: `keep`'s if it's there, else the first of the duplicates
+        kept, other = playlist_tracks.c, playlist_tracks.alias('other').c
+        position = lambda c: func.coalesce(c.track_order, -1)
+        db.session.execute(delete(playlist_tracks).where(kept.track_id.in_(duplicate_ids), exists().where(
+            other.playlist_id == kept.playlist_id,
+            or_(
+                other.track_id == keep.id,
+                and_(other.track_id.in_(duplicate_ids), or_(
+                    position(other) < position(kept),
+                    and_(position(other) == position(kept), other.track_id < kept.track_id),
+                )),
+            ),
+        )))
+        db.session.execute(update(playlist_tracks).where(kept.track_id.in_(duplicate_ids)).values(track_id=keep.id))
+
+    db.session.execute(update(PlayEvent).where(PlayEvent.track_id.in_(duplicate_ids)).values(track_id=keep.id)
+                       .execution_options(synchronize_session=False))
+    merge_track_rollups(duplicate_ids, keep.id)
+
+    now = datetime.utcnow()
+    for track in Track.query.filter(Track.id.in_(duplicate_ids)).all():
+        track.deleted_at = now
+        release_track(track)
+        change_broker.publish(keep.user_id, 'track.deleted', track_id=track.id)
+
+    if changed:
+        versions = db.session.execute(
+            update(Playlist).where(Playlist.id.in_(changed)).values(version=Playlist.version + 1)
+            .returning(Playlist.id, Playlist.version, Playlist.user_id).execution_options(synchronize_session=False)
+        ).all()
+        for playlist_id, version, owner_id in versions:
+            for user_id in audience(playlist_id, owner_id):
+                change_broker.publish(user_id, 'playlist.refreshed', playlist_id=playlist_id, version=version)
+        for owner_id in {owner_id for _, _, owner_id in versions}: # Editors' tracks are in others' playlists too
+            mark_stale(owner_id)
+    refresh_track(keep) # Smart playlists only hold it if it matches their rules
+    return len(changed)
+
+
+def backfill_fingerprints(batch_size=1000):
+    """Fingerprint tracks that predate duplicate detection, one batch per transaction. Returns how many."""
+    total = 0
+    while True:
+        tracks = Track.query.execution_options(include_deleted=True).filter(
+            Track.url_fingerprint.is_(None)
+        ).limit(batch_size).all()
+        if not tracks:
+            return total
+        for track in tracks:
+            fingerprint(track)
+        db.session.commit()
+        total += len(tracks)
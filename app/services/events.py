@@ -0,0 +1,259 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from sqlalchemy import event
+from app.extensions import db
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    id: str
+    type: str
+    data: dict
+
+    def encode(self):
+        """The event in text/event-stream framing."""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, separators=(',', ':'))}\n\n"
+
+
+class LocalChangeBackend:
+    """In-process event history and fan-out.
+
+    Keeps the last `history` events per user so reconnecting clients can
+    resume. Event ids are '<epoch>-<seq>' with a per-process epoch, so an id
+    from before a restart (or from another worker) is recognised as not
+    resumable rather than silently skipping events. Only correct with a
+    single worker; use RedisChangeBackend when there are several.
+    """
+
+    def __init__(self, history=500, max_users=10000):
+        self.history = history
+        self.max_users = max_users
+        self._epoch = uuid.uuid4().hex[:8]
+        self._users = OrderedDict() # user_id -> [last seq, deque of events]
+        self._cond = threading.Condition()
+
+    def _log(self, user_id):
+        log = self._users.get(user_id)
+        if log is None:
+            log = self._users[user_id] = [0, deque(maxlen=self.history)]
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return log
+
+    def _seq(self, event_id):
+        epoch, _, seq = (event_id or '').partition('-')
+        return int(seq) if epoch == self._epoch and seq.isdigit() else None
+
+    def publish(self, user_id, event_type, data):
+        with self._cond:
+            log = self._log(user_id)
+            log[0] += 1
+            change = ChangeEvent(f'{self._epoch}-{log[0]}', event_type, data)
+            log[1].append(change)
+            self._cond.notify_all()
+        return change.id
+
+    def head(self, user_id):
+        with self._cond:
+            return f'{self._epoch}-{self._log(user_id)[0]}'
+
+    def since(self, user_id, last_id):
+        """Events after last_id, or None if they can't all be replayed."""
+        seq = self._seq(last_id)
+        with self._cond:
+            last_seq, events = self._log(user_id)
+            if seq is None or seq > last_seq:
+                return None
+            if last_seq - seq > len(events):
+                return None # Some have already dropped out of the history
+            return list(events)[len(events) - (last_seq - seq):]
+
+    def wait(self, user_id, last_id, timeout):
+        """Block up to `timeout` seconds for events after last_id (a current id from head/since).
+
+        None if more than `history` events arrived meanwhile, so some can't be replayed.
+        """
+        seq = self._seq(last_id)
+        with self._cond:
+            self._cond.wait_for(lambda: self._log(user_id)[0] > seq, timeout)
+        return self.since(user_id, last_id)
+
+    def clear(self):
+        with self._cond:
+            self._users.clear()
+
+
+class RedisChangeBackend:
+    """Shared backend for multi-worker deployments, one Redis stream per user.
+
+    Stream entry ids double as SSE event ids, so a client can resume against
+    any worker. Requires the optional `redis` package.
+    """
+
+    def __init__(self, url, history=500, prefix='events:'):
+        import redis  # Optional dependency, only needed for this backend
+        self.history = history
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def _event(self, entry_id, fields):
+        return ChangeEvent(entry_id, fields['type'], json.loads(fields['data']))
+
+    def publish(self, user_id, event_type, data):
+        return self._client.xadd(self.prefix + str(user_id), {'type': event_type, 'data': json.dumps(data)},
+                                 maxlen=self.history, approximate=True)
+
+    def head(self, user_id):
+        entries = self._client.xrevrange(self.prefix + str(user_id), count=1)
+        return entries[0][0] if entries else '0-0'
+
+    def since(self, user_id, last_id):
+        key = self.prefix + str(user_id)
+        try:
+            known = last_id == '0-0' or self._client.xrange(key, last_id, last_id)
+        except Exception: # Not a stream id at all
+            return None
+        if not known:
+            return None # Trimmed away, or never ours
+        return [self._event(*entry) for entry in self._client.xrange(key, f'({last_id}', '+')]
+
+    def wait(self, user_id, last_id, timeout):
+        streams = self._client.xread({self.prefix + str(user_id): last_id}, block=max(1, int(timeout * 1000)))
+        return [self._event(*entry) for _, entries in streams for entry in entries]
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self.prefix + '*'):
+            self._client.delete(key)
+
+
+def make_change_backend(backend='local', url=None, history=500):
+    """Build a change event backend from config values ('local' or 'redis')."""
+    if backend == 'redis':
+        return RedisChangeBackend(url, history=history)
+    if backend == 'local':
+        return LocalChangeBackend(history=history)
+    raise ValueError(f"Unknown events backend: {backend}")
+
+
+class ChangeBroker:
+    """Publishes library/playlist change notifications to a user's open event streams.
+
+    Routes call `publish()` next to their writes; events are held on the
+    session and only handed to the backend once the transaction commits
+    (dropped on rollback), so clients never hear about changes that didn't
+    happen. Payloads are small (ids, new version, new order) so clients can
+    patch their copy instead of refetching the playlist.
+
+    Each open stream holds a worker thread, so at most `max_streams` are
+    open per process; `open_stream()` refuses the rest.
+    """
+
+    def __init__(self, keepalive=15, max_stream_seconds=300, max_streams=2):
+        self.keepalive = keepalive
+        self.max_stream_seconds = max_stream_seconds
+        self.max_streams = max_streams
+        self.backend = LocalChangeBackend()
+        self._streams = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.keepalive = app.config.get('EVENTS_KEEPALIVE', self.keepalive)
+        self.max_stream_seconds = app.config.get('EVENTS_MAX_STREAM_SECONDS', self.max_stream_seconds)
+        self.max_streams = app.config.get('EVENTS_MAX_STREAMS', self.max_streams)
+        self.backend = make_change_backend(
+            app.config.get('EVENTS_BACKEND', 'local'),
+            url=app.config.get('EVENTS_URL'),
+            history=app.config.get('EVENTS_HISTORY', 500),
+        )
+
+    def publish(self, user_id, event_type, **data):
+        """Queue an event for the user, sent when the current transaction commits."""
+        db.session.info.setdefault('change_events', []).append((user_id, event_type, data))
+
+    def _flush(self, session):
+        for user_id, event_type, data in session.info.pop('change_events', []):
+            self.backend.publish(user_id, event_type, data)
+
+    def open_stream(self, user_id, last_event_id=None):
+        """stream() holding one of the `max_streams` slots until the server closes it. None if all are taken."""
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return None
+            self._streams += 1
+        return _StreamSlot(self, self.stream(user_id, last_event_id))
+
+    def _release(self):
+        with self._lock:
+            self._streams -= 1
+
+    def stream(self, user_id, last_event_id=None):
+        """Yield text/event-stream chunks for the user until max_stream_seconds.
+
+        With a `last_event_id` it first replays what was missed; if that
+        isn't possible a `reset` event tells the client to refetch.
+        """
+        last_id = self.backend.head(user_id)
+        if last_event_id:
+            missed = self.backend.since(user_id, last_event_id)
+            if missed is None:
+                yield ChangeEvent(last_id, 'reset', {}).encode()
+            else:
+                for change in missed:
+                    yield change.encode()
+                    last_id = change.id
+        yield "retry: 3000\n\n"
+
+        deadline = time.monotonic() + self.max_stream_seconds
+        while (remaining := deadline - time.monotonic()) > 0:
+            events = self.backend.wait(user_id, last_id, min(self.keepalive, remaining))
+            if events is None:
+                # Fell behind by more than the history; the client refetches
+                # and the stream carries on from the newest event
+                last_id = self.backend.head(user_id)
+                yield ChangeEvent(last_id, 'reset', {}).encode()
+                continue
+            for change in events:
+                yield change.encode()
+                last_id = change.id
+            if not events:
+                yield ': keepalive\n\n' # Keeps proxies from closing an idle connection
+
+
+class _StreamSlot:
+    # Response body for a stream; WSGI servers call close() even on bodies
+    # that were never iterated, which a generator's finally wouldn't cover
+    def __init__(self, broker, chunks):
+        self.broker = broker
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            yield from self.chunks
+        finally:
+            self.close() # Ran out; the server may still call close() later
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.chunks.close()
+            self.broker._release()
+
+
+change_broker = ChangeBroker()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_committed(session):
+    change_broker._flush(session)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _drop_rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None: # Not for savepoints, the outer transaction can still commit
+        session.info.pop('change_events', None)
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import httpx
+from app.extensions import db
+from app.models import Track, ManifestHealth
+from .manifests import ManifestFetchError, upstream_guard
+
+
+class ManifestProber:
+    """Probes manifest URLs concurrently, with a per-host concurrency cap.
+
+    Stored ETag/Last-Modified validators are sent back as conditional
+    headers, so unchanged manifests cost the origin a 304.
+    """
+
+    def __init__(self, concurrency=50, per_host=4, timeout=10):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+
+    async def probe_all(self, targets):
+        """targets: iterable of (track_id, url, etag, last_modified) -> list of result dicts."""
+        limit = asyncio.Semaphore(self.concurrency)
+        hosts = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        limits = httpx.Limits(max_connections=self.concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, follow_redirects=True,
+                                     transport=upstream_guard.async_transport(limits=limits),
+                                     event_hooks={'request': [upstream_guard.ahook]}) as client:
+            async def probe(target):
+                host = urlsplit(target[1]).netloc
+                # Per host first: probes queued behind a slow origin mustn't hold global slots
+                async with hosts[host], limit:
+                    return await self._probe(client, *target)
+            return await asyncio.gather(*(probe(t) for t in targets))
+
+    async def _probe(self, client, track_id, url, etag, last_modified):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        result = {'track_id': track_id, 'etag': etag, 'last_modified': last_modified, 'error': None}
+        start = time.perf_counter()
+        try:
+            resp = await client.get(url, headers=headers)
+        except (httpx.HTTPError, ManifestFetchError, ValueError) as e: # ManifestFetchError: refused by upstream_guard
+            result.update(status='broken', http_status=None, error=(str(e) or type(e).__name__)[:500])
+        else:
+            result['http_status'] = resp.status_code
+            if resp.status_code < 400: # 304 means unchanged since the last good probe
+                result['status'] = 'ok'
+                if resp.status_code != 304:
+                    result['etag'] = resp.headers.get('ETag')
+                    result['last_modified'] = resp.headers.get('Last-Modified')
+            else:
+                result.update(status='broken', error=f"Upstream returned {resp.status_code}")
+        result['latency_ms'] = int((time.perf_counter() - start) * 1000)
+        return result
+
+
+def check_manifests(chunk_size=500, stale_after=None, prober=None):
+    """Scan the tracks table in id-ordered chunks and record probe results.
+
+    Tracks checked more recently than `stale_after` (a timedelta) are
+    skipped. Returns (checked, broken) counts.
+    """
+    prober = prober or ManifestProber()
+    cutoff = datetime.utcnow() - stale_after if stale_after else None
+    checked = broken = 0
+    last_id = 0
+    while True:
+        query = db.session.query(
+            Track.id, Track.manifest_url, ManifestHealth.etag, ManifestHealth.last_modified
+        ).outerjoin(ManifestHealth, ManifestHealth.track_id == Track.id).filter(Track.id > last_id)
+        if cutoff is not None:
+            query = query.filter((ManifestHealth.checked_at.is_(None)) | (ManifestHealth.checked_at < cutoff))
+        chunk = query.order_by(Track.id).limit(chunk_size).all()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        results = asyncio.run(prober.probe_all([tuple(row) for row in chunk]))
+
+        existing = {h.track_id: h for h in ManifestHealth.query.filter(
+            ManifestHealth.track_id.in_([r['track_id'] for r in results])
+        )}
+        now = datetime.utcnow()
+        for result in results:
+            health = existing.get(result['track_id'])
+            if health is None:
+                health = ManifestHealth(track_id=result['track_id'])
+                db.session.add(health)
+            for key, value in result.items():
+                setattr(health, key, value)
+            health.checked_at = now
+            broken += result['status'] == 'broken'
+        db.session.commit()
+        checked += len(results)
+    return checked, broken
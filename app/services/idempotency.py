@@ -0,0 +1,134 @@
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Response headers stored with the body and sent again on replay
+REPLAYED_HEADERS = ('ETag', 'Location', 'Cache-Control')
+
+
+def _scope():
+    try:
+        identity = get_jwt_identity() # Only set once @jwt_required() has run
+    except RuntimeError:
+        identity = None
+    return f'user:{identity}' if identity is not None else 'anonymous'
+
+
+def _fingerprint():
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.full_path.encode(), request.get_data(cache=True)):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _replay(record):
+    response = make_response(record.response_body, record.status_code)
+    if record.content_type:
+        response.content_type = record.content_type
+    response.headers.update(record.response_headers or {})
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(scope, key, fingerprint):
+    """Insert the in-progress row, or return (existing row, None) if another request owns the key."""
+    now = datetime.utcnow()
+    while True:
+        record = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+        if record is not None:
+            stale = record.status_code is None and record.created_at < now - current_app.config.get(
+                'IDEMPOTENCY_LOCK_TIMEOUT', timedelta(seconds=60))
+            if record.expires_at > now and not stale:
+                return record, None
+            # Expired, or its first request died mid-flight. Deleted by id so
+            # that two requests taking it over at once can't both succeed
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == record.id))
+            db.session.expunge(record)
+        claim = IdempotencyKey(
+            scope=scope, key=key, fingerprint=fingerprint, created_at=now,
+            expires_at=now + current_app.config.get('IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+        )
+        try:
+            db.session.add(claim)
+            db.session.commit() # Visible to concurrent duplicates before the view runs
+            return None, claim
+        except IntegrityError:
+            db.session.rollback() # A concurrent duplicate claimed it first, look again
+
+
+def idempotent(view):
+    """Make a mutating route safe to retry with an `Idempotency-Key` header.
+
+    The first request with a given key runs the view and its response
+    (status, body and REPLAYED_HEADERS) is stored for IDEMPOTENCY_KEY_TTL; retries with the same key and the same
+    method, path and body get that response replayed (with an
+    `Idempotent-Replayed: true` header) instead of running the view again.
+    A retry arriving while the first request is still running gets 409, and
+    reusing a key for a different request gets 422. 5xx responses aren't
+    stored, so those can be retried for real. Requests without the header
+    are passed through untouched.
+
+    Goes below @jwt_required() so keys are scoped per user.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({"message": f"{HEADER} must be 1-{MAX_KEY_LENGTH} characters"}), 400
+
+        fingerprint = _fingerprint()
+        existing, claim = _claim(_scope(), key, fingerprint)
+        if existing is not None:
+            if existing.fingerprint != fingerprint:
+                return jsonify({"message": f"{HEADER} was already used for a different request"}), 422
+            if existing.status_code is None:
+                response = jsonify({"message": f"A request with this {HEADER} is still in progress"})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            return _replay(existing)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _release(claim)
+            raise
+        if response.status_code >= 500 or response.is_streamed:
+            db.session.rollback()
+            _release(claim)
+            return response
+
+        claim.status_code = response.status_code
+        claim.content_type = response.content_type
+        claim.response_body = response.get_data(as_text=True)
+        claim.response_headers = {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers} or None
+        db.session.add(claim)
+        db.session.commit()
+        return response
+
+    return wrapper
+
+
+def _release(claim):
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == claim.id))
+    db.session.commit()
+
+
+def prune_idempotency_keys(now=None):
+    """Delete rows past their replay window. Returns the number deleted."""
+    deleted = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at < (now or datetime.utcnow()))
+    ).rowcount
+    db.session.commit()
+    return deleted
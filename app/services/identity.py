@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+from app.extensions import db, jwt
+from app.models import User
+from app.schemas import UserSchema
+from flask import jsonify
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from .cache import LocalCache, make_cache
+
+user_schema = UserSchema()
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """What authenticated routes get from `flask_jwt_extended.current_user`.
+
+    Built from the cached profile, so reading it never touches the users table.
+    """
+    id: int
+    username: str
+    roles: tuple
+    profile: dict  # UserSchema dump, served as-is by /api/auth/me
+
+    @classmethod
+    def from_profile(cls, profile):
+        roles = tuple(r for r in (profile.get('roles') or '').split(',') if r)
+        return cls(id=profile['id'], username=profile['username'], roles=roles, profile=profile)
+
+    def has_role(self, role):
+        return role in self.roles
+
+
+class UserIdentityCache:
+    """Caches JWT identity -> user profile lookups.
+
+    Entries are invalidated once a transaction that inserted, updated or
+    deleted a User row through the ORM commits (not at flush, where another
+    request could still cache the old row); bulk query.update()/delete()
+    bypass the ORM events, so the TTL bounds how stale those can get.
+    """
+
+    def __init__(self, app=None):
+        self.backend = LocalCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = make_cache(
+            backend=app.config.get('USER_CACHE_BACKEND', 'local'),
+            url=app.config.get('USER_CACHE_URL'),
+            maxsize=app.config.get('USER_CACHE_MAXSIZE', 10000),
+            ttl=app.config.get('USER_CACHE_TTL', 300),
+            prefix='user-identity:',
+        )
+
+    def get_profile(self, user_id):
+        profile = self.backend.get(user_id)
+        if profile is None:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            profile = user_schema.dump(user)
+            self.backend.set(user_id, profile)
+        return profile
+
+    def invalidate(self, user_id):
+        self.backend.delete(user_id)
+
+    def clear(self):
+        self.backend.clear()
+
+
+identity_cache = UserIdentityCache()
+
+
+@jwt.user_lookup_loader
+def load_current_user(_jwt_header, jwt_data):
+    profile = identity_cache.get_profile(int(jwt_data['sub']))
+    if profile is None or profile.get('deletion_requested_at'):
+        return None # Accounts queued for deletion are treated as gone
+    return CurrentUser.from_profile(profile)
+
+
+@jwt.user_lookup_error_loader
+def current_user_not_found(_jwt_header, _jwt_data):
+    return jsonify({"message": "User not found"}), 404
+
+
+def _collect_user(mapper, connection, target):
+    object_session(target).info.setdefault('changed_user_ids', set()).add(target.id)
+
+# Inserts are included so a reused primary key can never serve a stale profile
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(User, _event, _collect_user)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_committed(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        identity_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _drop_rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None: # Not for savepoints, the outer transaction can still commit
+        session.info.pop('changed_user_ids', None)
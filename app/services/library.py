@@ -0,0 +1,73 @@
+import re
+import unicodedata
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models import Artist, Album, Track
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_key(name):
+    """Grouping key for an artist/album name, or None for blank names."""
+    if name is None:
+        return None
+    key = _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', name)).strip().casefold()
+    return key or None
+
+
+def _get_or_create(model, name, **filters):
+    key = normalize_key(name)
+    if key is None:
+        return None
+    row = model.query.filter_by(key=key, **filters).first()
+    if row is None:
+        try:
+            with db.session.begin_nested(): # A concurrent request may create the same key
+                row = model(key=key, name=_WHITESPACE.sub(' ', name).strip(), **filters)
+                db.session.add(row)
+        except IntegrityError:
+            row = model.query.filter_by(key=key, **filters).one()
+    return row
+
+
+def refresh_counts(artist_ids=(), album_ids=()):
+    """Recount the given artists/albums from their tracks and drop empty ones.
+
+    Each count is an indexed lookup on tracks.album_id / tracks.artist_id,
+    so this costs the size of the affected groups, not the library.
+    """
+    db.session.flush()
+    album_ids = {i for i in album_ids if i is not None}
+    artist_ids = {i for i in artist_ids if i is not None}
+    for album in Album.query.filter(Album.id.in_(album_ids)).all() if album_ids else ():
+        album.track_count = db.session.scalar(select(func.count()).where(Track.album_id == album.id))
+        artist_ids.add(album.artist_id)
+        if not album.track_count:
+            db.session.delete(album)
+    artist_ids.discard(None)
+    db.session.flush()
+    for artist in Artist.query.filter(Artist.id.in_(artist_ids)).all() if artist_ids else ():
+        artist.track_count = db.session.scalar(select(func.count()).where(Track.artist_id == artist.id))
+        artist.album_count = db.session.scalar(select(func.count()).where(Album.artist_id == artist.id))
+        if not artist.track_count and not artist.album_count:
+            db.session.delete(artist)
+
+
+def sync_track(track):
+    """Point a new or edited track at its Artist/Album rows. Joins the caller's transaction."""
+    previous = (track.artist_id, track.album_id)
+    artist = _get_or_create(Artist, track.artist, user_id=track.user_id)
+    album = _get_or_create(Album, track.album, user_id=track.user_id, artist_id=artist.id if artist else None)
+    track.artist_id = artist.id if artist else None
+    track.album_id = album.id if album else None
+    db.session.add(track)
+    refresh_counts(artist_ids=(previous[0], track.artist_id), album_ids=(previous[1], track.album_id))
+
+
+def release_track(track):
+    """Drop a trashed track from its artist/album counts. Joins the caller's transaction.
+
+    Counts only include live tracks; restoring the track goes through sync_track().
+    """
+    refresh_counts(artist_ids=(track.artist_id,), album_ids=(track.album_id,))
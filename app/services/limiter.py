@@ -0,0 +1,187 @@
+import contextlib
+import threading
+import time
+from flask import current_app, g, has_request_context, jsonify, request
+
+# Highest first. Each class may use this share of the current limit, so as
+# load builds up the lower classes are turned away while the higher ones
+# still have room
+PRIORITIES = ('playback', 'reads', 'writes', 'auth', 'bulk')
+PRIORITY_SHARES = {'playback': 1.0, 'reads': 0.9, 'writes': 0.75, 'auth': 0.6, 'bulk': 0.4}
+
+# Class of every route of a blueprint, unless the view says otherwise with @priority
+BLUEPRINT_PRIORITIES = {'playback': 'playback', 'queue': 'playback', 'auth': 'auth'}
+# Long-lived streams would hold a slot for minutes; they're bounded by EVENTS_MAX_STREAMS instead
+EXEMPT_BLUEPRINTS = {'events'}
+
+# Clients (importers, sync jobs) may move their own requests down a class, never up
+HEADER = 'X-Request-Priority'
+
+
+def priority(name):
+    """Put a view in priority class `name`; goes between @bp.route and the other decorators."""
+    if name not in PRIORITY_SHARES:
+        raise ValueError(f"Unknown priority class: {name}")
+
+    def decorator(view):
+        view.priority = name
+        return view
+    return decorator
+
+
+class ConcurrencyLimiter:
+    """Adaptive limit on the requests a worker runs at once, shedding the least important first.
+
+    The limit moves AIMD style on observed latency: each endpoint keeps a
+    slow-moving baseline, and a request taking more than
+    CONCURRENCY_LATENCY_TOLERANCE times its endpoint's baseline means the
+    worker is queueing somewhere (database pool, CPU), so the limit is cut
+    by CONCURRENCY_BACKOFF, at most once per such latency. Otherwise, while
+    the worker is at least half busy, the limit grows by one per limit's
+    worth of requests.
+
+    Time spent waiting on an upstream origin (manifest and segment
+    fetches, see upstream()) isn't counted: a slow origin says nothing
+    about this worker's congestion.
+
+    A request over its class's share of the limit gets 503 with Retry-After
+    straight away, before authentication or any database work; nothing
+    waits in a queue. Counts are per process, like the limit itself, and
+    routes served natively under ASGI (app/aio) aren't limited. A process
+    runs at most its threads' worth of requests at once, so the limit only
+    has something to shed with threaded workers (gunicorn.conf.py runs
+    gthread) and CONCURRENCY_MAX_LIMIT should match the thread count.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.limit = 8.0
+        self.min_limit = 4
+        self.max_limit = 8
+        self.tolerance = 2.0
+        self.latency_floor = 0.01
+        self.backoff = 0.9
+        self.baseline_drift = 0.01
+        self.retry_after = 1
+        self.inflight = 0
+        self._baselines = {} # endpoint -> seconds
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CONCURRENCY_LIMIT_ENABLED', True)
+        self.min_limit = app.config.get('CONCURRENCY_MIN_LIMIT', self.min_limit)
+        self.max_limit = app.config.get('CONCURRENCY_MAX_LIMIT', self.max_limit)
+        self.tolerance = app.config.get('CONCURRENCY_LATENCY_TOLERANCE', self.tolerance)
+        self.latency_floor = app.config.get('CONCURRENCY_LATENCY_FLOOR', self.latency_floor)
+        self.backoff = app.config.get('CONCURRENCY_BACKOFF', self.backoff)
+        self.retry_after = app.config.get('CONCURRENCY_RETRY_AFTER', self.retry_after)
+        with self._lock:
+            self.limit = float(app.config.get('CONCURRENCY_INITIAL_LIMIT', 8))
+            self._baselines.clear()
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    @staticmethod
+    def classify():
+        """Priority class of the current request, or None if it isn't limited."""
+        if request.blueprint is None or request.blueprint in EXEMPT_BLUEPRINTS:
+            return None
+        view = current_app.view_functions.get(request.endpoint)
+        name = getattr(view, 'priority', None) or BLUEPRINT_PRIORITIES.get(request.blueprint)
+        if name is None:
+            name = 'reads' if request.method in ('GET', 'HEAD') else 'writes'
+        requested = request.headers.get(HEADER)
+        if requested in PRIORITY_SHARES and PRIORITIES.index(requested) > PRIORITIES.index(name):
+            name = requested
+        return name
+
+    def acquire(self, name):
+        """Take a slot for a request of class `name`; False if it should be shed."""
+        with self._lock:
+            if self.inflight >= self.limit * PRIORITY_SHARES[name]:
+                self._stats['shed'][name] += 1
+                return False
+            self.inflight += 1
+            self._stats['admitted'][name] += 1
+            return True
+
+    def release(self, endpoint, latency, now=None):
+        """Give back a slot, feeding the request's latency into the limit."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            busy = self.inflight
+            self.inflight -= 1
+            baseline = self._baselines.get(endpoint)
+            if baseline is None or latency < baseline:
+                baseline = latency
+            else:
+                baseline += (latency - baseline) * self.baseline_drift # Follows lasting changes, not spikes
+            self._baselines[endpoint] = baseline
+
+            if latency > self.tolerance * max(baseline, self.latency_floor):
+                # Requests finishing after this one mostly saw the same
+                # congestion; one cut per latency's worth of them is enough
+                if now - self._last_decrease >= latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+                    self._stats['decreases'] += 1
+            elif busy * 2 >= self.limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _before_request(self):
+        if not self.enabled:
+            return None
+        name = self.classify()
+        if name is None:
+            return None
+        if not self.acquire(name):
+            response = jsonify({"message": "Server busy, retry later"})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(self.retry_after)
+            return response
+        g.concurrency_slot = (request.endpoint, time.monotonic())
+        return None
+
+    def _teardown_request(self, exc):
+        slot = g.pop('concurrency_slot', None)
+        if slot is not None:
+            endpoint, started = slot
+            self.release(endpoint, time.monotonic() - started - g.pop('upstream_seconds', 0.0))
+
+    @staticmethod
+    @contextlib.contextmanager
+    def upstream():
+        """Leave the time spent inside out of the current request's latency."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            if has_request_context():
+                g.upstream_seconds = g.get('upstream_seconds', 0.0) + time.monotonic() - started
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {
+                'admitted': dict.fromkeys(PRIORITIES, 0),
+                'shed': dict.fromkeys(PRIORITIES, 0),
+                'decreases': 0,
+            }
+
+    def stats(self):
+        """Counters since startup, plus the current limit and requests in flight."""
+        with self._lock:
+            return {
+                'admitted': dict(self._stats['admitted']),
+                'shed': dict(self._stats['shed']),
+                'decreases': self._stats['decreases'],
+                'limit': round(self.limit, 2),
+                'inflight': self.inflight,
+            }
+
+
+concurrency_limiter = ConcurrencyLimiter()
@@ -0,0 +1,204 @@
+import http.client
+import ipaddress
+import socket
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+from app.models import ManifestType
+from .limiter import concurrency_limiter
+
+# Content types we serve proxied manifests with
+MEDIA_TYPES = {
+    ManifestType.HLS: 'application/vnd.apple.mpegurl',
+    ManifestType.DASH: 'application/dash+xml',
+}
+
+
+class ManifestFetchError(Exception):
+    """Raised when an upstream manifest can't be fetched."""
+
+
+class UnsafeURLError(ManifestFetchError):
+    """Raised for an upstream URL that isn't http(s) or points at a non-public address."""
+
+
+UPSTREAM_SCHEMES = ('http', 'https')
+
+
+def _public(address):
+    ip = ipaddress.ip_address(address.split('%', 1)[0]) # Drop an IPv6 zone id
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+class UpstreamGuard:
+    """Keeps fetches of user-supplied URLs (manifests, proxied segments, probes) off internal hosts.
+
+    Only http(s) is fetched, and only from public addresses: loopback,
+    private, link-local (cloud metadata services), shared and reserved
+    ranges are refused. Blocking fetches go through `open()`, which checks
+    the address each connection actually reached, so redirects and DNS
+    answers that change between lookups are covered. httpx clients get the
+    same from `async_transport()`, whose connections are checked once
+    connected and before anything is sent, plus `ahook` as a request event
+    hook to refuse other schemes and internal IP literals up front.
+
+    UPSTREAM_ALLOW_PRIVATE lifts the address check, for development
+    against origins on localhost; the scheme check always applies.
+    """
+
+    def __init__(self, app=None):
+        self.allow_private = False
+        self.opener = self._build_opener()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.allow_private = app.config.get('UPSTREAM_ALLOW_PRIVATE', False)
+
+    def check_address(self, address):
+        if not self.allow_private and not _public(address):
+            raise UnsafeURLError(f"Upstream address {address} isn't public")
+
+    def check_url(self, url, resolve=True):
+        """Raise UnsafeURLError unless `url` is http(s) to a public host.
+
+        With `resolve` off only IP literals are checked (no DNS lookup, for
+        callers that can't block); fetching checks the address again anyway.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in UPSTREAM_SCHEMES or not parts.hostname:
+            raise UnsafeURLError("Only http and https URLs can be fetched")
+        try:
+            ipaddress.ip_address(parts.hostname)
+        except ValueError:
+            if not resolve:
+                name = parts.hostname.rstrip('.').lower()
+                if name == 'localhost' or name.endswith('.localhost'):
+                    self.check_address('127.0.0.1')
+                return
+            try:
+                infos = socket.getaddrinfo(parts.hostname, parts.port or 80, proto=socket.IPPROTO_TCP)
+            except (socket.gaierror, UnicodeError) as e:
+                raise ManifestFetchError(f"Upstream unreachable: {e}") from e
+            for info in infos:
+                self.check_address(info[4][0])
+        else:
+            self.check_address(parts.hostname)
+
+    async def ahook(self, request):
+        """httpx request event hook: refuse other schemes and internal IP literals, redirects included."""
+        self.check_url(str(request.url), resolve=False)
+
+    def async_transport(self, **kwargs):
+        """httpx.AsyncHTTPTransport that checks the address each connection reached, before sending."""
+        import httpcore, httpx  # Only needed in ASGI mode
+        guard = self
+
+        class CheckedBackend(httpcore.AsyncNetworkBackend):
+            def __init__(self, backend):
+                self.backend = backend
+
+            async def connect_tcp(self, host, port, **kwargs):
+                stream = await self.backend.connect_tcp(host, port, **kwargs)
+                try:
+                    guard.check_address(stream.get_extra_info('server_addr')[0])
+                except UnsafeURLError:
+                    await stream.aclose()
+                    raise
+                return stream
+
+            async def connect_unix_socket(self, path, **kwargs):
+                raise UnsafeURLError("Only http and https URLs can be fetched")
+
+            async def sleep(self, seconds):
+                await self.backend.sleep(seconds)
+
+        kwargs.setdefault('proxy', None) # A proxied connection reaches the proxy, not the origin
+        transport = httpx.AsyncHTTPTransport(**kwargs)
+        pool = transport._pool # httpx doesn't pass a network backend through
+        pool._network_backend = CheckedBackend(pool._network_backend)
+        return transport
+
+    def open(self, url, timeout):
+        """urlopen() for user-supplied URLs. Raises UnsafeURLError, or what urlopen raises."""
+        self.check_url(url, resolve=False)
+        return self.opener.open(url, timeout=timeout)
+
+    def _connection(self, connection_class):
+        # http.client connection factory checking the peer of every socket it opens
+        guard = self
+
+        def connect(host, **kwargs):
+            connection = connection_class(host, **kwargs)
+            create_connection = connection._create_connection
+
+            def checked(*args, **kw):
+                sock = create_connection(*args, **kw)
+                try:
+                    guard.check_address(sock.getpeername()[0])
+                except UnsafeURLError:
+                    sock.close()
+                    raise
+                return sock
+            connection._create_connection = checked
+            return connection
+        return connect
+
+    def _build_opener(self):
+        guard = self
+
+        class HTTPHandler(urllib.request.HTTPHandler):
+            def http_open(self, req):
+                return self.do_open(guard._connection(http.client.HTTPConnection), req)
+
+        class HTTPSHandler(urllib.request.HTTPSHandler):
+            def https_open(self, req):
+                return self.do_open(guard._connection(http.client.HTTPSConnection), req, context=self._context)
+
+        # No file:, ftp: or data: handlers, and no proxies from the environment
+        opener = urllib.request.OpenerDirector()
+        for handler in (HTTPHandler(), HTTPSHandler(), urllib.request.HTTPRedirectHandler(),
+                        urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPErrorProcessor(),
+                        urllib.request.UnknownHandler()):
+            opener.add_handler(handler)
+        return opener
+
+
+upstream_guard = UpstreamGuard()
+
+
+def fetch_manifest(url, timeout=10, max_bytes=5 * 1024 * 1024):
+    """Fetch a manifest body with a blocking request (WSGI path)."""
+    try:
+        with concurrency_limiter.upstream(), upstream_guard.open(url, timeout=timeout) as resp:
+            body = resp.read(max_bytes + 1)
+    except urllib.error.HTTPError as e:
+        raise ManifestFetchError(f"Upstream returned {e.code}") from e
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        raise ManifestFetchError(f"Upstream unreachable: {e}") from e
+    if len(body) > max_bytes:
+        raise ManifestFetchError("Manifest too large")
+    return body
+
+
+async def afetch_manifest(client, url, max_bytes=5 * 1024 * 1024):
+    """Fetch a manifest body with a shared httpx.AsyncClient (ASGI path).
+
+    The client must use `upstream_guard.async_transport()`, with
+    `upstream_guard.ahook` among its request event hooks.
+    """
+    import httpx  # Only needed in ASGI mode
+    try:
+        async with client.stream('GET', url) as resp:
+            if resp.status_code >= 400:
+                raise ManifestFetchError(f"Upstream returned {resp.status_code}")
+            body = bytearray()
+            async for chunk in resp.aiter_bytes():
+                body += chunk
+                if len(body) > max_bytes:
+                    raise ManifestFetchError("Manifest too large")
+            return bytes(body)
+    except httpx.HTTPError as e:
+        raise ManifestFetchError(f"Upstream unreachable: {e}") from e
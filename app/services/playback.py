@@ -0,0 +1,137 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+from collections import namedtuple
+from flask import url_for
+from app.models import ManifestType
+
+# What a verified playback URL grants: one track's manifest until `expires` (Unix time)
+Playback = namedtuple('Playback', 'track_id manifest_type manifest_url expires')
+# What a verified segment URL grants: any upstream URL under `prefix`, see app/services/segments.py
+SegmentGrant = namedtuple('SegmentGrant', 'prefix expires')
+
+
+class PlaybackTokenError(Exception):
+    """Raised when a playback URL's token is malformed, forged or expired."""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class PlaybackSigner:
+    """Short-lived HMAC-signed playback URLs (GET /api/play/<token>).
+
+    The token carries the track's manifest URL and type and an expiry,
+    signed with PLAYBACK_URL_SECRET, so serving it takes no JWT decode and
+    no database query. Expiries are rounded up to PLAYBACK_URL_ROUNDING
+    seconds: every URL issued for a track in the same window is identical,
+    which lets an edge cache serve repeat plays.
+
+    URLs stay valid until they expire, even if the track is deleted or
+    edited in the meantime; keep PLAYBACK_URL_TTL short.
+
+    Segment URLs in proxied manifests are signed the same way, with their
+    own key and the longer SEGMENT_URL_TTL (a track has to play to the end).
+    """
+
+    def __init__(self, app=None):
+        self.keys = {}
+        self.ttl = 900
+        self.segment_ttl = 6 * 3600
+        self.rounding = 60
+        self.base_url = ''
+        self.cache_max_age = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        secret = app.config.get('PLAYBACK_URL_SECRET') or app.config.get('SECRET_KEY')
+        # Derived, so the signatures are no use against anything else keyed on SECRET_KEY (or each other)
+        self.keys = {
+            purpose: hmac.new(secret.encode(), purpose.encode(), hashlib.sha256).digest()
+            for purpose in ('playback-url', 'segment-url')
+        } if secret else {}
+        self.ttl = app.config.get('PLAYBACK_URL_TTL', self.ttl)
+        self.segment_ttl = app.config.get('SEGMENT_URL_TTL', self.segment_ttl)
+        self.rounding = max(1, app.config.get('PLAYBACK_URL_ROUNDING', self.rounding))
+        self.base_url = (app.config.get('PLAYBACK_BASE_URL') or '').rstrip('/')
+        self.cache_max_age = app.config.get('PLAYBACK_CACHE_MAX_AGE', self.cache_max_age)
+
+    def _mac(self, payload, purpose):
+        if not self.keys:
+            raise RuntimeError("Playback URLs need PLAYBACK_URL_SECRET or SECRET_KEY")
+        return hmac.new(self.keys[purpose], payload.encode(), hashlib.sha256).digest()[:16]
+
+    def _sign(self, fields, purpose):
+        payload = _b64encode(json.dumps(fields, separators=(',', ':')).encode())
+        return f'{payload}.{_b64encode(self._mac(payload, purpose))}'
+
+    def _open(self, token, purpose, now):
+        # The signed fields, expiry last, or PlaybackTokenError
+        payload, _, mac = token.partition('.')
+        try:
+            valid = hmac.compare_digest(self._mac(payload, purpose), _b64decode(mac))
+        except (binascii.Error, ValueError):
+            valid = False
+        if not valid:
+            raise PlaybackTokenError("Invalid playback URL")
+        try:
+            fields = json.loads(_b64decode(payload))
+            expires = int(fields[-1])
+        except (binascii.Error, ValueError, TypeError, IndexError):
+            raise PlaybackTokenError("Invalid playback URL") # Signed by us, so only after a format change
+        if expires <= (now if now is not None else time.time()):
+            raise PlaybackTokenError("Playback URL expired")
+        return fields
+
+    def expiry(self, now=None, ttl=None):
+        """Expiry (Unix time) of URLs issued at `now`, the same for the whole rounding window."""
+        deadline = int(now if now is not None else time.time()) + (ttl if ttl is not None else self.ttl)
+        return -(-deadline // self.rounding) * self.rounding
+
+    def sign(self, track_id, manifest_url, manifest_type, expires=None):
+        """The token for one track's manifest."""
+        expires = expires if expires is not None else self.expiry()
+        return self._sign([track_id, ManifestType(manifest_type).value, manifest_url, expires], 'playback-url')
+
+    def url(self, track_id, manifest_url, manifest_type, expires=None):
+        """Playback URL for one track; pass a shared `expires` when issuing a batch."""
+        token = self.sign(track_id, manifest_url, manifest_type, expires)
+        return self.base_url + url_for('playback.play', token=token)
+
+    def verify(self, token, now=None):
+        """The Playback a token grants. Raises PlaybackTokenError."""
+        try:
+            track_id, manifest_type, manifest_url, expires = self._open(token, 'playback-url', now)
+            return Playback(int(track_id), ManifestType(manifest_type), str(manifest_url), int(expires))
+        except (ValueError, TypeError):
+            raise PlaybackTokenError("Invalid playback URL")
+
+    def sign_prefix(self, prefix, expires=None):
+        """The token for fetching any upstream URL that starts with `prefix`."""
+        expires = expires if expires is not None else self.expiry(ttl=self.segment_ttl)
+        return self._sign([prefix, expires], 'segment-url')
+
+    def verify_prefix(self, token, now=None):
+        """The SegmentGrant a token gives. Raises PlaybackTokenError."""
+        try:
+            prefix, expires = self._open(token, 'segment-url', now)
+            return SegmentGrant(str(prefix), int(expires))
+        except (ValueError, TypeError):
+            raise PlaybackTokenError("Invalid playback URL")
+
+    def cache_control(self, grant, now=None):
+        """Cache-Control for serving a Playback or SegmentGrant: public, until it expires (at most PLAYBACK_CACHE_MAX_AGE)."""
+        remaining = grant.expires - int(now if now is not None else time.time())
+        return f'public, max-age={max(0, min(remaining, self.cache_max_age))}'
+
+
+playback_urls = PlaybackSigner()
@@ -0,0 +1,134 @@
+import atexit
+import logging
+import threading
+from sqlalchemy import insert
+from app.extensions import db
+from app.models import PlayEvent
+from .shards import shard_map
+
+logger = logging.getLogger(__name__)
+
+
+class PlayBufferFull(Exception):
+    """Raised by PlayEventBuffer.add() while `max_pending` events are waiting for the writer."""
+
+
+class PlayEventBuffer:
+    """In-process write buffer for play events.
+
+    Requests only append to a list; rows reach the database in one
+    executemany INSERT when `max_size` events are pending or every
+    `flush_interval` seconds, whichever comes first. A failed flush puts
+    its rows back, and the buffer is flushed at interpreter exit, so
+    accepted events are written at least once on a graceful shutdown. Once
+    the writer falls `max_pending` events behind, new events are refused
+    rather than buffered.
+    """
+
+    def __init__(self, max_size=1000, flush_interval=1.0, max_pending=100000):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # One flush at a time
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._app = None
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        self._app = app
+        self.max_size = app.config.get('PLAY_BUFFER_SIZE', self.max_size)
+        self.flush_interval = app.config.get('PLAY_FLUSH_INTERVAL', self.flush_interval)
+        self.max_pending = app.config.get('PLAY_BUFFER_MAX_PENDING', self.max_pending)
+        if not self._atexit_registered:
+            atexit.register(self._flush_at_exit)
+            self._atexit_registered = True
+
+    def add(self, rows):
+        """Queue row dicts for insertion. Returns the number now pending.
+
+        Raises PlayBufferFull, buffering nothing, while the writer is `max_pending` behind.
+        """
+        with self._lock:
+            full = len(self._pending) >= self.max_pending
+            if not full:
+                self._pending.extend(rows)
+            pending = len(self._pending)
+        if full:
+            self._wakeup.set()
+            raise PlayBufferFull(f"{pending} play events pending")
+        if pending >= self.max_size:
+            self._ensure_thread()
+            self._wakeup.set()
+        else:
+            self._ensure_thread()
+        return pending
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write everything pending. Needs an app context; returns rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            written = 0
+            groups = list(shard_map.partition(rows).items()) # One group unless SHARDS are configured
+            for index, (shard, group) in enumerate(groups):
+                try:
+                    with shard_map.use(shard):
+                        db.session.execute(insert(PlayEvent), group) # executemany
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    with self._lock:
+                        # Retry on the next flush; earlier shards' rows are already committed
+                        self._pending[:0] = [row for _, unwritten in groups[index:] for row in unwritten]
+                    raise
+                written += len(group)
+            return written
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+
+    def _ensure_thread(self):
+        if self._thread is not None or not self.flush_interval or self._app is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='play-event-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            with self._app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Flushing %d play events failed, will retry", len(self._pending))
+                finally:
+                    db.session.remove()
+
+    def _flush_at_exit(self):
+        if self._app is None:
+            return
+        with self._app.app_context():
+            try:
+                # Even with nothing pending: flush() waits out a flush the
+                # background thread has in flight, and writes its rows if
+                # that one failed and put them back
+                written = self.flush()
+                if written:
+                    logger.info("Flushed %d play events at shutdown", written)
+            except Exception:
+                logger.exception("Lost %d play events at shutdown", len(self._pending))
+
+
+play_buffer = PlayEventBuffer()
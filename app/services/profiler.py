@@ -0,0 +1,304 @@
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from flask import g, request
+from flask_jwt_extended import current_user, verify_jwt_in_request
+
+# Sent by an admin to profile one request: '1' for CPU samples, 'memory' to
+# add a tracemalloc diff. The response names the capture in HEADER_ID
+HEADER = 'X-Profile'
+HEADER_ID = 'X-Profile-Id'
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _short(filename):
+    # Paths in the tree relative to it, library paths from their package down
+    if filename.startswith(APP_ROOT + os.sep):
+        return os.path.relpath(filename, APP_ROOT)
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + os.sep):
+            return os.path.relpath(filename, path)
+    return filename
+
+
+class Rule:
+    """Profile a share of the requests to one endpoint (or all), until used up or expired."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, endpoint, sample_rate, max_requests, memory, expires_at):
+        self.id = next(self._ids)
+        self.endpoint = endpoint
+        self.sample_rate = sample_rate
+        self.remaining = max_requests
+        self.memory = memory
+        self.expires_at = expires_at
+
+    def to_dict(self):
+        return {'id': self.id, 'endpoint': self.endpoint, 'sample_rate': self.sample_rate,
+                'remaining': self.remaining, 'memory': self.memory, 'expires_at': self.expires_at.isoformat()}
+
+
+class Capture:
+    """The stack samples (and optionally allocations) of one profiled request."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, endpoint, method, path, interval, memory, rule_id=None):
+        self.id = next(self._ids)
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.rule_id = rule_id
+        self.started_at = datetime.utcnow()
+        self.started = time.monotonic()
+        self.duration = None
+        self.status_code = None
+        self.samples = Counter() # Stack (root first, of frame names) -> count
+        self.memory = [] if memory else None
+        self.snapshot = None # tracemalloc snapshot from the start of the request, while it runs
+
+    def summary(self):
+        return {
+            'id': self.id, 'endpoint': self.endpoint, 'method': self.method, 'path': self.path,
+            'rule_id': self.rule_id, 'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration * 1000, 1) if self.duration is not None else None,
+            'status_code': self.status_code, 'samples': sum(self.samples.values()),
+            'memory': self.memory is not None, 'worker': os.getpid(),
+        }
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed stacks ("root;...;leaf count" lines), for flamegraph.pl and friends."""
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def speedscope(self):
+        """A speedscope (https://www.speedscope.app) sampled profile, weighted in milliseconds."""
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            for name in stack:
+                if name not in index:
+                    index[name] = len(frames)
+                    function, _, location = name.partition(' (')
+                    file, _, line = location.rstrip(')').rpartition(':')
+                    frames.append({'name': function, 'file': file, 'line': int(line) if line.isdigit() else None})
+            samples.append([index[name] for name in stack])
+            weights.append(round(count * self.interval * 1000, 3))
+        name = f'{self.method} {self.path} #{self.id}'
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'music-streamer',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled', 'name': name, 'unit': 'milliseconds',
+                'startValue': 0, 'endValue': round(sum(weights), 3),
+                'samples': samples, 'weights': weights,
+            }],
+        }
+
+
+class RequestProfiler:
+    """On-demand sampling profiler for individual requests, with optional allocation tracking.
+
+    A request is profiled when an admin sends X-Profile, or when it matches
+    a rule set through /api/profiler (an endpoint, a sample rate, and a cap
+    on requests and time). While at least one profiled request runs, one
+    background thread reads the stacks of those requests' threads every
+    PROFILER_INTERVAL seconds; nothing is sampled otherwise. With memory
+    on, tracemalloc runs for the request and the capture keeps the top
+    allocation sites it grew. tracemalloc traces every thread while on, so
+    concurrent requests get slower too and their allocations show up in
+    the diff; it is off again once no memory capture is running.
+
+    The cost when nothing is being profiled is a dict check per request:
+    no JWT decoding unless X-Profile is sent, and no hooks at all with
+    PROFILER_ENABLED off. At most PROFILER_MAX_CONCURRENT requests are
+    profiled at once (others run normally), each for at most
+    PROFILER_MAX_SECONDS, and the last PROFILER_MAX_CAPTURES captures are
+    kept in memory for download. Rules and captures are per worker.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.interval = 0.005
+        self.max_concurrent = 2
+        self.max_seconds = 30
+        self.max_depth = 100
+        self.memory_frames = 10
+        self.memory_top = 25
+        self.rules = {}
+        self.captures = deque(maxlen=50)
+        self._active = {} # Thread ident -> Capture
+        self._tracing = 0 # Running memory captures
+        self._started_tracing = False # Left alone if tracemalloc was on already (PYTHONTRACEMALLOC)
+        self._sampler = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILER_ENABLED', True)
+        self.interval = app.config.get('PROFILER_INTERVAL', self.interval)
+        self.max_concurrent = app.config.get('PROFILER_MAX_CONCURRENT', self.max_concurrent)
+        self.max_seconds = app.config.get('PROFILER_MAX_SECONDS', self.max_seconds)
+        self.max_depth = app.config.get('PROFILER_MAX_DEPTH', self.max_depth)
+        self.memory_frames = app.config.get('PROFILER_TRACEMALLOC_FRAMES', self.memory_frames)
+        self.memory_top = app.config.get('PROFILER_TRACEMALLOC_TOP', self.memory_top)
+        with self._lock:
+            self.rules.clear()
+            self.captures = deque(maxlen=app.config.get('PROFILER_MAX_CAPTURES', 50))
+        if self.enabled:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            app.teardown_request(self._teardown_request)
+
+    # --- Rules ---
+
+    def add_rule(self, endpoint=None, sample_rate=1.0, max_requests=10, memory=False, duration=600):
+        rule = Rule(endpoint, sample_rate, max_requests, memory, datetime.utcnow() + timedelta(seconds=duration))
+        with self._lock:
+            self.rules[rule.id] = rule
+        return rule
+
+    def remove_rule(self, rule_id):
+        with self._lock:
+            return self.rules.pop(rule_id, None) is not None
+
+    def _match(self):
+        # The rule the current request is picked by, or None. Caller holds the lock
+        now = datetime.utcnow()
+        for rule in list(self.rules.values()):
+            if rule.expires_at <= now or rule.remaining <= 0:
+                del self.rules[rule.id]
+            elif rule.endpoint in (None, request.endpoint) and random.random() < rule.sample_rate:
+                rule.remaining -= 1
+                return rule
+        return None
+
+    def _requested(self):
+        # X-Profile from an admin: None if absent or not allowed, else whether memory was asked for
+        value = request.headers.get(HEADER)
+        if not value:
+            return None
+        try:
+            verify_jwt_in_request(optional=True)
+            allowed = current_user is not None and current_user.has_role('admin')
+        except Exception:
+            allowed = False
+        return value.lower() == 'memory' if allowed else None
+
+    # --- Request hooks ---
+
+    def _before_request(self):
+        if not self.rules and HEADER not in request.headers:
+            return None
+        memory, rule = self._requested(), None
+        with self._lock:
+            if len(self._active) >= self.max_concurrent:
+                return None
+            if memory is None:
+                rule = self._match()
+                if rule is None:
+                    return None
+                memory = rule.memory
+            capture = Capture(request.endpoint, request.method, request.path, self.interval, memory,
+                              rule.id if rule is not None else None)
+            if memory:
+                if self._tracing == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start(self.memory_frames)
+                    self._started_tracing = True
+                self._tracing += 1
+            self._active[threading.get_ident()] = capture
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+                self._sampler.start()
+        if memory:
+            capture.snapshot = tracemalloc.take_snapshot()
+        g.profile_capture = capture
+        return None
+
+    def _after_request(self, response):
+        capture = self._finish(response.status_code)
+        if capture is not None:
+            response.headers[HEADER_ID] = str(capture.id)
+        return response
+
+    def _teardown_request(self, exc):
+        self._finish(500) # The view raised; after_request never ran
+
+    def _finish(self, status_code):
+        capture = g.pop('profile_capture', None)
+        if capture is None:
+            return None
+        capture.duration = time.monotonic() - capture.started
+        capture.status_code = status_code
+        memory = None
+        if capture.memory is not None:
+            memory = self._memory_diff(capture)
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+            if capture.memory is not None:
+                capture.memory = memory
+                self._tracing -= 1
+                if self._tracing == 0 and self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+            self.captures.append(capture)
+        return capture
+
+    def _memory_diff(self, capture):
+        before, capture.snapshot = capture.snapshot, None
+        stats = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+        return [{'file': _short(stat.traceback[0].filename), 'line': stat.traceback[0].lineno,
+                 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+                for stat in stats[:self.memory_top] if stat.size_diff > 0]
+
+    # --- Sampling ---
+
+    def _sample(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            now = time.monotonic()
+            for ident, capture in active:
+                frame = frames.get(ident)
+                if frame is None or ident == me or now - capture.started > self.max_seconds:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                capture.samples[tuple(reversed(stack))] += 1
+
+    # --- Results ---
+
+    def capture(self, capture_id):
+        with self._lock:
+            return next((capture for capture in self.captures if capture.id == capture_id), None)
+
+    def state(self):
+        with self._lock:
+            return {
+                'rules': [rule.to_dict() for rule in self.rules.values()],
+                'captures': [capture.summary() for capture in reversed(self.captures)],
+                'active': len(self._active),
+            }
+
+
+request_profiler = RequestProfiler()
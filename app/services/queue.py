@@ -0,0 +1,96 @@
+import numpy as np
+
+# How far ahead _separate_neighbours looks for a different artist before giving up
+_REPAIR_WINDOW = 64
+
+
+def _codes(values):
+    """Integer codes for a sequence of strings, compared case-insensitively.
+
+    Empty/None values each get a code of their own, so unknown artists or
+    albums never count as "the same" as each other.
+    """
+    keys = np.array([v.casefold() if v else '' for v in values], dtype=str)
+    uniq, codes = np.unique(keys, return_inverse=True)
+    missing = np.flatnonzero(keys == '')
+    codes[missing] = len(uniq) + np.arange(len(missing))
+    return codes
+
+
+def shuffle_order(n, rng):
+    return rng.permutation(n)
+
+
+def artist_spread_order(artist_codes, rng):
+    """Shuffle that spreads each artist's tracks evenly through the queue.
+
+    Each artist's k tracks get positions (rank + u) / k with a per-artist
+    random offset u, so they land roughly 1/k of the queue apart; sorting
+    on that key interleaves artists. Remaining back-to-back pairs (only
+    possible when one artist dominates) are repaired afterwards.
+    """
+    n = len(artist_codes)
+    perm = rng.permutation(n) # Random order within each artist
+    codes = artist_codes[perm]
+    counts = np.bincount(codes)
+    by_artist = np.argsort(codes, kind='stable')
+    starts = np.cumsum(counts) - counts
+    rank = np.empty(n, dtype=np.int64)
+    rank[by_artist] = np.arange(n) - starts[codes[by_artist]]
+    key = (rank + rng.random(len(counts))[codes]) / counts[codes]
+    order = perm[np.argsort(key, kind='stable')]
+    return _separate_neighbours(order, artist_codes)
+
+
+def _separate_neighbours(order, codes):
+    seq = codes[order]
+    conflicts = np.flatnonzero(seq[1:] == seq[:-1])
+    if not len(conflicts):
+        return order
+    order, seq = order.tolist(), seq.tolist()
+    i = int(conflicts[0]) + 1
+    while i < len(order):
+        if seq[i] == seq[i - 1]:
+            # Pull the next track by a different artist forward into slot i
+            for j in range(i + 1, min(i + 1 + _REPAIR_WINDOW, len(order))):
+                if seq[j] != seq[i - 1]:
+                    order.insert(i, order.pop(j))
+                    seq.insert(i, seq.pop(j))
+                    break
+        i += 1
+    return np.array(order)
+
+
+def album_order(album_codes, track_numbers):
+    """Albums in order of first appearance, each played by track number."""
+    n = len(album_codes)
+    _, first_seen = np.unique(album_codes, return_index=True)
+    first_position = np.empty(album_codes.max() + 1 if n else 0, dtype=np.int64)
+    first_position[album_codes[first_seen]] = first_seen
+    return np.lexsort((np.arange(n), track_numbers, first_position[album_codes]))
+
+
+def build_queue(track_ids, artists, albums, track_numbers, mode, seed):
+    """Play order for tracks given in source order (playlist or library order).
+
+    Works on plain column arrays rather than ORM objects; returns an array
+    of track ids. The same inputs and seed always give the same order, so a
+    client can page through a queue (or resume it later) by passing the seed
+    back.
+    """
+    track_ids = np.asarray(track_ids, dtype=np.int64)
+    if not len(track_ids):
+        return track_ids
+    rng = np.random.default_rng(seed)
+    if mode == 'shuffle':
+        order = shuffle_order(len(track_ids), rng)
+    elif mode == 'artist_spread':
+        order = artist_spread_order(_codes(artists), rng)
+    elif mode == 'album':
+        # Albums are keyed by artist too, so two artists' "Greatest Hits" stay apart
+        keys = [f"{artist or ''}\x1f{album}" if album else None for artist, album in zip(artists, albums)]
+        numbers = np.array([tn if tn is not None else np.iinfo(np.int32).max for tn in track_numbers], dtype=np.int64)
+        order = album_order(_codes(keys), numbers)
+    else:
+        raise ValueError(f"Unknown queue mode: {mode}")
+    return track_ids[order]
@@ -0,0 +1,102 @@
+from datetime import datetime
+from sqlalchemy import delete, insert, select
+from app.extensions import db
+from app.models import Playlist, Track, TrackNeighbour, RecommendationRefresh, playlist_tracks
+from .upserts import upsert
+
+
+def similar_tracks(playlist_ids, track_ids, top_k=20, block_size=2048):
+    """Item-item cosine similarity over playlist membership.
+
+    Builds a binary playlists x tracks CSR matrix M and computes M^T M one
+    block of `block_size` tracks at a time, so peak memory is bounded by
+    the block's co-occurrences rather than the full tracks x tracks matrix.
+    Yields (track_ids, neighbour_ids, scores) arrays, at most `top_k`
+    neighbours per track, best first.
+    """
+    import numpy as np # Only the offline builder needs numpy/scipy, keep them out of web workers
+    from scipy import sparse
+    playlist_ids = np.asarray(playlist_ids)
+    track_ids = np.asarray(track_ids)
+    if not len(track_ids):
+        return
+    tracks, cols = np.unique(track_ids, return_inverse=True)
+    _, rows = np.unique(playlist_ids, return_inverse=True)
+    membership = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(rows.max() + 1, len(tracks))
+    )
+    membership.data[:] = 1 # Duplicate pairs are summed on construction, keep it binary
+    by_track = membership.T.tocsr()
+    inv_norms = 1 / np.sqrt(np.asarray(membership.sum(axis=0)).ravel())
+
+    for start in range(0, len(tracks), block_size):
+        stop = min(start + block_size, len(tracks))
+        block = (sparse.diags(inv_norms[start:stop]) @ (by_track[start:stop] @ membership) @ sparse.diags(inv_norms)).tocoo()
+        row, col, score = block.row, block.col, block.data
+        not_self = row + start != col
+        row, col, score = row[not_self], col[not_self], score[not_self]
+
+        # Rank within each row by score (ties broken by neighbour), keep the first top_k
+        order = np.lexsort((col, -score, row))
+        row, col, score = row[order], col[order], score[order]
+        rank = np.arange(len(row)) - np.searchsorted(row, row, side='left')
+        keep = rank < top_k
+        yield tracks[row[keep] + start], tracks[col[keep]], score[keep]
+
+
+def build_neighbours(user_ids=None, top_k=20, block_size=2048, insert_batch=5000):
+    """(Re)build track_neighbours for the given users, or for everyone.
+
+    Playlists and tracks are per user, so the co-occurrence matrix is block
+    diagonal by user and a refresh only has to touch the users whose
+    playlists changed. Returns the number of neighbour rows written.
+    """
+    # Joining both entities lets the soft-delete criteria drop trashed playlists and tracks
+    pairs = select(playlist_tracks.c.playlist_id, playlist_tracks.c.track_id).join(
+        Playlist, Playlist.id == playlist_tracks.c.playlist_id
+    ).join(Track, Track.id == playlist_tracks.c.track_id)
+    owned = select(Track.id)
+    if user_ids is not None:
+        pairs = pairs.where(Playlist.user_id.in_(user_ids))
+        owned = owned.where(Track.user_id.in_(user_ids))
+    rows = db.session.execute(pairs).all()
+
+    db.session.execute(delete(TrackNeighbour).where(TrackNeighbour.track_id.in_(owned)))
+    written = 0
+    if rows:
+        playlist_ids, track_ids = zip(*rows)
+        for sources, neighbours, scores in similar_tracks(playlist_ids, track_ids, top_k=top_k, block_size=block_size):
+            for i in range(0, len(sources), insert_batch):
+                batch = [
+                    {'track_id': s, 'neighbour_id': n, 'score': sc}
+                    for s, n, sc in zip(sources[i:i + insert_batch].tolist(), neighbours[i:i + insert_batch].tolist(),
+                                        scores[i:i + insert_batch].tolist())
+                ]
+                db.session.execute(insert(TrackNeighbour), batch)
+                written += len(batch)
+    return written
+
+
+def refresh_neighbours(top_k=20, block_size=2048):
+    """Rebuild neighbours for users flagged by mark_stale(). Returns (users, rows)."""
+    started = datetime.utcnow()
+    user_ids = [user_id for (user_id,) in db.session.query(RecommendationRefresh.user_id)]
+    if not user_ids:
+        return 0, 0
+    written = build_neighbours(user_ids, top_k=top_k, block_size=block_size)
+    # Keep flags raised again while we were building
+    db.session.execute(delete(RecommendationRefresh).where(
+        RecommendationRefresh.user_id.in_(user_ids), RecommendationRefresh.requested_at <= started
+    ))
+    db.session.commit()
+    return len(user_ids), written
+
+
+def mark_stale(user_id):
+    """Flag a user's neighbours for the next refresh. Joins the caller's transaction.
+
+    One upsert, so concurrent writes for the same user can't both insert.
+    """
+    upsert(RecommendationRefresh, [{'user_id': user_id, 'requested_at': datetime.utcnow()}], ['user_id'], {
+        'requested_at': lambda current, new: new,
+    })
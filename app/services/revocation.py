@@ -0,0 +1,147 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import or_
+from app.extensions import db, jwt
+from app.models import RevokedToken
+from .cursors import open_gaps, in_gaps, fill_gaps, advance
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings (no false negatives)."""
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        # Standard sizing: m = -n ln(p) / ln(2)^2, k = m/n ln(2)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationList:
+    """In-memory JWT denylist mirrored from the revoked_tokens table.
+
+    Lookups are a bloom filter probe, confirmed against an exact set only on
+    a (rare) bloom hit, so checking a token costs microseconds. Revocations
+    made by other workers are picked up by an incremental sync (rows with an
+    id above the last seen one, or late into an id gap it skipped) at most
+    every `sync_interval` seconds.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001, sync_interval=5):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def init_app(self, app):
+        self.capacity = app.config.get('REVOCATION_BLOOM_CAPACITY', self.capacity)
+        self.error_rate = app.config.get('REVOCATION_BLOOM_ERROR_RATE', self.error_rate)
+        self.sync_interval = app.config.get('REVOCATION_SYNC_INTERVAL', self.sync_interval)
+        self._reset()
+
+    def _reset(self):
+        self._bloom = BloomFilter(self.capacity, self.error_rate)
+        self._exact = {} # jti -> expires_at
+        self._last_id = 0
+        self._gaps = [] # Skipped ids still to check, see cursors
+        self._last_sync = None # Monotonic time of last DB sync, None forces a full load
+
+    def _remember(self, jti, expires_at):
+        self._bloom.add(jti)
+        self._exact[jti] = expires_at
+
+    def is_revoked(self, jti):
+        self.maybe_sync()
+        if jti not in self._bloom:
+            return False
+        return jti in self._exact
+
+    def sync_due(self):
+        last_sync = self._last_sync
+        return last_sync is None or time.monotonic() - last_sync >= self.sync_interval
+
+    def maybe_sync(self):
+        if not self.sync_due():
+            return
+        with self._lock:
+            if self._last_sync is not None and time.monotonic() - self._last_sync < self.sync_interval:
+                return
+            if self._last_sync is None or len(self._exact) >= self._bloom.capacity:
+                self._rebuild()
+            else:
+                self._sync_new_rows()
+            self._last_sync = time.monotonic()
+
+    def _sync_new_rows(self):
+        now = datetime.utcnow()
+        self._gaps = open_gaps(self._gaps, now)
+        condition = RevokedToken.id > self._last_id
+        if self._gaps:
+            condition = or_(condition, in_gaps(RevokedToken.id, self._gaps))
+        rows = db.session.query(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at).filter(
+            condition
+        ).order_by(RevokedToken.id).all()
+        for row_id, jti, expires_at in rows:
+            if expires_at > now: # Expired tokens are rejected anyway, until prune-revoked-tokens drops the row
+                self._remember(jti, expires_at)
+        late = [row[0] for row in rows if row[0] <= self._last_id]
+        self._gaps = fill_gaps(self._gaps, late)
+        self._last_id = advance(self._last_id, self._gaps, [row[0] for row in rows[len(late):]], now)
+
+    def _rebuild(self):
+        # Fresh filter without the tokens that have expired since (bloom
+        # filters can't delete). Every row up to the cursor and outside its
+        # gaps is already in _exact if still live, so only those are read
+        now = datetime.utcnow()
+        live = {jti: exp for jti, exp in self._exact.items() if exp > now}
+        self._bloom = BloomFilter(max(self.capacity, 2 * len(live)), self.error_rate)
+        self._exact = {}
+        for jti, exp in live.items():
+            self._remember(jti, exp)
+        self._sync_new_rows()
+
+    def revoke(self, jwt_payload):
+        """Persist a revocation and apply it locally straight away.
+
+        Adds to the current session; the caller commits.
+        """
+        expires_at = datetime.utcfromtimestamp(jwt_payload['exp'])
+        db.session.add(RevokedToken(
+            jti=jwt_payload['jti'],
+            token_type=jwt_payload['type'],
+            user_id=int(jwt_payload['sub']),
+            expires_at=expires_at,
+        ))
+        with self._lock:
+            self._remember(jwt_payload['jti'], expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+
+revocation_list = RevocationList()
+
+
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(_jwt_header, jwt_payload):
+    return revocation_list.is_revoked(jwt_payload['jti'])
@@ -0,0 +1,159 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import delete, select
+from app.extensions import db
+from app.models import PlayEvent, Track, TrackPlayRollup, ArtistPlayRollup, RollupWatermark
+from .cursors import open_gaps, in_gaps, fill_gaps, advance
+from .upserts import upsert
+
+WATERMARK_NAME = 'play_rollups'
+GRANULARITIES = {
+    'hour': lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    'day': lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+def _increment(model, rows, key_columns):
+    """Insert rows, or add their plays/ms_played onto existing rollup rows."""
+    upsert(model, rows, key_columns, {
+        'plays': lambda current, new: current + new,
+        'ms_played': lambda current, new: current + new,
+    })
+
+
+def _aggregate(events):
+    """Fold (user_id, track_id, artist, played_at, ms_played) rows into rollup rows."""
+    tracks = defaultdict(lambda: [0, 0])
+    artists = defaultdict(lambda: [0, 0])
+    artist_names = {}
+    for user_id, track_id, artist, played_at, ms_played in events:
+        for granularity, truncate in GRANULARITIES.items():
+            bucket = truncate(played_at)
+            totals = tracks[(granularity, bucket, user_id, track_id)]
+            totals[0] += 1
+            totals[1] += ms_played or 0
+            if artist:
+                key = (granularity, bucket, user_id, artist.casefold())
+                artist_names.setdefault(key, artist)
+                totals = artists[key]
+                totals[0] += 1
+                totals[1] += ms_played or 0
+    track_rows = [
+        {'granularity': g, 'bucket_start': b, 'user_id': u, 'track_id': t, 'plays': p, 'ms_played': ms}
+        for (g, b, u, t), (p, ms) in tracks.items()
+    ]
+    artist_rows = [
+        {'granularity': g, 'bucket_start': b, 'user_id': u, 'artist_key': a, 'artist': artist_names[(g, b, u, a)],
+         'plays': p, 'ms_played': ms}
+        for (g, b, u, a), (p, ms) in artists.items()
+    ]
+    return track_rows, artist_rows
+
+
+def _events_query():
+    # Artist comes from the track at aggregation time; deleted tracks still count for track stats
+    return db.session.query(
+        PlayEvent.id, PlayEvent.user_id, PlayEvent.track_id, Track.artist, PlayEvent.played_at, PlayEvent.ms_played
+    ).outerjoin(Track, Track.id == PlayEvent.track_id)
+
+
+def _fold(events):
+    """Add (id, user_id, track_id, artist, played_at, ms_played) rows onto the rollups."""
+    track_rows, artist_rows = _aggregate([event[1:] for event in events])
+    _increment(TrackPlayRollup, track_rows, ['granularity', 'bucket_start', 'user_id', 'track_id'])
+    _increment(ArtistPlayRollup, artist_rows, ['granularity', 'bucket_start', 'user_id', 'artist_key'])
+
+
+def _get_watermark():
+    watermark = db.session.get(RollupWatermark, WATERMARK_NAME)
+    if watermark is None:
+        watermark = RollupWatermark(name=WATERMARK_NAME, last_event_id=0)
+        db.session.add(watermark)
+    return watermark
+
+
+def aggregate_plays(chunk_size=10000, max_chunks=None):
+    """Fold play_events newer than the watermark, or late into its gaps, into the rollup tables.
+
+    Each chunk's rollup increments and the watermark move commit together,
+    so a crash mid-run never double counts. Returns events aggregated.
+    """
+    total = 0
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        watermark = _get_watermark()
+        now = datetime.utcnow()
+        gaps = open_gaps(watermark.gaps, now)
+        late = []
+        if gaps:
+            late = _events_query().filter(in_gaps(PlayEvent.id, gaps)).order_by(PlayEvent.id).limit(chunk_size).all()
+        events = _events_query().filter(PlayEvent.id > watermark.last_event_id).order_by(PlayEvent.id).limit(chunk_size).all()
+        if not late and not events:
+            watermark.gaps = gaps or None # Drops the expired ones
+            db.session.commit()
+            break
+        _fold(late + events)
+        gaps = fill_gaps(gaps, [event[0] for event in late])
+        watermark.last_event_id = advance(watermark.last_event_id, gaps, [event[0] for event in events], now)
+        watermark.gaps = gaps or None
+        watermark.updated_at = now
+        db.session.commit()
+        total += len(late) + len(events)
+        chunks += 1
+    return total
+
+
+def backfill_rollups(since=None, chunk_size=10000):
+    """Rebuild rollups from raw events played at or after `since` (all if None).
+
+    Only events up to the current watermark and outside its gaps are
+    replayed; anything else is left for aggregate_plays, so the two never
+    count an event twice.
+    """
+    watermark = _get_watermark()
+    upper = watermark.last_event_id
+    gaps = open_gaps(watermark.gaps, datetime.utcnow())
+    day_start = GRANULARITIES['day'](since) if since else None
+    for model in (TrackPlayRollup, ArtistPlayRollup):
+        stmt = delete(model)
+        if day_start is not None:
+            stmt = stmt.where(model.bucket_start >= day_start)
+        db.session.execute(stmt)
+
+    total = 0
+    last_id = 0
+    while True:
+        query = _events_query().filter(PlayEvent.id > last_id, PlayEvent.id <= upper)
+        if day_start is not None:
+            query = query.filter(PlayEvent.played_at >= day_start)
+        if gaps:
+            query = query.filter(~in_gaps(PlayEvent.id, gaps))
+        events = query.order_by(PlayEvent.id).limit(chunk_size).all()
+        if not events:
+            break
+        _fold(events)
+        last_id = events[-1][0]
+        total += len(events)
+    db.session.commit() # One transaction, readers never see a half-rebuilt range
+    return total
+
+
+def merge_track_rollups(track_ids, into_id):
+    """Fold the track rollups of `track_ids` into `into_id`'s. Joins the caller's transaction.
+
+    For merged duplicates, whose play events now point at `into_id`.
+    Artist rollups are keyed by name, so they need no change.
+    """
+    totals = defaultdict(lambda: [0, 0]) # Summed first: one statement can't update a row twice on PostgreSQL
+    for granularity, bucket, user_id, plays, ms_played in db.session.execute(
+        select(TrackPlayRollup.granularity, TrackPlayRollup.bucket_start, TrackPlayRollup.user_id,
+               TrackPlayRollup.plays, TrackPlayRollup.ms_played).where(TrackPlayRollup.track_id.in_(track_ids))
+    ):
+        total = totals[(granularity, bucket, user_id)]
+        total[0] += plays
+        total[1] += ms_played
+    db.session.execute(delete(TrackPlayRollup).where(TrackPlayRollup.track_id.in_(track_ids)))
+    _increment(TrackPlayRollup, [
+        {'granularity': g, 'bucket_start': b, 'user_id': u, 'track_id': into_id, 'plays': p, 'ms_played': ms}
+        for (g, b, u), (p, ms) in totals.items()
+    ], ['granularity', 'bucket_start', 'user_id', 'track_id'])
@@ -0,0 +1,330 @@
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+import urllib.error
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
+from xml.dom import minidom
+from xml.parsers.expat import ExpatError
+from app.models import ManifestType
+from .limiter import concurrency_limiter
+from .manifests import ManifestFetchError, UnsafeURLError, upstream_guard
+from .playback import playback_urls
+
+# Where the playback blueprint serves segments (app/routes/playback.py); built
+# by hand so manifests can be rewritten outside a Flask request (ASGI)
+SEGMENT_ROOT = '/api/play/segments'
+
+# Paths fetched through the proxy that are manifests themselves (HLS media
+# playlists of a master playlist), rewritten rather than cached
+PLAYLIST_SUFFIXES = {'.m3u8': ManifestType.HLS, '.m3u': ManifestType.HLS, '.mpd': ManifestType.DASH}
+
+SEGMENT_MEDIA_TYPES = {
+    '.ts': 'video/mp2t',
+    '.aac': 'audio/aac',
+    '.m4s': 'video/iso.segment',
+    '.m4a': 'audio/mp4',
+    '.mp4': 'video/mp4',
+    '.vtt': 'text/vtt',
+}
+
+_URI_ATTRIBUTE = re.compile(r'URI="([^"]*)"')
+# SegmentTemplate@media/@initialization, SegmentURL@media, Initialization@sourceURL, ...
+_DASH_URL_ATTRIBUTES = ('media', 'initialization', 'sourceURL', 'index')
+
+
+def playlist_type(path):
+    """ManifestType of an upstream path fetched through the proxy, or None for a segment."""
+    return PLAYLIST_SUFFIXES.get(os.path.splitext(urlsplit(path).path)[1].lower())
+
+
+def segment_media_type(path):
+    extension = os.path.splitext(urlsplit(path).path)[1].lower()
+    return SEGMENT_MEDIA_TYPES.get(extension) or mimetypes.guess_type(f'x{extension}')[0] or 'application/octet-stream'
+
+
+class _Rewriter:
+    # Upstream URL -> proxy URL, one signed token per upstream directory, so
+    # every segment of a rendition shares it (and edge caches see stable URLs)
+
+    def __init__(self):
+        self.tokens = {}
+
+    def __call__(self, url):
+        if urlsplit(url).scheme not in ('http', 'https'):
+            return url # data: URIs, skd:// keys and the like stay as they are
+        try:
+            # No DNS lookup here (ASGI rewrites on the event loop); _download
+            # checks the address it actually connects to
+            upstream_guard.check_url(url, resolve=False)
+        except UnsafeURLError:
+            return url # Never signed, so the proxy won't fetch it
+        prefix, _, rest = url.rpartition('/')
+        prefix += '/'
+        token = self.tokens.get(prefix)
+        if token is None:
+            token = self.tokens[prefix] = playback_urls.sign_prefix(prefix)
+        return f'{playback_urls.base_url}{SEGMENT_ROOT}/{token}/{rest}'
+
+
+def _rewrite_hls(text, manifest_url, proxied):
+    lines = []
+    for line in text.splitlines():
+        if line.startswith('#'):
+            line = _URI_ATTRIBUTE.sub(lambda m: f'URI="{proxied(urljoin(manifest_url, m.group(1)))}"', line)
+        elif line.strip():
+            line = proxied(urljoin(manifest_url, line.strip()))
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def _rewrite_dash(text, manifest_url, proxied):
+    try:
+        document = minidom.parseString(text)
+    except ExpatError as e:
+        raise ManifestFetchError(f"Unparseable DASH manifest: {e}") from e
+    mpd = document.documentElement
+
+    def base_urls(element):
+        return [child for child in element.childNodes
+                if child.nodeType == child.ELEMENT_NODE and child.localName == 'BaseURL']
+
+    # Top-level BaseURLs resolve against the manifest's own URL; without one
+    # add it, so relative segment paths resolve to the proxy too
+    top = base_urls(mpd)
+    if not top:
+        base = document.createElementNS(mpd.namespaceURI, f'{mpd.prefix}:BaseURL' if mpd.prefix else 'BaseURL')
+        base.appendChild(document.createTextNode(urljoin(manifest_url, '.')))
+        anchor = next((child for child in mpd.childNodes
+                       if child.nodeType == child.ELEMENT_NODE and child.localName != 'ProgramInformation'), None)
+        mpd.insertBefore(base, anchor)
+        top = [base]
+    for element in document.getElementsByTagNameNS('*', 'BaseURL'):
+        url = element.firstChild.data.strip() if element.firstChild else ''
+        # Deeper relative ones are left alone, they resolve against their (proxied) parent
+        if element in top or urlsplit(url).scheme:
+            for child in list(element.childNodes):
+                element.removeChild(child)
+            element.appendChild(document.createTextNode(proxied(urljoin(manifest_url, url))))
+    for element in document.getElementsByTagNameNS('*', '*'):
+        for name in _DASH_URL_ATTRIBUTES:
+            value = element.getAttribute(name)
+            if value and urlsplit(value).scheme:
+                element.setAttribute(name, proxied(value))
+    return document.toxml()
+
+
+def rewrite_manifest(body, manifest_type, manifest_url):
+    """A manifest body with its segment (and media playlist) URIs pointing at the segment proxy.
+
+    Relative URIs are resolved against `manifest_url` first. Raises
+    ManifestFetchError for a body that can't be parsed.
+    """
+    try:
+        text = body.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        raise ManifestFetchError("Manifest isn't UTF-8") from e
+    proxied = _Rewriter()
+    if ManifestType(manifest_type) == ManifestType.HLS:
+        return _rewrite_hls(text, manifest_url, proxied).encode()
+    return _rewrite_dash(text, manifest_url, proxied).encode()
+
+
+class _Download:
+    # One in-flight upstream fetch; concurrent misses for the same URL wait on it
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class SegmentCache:
+    """Size-bounded LRU of upstream segments on local disk, for the segment proxy.
+
+    Concurrent misses for a segment share one upstream download: the first
+    request fetches it, the others wait and then read the finished file.
+    Files are written under a temporary name and renamed into place, so a
+    reader never sees a partial segment, and handed out already open, so
+    eviction can't remove one between the lookup and the read.
+
+    The LRU index is per process, rebuilt from the directory at startup
+    (oldest files first). Workers sharing SEGMENT_CACHE_DIR also pick up
+    each other's files, but each evicts by its own view, so total disk use
+    can exceed SEGMENT_CACHE_MAX_BYTES by up to a factor of the worker
+    count; size it accordingly.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.max_bytes = 1024 ** 3
+        self.max_segment_bytes = 50 * 1024 * 1024
+        self.timeout = 10
+        self._entries = OrderedDict() # key -> size, least recently used first
+        self._size = 0
+        self._downloads = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SEGMENT_PROXY_ENABLED', False)
+        self.directory = app.config.get('SEGMENT_CACHE_DIR')
+        self.max_bytes = app.config.get('SEGMENT_CACHE_MAX_BYTES', self.max_bytes)
+        self.max_segment_bytes = app.config.get('SEGMENT_MAX_BYTES', self.max_segment_bytes)
+        self.timeout = app.config.get('MANIFEST_FETCH_TIMEOUT', self.timeout)
+        if self.enabled:
+            if not self.directory:
+                raise ValueError("SEGMENT_PROXY_ENABLED needs SEGMENT_CACHE_DIR")
+            os.makedirs(self.directory, exist_ok=True)
+            self.load()
+
+    def rewrite(self, body, manifest_type, manifest_url):
+        """rewrite_manifest() when the segment proxy is enabled, else the body as is."""
+        return rewrite_manifest(body, manifest_type, manifest_url) if self.enabled else body
+
+    def load(self):
+        """Rebuild the index from the cache directory, dropping stale partial downloads."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            files = []
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith('.part'):
+                    if time.time() - stat.st_mtime > 3600: # Not another worker's download in progress
+                        os.unlink(entry.path)
+                    continue
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+            for _, key, size in sorted(files):
+                self._entries[key] = size
+                self._size += size
+            self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _evict(self):
+        # Caller holds the lock. The newest entry always stays, however big
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self._count(evictions=1)
+            try:
+                os.unlink(self._path(key)) # Open readers keep their file
+            except FileNotFoundError:
+                pass
+
+    def _add(self, key, size):
+        # Caller holds the lock
+        self._size += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        self._evict()
+
+    def get(self, url):
+        """Cached file for segment `url`, open for binary reading, downloading it on a miss.
+
+        The caller closes the file. Raises ManifestFetchError.
+        """
+        key = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+        path = self._path(key)
+        while True:
+            with self._lock:
+                try:
+                    f = open(path, 'rb') # Under the lock: _evict can't unlink it first
+                except FileNotFoundError:
+                    pass
+                else:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    else: # Fetched by another worker
+                        self._add(key, os.fstat(f.fileno()).st_size)
+                    self._count(hits=1)
+                    return f
+                download = self._downloads.get(key)
+                leader = download is None
+                if leader:
+                    download = self._downloads[key] = _Download()
+                self._count(misses=1) if leader else self._count(shared=1)
+            if leader:
+                break
+            with concurrency_limiter.upstream():
+                download.done.wait()
+            if download.error is not None:
+                raise download.error
+            # Loop: normally a hit now, unless evicted again in the meantime
+
+        try:
+            with concurrency_limiter.upstream():
+                f, size = self._download(url, path)
+            with self._lock:
+                self._add(key, size)
+                self._count(bytes_fetched=size)
+            return f
+        except ManifestFetchError as e:
+            download.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._downloads[key]
+            download.done.set()
+
+    def _download(self, url, path):
+        # Returns (file, size), the file open on the renamed download
+        partial = f'{path}.{os.getpid()}.{threading.get_ident()}.part'
+        size = 0
+        out = None
+        try:
+            out = open(partial, 'w+b')
+            with upstream_guard.open(url, timeout=self.timeout) as resp:
+                while chunk := resp.read(256 * 1024):
+                    size += len(chunk)
+                    if size > self.max_segment_bytes:
+                        raise ManifestFetchError("Segment too large")
+                    out.write(chunk)
+            os.replace(partial, path)
+            out.seek(0)
+            return out, size
+        except urllib.error.HTTPError as e:
+            raise ManifestFetchError(f"Upstream returned {e.code}") from e
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise ManifestFetchError(f"Upstream unreachable: {e}") from e
+        finally:
+            if os.path.exists(partial): # Failed before the rename
+                if out is not None:
+                    out.close()
+                os.unlink(partial)
+
+    def clear(self):
+        """Remove every cached segment."""
+        with self._lock:
+            for key in self._entries:
+                try:
+                    os.unlink(self._path(key))
+                except FileNotFoundError:
+                    pass
+            self._entries.clear()
+            self._size = 0
+
+    def _count(self, **counts):
+        # Caller holds the lock
+        for name, value in counts.items():
+            self._stats[name] += value
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = dict.fromkeys(('hits', 'misses', 'shared', 'evictions', 'bytes_fetched'), 0)
+
+    def stats(self):
+        """Counters since startup, plus the cache's current size."""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._size)
+
+
+segment_cache = SegmentCache()
@@ -0,0 +1,548 @@
+import contextlib
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import (
+    MetaData, Select, Table, UpdateBase, and_, delete, func, insert, inspect, or_, select, text, tuple_, update
+)
+from sqlalchemy.sql.selectable import Join
+from app.extensions import ShardedSession, db
+from app.models import UserShard
+from .cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT = 'default'
+
+# Tables that stay in the main database: accounts, auth state and the shard
+# map itself. Every other table holds user data and lives on the user's shard
+DIRECTORY_TABLES = frozenset({'users', 'revoked_tokens', 'idempotency_keys', 'user_shards'})
+
+# Methods that may still run against a user who is being moved
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+Placement = namedtuple('Placement', 'shard locked')
+
+
+class ShardMoveError(Exception):
+    pass
+
+
+def _primary_table(mapper, clause):
+    # The table a statement is about: its mapper's, the DML target, or a SELECT's first FROM
+    if mapper is not None:
+        return inspect(mapper).local_table
+    if isinstance(clause, Table):
+        return clause
+    if isinstance(clause, UpdateBase):
+        return clause.table
+    if isinstance(clause, Select):
+        froms = clause.get_final_froms()
+        table = froms[0] if froms else None
+        while isinstance(table, Join):
+            table = table.left
+        return table
+    return None
+
+
+def shard_metadata():
+    """The user data tables, as created on a shard.
+
+    Foreign keys into the main database are left out (the users they point
+    at live there), and on SQLite the tables use AUTOINCREMENT so each
+    shard's id range can be reserved, see ShardMap.create_schema().
+    """
+    metadata = MetaData(naming_convention=db.metadata.naming_convention)
+    for table in db.metadata.sorted_tables:
+        if table.name in DIRECTORY_TABLES:
+            continue
+        table = table.to_metadata(metadata)
+        for fk in list(table.foreign_keys):
+            if fk.target_fullname.split('.')[0] in DIRECTORY_TABLES:
+                table.foreign_keys.discard(fk)
+                fk.parent.foreign_keys.discard(fk)
+                table.constraints.discard(fk.constraint)
+        if table.autoincrement_column is not None:
+            table.dialect_options['sqlite']['autoincrement'] = True
+    return metadata
+
+
+class ShardMap:
+    """Horizontal sharding of user data by user id.
+
+    The main database (SQLALCHEMY_DATABASE_URI) keeps the accounts and the
+    user_shards map; every user's tracks, playlists, plays and everything
+    hanging off them live together on one shard, either an extra database
+    from SHARDS or the main database itself ('default', where users
+    without a user_shards row are). New accounts are spread over
+    SHARD_NEW_USERS, and `flask shards move` rebalances online.
+
+    Each request is routed to a single shard: the authenticated user's, or
+    for /api/playlists/<id> the playlist owner's (members read and edit the
+    owner's copy). Statements on DIRECTORY_TABLES always go to the main
+    database. Jobs without a request run against one shard at a time under
+    `use()`, and `scan()` runs a query on every shard.
+
+    Ids are kept unique across shards by giving each shard its own range
+    (the nth shard in SHARDS allocates from n * SHARD_ID_SPAN), so rows keep
+    their ids, and URLs stay valid, when a user is moved.
+
+    With no SHARDS configured none of this is active.
+    """
+
+    def __init__(self, app=None):
+        self.names = (DEFAULT,)
+        self.new_user_shards = ()
+        self.id_span = 10**8
+        self.settle = 10
+        self.cache = LocalCache(maxsize=100000, ttl=5)
+        self.owners = LocalCache(maxsize=100000, ttl=3600)
+        if app is not None:
+            self.init_app(app)
+
+    @property
+    def enabled(self):
+        return len(self.names) > 1
+
+    def configure(self, config):
+        shards = tuple(config.get('SHARDS') or ())
+        if DEFAULT in shards:
+            raise ValueError(f"'{DEFAULT}' is the main database, pick another shard name")
+        self.names = (DEFAULT, *shards)
+        self.new_user_shards = tuple(config.get('SHARD_NEW_USERS') or shards)
+        self.id_span = config.get('SHARD_ID_SPAN', self.id_span)
+        self.settle = config.get('SHARD_MOVE_SETTLE', self.settle)
+        self.cache = LocalCache(maxsize=config.get('SHARD_MAP_MAXSIZE', 100000), ttl=config.get('SHARD_MAP_TTL', 5))
+        self.owners.clear()
+        ShardedSession.router = self.route if self.enabled else None
+
+    def init_app(self, app):
+        self.configure(app.config)
+        app.before_request(self._route_request)
+
+    # --- Routing ---
+
+    def engine(self, name):
+        if name not in self.names:
+            raise KeyError(f"Unknown shard: {name}")
+        return db.engines[None if name == DEFAULT else name]
+
+    def route(self, session, mapper, clause):
+        """ShardedSession.router: the engine for a statement, None for the main database."""
+        shard = session.info.get('shard', DEFAULT)
+        if shard == DEFAULT:
+            return None
+        table = _primary_table(mapper, clause)
+        if table is not None and table.name in DIRECTORY_TABLES:
+            return None
+        return self.engine(shard)
+
+    def placement(self, user_id):
+        """Where a user's data is, as Placement(shard, locked). Cached for SHARD_MAP_TTL."""
+        if not self.enabled:
+            return Placement(DEFAULT, False)
+        placement = self.cache.get(user_id)
+        if placement is None:
+            row = db.session.execute(
+                select(UserShard.shard, UserShard.locked_at).where(UserShard.user_id == user_id)
+            ).first()
+            placement = Placement(row.shard, row.locked_at is not None) if row else Placement(DEFAULT, False)
+            self.cache.set(user_id, placement)
+        return placement
+
+    def shard_for(self, user_id):
+        return self.placement(user_id).shard
+
+    def route_user(self, user_id):
+        """Send the rest of this request to the user's shard.
+
+        Returns a 503 response for writes while the user is being moved.
+        """
+        if not self.enabled:
+            return None
+        placement = self.placement(user_id)
+        db.session.info['shard'] = placement.shard
+        if placement.locked and request.method not in SAFE_METHODS:
+            response = jsonify({"message": "This library is being moved, try again shortly"})
+            response.headers['Retry-After'] = str(max(1, int(self.settle)))
+            return response, 503
+        return None
+
+    def route_to_owner(self, model, pk):
+        """route_user() for the owner of `model` row `pk`, wherever it is. None if there's no such row."""
+        if not self.enabled:
+            return None
+        key = (model.__tablename__, pk)
+        owner_id = self.owners.get(key)
+        if owner_id is None:
+            _, row = self.locate(
+                select(model.user_id).where(inspect(model).primary_key[0] == pk)
+                .execution_options(include_deleted=True)
+            )
+            if row is None:
+                return None
+            owner_id = row.user_id
+            self.owners.set(key, owner_id) # Owners never change, only their shard does
+        return self.route_user(owner_id)
+
+    def _route_request(self):
+        if not self.enabled:
+            return None
+        db.session.info.pop('shard', None) # Left over from the last request on this session
+        if request.blueprint == 'playback':
+            return None # Signed URLs need neither the caller's identity nor their shard
+        try:
+            # Decoded again by @jwt_required() in the view, which reports any problems
+            verify_jwt_in_request(optional=True, verify_type=False, skip_revocation_check=True)
+            identity = get_jwt_identity()
+        except Exception:
+            return None
+        if identity is None:
+            return None
+        return self.route_user(int(identity))
+
+    @contextlib.contextmanager
+    def use(self, name):
+        """Route db.session to shard `name` inside the block (for jobs and scans)."""
+        self.engine(name) # Fail early on a typo
+        previous = db.session.info.get('shard')
+        db.session.info['shard'] = name
+        try:
+            yield
+        finally:
+            if previous is None:
+                db.session.info.pop('shard', None)
+            else:
+                db.session.info['shard'] = previous
+
+    def scan(self, statement):
+        """Run a SELECT on every shard, yielding (shard, row)."""
+        for name in self.names:
+            with self.use(name):
+                for row in db.session.execute(statement):
+                    yield name, row
+
+    def locate(self, statement):
+        """(shard, first row) from the first shard where `statement` matches, else (None, None)."""
+        for name in self.names:
+            with self.use(name):
+                row = db.session.execute(statement).first()
+            if row is not None:
+                return name, row
+        return None, None
+
+    def partition(self, rows, key='user_id'):
+        """Group row dicts by the shard of their `key` user, as {shard: rows}."""
+        if not self.enabled:
+            return {DEFAULT: list(rows)}
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.shard_for(row[key]), []).append(row)
+        return groups
+
+    # --- Placement and schema ---
+
+    def assign(self, user):
+        """Place a newly created user on a shard. Joins the caller's transaction; needs user.id."""
+        if self.enabled and self.new_user_shards:
+            if user.id is None:
+                db.session.flush()
+            shard = self.new_user_shards[user.id % len(self.new_user_shards)]
+            db.session.add(UserShard(user_id=user.id, shard=shard))
+
+    def create_schema(self, name):
+        """Create the user data tables on a shard and reserve its id range. Safe to re-run.
+
+        On SQLite a table always allocates past the highest id it holds, so
+        moving a user onto a shard with a lower range pulls that shard's
+        allocations up into it; the ranges are only strict on PostgreSQL.
+        """
+        engine = self.engine(name)
+        base = self.names.index(name) * self.id_span
+        metadata = shard_metadata() if name != DEFAULT else None
+        with engine.begin() as conn:
+            if metadata is not None:
+                metadata.create_all(conn)
+            if not base:
+                return
+            for table in metadata.sorted_tables:
+                column = table.autoincrement_column
+                if column is None:
+                    continue
+                if conn.dialect.name == 'sqlite':
+                    if not conn.execute(text("SELECT 1 FROM sqlite_sequence WHERE name = :t"), {'t': table.name}).first():
+                        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:t, :seq)"),
+                                     {'t': table.name, 'seq': base})
+                elif conn.dialect.name == 'postgresql':
+                    conn.execute(text(
+                        f"SELECT setval(pg_get_serial_sequence('{table.name}', '{column.name}'), "
+                        f"GREATEST(:seq, (SELECT COALESCE(MAX({column.name}), 0) FROM {table.name})))"
+                    ), {'seq': base})
+                else:
+                    raise NotImplementedError(f"Can't reserve id ranges on {conn.dialect.name}")
+
+    def counts(self):
+        """{shard: {'users': n, 'tracks': n, 'playlists': n}}, a cross-shard admin scan."""
+        from app.models import Playlist, Track
+        users = dict(db.session.execute(select(UserShard.shard, func.count()).group_by(UserShard.shard)).all())
+        unplaced = db.session.scalar(select(func.count()).select_from(db.metadata.tables['users'])) - sum(users.values())
+        users[DEFAULT] = users.get(DEFAULT, 0) + unplaced
+        stats = {}
+        for name in self.names:
+            with self.use(name):
+                stats[name] = {
+                    'users': users.get(name, 0),
+                    'tracks': db.session.scalar(select(func.count(Track.id)).execution_options(include_deleted=True)),
+                    'playlists': db.session.scalar(select(func.count(Playlist.id)).execution_options(include_deleted=True)),
+                }
+        return stats
+
+    def clear(self):
+        self.cache.clear()
+        self.owners.clear()
+
+
+shard_map = ShardMap()
+
+
+# --- Moving users between shards ---
+
+# Rebuilt from the play events on the destination instead of being copied
+DERIVED_TABLES = frozenset({'track_play_rollups', 'artist_play_rollups'})
+# Copied once and rebuilt by the next `flask build-recommendations`, instead
+# of being brought in line under the lock (neighbours are most of the rows)
+REBUILT_TABLES = frozenset({'track_neighbours', 'recommendation_refreshes'})
+# A column every write to the table's rows moves forward, so step 2 of a
+# move only reads the rows changed since step 1. Playlist entries and
+# members go with their playlist, whose every write bumps it (see
+# PlaylistReadCache); the other, small tables are compared in full
+CHANGE_COLUMNS = {'tracks': 'updated_at', 'playlists': 'updated_at', 'manifest_health': 'checked_at'}
+
+
+def _user_rows(table, user_id, tables):
+    """WHERE clause selecting a user's rows in a shard table, None for tables that aren't per user."""
+    if 'playlist_id' in table.c: # playlist_tracks, playlist_members (user_id there is the member)
+        playlists = tables['playlists']
+        return table.c.playlist_id.in_(select(playlists.c.id).where(playlists.c.user_id == user_id))
+    if 'user_id' in table.c:
+        return table.c.user_id == user_id
+    if 'track_id' in table.c: # manifest_health, track_neighbours
+        tracks = tables['tracks']
+        return table.c.track_id.in_(select(tracks.c.id).where(tracks.c.user_id == user_id))
+    return None # rollup_watermarks
+
+
+def _pk_match(table, key):
+    return and_(*(column == value for column, value in zip(table.primary_key.columns, key)))
+
+
+def _check_self_contained(conn, user_id, tables):
+    # Editors put their own tracks into other people's playlists. Those
+    # links only work within one shard, so such users can't move alone
+    playlists, tracks, links = tables['playlists'], tables['tracks'], tables['playlist_tracks']
+    joined = links.join(playlists, playlists.c.id == links.c.playlist_id).join(tracks, tracks.c.id == links.c.track_id)
+    crossing = conn.execute(select(func.count()).select_from(joined).where(or_(
+        and_(playlists.c.user_id == user_id, tracks.c.user_id != user_id),
+        and_(playlists.c.user_id != user_id, tracks.c.user_id == user_id),
+    ))).scalar()
+    if crossing:
+        raise ShardMoveError(f"User {user_id} has {crossing} playlist entries linked with other users' libraries "
+                             "(through editors), which have to stay on one shard")
+
+
+def _copy_table(src, dest, table, where, batch_size):
+    """Copy matching rows in batches. Returns rows copied."""
+    copied = 0
+    stmt = select(table).where(where)
+    if table.name == 'play_events':
+        stmt = stmt.order_by(table.c.id)
+    for rows in src.execution_options(yield_per=batch_size).execute(stmt).mappings().partitions():
+        rows = [dict(row) for row in rows]
+        if table.name == 'play_events':
+            # They get new ids from the destination, above its rollup
+            # watermark, so its next aggregate-plays folds them into the
+            # (uncopied) rollups
+            for row in rows:
+                del row['id']
+        dest.execute(insert(table), rows)
+        dest.commit()
+        copied += len(rows)
+    return copied
+
+
+def _key(table, row):
+    return tuple(row[column.name] for column in table.primary_key.columns)
+
+
+def _diff(src, dest, table, where):
+    """(keys only on dest, rows missing or different on dest) among the rows matching `where`."""
+    theirs = {_key(table, row): dict(row) for row in src.execute(select(table).where(where)).mappings()}
+    ours = {_key(table, row): dict(row) for row in dest.execute(select(table).where(where)).mappings()}
+    return [pk for pk in ours if pk not in theirs], [row for pk, row in theirs.items() if ours.get(pk) != row]
+
+
+def _sync(src, dest, user_id, tables, since):
+    """Bring the destination's copy in line with the source, after a step 1 copy started at `since`.
+
+    Play events and REBUILT_TABLES are left alone. Tables in CHANGE_COLUMNS
+    only have their keys compared in full, to find deletions, and the rows
+    changed since `since` read. Returns rows changed.
+    """
+    deletes, upserts = [], []
+    playlists = set() # Changed since the copy, or gone: their entries and members are compared
+    for table in tables.values():
+        where = _user_rows(table, user_id, tables)
+        if where is None or table.name == 'play_events' or table.name in DERIVED_TABLES | REBUILT_TABLES:
+            continue
+        if table.name in CHANGE_COLUMNS:
+            pk = list(table.primary_key.columns)
+            theirs = set(map(tuple, src.execute(select(*pk).where(where))))
+            ours = set(map(tuple, dest.execute(select(*pk).where(where))))
+            gone = list(ours - theirs)
+            # Rows the copy read after they changed match on both sides and are skipped
+            _, rows = _diff(src, dest, table, and_(where, table.c[CHANGE_COLUMNS[table.name]] >= since))
+            missing = theirs - ours - {_key(table, row) for row in rows}
+            if missing: # Only a transaction open for longer than the settle time could leave these
+                rows += [dict(row) for row in src.execute(select(table).where(or_(
+                    *(_pk_match(table, key) for key in missing)
+                ))).mappings()]
+            if table.name == 'playlists':
+                playlists.update(row['id'] for row in rows)
+                playlists.update(key[0] for key in gone)
+        elif 'playlist_id' in table.c:
+            if not playlists:
+                continue
+            gone, rows = _diff(src, dest, table, and_(where, table.c.playlist_id.in_(playlists)))
+        else:
+            gone, rows = _diff(src, dest, table, where)
+        deletes.append((table, gone))
+        upserts.append((table, rows))
+
+    changed = 0
+    for table, keys in reversed(deletes): # Children first
+        for pk in keys:
+            dest.execute(delete(table).where(_pk_match(table, pk)))
+        changed += len(keys)
+    for table, rows in upserts: # Parents first
+        for row in rows:
+            if not dest.execute(update(table).where(_pk_match(table, _key(table, row))).values(row)).rowcount:
+                dest.execute(insert(table).values(row))
+        changed += len(rows)
+    return changed
+
+
+def _delete_user(conn, user_id, tables, batch_size):
+    """Delete a user's rows from one shard, `batch_size` rows per transaction."""
+    for table in reversed(list(tables.values())): # Children first
+        where = _user_rows(table, user_id, tables)
+        if where is None:
+            continue
+        pk = list(table.primary_key.columns)
+        chunk = select(*pk).where(where).limit(batch_size)
+        target = pk[0].in_(chunk) if len(pk) == 1 else tuple_(*pk).in_(chunk)
+        while True:
+            count = conn.execute(delete(table).where(target)).rowcount
+            conn.commit()
+            if count < batch_size:
+                break
+
+
+def _set_placement(user_id, **values):
+    placement = db.session.get(UserShard, user_id)
+    if placement is None:
+        placement = UserShard(user_id=user_id, shard=DEFAULT)
+        db.session.add(placement)
+    for name, value in values.items():
+        setattr(placement, name, value)
+    db.session.commit()
+    shard_map.cache.delete(user_id)
+
+
+def move_user(user_id, target, batch_size=1000, settle=None):
+    """Move a user's data to shard `target` while they keep using the app.
+
+    1. Copy everything in batches; the user carries on reading and writing
+       the source meanwhile. Play events are copied up to the newest id
+       when the move started, once `settle` seconds have passed for
+       inserts still in flight with lower ids to commit.
+    2. Lock the user (writes get 503 with Retry-After), wait `settle`
+       seconds for every worker's cached shard map and buffered play events
+       to catch up, then bring the copy exactly in line with the source.
+    3. Point user_shards at the target, unlock, wait `settle` again for
+       in-flight reads of the source to finish, and delete the source copy.
+
+    Step 2 only reads what changed during step 1 (see CHANGE_COLUMNS) and
+    the play events past the step 1 copy, so the lock is short. Stats
+    rollups aren't copied: the destination's next `flask aggregate-plays`
+    rebuilds them from the copied play events, and the next
+    `flask build-recommendations` rebuilds the user's neighbours.
+    Raises ShardMoveError if the user can't be moved on their own.
+    Returns {'copied': rows copied in step 1, 'synced': rows changed in step 2}.
+    """
+    settle = shard_map.settle if settle is None else settle
+    shard_map.engine(target)
+    source = db.session.execute(select(UserShard.shard).where(UserShard.user_id == user_id)).scalar() or DEFAULT
+    if source == target:
+        return {'copied': 0, 'synced': 0}
+    tables = {table.name: table for table in shard_metadata().sorted_tables}
+    copied = {name: _user_rows(table, user_id, tables) for name, table in tables.items() if name not in DERIVED_TABLES}
+    copied = {name: where for name, where in copied.items() if where is not None}
+    events = tables['play_events']
+
+    with shard_map.engine(source).connect() as src, shard_map.engine(target).connect() as dest:
+        _check_self_contained(src, user_id, tables)
+        _delete_user(dest, user_id, tables, batch_size) # Leftovers of an earlier, failed attempt
+        floor = src.execute(select(func.coalesce(func.max(events.c.id), 0))).scalar()
+        src.rollback()
+        started = time.monotonic()
+        # Writes committing after the copy read past their rows stamped them
+        # at most `settle` seconds before it started
+        since = datetime.utcnow() - timedelta(seconds=settle)
+
+        # Tables are copied parents first. On PostgreSQL the copy reads one
+        # REPEATABLE READ snapshot, so every row's parents are there before
+        # it. SQLite reads aren't held in one snapshot here, so its foreign
+        # keys are off instead; step 2 restores consistency, and nothing
+        # reads this copy before then
+        if src.dialect.name == 'postgresql':
+            src.execution_options(isolation_level='REPEATABLE READ')
+        if dest.dialect.name == 'sqlite':
+            dest.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        try:
+            rows = 0
+            for name, where in copied.items():
+                if name != 'play_events':
+                    rows += _copy_table(src, dest, tables[name], where, batch_size)
+        finally:
+            if dest.dialect.name == 'sqlite':
+                dest.exec_driver_sql('PRAGMA foreign_keys=ON')
+        src.rollback() # Later reads see the source as of now, not as of the snapshot
+        # Ids are taken in order but committed in any order: wait for the
+        # ones below the floor before copying up to it
+        time.sleep(max(0.0, started + settle - time.monotonic()))
+        rows += _copy_table(src, dest, events, and_(copied['play_events'], events.c.id <= floor), batch_size)
+        src.rollback()
+
+        _set_placement(user_id, locked_at=datetime.utcnow())
+        try:
+            time.sleep(settle)
+            synced = _sync(src, dest, user_id, tables, since)
+            synced += _copy_table(src, dest, events, and_(copied['play_events'], events.c.id > floor), batch_size)
+            refreshes = tables['recommendation_refreshes']
+            dest.execute(delete(refreshes).where(refreshes.c.user_id == user_id))
+            dest.execute(insert(refreshes).values(user_id=user_id, requested_at=datetime.utcnow()))
+            dest.commit()
+            src.rollback()
+            _set_placement(user_id, shard=target, locked_at=None)
+        except Exception:
+            dest.rollback()
+            _set_placement(user_id, locked_at=None)
+            raise
+
+        time.sleep(settle)
+        _delete_user(src, user_id, tables, batch_size)
+    logger.info("Moved user %s from %s to %s (%d rows copied, %d synced)", user_id, source, target, rows, synced)
+    return {'copied': rows, 'synced': synced}
@@ -0,0 +1,101 @@
+from sqlalchemy import exists, or_, select, update
+from sqlalchemy.orm import subqueryload
+from app.extensions import db
+from app.models import Playlist, PlaylistMember, playlist_tracks
+from app.schemas import PlaylistSchema
+from .cache import LocalCache, make_cache
+
+playlist_schema = PlaylistSchema()
+
+
+def resolve_access(playlist_id, user_id):
+    """The user's role on a live playlist as (role, version), or None.
+
+    role is 'owner', 'editor' or 'viewer'. One query, served by the
+    playlists and playlist_members primary keys.
+    """
+    row = db.session.execute(
+        select(Playlist.user_id, Playlist.version, PlaylistMember.role)
+        .outerjoin(PlaylistMember, (PlaylistMember.playlist_id == Playlist.id) & (PlaylistMember.user_id == user_id))
+        .where(Playlist.id == playlist_id)
+    ).first()
+    if row is None:
+        return None
+    owner_id, version, role = row
+    if owner_id == user_id:
+        return 'owner', version
+    return (role, version) if role else None
+
+
+def can_edit(user_id):
+    """WHERE clause over Playlist for the owner or an editor, for use inside a single UPDATE."""
+    return or_(
+        Playlist.user_id == user_id,
+        exists().where(
+            PlaylistMember.playlist_id == Playlist.id,
+            PlaylistMember.user_id == user_id,
+            PlaylistMember.role == 'editor',
+        ),
+    )
+
+
+def audience(playlist_id, owner_id):
+    """User ids to notify about a change to the playlist: the owner and every member."""
+    members = db.session.scalars(select(PlaylistMember.user_id).where(PlaylistMember.playlist_id == playlist_id))
+    return [owner_id, *members]
+
+
+def bump_playlists_containing(track_id):
+    """Bump the version of every playlist a track is in, after the track itself changed.
+
+    Playlist payloads embed their tracks, so this is what moves
+    playlist_cache on to a fresh entry. Joins the caller's transaction.
+    """
+    db.session.execute(
+        update(Playlist)
+        .where(Playlist.id.in_(select(playlist_tracks.c.playlist_id).where(playlist_tracks.c.track_id == track_id)))
+        .values(version=Playlist.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class PlaylistReadCache:
+    """Serialised playlist details (with tracks), keyed by (playlist id, version).
+
+    Every write to a playlist bumps its version, so entries never need
+    invalidating: readers of a popular shared playlist all hit the entry
+    for the current version and the old ones age out. Callers pass the
+    version from resolve_access(), which they've already paid for.
+    """
+
+    def __init__(self, app=None):
+        self.backend = LocalCache(maxsize=1000)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = make_cache(
+            backend=app.config.get('PLAYLIST_CACHE_BACKEND', 'local'),
+            url=app.config.get('PLAYLIST_CACHE_URL'),
+            maxsize=app.config.get('PLAYLIST_CACHE_MAXSIZE', 1000),
+            ttl=app.config.get('PLAYLIST_CACHE_TTL', 300),
+            prefix='playlist:',
+        )
+
+    def get_payload(self, playlist_id, version):
+        key = f'{playlist_id}:{version}'
+        payload = self.backend.get(key)
+        if payload is None:
+            playlist = Playlist.query.options(subqueryload(Playlist.tracks)).filter_by(id=playlist_id).first()
+            if playlist is None:
+                return None
+            payload = playlist_schema.dump(playlist)
+            if playlist.version == version: # Not one that changed since the caller looked
+                self.backend.set(key, payload)
+        return payload
+
+    def clear(self):
+        self.backend.clear()
+
+
+playlist_cache = PlaylistReadCache()
@@ -0,0 +1,139 @@
+import operator
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
+from app.extensions import db
+from app.models import ManifestType, Playlist, Track, playlist_tracks
+from app.schemas.playlist import SMART_RULE_FIELDS
+from .events import change_broker
+from .recommendations import mark_stale
+from .sharing import audience
+
+
+def _moment(value):
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None) # added_at is naive UTC
+    return moment
+
+
+# op -> (column, value) -> SQL condition
+_OPERATORS = {
+    'eq': operator.eq,
+    'ne': lambda column, value: or_(column != value, column.is_(None)), # Tracks without an artist aren't by X either
+    'contains': lambda column, value: column.icontains(value, autoescape=True),
+    'starts_with': lambda column, value: column.istartswith(value, autoescape=True),
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'in_last_days': lambda column, value: column >= datetime.utcnow() - timedelta(days=value),
+    'before': lambda column, value: column < _moment(value),
+    'after': lambda column, value: column > _moment(value),
+}
+
+
+def compile_rules(rules):
+    """WHERE clause over Track for a smart playlist's rules (as loaded by SmartRulesSchema).
+
+    Equality and range conditions compare the columns directly, so with the
+    owner's user_id they're served by ix_tracks_user_live (artist) and
+    ix_tracks_user_added (added_at).
+    """
+    conditions = []
+    for condition in rules['conditions']:
+        value = condition['value']
+        if SMART_RULE_FIELDS[condition['field']] == 'choice':
+            value = ManifestType(value)
+        conditions.append(_OPERATORS[condition['op']](getattr(Track, condition['field']), value))
+    return and_(*conditions) if rules.get('match', 'all') == 'all' else or_(*conditions)
+
+
+def _apply(playlist_id, owner_id, add=(), remove=(), bump=True):
+    # Tracks that start matching go at the end, in the order given
+    if not add and not remove:
+        return False
+    if remove:
+        db.session.execute(delete(playlist_tracks).where(
+            playlist_tracks.c.playlist_id == playlist_id, playlist_tracks.c.track_id.in_(remove)
+        ))
+    if add:
+        start = db.session.execute(
+            select(func.coalesce(func.max(playlist_tracks.c.track_order) + 1, 0))
+            .where(playlist_tracks.c.playlist_id == playlist_id)
+        ).scalar()
+        db.session.execute(insert(playlist_tracks), [
+            {'playlist_id': playlist_id, 'track_id': track_id, 'track_order': start + offset}
+            for offset, track_id in enumerate(add)
+        ])
+    mark_stale(owner_id)
+    if bump:
+        version = db.session.execute(
+            update(Playlist).where(Playlist.id == playlist_id)
+            .values(version=Playlist.version + 1).returning(Playlist.version)
+        ).scalar()
+        for user_id in audience(playlist_id, owner_id):
+            change_broker.publish(user_id, 'playlist.refreshed', playlist_id=playlist_id, version=version)
+    return True
+
+
+def refresh_playlist(playlist_id, bump=True):
+    """Re-evaluate a smart playlist's rules against the whole library. Joins the caller's transaction.
+
+    Tracks that still match keep their place. Pass bump=False when the
+    caller bumps the version (and notifies) for the same change itself.
+    Returns whether the tracks changed.
+    """
+    playlist = db.session.execute(select(Playlist.user_id, Playlist.rules).where(Playlist.id == playlist_id)).first()
+    if playlist is None or playlist.rules is None:
+        return False
+    matching = db.session.scalars(
+        select(Track.id).where(Track.user_id == playlist.user_id, compile_rules(playlist.rules))
+        .order_by(Track.added_at, Track.id)
+    ).all()
+    current = set(db.session.scalars(
+        select(playlist_tracks.c.track_id).where(playlist_tracks.c.playlist_id == playlist_id)
+    ))
+    return _apply(playlist_id, playlist.user_id, add=[track_id for track_id in matching if track_id not in current],
+                  remove=current.difference(matching), bump=bump)
+
+
+def refresh_track(track):
+    """Add or remove a track that was just created, changed, deleted or restored in its owner's smart playlists.
+
+    One query checks the track against every smart playlist's rules, so
+    the cost doesn't grow with the library. Joins the caller's transaction.
+    """
+    smart = db.session.execute(
+        select(Playlist.id, Playlist.rules).where(Playlist.user_id == track.user_id, Playlist.rules.isnot(None))
+    ).all()
+    if not smart:
+        return
+    db.session.flush() # The checks below read the track's new values
+    matches = db.session.execute(
+        select(*(case((compile_rules(rules), True), else_=False) for _, rules in smart))
+        .where(Track.id == track.id, Track.deleted_at.is_(None))
+        .execution_options(include_deleted=True) # A trashed track matches nothing
+    ).first() or [False] * len(smart)
+    current = set(db.session.scalars(select(playlist_tracks.c.playlist_id).where(
+        playlist_tracks.c.track_id == track.id, playlist_tracks.c.playlist_id.in_([playlist_id for playlist_id, _ in smart])
+    )))
+    for (playlist_id, _), matched in zip(smart, matches):
+        if matched and playlist_id not in current:
+            _apply(playlist_id, track.user_id, add=[track.id])
+        elif not matched and playlist_id in current:
+            _apply(playlist_id, track.user_id, remove=[track.id])
+
+
+def refresh_smart_playlists():
+    """Re-evaluate every smart playlist, one transaction each. Returns (playlists, changed).
+
+    Incremental updates (refresh_track) keep up with track writes; this
+    catches what they can't see, like "added in the last 30 days" rules
+    as time passes, so schedule it at least daily.
+    """
+    playlist_ids = db.session.scalars(select(Playlist.id).where(Playlist.rules.isnot(None))).all()
+    changed = 0
+    for playlist_id in playlist_ids:
+        changed += refresh_playlist(playlist_id)
+        db.session.commit()
+    return len(playlist_ids), changed
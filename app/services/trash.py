@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from app.extensions import db
+from app.models import Playlist, Track
+
+
+def purge_trash(retention_days=30, batch_size=1000, now=None):
+    """Hard-delete tracks and playlists trashed more than `retention_days` ago.
+
+    Works through ix_*_trash `batch_size` rows per transaction; playlist_tracks
+    and the other dependent rows go with ON DELETE CASCADE. Returns
+    {'playlists': n, 'tracks': n}.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    purged = {}
+    for name, model in (('playlists', Playlist), ('tracks', Track)):
+        purged[name] = 0
+        while True:
+            batch = select(model.id).where(model.deleted_at < cutoff).limit(batch_size)
+            count = db.session.execute(
+                delete(model).where(model.id.in_(batch)).execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            purged[name] += count
+            if count < batch_size:
+                break
+    return purged
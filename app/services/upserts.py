@@ -0,0 +1,42 @@
+from sqlalchemy import insert, literal, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+
+# Dialects with INSERT .. ON CONFLICT DO UPDATE; others (MySQL) take the
+# row-at-a-time fallback
+ON_CONFLICT_DIALECTS = {'postgresql': postgresql, 'sqlite': sqlite}
+
+
+def upsert(model, rows, key_columns, merge):
+    """Insert `rows`, or update the row already holding their key. Joins the caller's transaction.
+
+    `merge` maps the columns to update onto a function of (current, new)
+    SQL expressions giving the stored value, e.g. ``lambda cur, new: cur + new``.
+    """
+    if not rows:
+        return
+    dialect = ON_CONFLICT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect is not None:
+        stmt = dialect.insert(model)
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_={
+            name: combine(getattr(model, name), stmt.excluded[name]) for name, combine in merge.items()
+        })
+        db.session.execute(stmt, rows)
+        return
+    for row in rows:
+        if _update_row(model, row, key_columns, merge):
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(model).values(row))
+        except IntegrityError: # Another transaction inserted the key in between
+            _update_row(model, row, key_columns, merge)
+
+
+def _update_row(model, row, key_columns, merge):
+    stmt = update(model).where(*(getattr(model, name) == row[name] for name in key_columns)).values({
+        name: combine(getattr(model, name), literal(row[name], getattr(model, name).type))
+        for name, combine in merge.items()
+    }).execution_options(synchronize_session=False)
+    return db.session.execute(stmt).rowcount
@@ -0,0 +1,201 @@
+import hashlib
+import re
+from collections import namedtuple
+from xml.dom import minidom
+from xml.parsers.expat import ExpatError
+from app.models import ManifestType
+from .cache import LocalCache
+from .manifests import ManifestFetchError
+
+# What a client says it can play (ManifestProfileSchema), hashable for cache keys
+Profile = namedtuple('Profile', 'max_bandwidth max_width max_height codecs')
+
+# KEY=VALUE pairs of an HLS attribute list; quoted values may contain commas
+_ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+Variant = namedtuple('Variant', 'bandwidth width height codecs')
+
+
+def _hls_attributes(line):
+    return {key: value.strip('"') for key, value in _ATTRIBUTE.findall(line.partition(':')[2])}
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _hls_variant(line):
+    attributes = _hls_attributes(line)
+    width, _, height = attributes.get('RESOLUTION', '').partition('x')
+    codecs = [codec.strip() for codec in attributes['CODECS'].split(',')] if attributes.get('CODECS') else []
+    return Variant(_int(attributes.get('BANDWIDTH')), _int(width), _int(height), codecs)
+
+
+def _playable(variant, profile):
+    # Codec support is all or nothing; "avc1" in the profile covers "avc1.64001f"
+    if profile.codecs is None:
+        return True
+    return all(any(codec.lower() == c or codec.lower().startswith(c + '.') for c in profile.codecs)
+               for codec in variant.codecs)
+
+
+def _sustainable(variant, profile):
+    return not (
+        (profile.max_bandwidth and variant.bandwidth and variant.bandwidth > profile.max_bandwidth)
+        or (profile.max_width and variant.width and variant.width > profile.max_width)
+        or (profile.max_height and variant.height and variant.height > profile.max_height)
+    )
+
+
+def select_variants(variants, profile):
+    """The variants (with their indexes) a client should get, best first.
+
+    Unplayable codecs are dropped outright. Of the rest, the ones over the
+    bandwidth or resolution limits go too, unless that would leave nothing:
+    then the lowest-bandwidth variant stays, so the client still plays.
+    """
+    indexed = list(enumerate(variants))
+    candidates = [(i, v) for i, v in indexed if _playable(v, profile)] or indexed
+    kept = [(i, v) for i, v in candidates if _sustainable(v, profile)]
+    if not kept:
+        kept = [min(candidates, key=lambda item: item[1].bandwidth or 0)]
+    return sorted(kept, key=lambda item: -(item[1].bandwidth or 0))
+
+
+def _filter_hls(text, profile):
+    lines = text.splitlines()
+    variants, blocks, output, slot = [], [], [], None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            # The tag, then its URI on the next non-tag line
+            block = [line]
+            i += 1
+            while i < len(lines) and (not lines[i].strip() or lines[i].startswith('#')):
+                block.append(lines[i])
+                i += 1
+            if i < len(lines):
+                block.append(lines[i])
+            variants.append(_hls_variant(line))
+            blocks.append(block)
+            if slot is None:
+                slot = len(output)
+                output.append(None) # Where the kept variants go
+        elif line.startswith('#EXT-X-I-FRAME-STREAM-INF:'):
+            variant = _hls_variant(line)
+            if _playable(variant, profile) and _sustainable(variant, profile):
+                output.append(line)
+        else:
+            output.append(line)
+        i += 1
+    if slot is None:
+        return None # A media playlist, nothing to choose from
+    # The first variant listed is the one players start with
+    output[slot:slot + 1] = [line for index, _ in select_variants(variants, profile) for line in blocks[index]]
+    return '\n'.join(output) + '\n'
+
+
+def _children(element, name):
+    return [child for child in element.childNodes if child.nodeType == child.ELEMENT_NODE and child.localName == name]
+
+
+def _dash_variant(representation, adaptation_set):
+    def attribute(name):
+        return representation.getAttribute(name) or adaptation_set.getAttribute(name)
+    codecs = [codec.strip() for codec in attribute('codecs').split(',') if codec.strip()]
+    return Variant(_int(attribute('bandwidth')), _int(attribute('width')), _int(attribute('height')), codecs)
+
+
+def _content_type(adaptation_set):
+    content_type = adaptation_set.getAttribute('contentType') or adaptation_set.getAttribute('mimeType').partition('/')[0]
+    if not content_type:
+        representations = _children(adaptation_set, 'Representation')
+        content_type = representations[0].getAttribute('mimeType').partition('/')[0] if representations else ''
+    return content_type
+
+
+def _filter_dash(text, profile):
+    try:
+        document = minidom.parseString(text)
+    except ExpatError as e:
+        raise ManifestFetchError(f"Unparseable DASH manifest: {e}") from e
+    for period in document.getElementsByTagNameNS('*', 'Period'):
+        adaptation_sets = _children(period, 'AdaptationSet')
+        playable = {}
+        for adaptation_set in adaptation_sets:
+            representations = _children(adaptation_set, 'Representation')
+            variants = [_dash_variant(r, adaptation_set) for r in representations]
+            playable[adaptation_set] = any(_playable(v, profile) for v in variants) or not variants
+        for adaptation_set in adaptation_sets:
+            content_type = _content_type(adaptation_set)
+            if not playable[adaptation_set] and any(
+                playable[other] for other in adaptation_sets if other is not adaptation_set and _content_type(other) == content_type
+            ):
+                period.removeChild(adaptation_set) # Another set carries this content in a codec the client has
+                continue
+            representations = _children(adaptation_set, 'Representation')
+            if not representations:
+                continue
+            kept = {index for index, _ in select_variants([_dash_variant(r, adaptation_set) for r in representations], profile)}
+            for index, representation in enumerate(representations):
+                if index not in kept:
+                    adaptation_set.removeChild(representation)
+    return document.toxml()
+
+
+class VariantFilter:
+    """Prunes and reorders the variants of manifests served to constrained clients.
+
+    HLS master playlists lose the #EXT-X-STREAM-INF variants the client
+    can't play or sustain, and list the rest best first (players start with
+    the first). DASH manifests lose such Representations, and AdaptationSets
+    in codecs the client lacks when another set has the same content type.
+
+    Filtered bodies are cached per worker, keyed by a digest of the source
+    manifest and the client profile, so popular (manifest, device) pairs
+    are parsed once.
+    """
+
+    def __init__(self, app=None):
+        self.cache = LocalCache(maxsize=1000, ttl=3600)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache = LocalCache(maxsize=app.config.get('VARIANT_CACHE_MAXSIZE', 1000),
+                                ttl=app.config.get('VARIANT_CACHE_TTL', 3600))
+
+    @staticmethod
+    def profile(args):
+        """Profile from ManifestProfileSchema-loaded query args, or None if the client declared nothing."""
+        if not args:
+            return None
+        codecs = args.get('codecs')
+        return Profile(args.get('max_bandwidth'), args.get('max_width'), args.get('max_height'),
+                       tuple(sorted(set(codecs))) if codecs else None)
+
+    def apply(self, body, manifest_type, profile):
+        """`body` with only the variants `profile` suits. Raises ManifestFetchError for an unparseable body."""
+        if profile is None:
+            return body
+        key = (hashlib.blake2b(body, digest_size=16).hexdigest(), ManifestType(manifest_type).value, profile)
+        filtered = self.cache.get(key)
+        if filtered is None:
+            try:
+                text = body.decode('utf-8-sig')
+            except UnicodeDecodeError as e:
+                raise ManifestFetchError("Manifest isn't UTF-8") from e
+            if ManifestType(manifest_type) == ManifestType.HLS:
+                text = _filter_hls(text, profile)
+                filtered = text.encode() if text is not None else body
+            else:
+                filtered = _filter_dash(text, profile).encode()
+            self.cache.set(key, filtered)
+        return filtered
+
+
+variant_filter = VariantFilter()
@@ -0,0 +1,79 @@
+import logging
+import time
+from sqlalchemy import select
+from sqlalchemy.orm import configure_mappers, subqueryload
+from app.extensions import db
+from app.models import IdempotencyKey, Playlist, Track, User
+from app.services import revocation_list, shard_map
+from app.services.sharing import resolve_access
+
+logger = logging.getLogger(__name__)
+
+# Matches no row, the hot queries are only run for their compiled form
+_NO_ID = -1
+
+
+def compile_hot_sql():
+    """Run the queries behind the busiest routes once, against ids that don't exist.
+
+    SQLAlchemy caches each statement's compiled SQL on the engine by its
+    structure, so this leaves the cache holding what the first real
+    requests will look up (and the mappers configured). Done before the
+    fork, every worker inherits it. Each query must keep the exact shape of
+    the route it stands in for, or it warms a different cache entry.
+    """
+    configure_mappers()
+    try:
+        for name in shard_map.names: # Each database keeps its own cache
+            with shard_map.use(name):
+                _run_hot_sql()
+    finally:
+        db.session.rollback()
+        db.session.remove()
+
+
+def _run_hot_sql():
+    db.session.get(User, _NO_ID) # identity_cache, on every authenticated request
+    resolve_access(_NO_ID, _NO_ID) # Every playlist route
+    Track.query.filter_by(user_id=_NO_ID).order_by(Track.artist, Track.album, Track.track_number, Track.title).all()
+    Track.query.filter_by(id=_NO_ID, user_id=_NO_ID).first()
+    Playlist.query.filter_by(user_id=_NO_ID).order_by(Playlist.name).all()
+    # playlist_cache misses. The tracks subquery only runs when the playlist exists, so load a real one
+    any_playlist = db.session.scalar(select(Playlist.id).limit(1))
+    Playlist.query.options(subqueryload(Playlist.tracks)).filter_by(id=any_playlist or _NO_ID).first()
+    db.session.execute(select(Playlist.id, Playlist.version).where(Playlist.share_token == '')).first()
+    IdempotencyKey.query.filter_by(scope='', key='').first()
+    revocation_list.maybe_sync() # Loads the revocation list itself, too
+
+
+def prime_pool(connections):
+    """Open `connections` pooled connections per database now, rather than on the first requests."""
+    for engine in db.engines.values():
+        opened = [engine.connect() for _ in range(connections)]
+        for connection in opened:
+            connection.close() # Back to the pool, still connected
+
+
+def warmup(app):
+    """Pre-fork warmup for wsgi.py. Returns {phase: seconds}.
+
+    Leaves no database connections open: they must not be shared with the
+    forked workers, which open their own in after_fork().
+    """
+    timings = {}
+    with app.app_context():
+        # Schemas need nothing: create_app() already imported the routes, which build theirs at import
+        started = time.perf_counter()
+        compile_hot_sql()
+        timings['sql'] = time.perf_counter() - started
+        for engine in db.engines.values():
+            engine.dispose() # Keeps the compiled cache, drops the connections
+    return timings
+
+
+def after_fork(app):
+    """Per-worker half of the warmup, for gunicorn's post_fork hook."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False) # Don't touch connections the parent may still hold
+        prime_pool(app.config.get('WARMUP_POOL_CONNECTIONS', 2))
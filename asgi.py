@@ -0,0 +1,8 @@
+from app.aio import create_asgi_app
+
+app = create_asgi_app()
+
+# Run with an ASGI server, e.g.:
+#   uvicorn asgi:app --workers 4
+# Async routes live in app/aio/routes.py, everything else is served by the
+# regular Flask blueprints mounted underneath.
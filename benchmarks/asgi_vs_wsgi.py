@@ -0,0 +1,170 @@
+"""Concurrent throughput of the manifest proxy: sync WSGI vs ASGI.
+
+Both servers proxy GET /api/tracks/<id>/manifest to a local origin that
+answers after --origin-delay seconds, which is where sync workers block.
+The origin and both servers each run in their own process so they don't
+share a GIL with the load generator.
+
+    python benchmarks/asgi_vs_wsgi.py --concurrency 64 --requests 1000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import multiprocessing
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app, db  # noqa: E402
+from app.aio import create_asgi_app  # noqa: E402
+from app.models import User, Track  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server with a fixed thread pool, like gunicorn --threads N."""
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app, handler=QuietHandler)
+        self.pool = ThreadPoolExecutor(threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def bench_app(db_path):
+    return create_app(config_class=type('BenchConfig', (object,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{db_path}",
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'JWT_SECRET_KEY': 'benchmark-jwt-secret-key-benchmark',
+        'BCRYPT_LOG_ROUNDS': 4,
+    }))
+
+
+def serve_origin(port, delay):
+    async def manifest(request):
+        await asyncio.sleep(delay)
+        return Response("#EXTM3U\n#EXT-X-ENDLIST\n", media_type='application/vnd.apple.mpegurl')
+    uvicorn.run(Starlette(routes=[Route('/manifest.m3u8', manifest)]), host='127.0.0.1', port=port, log_level='warning')
+
+
+def serve_wsgi(db_path, port, threads):
+    PooledWSGIServer('127.0.0.1', port, bench_app(db_path), threads).serve_forever()
+
+
+def serve_asgi(db_path, port):
+    uvicorn.run(create_asgi_app(flask_app=bench_app(db_path)), host='127.0.0.1', port=port, log_level='warning')
+
+
+def start(target, *args):
+    process = multiprocessing.Process(target=target, args=args, daemon=True)
+    process.start()
+    return process
+
+
+def wait_for(port):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/')
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+async def load(url, token, concurrency, total):
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker(client):
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(url, headers={'Authorization': f'Bearer {token}'})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rps': total / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--origin-delay', type=float, default=0.05)
+    parser.add_argument('--wsgi-threads', type=int, default=8)
+    args = parser.parse_args()
+
+    origin_port, wsgi_port, asgi_port = 8701, 8702, 8703
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        flask_app = bench_app(db_path)
+        with flask_app.app_context():
+            db.create_all()
+            user = User(username='bench', email='bench@example.com')
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.flush()
+            track = Track(user_id=user.id, title='Bench', manifest_type='HLS',
+                          manifest_url=f'http://127.0.0.1:{origin_port}/manifest.m3u8')
+            db.session.add(track)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id))
+            path = f'/api/tracks/{track.id}/manifest'
+
+        servers = [
+            start(serve_origin, origin_port, args.origin_delay),
+            start(serve_wsgi, db_path, wsgi_port, args.wsgi_threads),
+            start(serve_asgi, db_path, asgi_port),
+        ]
+        for port in (origin_port, wsgi_port, asgi_port):
+            wait_for(port)
+
+        print(f"concurrency={args.concurrency} requests={args.requests} origin_delay={args.origin_delay}s")
+        for name, port in ((f'wsgi ({args.wsgi_threads} threads)', wsgi_port), ('asgi (1 worker)', asgi_port)):
+            result = asyncio.run(load(f'http://127.0.0.1:{port}{path}', token, args.concurrency, args.requests))
+            print(f"{name:<20} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms")
+        for process in servers:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
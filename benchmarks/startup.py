@@ -0,0 +1,148 @@
+"""Cold start: time from launching a server process to its first responses.
+
+Compares the development entry point (run.py) with the production one
+(wsgi.py, which skips alembic and warms up schemas and hot SQL before
+serving, then primes the pool the way gunicorn's post_fork hook does).
+Each run is a fresh interpreter serving a seeded SQLite database on one
+thread. Reported per entry point, as medians over --runs:
+
+  ready     process start until GET / answers
+  first     the first GET /api/tracks and GET /api/playlists/<id>
+  second    the same two requests again, for comparison
+
+--importtime additionally lists the slowest modules under `import app`.
+
+    python benchmarks/startup.py --runs 5 --importtime
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from app import create_app, db  # noqa: E402
+from app.models import User, Track, Playlist, playlist_tracks  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+JWT_SECRET = 'benchmark-jwt-secret-key-benchmark'
+
+SERVE = """
+import sys
+from werkzeug.serving import WSGIRequestHandler, make_server
+entry, port = sys.argv[1], int(sys.argv[2])
+if entry == 'wsgi.py':
+    from wsgi import app
+    from app.warmup import after_fork
+    after_fork(app) # What gunicorn's post_fork hook does in each worker
+else:
+    from run import app
+WSGIRequestHandler.log_request = lambda *args, **kwargs: None
+make_server('127.0.0.1', port, app).serve_forever()
+"""
+
+
+def seed(db_path, tracks):
+    app = create_app(config_class=type('BenchConfig', (object,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{db_path}",
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'JWT_SECRET_KEY': JWT_SECRET,
+        'BCRYPT_LOG_ROUNDS': 4,
+    }))
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.flush()
+        playlist = Playlist(user_id=user.id, name='Bench')
+        db.session.add(playlist)
+        db.session.add_all(
+            Track(user_id=user.id, title=f'Track {i}', artist=f'Artist {i % 20}', manifest_type='HLS',
+                  manifest_url=f'http://example.com/{i}.m3u8')
+            for i in range(tracks)
+        )
+        db.session.flush()
+        db.session.execute(playlist_tracks.insert(), [
+            {'playlist_id': playlist.id, 'track_id': track_id, 'track_order': order}
+            for order, track_id in enumerate(db.session.scalars(db.select(Track.id)).all()[:50])
+        ])
+        db.session.commit()
+        return create_access_token(identity=str(user.id)), playlist.id
+
+
+def timed_get(client, url, **kwargs):
+    start = time.perf_counter()
+    client.get(url, **kwargs).raise_for_status()
+    return time.perf_counter() - start
+
+
+def cold_start(entry, port, db_path, token, playlist_id):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', JWT_SECRET_KEY=JWT_SECRET)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', SERVE, entry, str(port)], cwd=ROOT, env=env)
+    base = f'http://127.0.0.1:{port}'
+    headers = {'Authorization': f'Bearer {token}'}
+    try:
+        with httpx.Client(timeout=30) as client:
+            while True:
+                try:
+                    client.get(f'{base}/')
+                    break
+                except httpx.TransportError:
+                    if process.poll() is not None or time.perf_counter() - start > 30:
+                        raise RuntimeError(f"{entry} did not start")
+                    time.sleep(0.005)
+            result = {'ready': time.perf_counter() - start}
+            for attempt in ('first', 'second'):
+                result[attempt] = (timed_get(client, f'{base}/api/tracks', headers=headers)
+                                   + timed_get(client, f'{base}/api/playlists/{playlist_id}', headers=headers))
+            return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def import_times(top):
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in output.splitlines():
+        if line.startswith('import time:') and '|' in line and 'cumulative' not in line:
+            _, cumulative, name = line.split('|')
+            modules.append((int(cumulative), name.rstrip()))
+    print(f"import app: {max(modules)[0] / 1000:.0f} ms, slowest (cumulative):")
+    for cumulative, name in sorted(modules, reverse=True)[1:top + 1]:
+        print(f"  {cumulative / 1000:7.1f} ms {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--tracks', type=int, default=500)
+    parser.add_argument('--importtime', action='store_true')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    if args.importtime:
+        import_times(args.top)
+        print()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        token, playlist_id = seed(db_path, args.tracks)
+        print(f"runs={args.runs} tracks={args.tracks}")
+        for port, entry in enumerate(('run.py', 'wsgi.py'), start=8711):
+            results = [cold_start(entry, port, db_path, token, playlist_id) for _ in range(args.runs)]
+            ready, first, second = (statistics.median(r[k] for r in results) * 1000 for k in ('ready', 'first', 'second'))
+            print(f"{entry:<8} ready {ready:7.1f} ms  first {first:6.1f} ms  second {second:6.1f} ms  "
+                  f"-> first response after {ready + first:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv() # Load environment variables from .env file
@@ -11,3 +12,122 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'another_secret_key') # CHANGE THIS IN PRODUCTION
     # JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+
+    # JWT identity -> user lookup cache ('local' per worker, or 'redis' shared across workers)
+    USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND', 'local')
+    USER_CACHE_URL = os.environ.get('USER_CACHE_URL') # e.g. redis://localhost:6379/0
+    USER_CACHE_MAXSIZE = int(os.environ.get('USER_CACHE_MAXSIZE', 10000))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300)) # Seconds
+
+    # Refresh tokens and the in-memory revocation list
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.environ.get('JWT_REFRESH_TOKEN_DAYS', 30)))
+    REVOCATION_BLOOM_CAPACITY = int(os.environ.get('REVOCATION_BLOOM_CAPACITY', 100000))
+    REVOCATION_BLOOM_ERROR_RATE = 0.001
+    REVOCATION_SYNC_INTERVAL = int(os.environ.get('REVOCATION_SYNC_INTERVAL', 5)) # Seconds between DB syncs
+
+    # Manifest proxying (both the WSGI and the ASGI paths)
+    MANIFEST_FETCH_TIMEOUT = int(os.environ.get('MANIFEST_FETCH_TIMEOUT', 10)) # Seconds
+    MANIFEST_MAX_BYTES = 5 * 1024 * 1024
+    # Let fetches of user-supplied URLs reach loopback/private addresses; development only, it exposes internal hosts
+    UPSTREAM_ALLOW_PRIVATE = os.environ.get('UPSTREAM_ALLOW_PRIVATE', '').lower() in ('1', 'true')
+
+    # ASGI mode (asgi.py): async driver URL is derived from SQLALCHEMY_DATABASE_URI unless set
+    ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URI')
+    ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 10))
+    ASYNC_DB_MAX_OVERFLOW = int(os.environ.get('ASYNC_DB_MAX_OVERFLOW', 20))
+    UPSTREAM_MAX_CONNECTIONS = int(os.environ.get('UPSTREAM_MAX_CONNECTIONS', 100))
+
+    # Play event ingestion (POST /api/plays) write batching
+    PLAY_BUFFER_SIZE = int(os.environ.get('PLAY_BUFFER_SIZE', 1000)) # Flush once this many events are pending
+    PLAY_FLUSH_INTERVAL = float(os.environ.get('PLAY_FLUSH_INTERVAL', 1.0)) # ...or after this many seconds
+    PLAY_BUFFER_MAX_PENDING = 100000 # Past this, requests get 503 until the writer catches up
+
+    # Soft delete: trashed tracks/playlists are hard-deleted by `flask purge-trash` after this
+    TRASH_RETENTION_DAYS = int(os.environ.get('TRASH_RETENTION_DAYS', 30))
+
+    # Idempotency-Key support on mutating routes (app/services/idempotency.py)
+    IDEMPOTENCY_KEY_TTL = timedelta(hours=int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))) # Replay window
+    IDEMPOTENCY_LOCK_TIMEOUT = timedelta(seconds=60) # An unfinished first request older than this is retried
+
+    # Change notifications streamed by GET /api/events ('local' per worker, or 'redis' shared across workers)
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'local')
+    EVENTS_URL = os.environ.get('EVENTS_URL') # e.g. redis://localhost:6379/0
+    EVENTS_HISTORY = int(os.environ.get('EVENTS_HISTORY', 500)) # Per-user events kept for Last-Event-ID resume
+    EVENTS_KEEPALIVE = 15 # Seconds between keepalive comments on an idle stream
+    EVENTS_MAX_STREAM_SECONDS = int(os.environ.get('EVENTS_MAX_STREAM_SECONDS', 300)) # Client reconnects after this
+    # Open streams per worker, each holds a thread: well below GUNICORN_THREADS so requests keep the rest
+    EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', max(1, int(os.environ.get('GUNICORN_THREADS', 8)) // 4)))
+    EVENTS_RETRY_AFTER = 10 # Retry-After seconds when all streams are taken
+
+    # Serialised playlist details keyed by (id, version) ('local' per worker, or 'redis' shared across workers)
+    PLAYLIST_CACHE_BACKEND = os.environ.get('PLAYLIST_CACHE_BACKEND', 'local')
+    PLAYLIST_CACHE_URL = os.environ.get('PLAYLIST_CACHE_URL') # e.g. redis://localhost:6379/0
+    PLAYLIST_CACHE_MAXSIZE = int(os.environ.get('PLAYLIST_CACHE_MAXSIZE', 1000))
+    PLAYLIST_CACHE_TTL = int(os.environ.get('PLAYLIST_CACHE_TTL', 300)) # Seconds, bounds staleness from bulk deletes
+
+    # Response compression (app/services/compression.py); br and zstd need the brotli/zstandard packages
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500)) # Bytes, smaller bodies aren't worth it
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_MIMETYPES = ('application/json', 'application/vnd.apple.mpegurl', 'application/dash+xml')
+    COMPRESS_CACHE_MAXSIZE = int(os.environ.get('COMPRESS_CACHE_MAXSIZE', 1000)) # Finished bodies kept per worker
+    COMPRESS_CACHE_TTL = 300 # Seconds
+
+    # `flask db` support; the production entry point (wsgi.py) switches it off to skip importing alembic
+    MIGRATIONS_ENABLED = True
+
+    # Warmup run by wsgi.py before gunicorn forks its workers (app/warmup.py)
+    WARMUP_POOL_CONNECTIONS = int(os.environ.get('WARMUP_POOL_CONNECTIONS', 2)) # Opened by each worker after fork
+
+    # Horizontal sharding of user data (app/services/shards.py), e.g. SHARDS="s1=postgresql://... s2=postgresql://..."
+    # Append only: a shard's position sets the id range it allocates from
+    SHARDS = dict(pair.split('=', 1) for pair in os.environ.get('SHARDS', '').split())
+    SQLALCHEMY_BINDS = dict(SHARDS)
+    SHARD_NEW_USERS = os.environ.get('SHARD_NEW_USERS', '').split() # Shards new accounts go to (default: all)
+    SHARD_ID_SPAN = 10**8 # Ids per shard; 32-bit id columns leave room for 20 shards
+    SHARD_MAP_TTL = int(os.environ.get('SHARD_MAP_TTL', 5)) # Seconds a worker caches a user's shard
+    SHARD_MOVE_SETTLE = int(os.environ.get('SHARD_MOVE_SETTLE', 10)) # Seconds, must exceed SHARD_MAP_TTL
+
+    # Signed playback URLs (app/services/playback.py), served without auth or a DB query
+    PLAYBACK_URL_SECRET = os.environ.get('PLAYBACK_URL_SECRET') # Defaults to SECRET_KEY; changing it voids issued URLs
+    PLAYBACK_URL_TTL = int(os.environ.get('PLAYBACK_URL_TTL', 900)) # Seconds
+    PLAYBACK_URL_ROUNDING = 60 # Seconds; URLs issued in the same window are identical, so edge-cacheable
+    PLAYBACK_URL_MODE = os.environ.get('PLAYBACK_URL_MODE', 'redirect') # 'redirect' to the manifest, or 'proxy' it
+    PLAYBACK_BASE_URL = os.environ.get('PLAYBACK_BASE_URL', '') # e.g. https://cdn.example.com in front of /api/play
+    PLAYBACK_CACHE_MAX_AGE = int(os.environ.get('PLAYBACK_CACHE_MAX_AGE', 300)) # Seconds, caps Cache-Control
+
+    # Segment proxy (app/services/segments.py): proxied manifests point their segments at /api/play/segments
+    SEGMENT_PROXY_ENABLED = os.environ.get('SEGMENT_PROXY_ENABLED', '').lower() in ('1', 'true')
+    SEGMENT_CACHE_DIR = os.environ.get('SEGMENT_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'segment_cache'))
+    SEGMENT_CACHE_MAX_BYTES = int(os.environ.get('SEGMENT_CACHE_MAX_BYTES', 10 * 1024 ** 3)) # Per worker, see SegmentCache
+    SEGMENT_MAX_BYTES = 50 * 1024 * 1024 # Bigger upstream segments get 502
+    SEGMENT_URL_TTL = int(os.environ.get('SEGMENT_URL_TTL', 6 * 3600)) # Seconds; covers a long track, paused
+
+    # Manifests filtered by client profile (app/services/variants.py), cached per worker
+    VARIANT_CACHE_MAXSIZE = int(os.environ.get('VARIANT_CACHE_MAXSIZE', 1000))
+    VARIANT_CACHE_TTL = 3600 # Seconds; keyed by the source body, so this only bounds memory
+
+    # Adaptive concurrency limit per worker (app/services/limiter.py); low-priority requests over it get 503
+    CONCURRENCY_LIMIT_ENABLED = os.environ.get('CONCURRENCY_LIMIT_ENABLED', 'true').lower() in ('1', 'true')
+    # A worker runs at most its gunicorn threads' worth of requests at once, see gunicorn.conf.py
+    CONCURRENCY_INITIAL_LIMIT = int(os.environ.get('CONCURRENCY_INITIAL_LIMIT', os.environ.get('GUNICORN_THREADS', 8)))
+    CONCURRENCY_MIN_LIMIT = 4
+    CONCURRENCY_MAX_LIMIT = int(os.environ.get('CONCURRENCY_MAX_LIMIT', os.environ.get('GUNICORN_THREADS', 8)))
+    CONCURRENCY_LATENCY_TOLERANCE = 2.0 # Latency over this multiple of the endpoint's baseline cuts the limit
+    CONCURRENCY_LATENCY_FLOOR = 0.01 # Seconds; baselines under this count as this, so jitter isn't congestion
+    CONCURRENCY_BACKOFF = 0.9 # Factor the limit is cut by
+    CONCURRENCY_RETRY_AFTER = 1 # Seconds, sent with 503s
+
+    # On-demand request profiling (app/services/profiler.py), driven by X-Profile or /api/profiler rules
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'true').lower() in ('1', 'true') # Off: no request hooks at all
+    PROFILER_INTERVAL = 0.005 # Seconds between stack samples
+    PROFILER_MAX_CONCURRENT = 2 # Profiled requests at once per worker; the rest run unprofiled
+    PROFILER_MAX_SECONDS = 30 # Sampling of a request stops after this
+    PROFILER_MAX_DEPTH = 100 # Stack frames kept per sample, innermost first
+    PROFILER_MAX_CAPTURES = 50 # Finished captures kept per worker for download
+    PROFILER_TRACEMALLOC_FRAMES = 10
+    PROFILER_TRACEMALLOC_TOP = 25 # Allocation sites kept per memory capture
+
+
+class ServeConfig(Config):
+    # Serving only: no migrations (run `flask db upgrade` with the default Config)
+    MIGRATIONS_ENABLED = False
@@ -1,8 +1,12 @@
 import pytest
 import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from app import create_app, db as _db # Rename db to avoid pytest fixture conflict
 from app.models import User, Track, Playlist, playlist_tracks # Import models for direct use in tests
 from app.extensions import bcrypt # Import bcrypt for direct password setting in fixtures
+from app.services import playlist_cache, compressor, upstream_guard
 
 @pytest.fixture(scope='session')
 def app():
@@ -15,7 +19,8 @@ def app():
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
         'SECRET_KEY': 'test-secret-key',
         'JWT_SECRET_KEY': 'test-jwt-secret-key',
-        'BCRYPT_LOG_ROUNDS': 4
+        'BCRYPT_LOG_ROUNDS': 4,
+        'PLAY_FLUSH_INTERVAL': None # No background flusher, tests flush play events explicitly
     }))
 
     with app.app_context():
@@ -27,15 +32,18 @@ def db(app):
     with app.app_context():
         _db.create_all()
     yield _db
+    # Clean up in the session-wide app context the test ran in, a freshly
+    # pushed context would get (and remove) a different scoped session
+    try:
+         _db.session.rollback() # Rollback any potentially failed transactions before removing
+    except Exception:
+         pass # Ignore errors during rollback if session is weird
+    finally:
+         _db.session.remove()
     with app.app_context():
-         # Rollback any potentially failed transactions before removing
-        try:
-             _db.session.rollback()
-        except Exception:
-             pass # Ignore errors during rollback if session is weird
-        finally:
-             _db.session.remove()
         _db.drop_all() # drop_all should work fine on :memory:
+    playlist_cache.clear() # Keyed by playlist id and version, which the next test reuses
+    compressor.cache.clear()
 
 @pytest.fixture(scope='function')
 def client(app, db): # Ensure db fixture runs before client fixture
@@ -131,3 +139,66 @@ def add_track_to_playlist_db(db):
          db.session.execute(stmt)
          db.session.commit()
     return _add
+
+
+# --- Local stub origin ---
+
+class StubOrigin:
+    """A local HTTP server standing in for user-supplied manifest origins."""
+
+    def __init__(self):
+        self.responses = {} # path -> (status, headers, body)
+        self.requests = [] # (method, path, headers) in arrival order
+        self.delay = 0 # Seconds to sleep before answering
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def add(self, path, body, status=200, headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.responses[path] = (status, headers or {}, body)
+
+    def _handler(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, send_body):
+                origin.requests.append((self.command, self.path, dict(self.headers)))
+                if origin.delay:
+                    time.sleep(origin.delay)
+                status, headers, body = origin.responses.get(self.path, (404, {}, b'not found'))
+                if headers.get('ETag') and self.headers.get('If-None-Match') == headers['ETag']:
+                    status, body = 304, b'' # Honour conditional requests like a real origin
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(True)
+
+            def do_HEAD(self):
+                self._respond(False)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture(scope='function')
+def stub_origin(monkeypatch):
+    """A running StubOrigin, shut down after the test."""
+    origin = StubOrigin()
+    origin.thread.start()
+    monkeypatch.setattr(upstream_guard, 'allow_private', True) # It listens on 127.0.0.1
+    yield origin
+    origin.server.shutdown()
+    origin.server.server_close()
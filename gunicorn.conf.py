@@ -0,0 +1,24 @@
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+# Threaded workers: the concurrency limiter (app/services/limiter.py) sheds
+# per process, which takes more than one request running in each. Keep the
+# threads within a worker's database pool (5 + 10 overflow by default);
+# CONCURRENCY_INITIAL_LIMIT and CONCURRENCY_MAX_LIMIT default to the same
+# GUNICORN_THREADS, see config.py
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = 60
+
+# Import and warm up wsgi:app once in the master, then fork: workers start
+# ready to serve and share the imported code pages copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Fresh database connections per worker, the parent's must not be shared
+    from wsgi import app
+    from app.warmup import after_fork
+    after_fork(app)
@@ -97,6 +97,13 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        if connection.dialect.name == 'sqlite':
+            # app/extensions.py switches foreign keys on for every SQLite
+            # connection. Batch migrations recreate tables, and dropping a
+            # parent table would then fire ON DELETE CASCADE on its children
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            connection.commit()
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
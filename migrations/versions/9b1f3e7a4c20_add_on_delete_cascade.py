@@ -0,0 +1,73 @@
+"""Add ON DELETE CASCADE and account deletion
+
+Revision ID: 9b1f3e7a4c20
+Revises: 2d8a61f4c0b7
+Create Date: 2026-10-18 20:03:17.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1f3e7a4c20'
+down_revision = '2d8a61f4c0b7'
+branch_labels = None
+depends_on = None
+
+
+# (table, column, referred table, ON DELETE)
+FOREIGN_KEYS = [
+    ('tracks', 'user_id', 'users', 'CASCADE'),
+    ('tracks', 'artist_id', 'artists', 'SET NULL'),
+    ('tracks', 'album_id', 'albums', 'SET NULL'),
+    ('playlists', 'user_id', 'users', 'CASCADE'),
+    ('playlist_tracks', 'playlist_id', 'playlists', 'CASCADE'),
+    ('playlist_tracks', 'track_id', 'tracks', 'CASCADE'),
+    ('revoked_tokens', 'user_id', 'users', 'CASCADE'),
+    ('artists', 'user_id', 'users', 'CASCADE'),
+    ('albums', 'user_id', 'users', 'CASCADE'),
+    ('albums', 'artist_id', 'artists', 'CASCADE'),
+]
+
+# Gives the unnamed constraints from earlier revisions a name to drop them
+# by when SQLite tables are recreated in batch mode
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def _original_fk_name(table, column, referred):
+    # tracks.artist_id/album_id were named by 2d8a61f4c0b7, the rest were
+    # created unnamed and got PostgreSQL's default name there
+    named = table == 'tracks' and column in ('artist_id', 'album_id')
+    if op.get_bind().dialect.name == 'postgresql' and not named:
+        return f'{table}_{column}_fkey'
+    return f'fk_{table}_{column}_{referred}'
+
+
+def _replace_foreign_keys(upgrading):
+    for table in dict.fromkeys(t for t, _, _, _ in FOREIGN_KEYS):
+        with op.batch_alter_table(table, schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+            for fk_table, column, referred, ondelete in FOREIGN_KEYS:
+                if fk_table != table:
+                    continue
+                name = f'fk_{table}_{column}_{referred}'
+                batch_op.drop_constraint(_original_fk_name(table, column, referred) if upgrading else name,
+                                         type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'],
+                                            ondelete=ondelete if upgrading else None)
+
+
+def upgrade():
+    _replace_foreign_keys(upgrading=True)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deletion_requested_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_users_deletion_requested_at'), ['deletion_requested_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_deletion_requested_at'))
+        batch_op.drop_column('deletion_requested_at')
+
+    _replace_foreign_keys(upgrading=False)
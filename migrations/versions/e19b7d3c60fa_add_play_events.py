@@ -0,0 +1,56 @@
+"""Add play events
+
+Revision ID: e19b7d3c60fa
+Revises: c5e2a9f71b38
+Create Date: 2026-10-18 15:20:44.091532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e19b7d3c60fa'
+down_revision = 'c5e2a9f71b38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # Range-partitioned by month on played_at. The primary key has to
+        # include the partition key. New partitions are created ahead of time
+        # by `flask create-play-partitions`; the default partition catches
+        # anything outside them.
+        op.execute("""
+            CREATE TABLE play_events (
+                id BIGSERIAL NOT NULL,
+                user_id INTEGER NOT NULL,
+                track_id INTEGER NOT NULL,
+                played_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                ms_played INTEGER,
+                source VARCHAR(20),
+                PRIMARY KEY (id, played_at)
+            ) PARTITION BY RANGE (played_at)
+        """)
+        op.execute("CREATE TABLE play_events_default PARTITION OF play_events DEFAULT")
+        op.execute("CREATE INDEX ix_play_events_user_played ON play_events (user_id, played_at)")
+        # BRIN stays tiny on append-ordered timestamps
+        op.execute("CREATE INDEX ix_play_events_played_at_brin ON play_events USING BRIN (played_at)")
+        return
+
+    op.create_table('play_events',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('track_id', sa.Integer(), nullable=False),
+    sa.Column('played_at', sa.DateTime(), nullable=False),
+    sa.Column('ms_played', sa.Integer(), nullable=True),
+    sa.Column('source', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('play_events', schema=None) as batch_op:
+        batch_op.create_index('ix_play_events_user_played', ['user_id', 'played_at'], unique=False)
+
+
+def downgrade():
+    op.drop_table('play_events') # Drops the partitions with it on PostgreSQL
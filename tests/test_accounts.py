@@ -0,0 +1,129 @@
+from datetime import datetime
+from flask_jwt_extended import create_access_token
+from sqlalchemy import delete, event, insert, select
+from app.models import (
+    User, Track, Playlist, Artist, ManifestHealth, PlayEvent, TrackPlayRollup, playlist_tracks
+)
+from app.services.accounts import purge_account, purge_accounts
+
+def capture_selects(engine):
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements, lambda: event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def add_library(db, user_id, tracks=3):
+    """Give a user tracks in a playlist, health rows, plays and a rollup."""
+    playlist = Playlist(user_id=user_id, name="Mix")
+    db.session.add(playlist)
+    items = [Track(user_id=user_id, title=f"T{i}", manifest_url="http://example.com/t.m3u8", manifest_type="HLS")
+             for i in range(tracks)]
+    db.session.add_all(items)
+    db.session.flush()
+    db.session.execute(insert(playlist_tracks), [
+        {"playlist_id": playlist.id, "track_id": t.id, "track_order": i} for i, t in enumerate(items)
+    ])
+    db.session.add_all([ManifestHealth(track_id=t.id, status='ok') for t in items])
+    db.session.execute(insert(PlayEvent), [
+        {"user_id": user_id, "track_id": t.id, "played_at": datetime.utcnow()} for t in items
+    ])
+    db.session.add(TrackPlayRollup(granularity='day', bucket_start=datetime(2026, 1, 1), user_id=user_id,
+                                   track_id=items[0].id, plays=1, ms_played=0))
+    db.session.commit()
+    return playlist, items
+
+def test_delete_track_cascades_in_database(db, auth_tokens):
+    """Test that playlist_tracks and manifest_health rows go with the track."""
+    user_id = auth_tokens['ids']['user_a']
+    playlist, (track, *_) = add_library(db, user_id)
+    db.session.execute(delete(Track).where(Track.id == track.id))
+    db.session.commit()
+    assert db.session.execute(select(playlist_tracks).filter_by(track_id=track.id)).first() is None
+    assert db.session.get(ManifestHealth, track.id) is None
+
+def test_delete_playlist_does_not_load_tracks(db, auth_tokens):
+    """Test that deleting a playlist leaves playlist_tracks to ON DELETE CASCADE."""
+    playlist, _ = add_library(db, auth_tokens['ids']['user_a'])
+    db.session.expire_all()
+    selects, stop = capture_selects(db.engine)
+    try:
+        db.session.delete(db.session.get(Playlist, playlist.id))
+        db.session.commit()
+    finally:
+        stop()
+    assert not any('FROM tracks' in s for s in selects)
+    assert db.session.execute(select(playlist_tracks)).first() is None
+
+def test_delete_user_does_not_load_library(db, auth_tokens):
+    """Test that the User relationships use passive_deletes."""
+    user_id = auth_tokens['ids']['user_a']
+    add_library(db, user_id)
+    db.session.expire_all()
+    selects, stop = capture_selects(db.engine)
+    try:
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+    finally:
+        stop()
+    assert not any('FROM tracks' in s or 'FROM playlists' in s for s in selects)
+    assert Track.query.count() == 0
+    assert Playlist.query.count() == 0
+
+def test_delete_account_is_deferred(client, db, app, auth_tokens):
+    """Test that DELETE /me flags the account and locks it out."""
+    user_id = auth_tokens['ids']['user_a']
+    add_library(db, user_id)
+    other_token = create_access_token(identity=str(user_id))
+
+    response = client.delete('/api/auth/me', headers={'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"})
+    assert response.status_code == 202
+    assert db.session.get(User, user_id).deletion_requested_at is not None
+    assert Track.query.filter_by(user_id=user_id).count() == 3 # Removed later by the purge job
+
+    assert client.get('/api/auth/me', headers={'Authorization': f"Bearer {other_token}"}).status_code == 404
+    response = client.post('/api/auth/login', json={"username": "user_a", "password": "password_a"})
+    assert response.status_code == 401
+
+def test_purge_account_in_chunks(db, auth_tokens):
+    """Test that purging removes everything the user owns, and only that."""
+    user_a, user_b = auth_tokens['ids']['user_a'], auth_tokens['ids']['user_b']
+    add_library(db, user_a, tracks=5)
+    add_library(db, user_b, tracks=2)
+    db.session.add(Artist(user_id=user_a, key='a', name='A'))
+    db.session.commit()
+
+    purge_account(user_a, chunk_size=2)
+    db.session.expire_all()
+    assert db.session.get(User, user_a) is None
+    for model in (Track, Playlist, PlayEvent, TrackPlayRollup, Artist):
+        assert model.query.filter_by(user_id=user_a).count() == 0
+    assert Track.query.filter_by(user_id=user_b).count() == 2
+    assert db.session.execute(select(playlist_tracks)).all() != []
+    assert ManifestHealth.query.count() == 2
+
+def test_purge_account_deletes_playlist_entries_in_chunks(db, auth_tokens):
+    """Test that playlist entries are deleted chunk by chunk, not all at once by cascade from the playlist."""
+    user_a = auth_tokens['ids']['user_a']
+    add_library(db, user_a, tracks=5)
+    deletes = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('DELETE FROM PLAYLIST_TRACKS'):
+            deletes.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        purge_account(user_a, chunk_size=2)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert len(deletes) == 3
+    assert db.session.execute(select(playlist_tracks)).all() == []
+
+def test_purge_accounts_command(client, runner, db, auth_tokens):
+    """Test the scheduled purge only touches flagged accounts."""
+    client.delete('/api/auth/me', headers={'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"})
+    result = runner.invoke(args=['purge-accounts', '--chunk-size', '10'])
+    assert result.exit_code == 0
+    assert "Purged 1 accounts" in result.output
+    assert [u.username for u in User.query.all()] == ["user_b"]
+    assert purge_accounts() == (0, 0)
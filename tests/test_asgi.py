@@ -0,0 +1,128 @@
+import asyncio
+import json
+import httpx
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app, db as _db
+from app.aio import create_asgi_app
+from app.models import ManifestType, User, Track
+from app.services.manifests import UnsafeURLError, upstream_guard
+from app.services.playback import playback_urls
+
+@pytest.fixture(scope='function')
+def asgi_app(app, tmp_path):
+    """ASGI app over a file-backed SQLite DB (the async driver can't share :memory:)."""
+    flask_app = create_app(config_class=type('AsgiTestConfig', (object,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'asgi.db'}",
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': 'test-secret-key',
+        'JWT_SECRET_KEY': 'test-jwt-secret-key',
+        'BCRYPT_LOG_ROUNDS': 4,
+        'PLAY_FLUSH_INTERVAL': None
+    }))
+    with flask_app.app_context():
+        _db.create_all()
+    yield create_asgi_app(flask_app=flask_app)
+    with flask_app.app_context():
+        _db.session.remove()
+        _db.drop_all()
+
+def seed(asgi_app, manifest_urls):
+    """Create a user owning one track per URL, return (token, track ids)."""
+    with asgi_app.state.flask_app.app_context():
+        user = User(username='async_user', email='async@test.com')
+        user.set_password('password')
+        _db.session.add(user)
+        _db.session.flush()
+        tracks = [Track(user_id=user.id, title=f"Song {i}", manifest_url=url, manifest_type='HLS')
+                  for i, url in enumerate(manifest_urls)]
+        _db.session.add_all(tracks)
+        _db.session.commit()
+        return create_access_token(identity=str(user.id)), [t.id for t in tracks]
+
+def call(asgi_app, method, path, **kwargs):
+    async def _call():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            response = await client.request(method, path, **kwargs)
+        await asgi_app.state.http.aclose()
+        await asgi_app.state.db.dispose()
+        return response
+    return asyncio.run(_call())
+
+def test_asgi_health(asgi_app):
+    """Test the async liveness and readiness probes."""
+    assert call(asgi_app, 'GET', '/api/health').json() == {"status": "ok"}
+    response = call(asgi_app, 'GET', '/api/health/ready')
+    assert response.status_code == 200
+    assert response.json()['database'] == 'ok'
+
+def test_asgi_manifest_proxy(asgi_app, stub_origin):
+    """Test the async manifest proxy against a local origin."""
+    stub_origin.add('/a.m3u8', "#EXTM3U\n")
+    token, (track_id,) = seed(asgi_app, [stub_origin.url('/a.m3u8')])
+
+    response = call(asgi_app, 'GET', f'/api/tracks/{track_id}/manifest', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/vnd.apple.mpegurl')
+    assert response.content == b"#EXTM3U\n"
+
+def test_asgi_manifest_proxy_refuses_internal_addresses(asgi_app, stub_origin, monkeypatch):
+    """Test that the async fetch checks the upstream address too."""
+    stub_origin.add('/a.m3u8', "#EXTM3U\n")
+    token, (track_id,) = seed(asgi_app, [stub_origin.url('/a.m3u8')])
+    monkeypatch.setattr(upstream_guard, 'allow_private', False)
+
+    response = call(asgi_app, 'GET', f'/api/tracks/{track_id}/manifest', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 502
+    assert stub_origin.requests == []
+
+def test_asgi_signed_playback(asgi_app, stub_origin):
+    """Test that signed playback URLs are served by the async route too, without auth."""
+    stub_origin.add('/a.m3u8', "#EXTM3U\n")
+    token = playback_urls.sign(1, stub_origin.url('/a.m3u8'), ManifestType.HLS)
+
+    asgi_app.state.flask_app.config['PLAYBACK_URL_MODE'] = 'proxy'
+    response = call(asgi_app, 'GET', f'/api/play/{token}')
+    assert response.content == b"#EXTM3U\n"
+    assert response.headers['cache-control'].startswith('public, max-age=')
+    asgi_app.state.flask_app.config['PLAYBACK_URL_MODE'] = 'redirect' # No upstream fetch
+    response = call(asgi_app, 'GET', f'/api/play/{token}')
+    assert response.status_code == 302
+    assert response.headers['location'] == stub_origin.url('/a.m3u8')
+    assert call(asgi_app, 'GET', f'/api/play/{token}x').status_code == 403
+
+def test_asgi_manifest_proxy_requires_auth(asgi_app):
+    """Test that async routes reject missing tokens like @jwt_required does."""
+    response = call(asgi_app, 'GET', '/api/tracks/1/manifest')
+    assert response.status_code == 401
+    assert response.json()['msg'] == "Missing Authorization Header"
+
+def test_asgi_export_streams_library(asgi_app):
+    """Test the NDJSON library export."""
+    token, track_ids = seed(asgi_app, [f"http://example.com/{i}.m3u8" for i in range(3)])
+
+    response = call(asgi_app, 'GET', '/api/tracks/export', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row['id'] for row in rows] == track_ids
+
+def test_asgi_falls_through_to_flask(asgi_app):
+    """Test that sync blueprints are still served under ASGI."""
+    token, _ = seed(asgi_app, [])
+    response = call(asgi_app, 'GET', '/api/auth/me', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.json()['username'] == 'async_user'
+
+def test_async_transport_checks_the_connected_peer(stub_origin, monkeypatch):
+    """Test that a host that passed the request hook is still refused once it connects to an internal address."""
+    stub_origin.add('/a.m3u8', "#EXTM3U\n")
+    monkeypatch.setattr(upstream_guard, 'allow_private', False)
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=upstream_guard.async_transport()) as client: # No hook, as if DNS changed after it ran
+            await client.get(stub_origin.url('/a.m3u8'))
+    with pytest.raises(UnsafeURLError):
+        asyncio.run(fetch())
+    assert stub_origin.requests == []
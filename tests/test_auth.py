@@ -1,6 +1,7 @@
 import pytest
-from flask import jsonify
-from app.models import User
+from datetime import datetime, timedelta
+from app.models import User, RevokedToken
+from sqlalchemy import event
 
 def test_register_user_success(client):
     """Test successful user registration."""
@@ -108,3 +109,162 @@ def test_get_current_user_invalid_token(client):
     })
     assert response.status_code == 422 # Expecting JWT Extended's invalid token error
     assert b"Invalid header padding" in response.data or b"Not enough segments" in response.data # Check specific message
+
+def test_get_current_user_served_from_cache(client, db, auth_tokens):
+    """Test that repeated /me calls don't query the users table."""
+    token = auth_tokens['tokens']['user_a']
+    client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'}) # Warm the cache
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    assert response.json['username'] == 'user_a'
+    assert not any('users' in s for s in statements)
+
+def test_get_current_user_cache_invalidated_on_update(client, db, auth_tokens):
+    """Test that changing a user evicts their cached identity."""
+    token = auth_tokens['tokens']['user_a']
+    user_id = auth_tokens['ids']['user_a']
+    client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'}) # Warm the cache
+
+    user = db.session.get(User, user_id)
+    user.username = 'renamed_a'
+    user.roles = 'admin'
+    db.session.commit()
+
+    response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.json['username'] == 'renamed_a'
+    assert response.json['roles'] == 'admin'
+
+def test_get_current_user_cache_invalidated_on_commit(db, auth_tokens):
+    """Test that a profile cached between a user change's flush and its commit is still evicted."""
+    from app.services import identity_cache
+    user_id = auth_tokens['ids']['user_a']
+    user = db.session.get(User, user_id)
+    user.username = 'renamed_a'
+    db.session.flush()
+    identity_cache.backend.set(user_id, {'id': user_id, 'username': 'user_a'}) # Another request read the old row
+    db.session.commit()
+    assert identity_cache.backend.get(user_id) is None
+
+def test_get_current_user_deleted(client, db, auth_tokens):
+    """Test that a token for a deleted user is rejected."""
+    token = auth_tokens['tokens']['user_a']
+    user_id = auth_tokens['ids']['user_a']
+    client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'}) # Warm the cache
+
+    db.session.delete(db.session.get(User, user_id))
+    db.session.commit()
+
+    response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 404
+    assert b"User not found" in response.data
+
+def test_login_returns_refresh_token(client, add_user):
+    """Test that login issues a refresh token alongside the access token."""
+    add_user('loginuser', 'login@example.com', 'password123')
+    response = client.post('/api/auth/login', json={
+        'username': 'loginuser',
+        'password': 'password123'
+    })
+    assert response.status_code == 200
+    assert 'refresh_token' in response.json
+
+def test_refresh_rotates_tokens(client, add_user):
+    """Test that refreshing issues a new pair and revokes the old refresh token."""
+    add_user('loginuser', 'login@example.com', 'password123')
+    login = client.post('/api/auth/login', json={'username': 'loginuser', 'password': 'password123'})
+    old_refresh = login.json['refresh_token']
+
+    response = client.post('/api/auth/refresh', headers={'Authorization': f'Bearer {old_refresh}'})
+    assert response.status_code == 200
+    assert 'access_token' in response.json
+    new_refresh = response.json['refresh_token']
+    assert new_refresh != old_refresh
+
+    # New access token works, old refresh token is now revoked
+    me = client.get('/api/auth/me', headers={'Authorization': f'Bearer {response.json["access_token"]}'})
+    assert me.status_code == 200
+    reuse = client.post('/api/auth/refresh', headers={'Authorization': f'Bearer {old_refresh}'})
+    assert reuse.status_code == 401
+    assert b"Token has been revoked" in reuse.data
+
+def test_refresh_requires_refresh_token(client, auth_tokens):
+    """Test that an access token can't be used to refresh."""
+    token = auth_tokens['tokens']['user_a']
+    response = client.post('/api/auth/refresh', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 422
+
+def test_logout_revokes_access_token(client, db, auth_tokens):
+    """Test that a logged out access token is rejected and persisted."""
+    token = auth_tokens['tokens']['user_a']
+    response = client.post('/api/auth/logout', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert RevokedToken.query.count() == 1
+
+    response = client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 401
+    assert b"Token has been revoked" in response.data
+
+def test_concurrent_refresh_with_one_token(client, db, add_user, monkeypatch):
+    """Test that the loser of two refreshes racing with the same token gets 401, not 500."""
+    from flask_jwt_extended import decode_token
+    from app.services import revocation_list
+    add_user('loginuser', 'login@example.com', 'password123')
+    refresh_token = client.post('/api/auth/login', json={'username': 'loginuser', 'password': 'password123'}).json['refresh_token']
+    payload = decode_token(refresh_token)
+    monkeypatch.setattr(revocation_list, 'is_revoked', lambda jti: False) # Both passed the check before either committed
+    db.session.add(RevokedToken(jti=payload['jti'], token_type='refresh', user_id=int(payload['sub']),
+                                expires_at=datetime.utcfromtimestamp(payload['exp'])))
+    db.session.commit()
+
+    response = client.post('/api/auth/refresh', headers={'Authorization': f'Bearer {refresh_token}'})
+    assert response.status_code == 401
+    assert response.json == {"message": "Token has been revoked"}
+
+def test_revocation_list_skips_expired_rows(db, auth_tokens):
+    """Test that neither the first load nor a rebuild brings back tokens that have expired."""
+    from app.services import revocation_list
+    now = datetime.utcnow()
+    user_id = auth_tokens['ids']['user_a']
+    db.session.add_all([
+        RevokedToken(jti='expired', token_type='access', user_id=user_id, expires_at=now - timedelta(hours=1)),
+        RevokedToken(jti='live', token_type='access', user_id=user_id, expires_at=now + timedelta(hours=1)),
+    ])
+    db.session.commit()
+    revocation_list.clear()
+    assert revocation_list.is_revoked('live') and not revocation_list.is_revoked('expired')
+    last_id = revocation_list._last_id
+    revocation_list._rebuild()
+    assert revocation_list._last_id == last_id
+    assert set(revocation_list._exact) == {'live'}
+
+def test_revocation_list_rechecks_skipped_ids(db, auth_tokens):
+    """Test that a revocation committing after a newer one was synced is still picked up."""
+    from app.services import revocation_list
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    user_id = auth_tokens['ids']['user_a']
+    revocation_list.clear()
+    revocation_list.is_revoked('warmup')
+    for jti in ('first', 'slow', 'fast'):
+        db.session.add(RevokedToken(jti=jti, token_type='access', user_id=user_id, expires_at=expires_at))
+        db.session.commit()
+    slow = RevokedToken.query.filter_by(jti='slow').one()
+    db.session.delete(slow) # Stands in for the slow insert not having committed yet
+    db.session.commit()
+    revocation_list._sync_new_rows()
+    assert not revocation_list.is_revoked('slow')
+    assert revocation_list._gaps and revocation_list._gaps[0][:2] == [slow.id, slow.id]
+
+    db.session.add(RevokedToken(id=slow.id, jti='slow', token_type='access', user_id=user_id, expires_at=expires_at))
+    db.session.commit()
+    revocation_list._sync_new_rows()
+    assert revocation_list._exact.keys() >= {'first', 'slow', 'fast'}
+    assert revocation_list._gaps == []
@@ -0,0 +1,34 @@
+import time
+from app.services.cache import LocalCache
+from app.services.revocation import BloomFilter
+
+def test_local_cache_evicts_least_recently_used():
+    """Test that the cache stays bounded and evicts the LRU entry."""
+    cache = LocalCache(maxsize=2, ttl=60)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    assert cache.get(1) == 'a' # Touch 1 so 2 becomes least recently used
+    cache.set(3, 'c')
+    assert len(cache) == 2
+    assert cache.get(2) is None
+    assert cache.get(1) == 'a'
+    assert cache.get(3) == 'c'
+
+def test_local_cache_expires_entries():
+    """Test that entries past their TTL are not returned."""
+    cache = LocalCache(maxsize=10, ttl=60)
+    cache.set('short', 'x', ttl=0.01)
+    cache.set('long', 'y')
+    time.sleep(0.02)
+    assert cache.get('short') is None
+    assert cache.get('long') == 'y'
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test that every added item is reported as present."""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f"jti-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{i}" in bloom for i in range(1000))
+    assert false_positives < 50
@@ -0,0 +1,98 @@
+import gzip
+import json
+import pytest
+from app.models import User
+from app.services.compression import compressor
+
+def auth(tokens, user='user_a', **extra):
+    return {'Authorization': f"Bearer {tokens['tokens'][user]}", **extra}
+
+@pytest.fixture
+def library(auth_tokens, add_track):
+    user_id = auth_tokens['ids']['user_a']
+    return [add_track(user_id, f"Song {i}") for i in range(20)]
+
+def test_gzip_large_json(client, auth_tokens, library):
+    """Test that a large JSON body is gzipped when the client accepts it."""
+    compressor.reset_stats()
+    raw = client.get('/api/tracks', headers=auth(auth_tokens))
+    response = client.get('/api/tracks', headers=auth(auth_tokens, **{'Accept-Encoding': 'gzip'}))
+    assert 'Content-Encoding' not in raw.headers
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    body = gzip.decompress(response.get_data())
+    assert json.loads(body) == raw.json
+    assert int(response.headers['Content-Length']) < len(body)
+
+    stats = compressor.stats()
+    assert stats['responses'] == 1
+    assert stats['bytes_saved'] == len(body) - len(response.get_data())
+
+def test_small_bodies_not_compressed(client, auth_tokens):
+    """Test that bodies under COMPRESS_MIN_SIZE are sent as is."""
+    response = client.get('/api/tracks', headers=auth(auth_tokens, **{'Accept-Encoding': 'gzip'}))
+    assert response.json == []
+    assert 'Content-Encoding' not in response.headers
+
+def test_negotiation(client, auth_tokens, library, monkeypatch):
+    """Test that the client's q-values pick the codec, and q=0 opts out."""
+    monkeypatch.setattr(compressor, 'codecs', {
+        'br': lambda data: b'br:' + data, 'gzip': lambda data: gzip.compress(data)
+    })
+    response = client.get('/api/tracks', headers=auth(auth_tokens, **{'Accept-Encoding': 'gzip, br'}))
+    assert response.headers['Content-Encoding'] == 'br'
+    response = client.get('/api/tracks', headers=auth(auth_tokens, **{'Accept-Encoding': 'br;q=0.5, gzip'}))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    response = client.get('/api/tracks', headers=auth(auth_tokens, **{'Accept-Encoding': 'gzip;q=0'}))
+    assert 'Content-Encoding' not in response.headers
+
+def test_event_stream_not_compressed(client, auth_tokens, monkeypatch):
+    """Test that streamed responses are left alone."""
+    from app.services.events import change_broker
+    monkeypatch.setattr(change_broker, 'max_stream_seconds', 0.01)
+    response = client.get('/api/events', headers=auth(auth_tokens, **{'Accept-Encoding': 'gzip'}))
+    assert 'Content-Encoding' not in response.headers
+
+def test_unchanged_playlist_served_from_cache(client, auth_tokens, add_playlist, library, add_track_to_playlist_db,
+                                              monkeypatch):
+    """Test that a repeat fetch of the same version skips serialisation and compression."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    for i, track in enumerate(library):
+        add_track_to_playlist_db(playlist.id, track.id, i)
+    headers = auth(auth_tokens, **{'Accept-Encoding': 'gzip'})
+    first = client.get(f'/api/playlists/{playlist.id}', headers=headers)
+    assert first.headers['Content-Encoding'] == 'gzip'
+
+    calls = []
+    monkeypatch.setattr(compressor, 'codecs', {'gzip': lambda data: calls.append(data) or gzip.compress(data)})
+    from app.services.sharing import playlist_cache
+    monkeypatch.setattr(playlist_cache, 'get_payload', lambda *args: pytest.fail("serialised again"))
+    compressor.reset_stats()
+    second = client.get(f'/api/playlists/{playlist.id}', headers=headers)
+    assert second.get_data() == first.get_data()
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.headers['Content-Encoding'] == 'gzip'
+    assert calls == []
+    assert compressor.stats()['cache_hits'] == 1
+
+def test_new_version_is_not_served_stale(client, auth_tokens, add_playlist, library, add_track_to_playlist_db):
+    """Test that a write moves readers on to a fresh body."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    for i, track in enumerate(library):
+        add_track_to_playlist_db(playlist.id, track.id, i)
+    headers = auth(auth_tokens, **{'Accept-Encoding': 'gzip'})
+    client.get(f'/api/playlists/{playlist.id}', headers=headers)
+    client.put(f'/api/playlists/{playlist.id}', json={"name": "Renamed"}, headers=auth(auth_tokens))
+    response = client.get(f'/api/playlists/{playlist.id}', headers=headers)
+    assert json.loads(gzip.decompress(response.get_data()))['name'] == "Renamed"
+
+def test_metrics_admin_only(client, db, auth_tokens, library):
+    """Test that compression metrics are reported to admins."""
+    client.get('/api/tracks', headers=auth(auth_tokens, **{'Accept-Encoding': 'gzip'}))
+    assert client.get('/api/metrics', headers=auth(auth_tokens)).status_code == 403
+
+    db.session.get(User, auth_tokens['ids']['user_a']).roles = 'admin'
+    db.session.commit()
+    response = client.get('/api/metrics', headers=auth(auth_tokens))
+    assert response.status_code == 200
+    assert response.json['compression']['bytes_saved'] > 0
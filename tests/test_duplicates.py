@@ -0,0 +1,102 @@
+from datetime import datetime
+from sqlalchemy import select
+from app.models import PlayEvent, Track, TrackPlayRollup, playlist_tracks
+from app.services.duplicates import canonical_url, duplicate_clusters
+
+def auth(tokens, user='user_a'):
+    return {'Authorization': f"Bearer {tokens['tokens'][user]}"}
+
+def post_track(client, tokens, title, url, artist=None, album=None, query=''):
+    return client.post(f'/api/tracks{query}', json={"title": title, "artist": artist, "album": album,
+                                                    "manifest_url": url, "manifest_type": "HLS"}, headers=auth(tokens))
+
+def test_canonical_url():
+    """Test that URL spelling variants of the same resource compare equal."""
+    assert canonical_url("HTTPS://CDN.Example.com:443/a/B.m3u8?b=2&a=1&utm_source=x#top") == \
+        canonical_url("https://cdn.example.com/a/B.m3u8?a=1&b=2")
+    assert canonical_url("https://cdn.example.com/a/b.m3u8") != canonical_url("https://cdn.example.com/a/B.m3u8")
+    assert canonical_url("http://example.com:8080/x") != canonical_url("http://example.com/x")
+
+def test_duplicates_refused_on_ingest(client, auth_tokens):
+    """Test that the same URL or the same title/artist/album is reported instead of added again."""
+    first = post_track(client, auth_tokens, "Song", "http://example.com/song.m3u8", artist="Band").json['id']
+
+    response = post_track(client, auth_tokens, "Other", "http://EXAMPLE.com/song.m3u8?utm_medium=mail")
+    assert response.status_code == 409
+    assert response.json['duplicate_id'] == first
+    response = post_track(client, auth_tokens, " song ", "http://mirror.example.com/song.m3u8", artist="BAND")
+    assert response.json['duplicate_id'] == first
+
+    # Other users' libraries, and the same title by another artist (or none), don't count
+    other = client.post('/api/tracks', json={"title": "Song", "manifest_url": "http://example.com/song.m3u8",
+                                             "manifest_type": "HLS"}, headers=auth(auth_tokens, 'user_b'))
+    assert other.status_code == 201
+    assert post_track(client, auth_tokens, "Song", "http://example.com/cover.m3u8", artist="Covers").status_code == 201
+    assert post_track(client, auth_tokens, "Song", "http://example.com/solo.m3u8").status_code == 201
+
+    forced = post_track(client, auth_tokens, "Song", "http://example.com/song.m3u8", artist="Band",
+                        query='?allow_duplicate=true')
+    assert forced.status_code == 201
+
+def test_clusters_and_merge(client, db, auth_tokens, add_playlist, add_track_to_playlist_db):
+    """Test listing duplicate clusters and merging them, playlists, plays and stats included."""
+    user_id = auth_tokens['ids']['user_a']
+    keep = post_track(client, auth_tokens, "Song", "http://example.com/a.m3u8", artist="Band").json['id']
+    same_url = post_track(client, auth_tokens, "Song (remaster)", "http://example.com/a.m3u8",
+                          query='?allow_duplicate=true').json['id']
+    same_tags = post_track(client, auth_tokens, "Song", "http://mirror.example.com/a.m3u8", artist="Band",
+                           query='?allow_duplicate=true').json['id']
+    post_track(client, auth_tokens, "Unrelated", "http://example.com/b.m3u8")
+
+    response = client.get('/api/tracks/duplicates', headers=auth(auth_tokens))
+    assert [[t['id'] for t in cluster] for cluster in response.json] == [[keep, same_url, same_tags]]
+    assert duplicate_clusters() == [{'user_id': user_id, 'track_ids': [keep, same_url, same_tags]}]
+
+    with_keep = add_playlist(user_id, "Has both")
+    add_track_to_playlist_db(with_keep.id, keep, 0)
+    add_track_to_playlist_db(with_keep.id, same_url, 1)
+    only_duplicates = add_playlist(user_id, "Duplicates only")
+    add_track_to_playlist_db(only_duplicates.id, same_tags, 0)
+    add_track_to_playlist_db(only_duplicates.id, same_url, 1)
+    db.session.add(PlayEvent(user_id=user_id, track_id=same_url, played_at=datetime(2026, 10, 1, 12), ms_played=1000))
+    db.session.add_all(TrackPlayRollup(granularity='day', bucket_start=datetime(2026, 10, 1), user_id=user_id,
+                                       track_id=track_id, plays=1, ms_played=1000) for track_id in (keep, same_url))
+    db.session.commit()
+
+    response = client.post(f'/api/tracks/{keep}/merge', json={"duplicate_ids": [same_url, same_tags]},
+                           headers=auth(auth_tokens))
+    assert response.status_code == 200
+    assert response.json['merged'] == 2
+    assert response.json['playlists'] == 2
+
+    entries = db.session.execute(select(playlist_tracks.c.playlist_id, playlist_tracks.c.track_id,
+                                        playlist_tracks.c.track_order).order_by(playlist_tracks.c.playlist_id)).all()
+    assert entries == [(with_keep.id, keep, 0), (only_duplicates.id, keep, 0)]
+    assert [e.track_id for e in PlayEvent.query.all()] == [keep]
+    rollup = TrackPlayRollup.query.one()
+    assert (rollup.track_id, rollup.plays, rollup.ms_played) == (keep, 2, 2000)
+    assert {t.id for t in Track.query.all()} == {keep, keep + 3}
+    assert client.get('/api/tracks/duplicates', headers=auth(auth_tokens)).json == []
+
+def test_merge_checks_ownership(client, auth_tokens):
+    """Test that only the user's own tracks can be merged."""
+    mine = post_track(client, auth_tokens, "Mine", "http://example.com/mine.m3u8").json['id']
+    theirs = client.post('/api/tracks', json={"title": "Theirs", "manifest_url": "http://example.com/t.m3u8",
+                                              "manifest_type": "HLS"}, headers=auth(auth_tokens, 'user_b')).json['id']
+    response = client.post(f'/api/tracks/{mine}/merge', json={"duplicate_ids": [theirs]}, headers=auth(auth_tokens))
+    assert response.status_code == 404
+    assert response.json['missing'] == [theirs]
+    assert client.post(f'/api/tracks/{mine}/merge', json={"duplicate_ids": []}, headers=auth(auth_tokens)).status_code == 400
+
+def test_find_duplicates_command(client, db, runner, auth_tokens, add_track):
+    """Test that the job fingerprints older tracks, reports clusters and merges them on request."""
+    user_id = auth_tokens['ids']['user_a']
+    for title in ("Song", "song", "Other"): # Added directly, so without fingerprints
+        add_track(user_id, title, manifest_url=f"http://example.com/{title}.m3u8", artist="Band")
+    result = runner.invoke(args=['find-duplicates'])
+    assert "Fingerprinted 3 tracks; 1 duplicate clusters (1 extra tracks) in 1 libraries" in result.output
+    assert Track.query.count() == 3
+
+    result = runner.invoke(args=['find-duplicates', '--merge'])
+    assert "Merged 1 tracks" in result.output
+    assert sorted(t.title for t in Track.query.all()) == ["Other", "Song"]
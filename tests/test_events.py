@@ -0,0 +1,120 @@
+import json
+import threading
+import pytest
+from app.services.events import LocalChangeBackend, change_broker
+
+def auth(tokens, user='user_a', **extra):
+    return {'Authorization': f"Bearer {tokens['tokens'][user]}", **extra}
+
+def parse(body):
+    """Split a text/event-stream body into (id, event, data) tuples, skipping comments."""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['id'], fields['event'], json.loads(fields['data'])))
+    return events
+
+@pytest.fixture
+def short_streams(monkeypatch):
+    monkeypatch.setattr(change_broker, 'max_stream_seconds', 0.05)
+    monkeypatch.setattr(change_broker, 'keepalive', 0.05)
+
+def test_playlist_edits_are_replayed(client, auth_tokens, add_playlist, add_track, short_streams):
+    """Test that track added, reordered and metadata updated events reach the stream in order."""
+    user_id = auth_tokens['ids']['user_a']
+    playlist, first, second = add_playlist(user_id, "Mix"), add_track(user_id, "One"), add_track(user_id, "Two")
+    last_id = change_broker.backend.head(user_id)
+
+    for track in (first, second):
+        client.post(f'/api/playlists/{playlist.id}/tracks', json={"track_id": track.id}, headers=auth(auth_tokens))
+    client.put(f'/api/playlists/{playlist.id}/tracks/order', json={"track_ids": [second.id, first.id]},
+               headers=auth(auth_tokens))
+    client.put(f'/api/playlists/{playlist.id}', json={"name": "Renamed"}, headers=auth(auth_tokens))
+
+    response = client.get('/api/events', headers=auth(auth_tokens, **{'Last-Event-ID': last_id}))
+    assert response.mimetype == 'text/event-stream'
+    events = parse(response.get_data(as_text=True))
+    assert [(name, data.get('version')) for _, name, data in events] == [
+        ('playlist.track_added', 2), ('playlist.track_added', 3), ('playlist.reordered', 4), ('playlist.updated', 5)
+    ]
+    assert events[2][2]['track_ids'] == [second.id, first.id]
+    assert events[3][2]['name'] == "Renamed"
+
+    # Resuming from the last one seen gives nothing new
+    response = client.get('/api/events', headers=auth(auth_tokens, **{'Last-Event-ID': events[-1][0]}))
+    assert parse(response.get_data(as_text=True)) == []
+
+def test_events_are_per_user(client, auth_tokens, short_streams):
+    """Test that one user's changes don't reach another user's stream."""
+    last_id = change_broker.backend.head(auth_tokens['ids']['user_b'])
+    client.post('/api/playlists', json={"name": "Mine"}, headers=auth(auth_tokens))
+    response = client.get('/api/events', headers=auth(auth_tokens, 'user_b', **{'Last-Event-ID': last_id}))
+    assert parse(response.get_data(as_text=True)) == []
+
+def test_failed_writes_publish_nothing(client, auth_tokens, add_playlist, short_streams):
+    """Test that events queued by a rolled-back request are dropped."""
+    user_id = auth_tokens['ids']['user_a']
+    playlist = add_playlist(user_id, "Mix")
+    last_id = change_broker.backend.head(user_id)
+    response = client.delete(f'/api/playlists/{playlist.id}/tracks/999', headers=auth(auth_tokens))
+    assert response.status_code == 404
+    response = client.get('/api/events', headers=auth(auth_tokens, **{'Last-Event-ID': last_id}))
+    assert parse(response.get_data(as_text=True)) == []
+
+def test_unknown_last_event_id_resets(client, auth_tokens, short_streams):
+    """Test that an id that can't be resumed from tells the client to refetch."""
+    response = client.get('/api/events', headers=auth(auth_tokens, **{'Last-Event-ID': 'deadbeef-12'}))
+    assert [name for _, name, _ in parse(response.get_data(as_text=True))] == ['reset']
+
+def test_streams_are_capped_per_worker(client, auth_tokens, short_streams, monkeypatch):
+    """Test that streams past EVENTS_MAX_STREAMS get 503 and a closed stream frees its slot."""
+    monkeypatch.setattr(change_broker, 'max_streams', 1)
+    held = change_broker.open_stream(auth_tokens['ids']['user_b'])
+    response = client.get('/api/events', headers=auth(auth_tokens))
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '10'
+    held.close() # Never iterated, still released
+
+    response = client.get('/api/events', headers=auth(auth_tokens))
+    assert response.status_code == 200
+    response.get_data()
+    response.close()
+    assert change_broker._streams == 0
+
+def test_live_delivery():
+    """Test that a waiting stream wakes up for a new event."""
+    backend = LocalChangeBackend()
+    head = backend.head(1)
+    timer = threading.Timer(0.05, backend.publish, args=(1, 'track.created', {'track_id': 7}))
+    timer.start()
+    events = backend.wait(1, head, timeout=5)
+    timer.join()
+    assert [(e.type, e.data) for e in events] == [('track.created', {'track_id': 7})]
+
+def test_history_overflow_is_not_resumable():
+    """Test that ids older than the kept history can't be resumed."""
+    backend = LocalChangeBackend(history=2)
+    head = backend.head(1)
+    for i in range(3):
+        backend.publish(1, 'track.created', {'track_id': i})
+    assert backend.since(1, head) is None
+    second = backend.since(1, head.replace('-0', '-1'))
+    assert [e.data['track_id'] for e in second] == [1, 2]
+
+def test_falling_behind_mid_stream_resets(monkeypatch):
+    """Test that a stream that misses more than the history sends reset and carries on from the newest event."""
+    backend = LocalChangeBackend(history=2)
+    monkeypatch.setattr(change_broker, 'backend', backend)
+    monkeypatch.setattr(change_broker, 'max_stream_seconds', 0.2)
+    monkeypatch.setattr(change_broker, 'keepalive', 0.05)
+    stream = change_broker.stream(1)
+    assert next(stream) == "retry: 3000\n\n"
+    for i in range(5): # Between the stream's head() and its first wait()
+        backend.publish(1, 'track.created', {'track_id': i})
+    chunks = list(stream)
+    assert len(chunks) < 20 # Waits for events again instead of spinning
+    events = parse(''.join(chunks))
+    assert [name for _, name, _ in events] == ['reset']
+    assert events[0][0] == backend.head(1)
+    assert backend.wait(1, events[0][0], timeout=0) == []
@@ -0,0 +1,106 @@
+from app.models import ManifestHealth
+from app.services.health_check import ManifestProber, check_manifests
+from app.services.manifests import upstream_guard
+
+def test_check_manifests_records_results(db, auth_tokens, add_track, stub_origin):
+    """Test that good and broken manifests are recorded."""
+    user_id = auth_tokens['ids']['user_a']
+    stub_origin.add('/ok.m3u8', "#EXTM3U\n", headers={'ETag': '"v1"'})
+    ok = add_track(user_id, "Fine", manifest_url=stub_origin.url('/ok.m3u8'))
+    gone = add_track(user_id, "Gone", manifest_url=stub_origin.url('/gone.m3u8'))
+    dead = add_track(user_id, "Dead", manifest_url="http://127.0.0.1:1/dead.m3u8")
+
+    checked, broken = check_manifests(chunk_size=2) # Forces more than one chunk
+    assert (checked, broken) == (3, 2)
+
+    ok_health = db.session.get(ManifestHealth, ok.id)
+    assert ok_health.status == 'ok'
+    assert ok_health.http_status == 200
+    assert ok_health.etag == '"v1"'
+    assert ok_health.latency_ms is not None
+    assert db.session.get(ManifestHealth, gone.id).http_status == 404
+    dead_health = db.session.get(ManifestHealth, dead.id)
+    assert dead_health.status == 'broken'
+    assert dead_health.http_status is None
+
+def test_check_manifests_sends_conditional_requests(db, auth_tokens, add_track, stub_origin):
+    """Test that a second run revalidates with If-None-Match and accepts a 304."""
+    user_id = auth_tokens['ids']['user_a']
+    stub_origin.add('/ok.m3u8', "#EXTM3U\n", headers={'ETag': '"v1"'})
+    track = add_track(user_id, "Fine", manifest_url=stub_origin.url('/ok.m3u8'))
+
+    check_manifests()
+    check_manifests()
+    assert stub_origin.requests[-1][2].get('If-None-Match') == '"v1"'
+    health = db.session.get(ManifestHealth, track.id)
+    assert health.status == 'ok'
+    assert health.http_status == 304
+    assert health.etag == '"v1"' # Validators are kept across 304s
+
+def test_check_manifests_skips_recently_checked(db, auth_tokens, add_track, stub_origin):
+    """Test that --stale-after style runs don't re-probe fresh results."""
+    from datetime import timedelta
+    user_id = auth_tokens['ids']['user_a']
+    stub_origin.add('/ok.m3u8', "#EXTM3U\n")
+    add_track(user_id, "Fine", manifest_url=stub_origin.url('/ok.m3u8'))
+
+    check_manifests()
+    assert check_manifests(stale_after=timedelta(hours=1)) == (0, 0)
+
+def test_manifest_prober_limits_per_host(stub_origin):
+    """Test that no more than per_host probes hit one origin at a time."""
+    import asyncio, threading
+    active = {'now': 0, 'max': 0}
+    lock = threading.Lock()
+    handler = stub_origin.server.RequestHandlerClass
+    original = handler._respond
+    def counting(self, send_body):
+        with lock:
+            active['now'] += 1
+            active['max'] = max(active['max'], active['now'])
+        try:
+            original(self, send_body)
+        finally:
+            with lock:
+                active['now'] -= 1
+    handler._respond = counting
+    stub_origin.delay = 0.05
+    stub_origin.add('/m.m3u8', "#EXTM3U\n")
+
+    prober = ManifestProber(concurrency=20, per_host=2)
+    results = asyncio.run(prober.probe_all([(i, stub_origin.url('/m.m3u8'), None, None) for i in range(8)]))
+    assert all(r['status'] == 'ok' for r in results)
+    assert active['max'] <= 2
+
+def test_slow_host_does_not_hold_global_slots(monkeypatch):
+    """Test that probes waiting on a busy host leave the global slots to other hosts."""
+    import asyncio
+    finished = []
+    async def probe(self, client, track_id, url, etag, last_modified):
+        await asyncio.sleep(0.2 if 'slow' in url else 0)
+        finished.append(track_id)
+        return {'track_id': track_id}
+    monkeypatch.setattr(ManifestProber, '_probe', probe)
+
+    prober = ManifestProber(concurrency=2, per_host=1)
+    targets = [(i, f'http://slow.example/{i}.m3u8', None, None) for i in range(3)]
+    targets.append((3, 'http://fast.example/m.m3u8', None, None))
+    asyncio.run(prober.probe_all(targets))
+    assert finished[0] == 3
+
+def test_check_manifests_command(runner, auth_tokens, add_track, stub_origin):
+    """Test the scheduled CLI entry point."""
+    stub_origin.add('/ok.m3u8', "#EXTM3U\n")
+    add_track(auth_tokens['ids']['user_a'], "Fine", manifest_url=stub_origin.url('/ok.m3u8'))
+    result = runner.invoke(args=['check-manifests', '--per-host', '2'])
+    assert result.exit_code == 0
+    assert "Checked 1 manifests, 0 broken" in result.output
+
+def test_check_manifests_refuses_internal_addresses(db, auth_tokens, add_track, stub_origin, monkeypatch):
+    """Test that probes don't reach loopback/private hosts."""
+    stub_origin.add('/ok.m3u8', "#EXTM3U\n")
+    track = add_track(auth_tokens['ids']['user_a'], "Local", manifest_url=stub_origin.url('/ok.m3u8'))
+    monkeypatch.setattr(upstream_guard, 'allow_private', False)
+    assert check_manifests() == (1, 1)
+    assert "isn't public" in db.session.get(ManifestHealth, track.id).error
+    assert stub_origin.requests == []
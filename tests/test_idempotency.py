@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from app.models import IdempotencyKey, Track, playlist_tracks
+from app.services.idempotency import prune_idempotency_keys
+
+TRACK = {"title": "Song", "artist": "Band", "manifest_url": "http://example.com/s.m3u8", "manifest_type": "HLS"}
+
+def headers(tokens, key, user='user_a'):
+    return {'Authorization': f"Bearer {tokens['tokens'][user]}", 'Idempotency-Key': key}
+
+def test_retry_replays_response(client, auth_tokens):
+    """Test that a retried POST returns the first response without creating a second track."""
+    first = client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1'))
+    retry = client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1'))
+    assert first.status_code == retry.status_code == 201
+    assert retry.json == first.json
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert Track.query.count() == 1
+
+def test_key_reused_for_different_request(client, auth_tokens):
+    """Test that the same key with a different body is rejected."""
+    client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1'))
+    response = client.post('/api/tracks', json={**TRACK, "title": "Other"}, headers=headers(auth_tokens, 'k1'))
+    assert response.status_code == 422
+    assert Track.query.count() == 1
+
+def test_keys_are_scoped_per_user(client, auth_tokens):
+    """Test that two users can use the same key independently."""
+    client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1'))
+    response = client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1', 'user_b'))
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+    assert Track.query.count() == 2
+
+def test_duplicate_while_in_progress(client, db, auth_tokens):
+    """Test that a retry racing the first request gets 409 instead of running twice."""
+    client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1'))
+    record = IdempotencyKey.query.one()
+    record.status_code = None # As if the first request were still running
+    db.session.commit()
+
+    response = client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1'))
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert Track.query.count() == 1
+
+def test_stale_claim_is_taken_over(client, db, auth_tokens):
+    """Test that a key whose first request died is run again after the lock timeout."""
+    record = IdempotencyKey(scope=f"user:{auth_tokens['ids']['user_a']}", key='k1', fingerprint='x',
+                            created_at=datetime.utcnow() - timedelta(minutes=5),
+                            expires_at=datetime.utcnow() + timedelta(hours=1))
+    db.session.add(record)
+    db.session.commit()
+    response = client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1'))
+    assert response.status_code == 201
+    assert IdempotencyKey.query.one().status_code == 201
+
+def test_retry_add_to_playlist(client, db, auth_tokens, add_track, add_playlist):
+    """Test that retrying a non-idempotent add gets the original 201 rather than a conflict."""
+    user_id = auth_tokens['ids']['user_a']
+    track, playlist = add_track(user_id, "Song"), add_playlist(user_id, "Mix")
+    url = f'/api/playlists/{playlist.id}/tracks'
+    first = client.post(url, json={"track_id": track.id}, headers=headers(auth_tokens, 'add-1'))
+    retry = client.post(url, json={"track_id": track.id}, headers=headers(auth_tokens, 'add-1'))
+    assert first.status_code == retry.status_code == 201
+    assert retry.headers['ETag'] == first.headers['ETag'] # Replayed along with the body
+    assert len(db.session.execute(playlist_tracks.select()).all()) == 1
+
+def test_errors_are_not_stored_for_5xx(client, auth_tokens, monkeypatch):
+    """Test that a failed request releases its key so the retry runs for real."""
+    from app.routes import tracks
+    monkeypatch.setattr(tracks, 'sync_track', lambda track: (_ for _ in ()).throw(RuntimeError("boom")))
+    client.application.config['PROPAGATE_EXCEPTIONS'] = False
+    try:
+        assert client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1')).status_code == 500
+    finally:
+        client.application.config['PROPAGATE_EXCEPTIONS'] = None
+    assert IdempotencyKey.query.count() == 0
+    monkeypatch.undo()
+    assert client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1')).status_code == 201
+
+def test_requests_without_key_unaffected(client, auth_tokens):
+    """Test that requests without the header run every time and store nothing."""
+    auth = {'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"}
+    client.post('/api/tracks?allow_duplicate=true', json=TRACK, headers=auth)
+    client.post('/api/tracks?allow_duplicate=true', json=TRACK, headers=auth)
+    assert Track.query.count() == 2
+    assert IdempotencyKey.query.count() == 0
+
+def test_invalid_key(client, auth_tokens):
+    """Test that an empty or oversized key is rejected."""
+    assert client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, '')).status_code == 400
+    assert client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k' * 256)).status_code == 400
+
+def test_register_without_token(client):
+    """Test that retrying registration replays instead of reporting the username as taken."""
+    body = {"username": "new_user", "email": "new@example.com", "password": "password"}
+    first = client.post('/api/auth/register', json=body, headers={'Idempotency-Key': 'reg-1'})
+    retry = client.post('/api/auth/register', json=body, headers={'Idempotency-Key': 'reg-1'})
+    assert first.status_code == retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+
+def test_expired_keys(client, db, runner, auth_tokens):
+    """Test that expired keys run again and are pruned."""
+    client.post('/api/tracks', json=TRACK, headers=headers(auth_tokens, 'k1'))
+    IdempotencyKey.query.one().expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    response = client.post('/api/tracks?allow_duplicate=true', json=TRACK, headers=headers(auth_tokens, 'k1'))
+    assert 'Idempotent-Replayed' not in response.headers
+    assert Track.query.count() == 2
+
+    assert prune_idempotency_keys(now=datetime.utcnow() + timedelta(days=2)) == 1
+    result = runner.invoke(args=['prune-idempotency-keys'])
+    assert result.exit_code == 0
+    assert "Pruned 0 expired idempotency keys" in result.output
@@ -0,0 +1,69 @@
+from app.models import Artist, Album
+from app.services.library import normalize_key
+
+def post_track(client, token, title, artist=None, album=None, track_number=None):
+    response = client.post('/api/tracks', json={
+        "title": title, "artist": artist, "album": album, "track_number": track_number,
+        "manifest_url": f"http://example.com/{title}.m3u8", "manifest_type": "HLS"
+    }, headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 201
+    return response.json
+
+def test_normalize_key():
+    """Test that spelling variants share a key and blank names have none."""
+    assert normalize_key("The  Band ") == normalize_key("the band") == "the band"
+    assert normalize_key("ＡＢＣ") == "abc" # NFKC folds full-width forms
+    assert normalize_key("   ") is None
+    assert normalize_key(None) is None
+
+def test_browse_artists_albums_tracks(client, auth_tokens):
+    """Test browsing from artists to albums to tracks."""
+    token = auth_tokens['tokens']['user_a']
+    headers = {'Authorization': f'Bearer {token}'}
+    post_track(client, token, "Two", "The Band", "First", 2)
+    post_track(client, token, "One", "the band", "first", 1)
+    post_track(client, token, "Solo Song", "Another", None)
+    post_track(client, token, "Last", "Zed", "Z", 1)
+    post_track(client, auth_tokens['tokens']['user_b'], "Hidden", "The Band", "First")
+
+    response = client.get('/api/artists', headers=headers)
+    assert response.status_code == 200
+    assert [(a['name'], a['track_count'], a['album_count']) for a in response.json] == [
+        ("Another", 1, 0), ("The Band", 2, 1), ("Zed", 1, 1)
+    ]
+
+    band_id = response.json[1]['id']
+    response = client.get(f'/api/artists/{band_id}/albums', headers=headers)
+    assert [(a['name'], a['track_count']) for a in response.json] == [("First", 2)]
+
+    response = client.get(f"/api/albums/{response.json[0]['id']}/tracks", headers=headers)
+    assert [t['title'] for t in response.json] == ["One", "Two"]
+
+def test_browse_wrong_user(client, auth_tokens):
+    """Test that artists and albums are private to their owner."""
+    track = post_track(client, auth_tokens['tokens']['user_a'], "Song", "Artist", "Album")
+    headers = {'Authorization': f"Bearer {auth_tokens['tokens']['user_b']}"}
+    assert client.get('/api/artists', headers=headers).json == []
+    assert client.get(f"/api/artists/{track['artist_id']}/albums", headers=headers).status_code == 404
+    assert client.get(f"/api/albums/{track['album_id']}/tracks", headers=headers).status_code == 404
+
+def test_counts_follow_track_edits(client, auth_tokens):
+    """Test that updates and deletes move counts and drop empty entities."""
+    token = auth_tokens['tokens']['user_a']
+    headers = {'Authorization': f'Bearer {token}'}
+    first = post_track(client, token, "A", "Artist", "Album")
+    second = post_track(client, token, "B", "Artist", "Album")
+
+    response = client.put(f"/api/tracks/{second['id']}", json={"album": "Other Album"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json['album_id'] != first['album_id']
+    artist = Artist.query.one()
+    assert (artist.track_count, artist.album_count) == (2, 2)
+
+    client.delete(f"/api/tracks/{second['id']}", headers=headers)
+    assert [(a.name, a.track_count) for a in Album.query.all()] == [("Album", 1)]
+    assert Artist.query.one().album_count == 1
+
+    client.delete(f"/api/tracks/{first['id']}", headers=headers)
+    assert Artist.query.count() == 0
+    assert Album.query.count() == 0
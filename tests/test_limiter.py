@@ -0,0 +1,97 @@
+import pytest
+from app.services.limiter import concurrency_limiter
+
+@pytest.fixture
+def limiter(app, monkeypatch):
+    """The session-wide limiter with a known limit and fresh counters."""
+    monkeypatch.setattr(concurrency_limiter, 'limit', 10.0)
+    monkeypatch.setattr(concurrency_limiter, 'max_limit', 200)
+    monkeypatch.setattr(concurrency_limiter, '_baselines', {})
+    monkeypatch.setattr(concurrency_limiter, '_last_decrease', 0.0)
+    concurrency_limiter.reset_stats()
+    yield concurrency_limiter
+    assert concurrency_limiter.inflight == 0
+
+def test_shares_by_priority(limiter):
+    """Test that lower classes are refused first as slots fill up."""
+    held = 0
+    while limiter.acquire('bulk'):
+        held += 1
+    assert held == 4
+    while limiter.acquire('writes'):
+        held += 1
+    assert held == 8
+    assert limiter.acquire('playback') and limiter.acquire('playback')
+    assert not limiter.acquire('playback')
+    for _ in range(held + 2):
+        limiter.release('x', 0.001)
+    stats = limiter.stats()
+    assert stats['shed'] == {'playback': 1, 'reads': 0, 'writes': 1, 'auth': 0, 'bulk': 1}
+    assert stats['admitted']['playback'] == 2
+
+def test_limit_follows_latency(limiter):
+    """Test that slow requests cut the limit once per latency and busy fast ones grow it back."""
+    for _ in range(6):
+        limiter.acquire('reads')
+    limiter.release('e', 0.02, now=100.0) # Sets the baseline
+    limiter.release('e', 0.5, now=100.1)
+    assert limiter.limit == pytest.approx(10.1 * 0.9)
+    limiter.release('e', 0.5, now=100.2) # Same congestion, already acted on
+    assert limiter.stats()['decreases'] == 1
+    limiter.release('e', 0.5, now=101.0)
+    assert limiter.stats()['decreases'] == 2
+    cut = limiter.limit
+    limiter.release('e', 0.02, now=101.1) # 2 of ~8 busy: not enough load to grow
+    assert limiter.limit == cut
+    limiter.release('e', 0.02, now=101.2)
+
+    for _ in range(50): # Fast and busy
+        for _ in range(6):
+            limiter.acquire('reads')
+        for _ in range(6):
+            limiter.release('e', 0.02, now=200.0)
+    assert limiter.limit > cut + 1
+
+def test_limit_has_a_floor(limiter):
+    """Test that a persistently slow worker keeps at least CONCURRENCY_MIN_LIMIT."""
+    limiter.acquire('reads')
+    limiter.release('slow', 0.001, now=0.0)
+    for i in range(100):
+        limiter.acquire('reads')
+        limiter.release('slow', 1.0, now=10.0 + i * 2)
+    assert limiter.limit == limiter.min_limit
+
+def test_routes_shed_by_class(client, auth_tokens, add_track, limiter, monkeypatch):
+    """Test that a full worker turns away bulk and write routes with 503 + Retry-After but still plays tracks."""
+    headers = {'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"}
+    track = add_track(auth_tokens['ids']['user_a'], "Song")
+    monkeypatch.setattr(limiter, 'inflight', 8) # Other requests in flight
+
+    response = client.get('/api/tracks/duplicates', headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert response.json == {"message": "Server busy, retry later"}
+    assert client.post('/api/tracks', json={"title": "New"}, headers=headers).status_code == 503
+    assert client.get(f'/api/tracks/{track.id}', headers=headers).status_code == 200
+    assert client.get('/api/tracks', headers=headers).status_code == 200
+    # A client can lower its own priority, but not raise it
+    assert client.get('/api/tracks', headers=dict(headers, **{'X-Request-Priority': 'bulk'})).status_code == 503
+    assert client.get('/api/tracks/duplicates',
+                      headers=dict(headers, **{'X-Request-Priority': 'playback'})).status_code == 503
+    assert limiter.inflight == 8
+    monkeypatch.setattr(limiter, 'inflight', 0)
+    assert client.get('/api/tracks/duplicates', headers=headers).status_code == 200
+
+def test_upstream_time_is_not_latency(client, auth_tokens, add_track, stub_origin, limiter, monkeypatch):
+    """Test that waiting on a slow origin doesn't count towards the latency fed into the limit."""
+    user_id = auth_tokens['ids']['user_a']
+    stub_origin.add('/slow.m3u8', "#EXTM3U\n")
+    stub_origin.delay = 0.3
+    track = add_track(user_id, "Slow Origin", manifest_url=stub_origin.url('/slow.m3u8'))
+    released = []
+    release = limiter.release
+    monkeypatch.setattr(limiter, 'release', lambda endpoint, latency: (released.append(latency), release(endpoint, latency)))
+
+    response = client.get(f'/api/tracks/{track.id}/manifest', headers={'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"})
+    assert response.status_code == 200
+    assert released[0] < 0.3
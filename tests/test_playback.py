@@ -0,0 +1,82 @@
+import time
+import pytest
+from sqlalchemy import event
+from app.models import ManifestType
+from app.services.playback import PlaybackTokenError, playback_urls
+
+def auth(tokens, user='user_a'):
+    return {'Authorization': f"Bearer {tokens['tokens'][user]}"}
+
+def test_sign_and_verify(app):
+    """Test that tokens round-trip, and that tampered or expired ones are refused."""
+    token = playback_urls.sign(7, "http://example.com/a.m3u8", ManifestType.DASH, expires=2000)
+    playback = playback_urls.verify(token, now=1000)
+    assert playback == (7, ManifestType.DASH, "http://example.com/a.m3u8", 2000)
+    with pytest.raises(PlaybackTokenError, match="expired"):
+        playback_urls.verify(token, now=2000)
+
+    forged = playback_urls.sign(7, "http://evil.example.com/a.m3u8", ManifestType.DASH, expires=2000)
+    for bad in (forged.split('.')[0] + '.' + token.split('.')[1], token[:-2], token + 'x', 'garbage', ''):
+        with pytest.raises(PlaybackTokenError, match="Invalid"):
+            playback_urls.verify(bad, now=1000)
+
+def test_expiry_is_rounded(app):
+    """Test that URLs issued within one rounding window are identical, so an edge cache can share them."""
+    ttl, rounding = playback_urls.ttl, playback_urls.rounding
+    window = (1_700_000_000 // rounding + 1) * rounding
+    assert playback_urls.expiry(window - rounding + 1) == playback_urls.expiry(window - 1) == window + ttl
+    assert playback_urls.expiry(window - 1) >= window - 1 + ttl
+
+def test_play_redirects_without_auth_or_db(client, db, app):
+    """Test that GET /api/play/<token> answers from the token alone."""
+    token = playback_urls.sign(1, "http://example.com/a.m3u8", ManifestType.HLS, expires=int(time.time()) + 120)
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(f'/api/play/{token}')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 302
+    assert response.headers['Location'] == "http://example.com/a.m3u8"
+    max_age = int(response.headers['Cache-Control'].removeprefix('public, max-age='))
+    assert 0 < max_age <= 120
+    assert statements == []
+
+    assert client.get(f'/api/play/{token[:-1]}').status_code == 403
+
+def test_play_proxies_manifest(client, app, stub_origin):
+    """Test that PLAYBACK_URL_MODE='proxy' serves the manifest body instead of redirecting."""
+    stub_origin.add('/a.mpd', "<MPD/>")
+    token = playback_urls.sign(1, stub_origin.url('/a.mpd'), ManifestType.DASH)
+    app.config['PLAYBACK_URL_MODE'] = 'proxy'
+    try:
+        response = client.get(f'/api/play/{token}')
+    finally:
+        app.config['PLAYBACK_URL_MODE'] = 'redirect'
+    assert response.status_code == 200
+    assert response.mimetype == 'application/dash+xml'
+    assert response.data == b"<MPD/>"
+    assert response.headers['Cache-Control'].startswith('public, max-age=')
+
+def test_queue_and_playlist_issue_playback_urls(client, auth_tokens, add_track, add_playlist, add_track_to_playlist_db):
+    """Test that queue windows and playlists come with playback URLs for their tracks."""
+    user_id = auth_tokens['ids']['user_a']
+    tracks = [add_track(user_id, f"Song {i}", manifest_url=f"http://example.com/{i}.m3u8") for i in range(3)]
+    playlist = add_playlist(user_id, "Mix")
+    for order, track in enumerate(reversed(tracks)):
+        add_track_to_playlist_db(playlist.id, track.id, order)
+
+    queue = client.get('/api/queue', query_string={"mode": "album"}, headers=auth(auth_tokens)).json
+    assert queue['playback_expires'] > time.time()
+    for item in queue['items']:
+        response = client.get(item['playback_url'])
+        assert response.headers['Location'] == item['manifest_url']
+
+    response = client.get(f'/api/playlists/{playlist.id}/playback', headers=auth(auth_tokens))
+    assert response.status_code == 200
+    assert [t['track_id'] for t in response.json['tracks']] == [t.id for t in reversed(tracks)]
+    location = client.get(response.json['tracks'][0]['playback_url']).headers['Location']
+    assert location == "http://example.com/2.m3u8"
+    assert client.get(f'/api/playlists/{playlist.id}/playback', headers=auth(auth_tokens, 'user_b')).status_code == 404
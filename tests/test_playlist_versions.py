@@ -0,0 +1,100 @@
+from sqlalchemy import select
+from app.models import Playlist, playlist_tracks
+
+def auth(tokens, user='user_a', **extra):
+    return {'Authorization': f"Bearer {tokens['tokens'][user]}", **extra}
+
+def test_version_exposed_as_etag(client, auth_tokens, add_playlist):
+    """Test that reads and writes return the current version as a strong ETag."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    response = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens))
+    assert response.headers['ETag'] == '"1"'
+    assert response.json['version'] == 1
+
+    response = client.put(f'/api/playlists/{playlist.id}', json={"name": "Renamed"}, headers=auth(auth_tokens))
+    assert response.headers['ETag'] == '"2"'
+    assert response.json['version'] == 2
+
+def test_if_match_current_version(client, auth_tokens, add_playlist):
+    """Test that a write with the current version applies and bumps it."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    response = client.put(f'/api/playlists/{playlist.id}', json={"name": "Renamed"},
+                          headers=auth(auth_tokens, **{'If-Match': '"1"'}))
+    assert response.status_code == 200
+    assert response.json['name'] == "Renamed"
+
+def test_if_match_stale_version(client, db, auth_tokens, add_playlist):
+    """Test that the second of two writers holding the same version gets 412 and the write is skipped."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    url = f'/api/playlists/{playlist.id}'
+    assert client.put(url, json={"name": "Phone"}, headers=auth(auth_tokens, **{'If-Match': '"1"'})).status_code == 200
+    response = client.put(url, json={"name": "Laptop"}, headers=auth(auth_tokens, **{'If-Match': '"1"'}))
+    assert response.status_code == 412
+    assert response.headers['ETag'] == '"2"'
+    db.session.expire_all()
+    assert db.session.get(Playlist, playlist.id).name == "Phone"
+
+def test_stale_reorder_after_concurrent_add(client, db, auth_tokens, add_playlist, add_track, add_track_to_playlist_db):
+    """Test that a reorder based on an old track list is rejected once another device added a track."""
+    user_id = auth_tokens['ids']['user_a']
+    playlist = add_playlist(user_id, "Mix")
+    first, second, third = (add_track(user_id, title) for title in ("One", "Two", "Three"))
+    add_track_to_playlist_db(playlist.id, first.id, 0)
+    add_track_to_playlist_db(playlist.id, second.id, 1)
+    etag = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens)).headers['ETag']
+
+    response = client.post(f'/api/playlists/{playlist.id}/tracks', json={"track_id": third.id},
+                           headers=auth(auth_tokens, **{'If-Match': etag}))
+    assert response.status_code == 201
+    response = client.put(f'/api/playlists/{playlist.id}/tracks/order', json={"track_ids": [second.id, first.id]},
+                          headers=auth(auth_tokens, **{'If-Match': etag}))
+    assert response.status_code == 412
+
+    rows = db.session.execute(select(playlist_tracks.c.track_id).order_by(playlist_tracks.c.track_order)).scalars()
+    assert list(rows) == [first.id, second.id, third.id]
+
+def test_reorder_ignores_trashed_tracks(client, db, auth_tokens, add_playlist, add_track, add_track_to_playlist_db):
+    """Test that a reorder lists only the tracks clients see, and trashed entries move after them."""
+    user_id = auth_tokens['ids']['user_a']
+    playlist = add_playlist(user_id, "Mix")
+    first, trashed, second = (add_track(user_id, title) for title in ("One", "Gone", "Two"))
+    for order, track in enumerate((first, trashed, second)):
+        add_track_to_playlist_db(playlist.id, track.id, order)
+    assert client.delete(f'/api/tracks/{trashed.id}', headers=auth(auth_tokens)).status_code == 200
+
+    response = client.put(f'/api/playlists/{playlist.id}/tracks/order', json={"track_ids": [second.id, first.id]},
+                          headers=auth(auth_tokens))
+    assert response.status_code == 200
+    rows = db.session.execute(select(playlist_tracks.c.track_id, playlist_tracks.c.track_order)
+                              .order_by(playlist_tracks.c.track_order)).all()
+    assert [tuple(row) for row in rows] == [(second.id, 0), (first.id, 1), (trashed.id, 2)]
+
+    assert client.post(f'/api/tracks/{trashed.id}/restore', headers=auth(auth_tokens)).status_code == 200
+    tracks = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens)).json['tracks']
+    assert [track['id'] for track in tracks] == [second.id, first.id, trashed.id]
+
+def test_failed_write_does_not_bump_version(client, db, auth_tokens, add_playlist):
+    """Test that a rejected write leaves the version alone."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    response = client.delete(f'/api/playlists/{playlist.id}/tracks/999', headers=auth(auth_tokens))
+    assert response.status_code == 404
+    db.session.expire_all()
+    assert db.session.get(Playlist, playlist.id).version == 1
+
+def test_if_match_missing_playlist(client, auth_tokens, add_playlist):
+    """Test that a missing or foreign playlist is still a 404, not a 412."""
+    playlist = add_playlist(auth_tokens['ids']['user_b'], "Theirs")
+    response = client.delete(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens, **{'If-Match': '"1"'}))
+    assert response.status_code == 404
+
+def test_delete_and_restore_with_if_match(client, auth_tokens, add_playlist):
+    """Test that delete hands back the ETag restore needs."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    response = client.delete(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens, **{'If-Match': '*'}))
+    assert response.status_code == 200
+    assert client.post(f'/api/playlists/{playlist.id}/restore',
+                       headers=auth(auth_tokens, **{'If-Match': '"1"'})).status_code == 412
+    response = client.post(f'/api/playlists/{playlist.id}/restore',
+                           headers=auth(auth_tokens, **{'If-Match': response.headers['ETag']}))
+    assert response.status_code == 200
+    assert response.json['deleted_at'] is None
@@ -72,11 +72,11 @@ def test_delete_playlist_success(client, db, auth_tokens, add_playlist):
 
     response = client.delete(f'/api/playlists/{playlist_id}', headers={'Authorization': f'Bearer {token}'})
     assert response.status_code == 200
-    assert b"Playlist deleted successfully" in response.data
+    assert b"Playlist moved to trash" in response.data
 
-    # Verify DB
-    db_playlist = db.session.get(Playlist, playlist_id)
-    assert db_playlist is None
+    # Verify DB: soft deleted, so hidden from queries but still restorable
+    assert Playlist.query.filter_by(id=playlist_id).first() is None
+    assert db.session.get(Playlist, playlist_id).deleted_at is not None
 
 # --- Playlist Track Management ---
 
@@ -0,0 +1,126 @@
+import pytest
+from app.models import PlayEvent
+from app.services import play_buffer
+
+def test_record_single_play(client, db, auth_tokens, add_track):
+    """Test that a single play is buffered and written on flush."""
+    user_id = auth_tokens['ids']['user_a']
+    token = auth_tokens['tokens']['user_a']
+    track = add_track(user_id, "Played Song")
+
+    response = client.post('/api/plays', json={"track_id": track.id, "ms_played": 30000},
+                           headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 202
+    assert response.json == {"accepted": 1, "rejected": 0}
+    assert PlayEvent.query.count() == 0 # Not written until the buffer flushes
+
+    assert play_buffer.flush() == 1
+    event = PlayEvent.query.one()
+    assert (event.user_id, event.track_id, event.ms_played) == (user_id, track.id, 30000)
+    assert event.played_at is not None
+
+def test_record_batched_plays_rejects_foreign_tracks(client, db, auth_tokens, add_track):
+    """Test a batch where some tracks belong to another user."""
+    user_a_id = auth_tokens['ids']['user_a']
+    user_b_id = auth_tokens['ids']['user_b']
+    token_a = auth_tokens['tokens']['user_a']
+    mine = add_track(user_a_id, "Mine")
+    theirs = add_track(user_b_id, "Theirs")
+
+    response = client.post('/api/plays', json={"events": [
+        {"track_id": mine.id, "played_at": "2026-10-01T12:00:00"},
+        {"track_id": mine.id, "played_at": "2026-10-01T12:04:00", "source": "playlist"},
+        {"track_id": theirs.id}
+    ]}, headers={'Authorization': f'Bearer {token_a}'})
+    assert response.status_code == 202
+    assert response.json == {"accepted": 2, "rejected": 1}
+    play_buffer.flush()
+    assert PlayEvent.query.filter_by(user_id=user_a_id, track_id=mine.id).count() == 2
+    assert PlayEvent.query.filter_by(track_id=theirs.id).count() == 0
+
+def test_played_at_offsets_are_stored_as_utc(client, db, auth_tokens, add_track):
+    """Test that played_at sent with a UTC offset is converted, not just stripped of it."""
+    track = add_track(auth_tokens['ids']['user_a'], "Song")
+    response = client.post('/api/plays', json={"events": [
+        {"track_id": track.id, "played_at": "2026-10-01T14:00:00+02:00"},
+        {"track_id": track.id, "played_at": "2026-10-01T12:30:00"},
+    ]}, headers={'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"})
+    assert response.status_code == 202
+    play_buffer.flush()
+    assert sorted(event.played_at.isoformat() for event in PlayEvent.query) == ["2026-10-01T12:00:00", "2026-10-01T12:30:00"]
+
+def test_record_plays_validation(client, auth_tokens):
+    """Test malformed play events."""
+    token = auth_tokens['tokens']['user_a']
+    response = client.post('/api/plays', json={"ms_played": -1}, headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+    assert 'track_id' in response.json
+    response = client.post('/api/plays', json={"events": []}, headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+
+def test_play_buffer_keeps_rows_when_flush_fails(app, db, monkeypatch):
+    """Test at-least-once: rows survive a failed flush and are written by the next one."""
+    play_buffer.add([{"user_id": 1, "track_id": 1, "played_at": _now()}])
+    def fail(*args, **kwargs):
+        raise RuntimeError("database went away")
+    monkeypatch.setattr(db.session, 'execute', fail)
+    with pytest.raises(RuntimeError):
+        play_buffer.flush()
+    assert len(play_buffer) == 1
+
+    monkeypatch.undo()
+    assert play_buffer.flush() == 1
+    assert PlayEvent.query.count() == 1
+
+def test_play_buffer_flushes_in_background(app, db):
+    """Test the size trigger wakes the flusher thread."""
+    import time
+    from app.services.plays import PlayEventBuffer
+    buffer = PlayEventBuffer()
+    buffer.init_app(app)
+    buffer.max_size, buffer.flush_interval = 2, 60 # Only the size trigger can fire within the test
+    buffer.add([{"user_id": 1, "track_id": 1, "played_at": _now()} for _ in range(2)])
+    deadline = time.monotonic() + 5
+    while len(buffer) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(buffer) == 0
+    assert PlayEvent.query.count() == 2
+
+def test_full_play_buffer_rejects_without_buffering(client, db, auth_tokens, add_track, monkeypatch):
+    """Test that a request over max_pending gets 503 and its events aren't kept for a retry to duplicate."""
+    token = auth_tokens['tokens']['user_a']
+    track = add_track(auth_tokens['ids']['user_a'], "Song")
+    monkeypatch.setattr(play_buffer, 'max_pending', 1)
+    play_buffer.add([{"user_id": 1, "track_id": 1, "played_at": _now()}])
+    response = client.post('/api/plays', json={"track_id": track.id}, headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert len(play_buffer) == 1
+    play_buffer.clear()
+
+def test_flush_at_exit_waits_for_inflight_flush(app, db, monkeypatch):
+    """Test that shutdown writes the rows a failing background flush had taken off the buffer."""
+    import threading
+    monkeypatch.setattr(play_buffer, '_app', app)
+    play_buffer.add([{"user_id": 1, "track_id": 1, "played_at": _now()}])
+    taken = threading.Event()
+
+    def failing_flush():
+        with play_buffer._flush_lock:
+            with play_buffer._lock:
+                rows, play_buffer._pending = play_buffer._pending, []
+            taken.set()
+            threading.Event().wait(0.2)
+            with play_buffer._lock:
+                play_buffer._pending[:0] = rows # What flush() does when the INSERT fails
+    thread = threading.Thread(target=failing_flush)
+    thread.start()
+    taken.wait()
+    assert len(play_buffer) == 0
+    play_buffer._flush_at_exit()
+    thread.join()
+    assert PlayEvent.query.count() == 1
+
+def _now():
+    from datetime import datetime
+    return datetime.utcnow()
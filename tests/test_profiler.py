@@ -0,0 +1,80 @@
+import tracemalloc
+import pytest
+from app.models import User
+from app.services.profiler import request_profiler
+
+@pytest.fixture
+def profiler(app, db, auth_tokens, add_track, stub_origin):
+    """A clean profiler, an admin (user_a) and a track whose manifest takes a while to fetch."""
+    request_profiler.rules.clear()
+    request_profiler.captures.clear()
+    db.session.get(User, auth_tokens['ids']['user_a']).roles = 'admin'
+    db.session.commit()
+    stub_origin.add('/slow.m3u8', "#EXTM3U\n#EXTINF:4.0,\nseg1.ts\n")
+    stub_origin.delay = 0.1
+    track = add_track(auth_tokens['ids']['user_b'], "Song", manifest_url=stub_origin.url('/slow.m3u8'))
+    yield {'url': f'/api/tracks/{track.id}/manifest',
+           'admin': {'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"},
+           'user': {'Authorization': f"Bearer {auth_tokens['tokens']['user_b']}"}}
+    request_profiler.rules.clear()
+    request_profiler.captures.clear()
+
+def test_profile_header(client, profiler):
+    """Test that X-Profile from an admin captures the request, downloadable as speedscope and collapsed stacks."""
+    response = client.get(profiler['url'], headers=dict(profiler['user'], **{'X-Profile': '1'}))
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers # Not an admin
+    assert request_profiler.state()['captures'] == []
+
+    response = client.get('/api/tracks', headers=dict(profiler['admin'], **{'X-Profile': '1'}))
+    capture_id = response.headers['X-Profile-Id']
+
+    speedscope = client.get(f'/api/profiler/captures/{capture_id}', headers=profiler['admin'])
+    assert speedscope.status_code == 200
+    assert speedscope.headers['Content-Disposition'] == f'attachment; filename=profile-{capture_id}.speedscope.json'
+    profile = speedscope.json['profiles'][0]
+    assert profile['type'] == 'sampled' and len(profile['samples']) == len(profile['weights'])
+    collapsed = client.get(f'/api/profiler/captures/{capture_id}?format=collapsed', headers=profiler['admin'])
+    assert collapsed.mimetype == 'text/plain'
+    assert client.get(f'/api/profiler/captures/{capture_id}?format=svg', headers=profiler['admin']).status_code == 400
+
+def test_slow_request_is_sampled(client, profiler):
+    """Test that the stacks of a slow request land in its capture, view function included."""
+    response = client.get(profiler['url'], headers=dict(profiler['admin'], **{'X-Profile': '1'}))
+    assert response.status_code == 404 # user_b's track; the request is profiled all the same
+    response = client.post('/api/profiler/rules', headers=profiler['admin'], json={"endpoint": "tracks.get_track_manifest"})
+    assert response.status_code == 201
+    assert client.get(profiler['url'], headers=profiler['user']).status_code == 200
+    capture = request_profiler.captures[-1]
+    assert capture.endpoint == 'tracks.get_track_manifest' and capture.rule_id == response.json['id']
+    lines = capture.collapsed().splitlines()
+    assert sum(int(line.rpartition(' ')[2]) for line in lines) >= 5
+    assert any('get_track_manifest (app/routes/tracks.py:' in line for line in lines)
+    assert client.delete(f"/api/profiler/rules/{capture.rule_id}", headers=profiler['admin']).status_code == 200
+
+def test_rules_run_out(client, profiler):
+    """Test that a rule stops after max_requests, records allocations when asked, and leaves tracemalloc off."""
+    assert client.post('/api/profiler/rules', headers=profiler['admin'],
+                       json={"endpoint": "tracks.nope"}).status_code == 400
+    assert client.post('/api/profiler/rules', headers=profiler['admin'],
+                       json={"sample_rate": 0}).status_code == 400
+    rule = client.post('/api/profiler/rules', headers=profiler['admin'], json={
+        "endpoint": "tracks.get_track_manifest", "max_requests": 1, "memory": True,
+    }).json
+    first = client.get(profiler['url'], headers=profiler['user'])
+    second = client.get(profiler['url'], headers=profiler['user'])
+    assert 'X-Profile-Id' in first.headers and 'X-Profile-Id' not in second.headers
+    assert not tracemalloc.is_tracing()
+
+    state = client.get('/api/profiler', headers=profiler['admin']).json
+    assert [capture['rule_id'] for capture in state['captures']] == [rule['id']]
+    allocations = client.get(f"/api/profiler/captures/{first.headers['X-Profile-Id']}?format=allocations",
+                             headers=profiler['admin'])
+    assert isinstance(allocations.json['allocations'], list)
+    assert client.delete(f"/api/profiler/rules/{rule['id']}", headers=profiler['admin']).status_code == 404 # Used up
+
+def test_admin_only(client, profiler):
+    """Test that the profiler endpoints are for admins."""
+    assert client.get('/api/profiler', headers=profiler['user']).status_code == 403
+    assert client.post('/api/profiler/rules', headers=profiler['user'], json={}).status_code == 403
+    assert client.get('/api/profiler').status_code == 401
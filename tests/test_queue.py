@@ -0,0 +1,92 @@
+import numpy as np
+from app.services.queue import build_queue
+
+def get_queue(client, token, **params):
+    return client.get('/api/queue', query_string=params, headers={'Authorization': f'Bearer {token}'})
+
+def test_queue_shuffle_is_seeded_and_pageable(client, auth_tokens, add_track):
+    """Test that the same seed gives the same queue across pages."""
+    user_id = auth_tokens['ids']['user_a']
+    token = auth_tokens['tokens']['user_a']
+    track_ids = {add_track(user_id, f"Song {i}").id for i in range(12)}
+
+    full = get_queue(client, token, seed=42, limit=12)
+    assert full.status_code == 200
+    assert full.json['total'] == 12
+    assert full.json['next_offset'] is None
+    order = [item['track_id'] for item in full.json['items']]
+    assert set(order) == track_ids
+
+    first = get_queue(client, token, seed=42, limit=5)
+    second = get_queue(client, token, seed=42, offset=first.json['next_offset'], limit=5)
+    paged = [item['track_id'] for item in first.json['items'] + second.json['items']]
+    assert paged == order[:10]
+    assert first.json['items'][0]['manifest_url'] == "http://example.com/test.m3u8"
+    assert first.json['items'][0]['manifest_type'] == "HLS"
+
+def test_queue_returns_generated_seed(client, auth_tokens, add_track):
+    """Test that a queue without a seed reports the one it used."""
+    user_id = auth_tokens['ids']['user_a']
+    token = auth_tokens['tokens']['user_a']
+    add_track(user_id, "Song")
+    response = get_queue(client, token)
+    assert response.status_code == 200
+    assert isinstance(response.json['seed'], int)
+
+def test_queue_artist_spread_avoids_back_to_back(client, auth_tokens, add_track):
+    """Test that artist spread never plays the same artist twice in a row when avoidable."""
+    user_id = auth_tokens['ids']['user_a']
+    token = auth_tokens['tokens']['user_a']
+    artist_of = {}
+    for artist, count in (("A", 6), ("B", 4), ("C", 3), ("D", 1)):
+        for i in range(count):
+            artist_of[add_track(user_id, f"{artist} {i}", artist=artist).id] = artist
+
+    for seed in range(5):
+        response = get_queue(client, token, mode='artist_spread', seed=seed, limit=100)
+        artists = [artist_of[item['track_id']] for item in response.json['items']]
+        assert len(artists) == 14
+        assert all(a != b for a, b in zip(artists, artists[1:]))
+
+def test_queue_album_order_for_playlist(client, auth_tokens, add_playlist, add_track_to_playlist_db, db):
+    """Test album mode groups a playlist's tracks by album in track-number order."""
+    from app.models import Track
+    user_id = auth_tokens['ids']['user_a']
+    token = auth_tokens['tokens']['user_a']
+    playlist = add_playlist(user_id, "Mixed")
+    tracks = [
+        Track(user_id=user_id, title="X2", artist="Art", album="X", track_number=2, manifest_url="http://e/1", manifest_type="HLS"),
+        Track(user_id=user_id, title="Y1", artist="Art", album="Y", track_number=1, manifest_url="http://e/2", manifest_type="DASH"),
+        Track(user_id=user_id, title="X1", artist="Art", album="X", track_number=1, manifest_url="http://e/3", manifest_type="HLS"),
+    ]
+    db.session.add_all(tracks)
+    db.session.commit()
+    for order, track in enumerate(tracks):
+        add_track_to_playlist_db(playlist.id, track.id, order)
+
+    response = get_queue(client, token, playlist_id=playlist.id, mode='album')
+    assert response.status_code == 200
+    assert [item['track_id'] for item in response.json['items']] == [tracks[2].id, tracks[0].id, tracks[1].id]
+
+def test_queue_playlist_wrong_user(client, auth_tokens, add_playlist):
+    """Test queueing another user's playlist."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Private")
+    response = get_queue(client, auth_tokens['tokens']['user_b'], playlist_id=playlist.id)
+    assert response.status_code == 404
+
+def test_queue_invalid_mode(client, auth_tokens):
+    """Test that unknown modes are rejected."""
+    response = get_queue(client, auth_tokens['tokens']['user_a'], mode='radio')
+    assert response.status_code == 400
+    assert 'mode' in response.json
+
+def test_build_queue_artist_spread_large():
+    """Test artist spread on a large library stays a permutation without adjacent repeats."""
+    rng = np.random.default_rng(0)
+    n = 20000
+    artists = [f"artist {a}" for a in rng.integers(0, 500, n)]
+    ids = np.arange(n)
+    order = build_queue(ids, artists, [None] * n, [None] * n, 'artist_spread', seed=7)
+    assert sorted(order.tolist()) == ids.tolist()
+    played = np.array(artists)[order]
+    assert not np.any(played[1:] == played[:-1])
@@ -0,0 +1,92 @@
+import pytest
+import numpy as np
+from app.models import RecommendationRefresh, TrackNeighbour
+from app.services.recommendations import similar_tracks, refresh_neighbours
+
+def test_similar_tracks_blocks_match_unblocked():
+    """Test that block size doesn't change the result."""
+    rng = np.random.default_rng(1)
+    playlist_ids = rng.integers(0, 40, 600)
+    track_ids = rng.integers(100, 300, 600)
+
+    def collect(block_size):
+        parts = list(similar_tracks(playlist_ids, track_ids, top_k=5, block_size=block_size))
+        return [np.concatenate(column) for column in zip(*parts)]
+
+    whole = collect(10000)
+    blocked = collect(7)
+    assert all(np.array_equal(a, b) for a, b in zip(whole[:2], blocked[:2]))
+    assert np.allclose(whole[2], blocked[2])
+    sources = whole[0]
+    assert np.bincount(sources).max() <= 5 # top_k per track
+    assert not np.any(whole[0] == whole[1]) # No self-neighbours
+
+def test_similar_tracks_cosine():
+    """Test scores on a tiny hand-checkable example."""
+    # Playlist 1: a, b ; playlist 2: a, b, c
+    sources, neighbours, scores = next(similar_tracks([1, 1, 2, 2, 2], [10, 20, 10, 20, 30], top_k=5))
+    result = {(s, n): round(float(v), 4) for s, n, v in zip(sources, neighbours, scores)}
+    assert result[(10, 20)] == 1.0
+    assert result[(10, 30)] == round(1 / np.sqrt(2), 4)
+    assert result[(30, 10)] == round(1 / np.sqrt(2), 4)
+
+def test_get_similar_tracks(client, db, auth_tokens, add_track, add_playlist):
+    """Test the endpoint after playlist edits and an incremental refresh."""
+    user_id = auth_tokens['ids']['user_a']
+    token = auth_tokens['tokens']['user_a']
+    headers = {'Authorization': f'Bearer {token}'}
+    a, b, c = (add_track(user_id, name) for name in ("A", "B", "C"))
+    p1 = add_playlist(user_id, "One")
+    p2 = add_playlist(user_id, "Two")
+    for playlist, tracks in ((p1, (a, b)), (p2, (a, b, c))):
+        for track in tracks:
+            assert client.post(f'/api/playlists/{playlist.id}/tracks', json={"track_id": track.id}, headers=headers).status_code == 201
+    assert db.session.get(RecommendationRefresh, user_id) is not None
+
+    assert refresh_neighbours()[0] == 1
+    assert db.session.get(RecommendationRefresh, user_id) is None
+
+    response = client.get(f'/api/tracks/{a.id}/similar', headers=headers)
+    assert response.status_code == 200
+    assert [t['id'] for t in response.json] == [b.id, c.id]
+    assert response.json[0]['score'] == 1.0
+
+    # Removing C from playlist two drops it from A's neighbours after the next refresh
+    client.delete(f'/api/playlists/{p2.id}/tracks/{c.id}', headers=headers)
+    refresh_neighbours()
+    response = client.get(f'/api/tracks/{a.id}/similar', headers=headers)
+    assert [t['id'] for t in response.json] == [b.id]
+
+def test_get_similar_tracks_wrong_user(client, auth_tokens, add_track):
+    """Test similar tracks for another user's track."""
+    track = add_track(auth_tokens['ids']['user_a'], "Mine")
+    response = client.get(f'/api/tracks/{track.id}/similar', headers={'Authorization': f"Bearer {auth_tokens['tokens']['user_b']}"})
+    assert response.status_code == 404
+
+def test_build_recommendations_command(runner, db, auth_tokens, add_track, add_playlist, add_track_to_playlist_db):
+    """Test the full rebuild CLI."""
+    user_id = auth_tokens['ids']['user_a']
+    a, b = add_track(user_id, "A"), add_track(user_id, "B")
+    playlist = add_playlist(user_id, "P")
+    add_track_to_playlist_db(playlist.id, a.id, 0)
+    add_track_to_playlist_db(playlist.id, b.id, 1)
+    result = runner.invoke(args=['build-recommendations', '--full'])
+    assert result.exit_code == 0
+    assert "Rebuilt all neighbours (2 rows)" in result.output
+    assert TrackNeighbour.query.count() == 2
+
+@pytest.mark.parametrize('on_conflict', [True, False])
+def test_mark_stale_upserts(db, auth_tokens, monkeypatch, on_conflict):
+    """Test that flagging a user twice keeps one row with the later time, with or without ON CONFLICT."""
+    if not on_conflict:
+        monkeypatch.setattr('app.services.upserts.ON_CONFLICT_DIALECTS', {})
+    from datetime import datetime
+    from app.services.recommendations import mark_stale
+    user_id = auth_tokens['ids']['user_a']
+    db.session.add(RecommendationRefresh(user_id=user_id, requested_at=datetime(2026, 1, 1)))
+    db.session.commit()
+    mark_stale(user_id)
+    mark_stale(user_id)
+    db.session.commit()
+    db.session.expire_all()
+    assert RecommendationRefresh.query.one().requested_at > datetime(2026, 1, 1)
@@ -0,0 +1,174 @@
+import os
+import threading
+import pytest
+from app.models import ManifestType
+from app.services.manifests import UnsafeURLError
+from app.services.playback import playback_urls
+from app.services.segments import SEGMENT_ROOT, rewrite_manifest, segment_cache
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=128000
+low/index.m3u8
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="a",NAME="en",URI="audio/index.m3u8"
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-KEY:METHOD=AES-128,URI="https://keys.example.com/k?id=1"
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:4.0,
+seg1.m4s
+#EXTINF:4.0,
+seg2.m4s
+#EXT-X-ENDLIST
+"""
+
+MPD = """<?xml version="1.0"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static">
+  <ProgramInformation/>
+  <Period>
+    <AdaptationSet>
+      <SegmentTemplate media="$Number$.m4s" initialization="https://cdn.example.com/v/init.mp4"/>
+      <Representation id="1" bandwidth="128000"><BaseURL>audio/</BaseURL></Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+@pytest.fixture(scope='function')
+def segment_proxy(app, tmp_path):
+    """The session-wide app with the segment proxy on, over a temporary cache directory."""
+    app.config.update(SEGMENT_PROXY_ENABLED=True, SEGMENT_CACHE_DIR=str(tmp_path / 'segments'))
+    segment_cache.init_app(app)
+    segment_cache.reset_stats()
+    yield segment_cache
+    segment_cache.clear()
+    app.config.update(SEGMENT_PROXY_ENABLED=False)
+    segment_cache.init_app(app)
+
+def proxied_lines(body):
+    return [line for line in body.decode().splitlines() if SEGMENT_ROOT in line]
+
+def test_hls_rewrite(app):
+    """Test that HLS URIs, in lines and URI attributes, point at the proxy with one token per directory."""
+    master = rewrite_manifest(MASTER.encode(), ManifestType.HLS, "http://origin.example.com/t/master.m3u8").decode()
+    variant = master.splitlines()[2]
+    assert variant.startswith(f"{SEGMENT_ROOT}/") and variant.endswith("/index.m3u8")
+    assert playback_urls.verify_prefix(variant.split('/')[-2]).prefix == "http://origin.example.com/t/low/"
+    assert 'URI="/api/play/segments/' in master.splitlines()[3]
+
+    media = rewrite_manifest(MEDIA.encode(), ManifestType.HLS, "http://origin.example.com/t/low/index.m3u8").decode()
+    lines = media.splitlines()
+    assert lines[1].startswith('#EXT-X-KEY:METHOD=AES-128,URI="') and lines[1].endswith('/k?id=1"')
+    segments = [line for line in lines if line.endswith('.m4s')]
+    assert len(segments) == 2 and all(line.startswith(SEGMENT_ROOT) for line in segments)
+    token = segments[0].split('/')[-2]
+    assert segments[1].split('/')[-2] == token
+    assert playback_urls.verify_prefix(token).prefix == "http://origin.example.com/t/low/"
+
+def test_internal_uris_are_not_signed(app):
+    """Test that URIs on internal hosts are left as they are, so the proxy never gets a token for them."""
+    manifest = ("#EXTM3U\n#EXTINF:4.0,\nhttp://169.254.169.254/latest/meta-data/x\n#EXTINF:4.0,\n"
+                "http://localhost:8080/admin\n#EXTINF:4.0,\nhttp://[::ffff:10.0.0.1]/a.ts\n#EXTINF:4.0,\nseg1.ts\n")
+    lines = rewrite_manifest(manifest.encode(), ManifestType.HLS, "http://origin.example.com/t/index.m3u8").decode().splitlines()
+    assert lines[2] == "http://169.254.169.254/latest/meta-data/x"
+    assert lines[4] == "http://localhost:8080/admin"
+    assert lines[6] == "http://[::ffff:10.0.0.1]/a.ts"
+    assert lines[8].startswith(SEGMENT_ROOT)
+
+def test_dash_rewrite(app):
+    """Test that an MPD gets a proxied top-level BaseURL and absolute URL attributes are proxied."""
+    body = rewrite_manifest(MPD.encode(), ManifestType.DASH, "http://origin.example.com/t/manifest.mpd").decode()
+    assert 'xmlns="urn:mpeg:dash:schema:mpd:2011"' in body
+    assert body.index('<ProgramInformation/>') < body.index(f'<BaseURL>{SEGMENT_ROOT}/') < body.index('<Period>')
+    assert 'media="$Number$.m4s"' in body # Relative, resolved by the player against the proxied BaseURL
+    assert f'initialization="{SEGMENT_ROOT}/' in body
+    assert '<BaseURL>audio/</BaseURL>' in body
+
+def test_segments_are_cached_and_ranged(client, segment_proxy, stub_origin):
+    """Test the whole path: manifest, media playlist, then segments served from disk with Range support."""
+    stub_origin.add('/t/master.m3u8', MASTER)
+    stub_origin.add('/t/low/index.m3u8', MEDIA)
+    stub_origin.add('/t/low/seg1.m4s', bytes(range(256)) * 4)
+    token = playback_urls.sign(1, stub_origin.url('/t/master.m3u8'), ManifestType.HLS)
+
+    master = client.get(f'/api/play/{token}') # Served, not redirected, with the proxy on
+    assert master.status_code == 200
+    media = client.get(proxied_lines(master.data)[0])
+    assert media.status_code == 200
+    assert media.mimetype == 'application/vnd.apple.mpegurl'
+    segment_url = next(line for line in proxied_lines(media.data) if line.endswith('seg1.m4s'))
+
+    first = client.get(segment_url)
+    assert first.status_code == 200
+    assert first.mimetype == 'video/iso.segment'
+    assert first.data == bytes(range(256)) * 4
+    assert first.headers['Cache-Control'].startswith('public, max-age=')
+    ranged = client.get(segment_url, headers={'Range': 'bytes=256-259'})
+    assert ranged.status_code == 206
+    assert ranged.data == bytes([0, 1, 2, 3])
+    assert ranged.headers['Content-Range'] == 'bytes 256-259/1024'
+    assert client.get(segment_url, headers={'Range': 'bytes=2000-'}).status_code == 416
+    assert [path for _, path, _ in stub_origin.requests].count('/t/low/seg1.m4s') == 1
+    assert segment_proxy.stats()['hits'] == 2
+
+    segment_token = segment_url.split('/')[-2]
+    assert client.get(segment_url.replace(segment_token, segment_token[:-1])).status_code == 403
+    assert client.get(f'{SEGMENT_ROOT}/{segment_token}/%2E%2E/secret').status_code == 400
+    assert client.get(segment_url.replace('seg1', 'missing')).status_code == 502
+
+def test_concurrent_misses_share_one_download(app, segment_proxy, stub_origin):
+    """Test that requests for a segment that's being downloaded wait for it instead of fetching again."""
+    stub_origin.add('/seg.ts', b'x' * 1000)
+    stub_origin.delay = 0.2
+    bodies, errors = [], []
+    def fetch():
+        try:
+            with segment_proxy.get(stub_origin.url('/seg.ts')) as f:
+                bodies.append(f.read())
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=fetch) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert bodies == [b'x' * 1000] * 5
+    assert len(stub_origin.requests) == 1
+    assert segment_proxy.stats()['misses'] == 1
+    assert segment_proxy.stats()['shared'] == 4
+
+def test_lru_eviction(app, segment_proxy, stub_origin, monkeypatch):
+    """Test that the least recently used segments go once the cache is over its size, and survive a restart."""
+    for name in 'abc':
+        stub_origin.add(f'/{name}.ts', name.encode() * 100)
+    monkeypatch.setattr(segment_proxy, 'max_bytes', 250)
+    for name in 'abac': # a is the most recently used when c comes in
+        segment_proxy.get(stub_origin.url(f'/{name}.ts')).close()
+    assert segment_proxy.stats()['bytes'] == 200
+    assert len(os.listdir(segment_proxy.directory)) == 2
+
+    segment_proxy.load()
+    assert segment_proxy.stats()['entries'] == 2
+    for name in 'ab':
+        segment_proxy.get(stub_origin.url(f'/{name}.ts')).close()
+    assert [path for _, path, _ in stub_origin.requests].count('/a.ts') == 1
+    assert [path for _, path, _ in stub_origin.requests].count('/b.ts') == 2
+
+def test_evicted_segment_stays_readable(app, segment_proxy, stub_origin):
+    """Test that a segment evicted after the lookup is still read in full by the request that got it."""
+    stub_origin.add('/seg.ts', b'x' * 100)
+    segment_proxy.get(stub_origin.url('/seg.ts')).close()
+    with segment_proxy.get(stub_origin.url('/seg.ts')) as f:
+        segment_proxy.clear()
+        assert os.listdir(segment_proxy.directory) == []
+        assert f.read() == b'x' * 100
+
+def test_downloads_refuse_internal_addresses(app, segment_proxy, stub_origin, monkeypatch):
+    """Test that a segment on an internal host isn't fetched, even under a validly signed prefix."""
+    stub_origin.add('/seg.ts', b'x' * 10)
+    monkeypatch.setattr('app.services.manifests.upstream_guard.allow_private', False)
+    with pytest.raises(UnsafeURLError):
+        segment_proxy.get(stub_origin.url('/seg.ts'))
+    assert stub_origin.requests == []
+    assert segment_proxy.stats()['entries'] == 0
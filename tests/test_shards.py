@@ -0,0 +1,228 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import text
+from app import create_app, db as _db
+from app.models import UserShard
+from app.services import play_buffer
+from app.services import shards
+from app.services.shards import ShardMoveError, move_user, shard_map
+
+SHARDS = ('s1', 's2')
+
+@pytest.fixture(scope='function')
+def sharded_app(app, tmp_path):
+    """App over a main SQLite DB and two shard DBs, all file-backed."""
+    shards = {name: f"sqlite:///{tmp_path / name}.db" for name in SHARDS}
+    flask_app = create_app(config_class=type('ShardTestConfig', (object,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'main.db'}",
+        'SQLALCHEMY_BINDS': shards,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': 'test-secret-key',
+        'JWT_SECRET_KEY': 'test-jwt-secret-key',
+        'BCRYPT_LOG_ROUNDS': 4,
+        'PLAY_FLUSH_INTERVAL': None,
+        'MIGRATIONS_ENABLED': False,
+        'SHARDS': shards,
+        'SHARD_ID_SPAN': 1000,
+        'SHARD_MOVE_SETTLE': 0,
+    }))
+    with flask_app.app_context():
+        _db.create_all(bind_key=None)
+        for name in SHARDS:
+            shard_map.create_schema(name)
+    yield flask_app
+    with flask_app.app_context():
+        _db.session.remove()
+    play_buffer.clear()
+    for name in SHARDS:
+        _db.metadatas.pop(name, None) # Added per bind by init_app, the session-wide app's create_all would trip on them
+    shard_map.configure(app.config) # Back to the session-wide, unsharded app
+
+@pytest.fixture(scope='function')
+def users(sharded_app):
+    """Register and log in three users, returning {username: (id, headers)}."""
+    client = sharded_app.test_client()
+    users = {}
+    for name in ('alice', 'bob', 'carol'):
+        response = client.post('/api/auth/register', json={"username": name, "email": f"{name}@test.com",
+                                                           "password": "password"})
+        assert response.status_code == 201
+        token = client.post('/api/auth/login', json={"username": name, "password": "password"}).json['access_token']
+        users[name] = (response.json['id'], {'Authorization': f'Bearer {token}'})
+    return users
+
+def add_track(client, headers, title):
+    response = client.post('/api/tracks', json={"title": title, "artist": "Artist", "manifest_type": "HLS",
+                                                "manifest_url": f"http://example.com/{title}.m3u8"}, headers=headers)
+    assert response.status_code == 201
+    return response.json['id']
+
+def shard_rows(app, shard, table):
+    with app.app_context():
+        return _db.session.execute(text(f"SELECT count(*) FROM {table}"),
+                                   bind_arguments={'bind': shard_map.engine(shard)}).scalar()
+
+def test_users_are_spread_over_shards(sharded_app, users):
+    """Test that new users get a shard and their data is written there, in the shard's id range."""
+    with sharded_app.app_context():
+        placements = {name: shard_map.shard_for(user_id) for name, (user_id, _) in users.items()}
+    assert set(placements.values()) == set(SHARDS)
+
+    client = sharded_app.test_client()
+    alice_id, headers = users['alice']
+    track_id = add_track(client, headers, "Song")
+    base = shard_map.names.index(placements['alice']) * 1000
+    assert base < track_id < base + 1000
+    assert shard_rows(sharded_app, placements['alice'], 'tracks') == 1
+    assert shard_rows(sharded_app, 'default', 'tracks') == 0
+    assert [t['id'] for t in client.get('/api/tracks', headers=headers).json] == [track_id]
+    assert client.get('/api/tracks', headers=users['bob'][1]).json == []
+
+    assert client.post('/api/plays', json={"track_id": track_id}, headers=headers).status_code == 202
+    with sharded_app.app_context():
+        assert play_buffer.flush() == 1
+    assert shard_rows(sharded_app, placements['alice'], 'play_events') == 1
+
+def test_shared_playlists_across_shards(sharded_app, users):
+    """Test that members on other shards read the owner's playlist, by id, share list and link."""
+    client = sharded_app.test_client()
+    with sharded_app.app_context():
+        owner = next(name for name, (user_id, _) in users.items() if shard_map.shard_for(user_id) == 's1')
+        member = next(name for name, (user_id, _) in users.items() if shard_map.shard_for(user_id) != 's1')
+    owner_headers, member_id = users[owner][1], users[member][0]
+    playlist_id = client.post('/api/playlists', json={"name": "Mix"}, headers=owner_headers).json['id']
+    track_id = add_track(client, owner_headers, "Song")
+    assert client.post(f'/api/playlists/{playlist_id}/tracks', json={"track_id": track_id},
+                       headers=owner_headers).status_code == 201
+
+    response = client.put(f'/api/playlists/{playlist_id}/members/{member_id}', json={"role": "editor"},
+                          headers=owner_headers)
+    assert response.status_code == 409 # Their tracks can't be added here
+    assert client.put(f'/api/playlists/{playlist_id}/members/{member_id}', json={"role": "viewer"},
+                      headers=owner_headers).status_code == 201
+
+    details = client.get(f'/api/playlists/{playlist_id}', headers=users[member][1])
+    assert details.status_code == 200
+    assert [t['title'] for t in details.json['tracks']] == ["Song"]
+    assert [p['id'] for p in client.get('/api/playlists/shared', headers=users[member][1]).json] == [playlist_id]
+    assert client.put(f'/api/playlists/{playlist_id}', json={"name": "Mine"},
+                      headers=users[member][1]).status_code == 403
+
+    token = client.post(f'/api/playlists/{playlist_id}/share', headers=owner_headers).json['share_token']
+    public = client.get(f'/api/playlists/shared/{token}')
+    assert public.status_code == 200
+    assert public.json['name'] == "Mix"
+
+def test_move_user(sharded_app, users):
+    """Test that a move copies everything, keeps ids and leaves nothing behind."""
+    client = sharded_app.test_client()
+    user_id, headers = users['alice']
+    track_ids = [add_track(client, headers, title) for title in ("One", "Two")]
+    playlist_id = client.post('/api/playlists', json={"name": "Mix"}, headers=headers).json['id']
+    for track_id in track_ids:
+        client.post(f'/api/playlists/{playlist_id}/tracks', json={"track_id": track_id}, headers=headers)
+    client.post('/api/plays', json={"events": [{"track_id": track_ids[0]}, {"track_id": track_ids[1]}]}, headers=headers)
+    with sharded_app.app_context():
+        play_buffer.flush()
+        source = shard_map.shard_for(user_id)
+        target = next(name for name in SHARDS if name != source)
+        before = client.get(f'/api/playlists/{playlist_id}', headers=headers).json
+
+        moved = move_user(user_id, target, batch_size=1)
+        assert moved['copied'] > 0
+        assert shard_map.shard_for(user_id) == target
+
+    assert shard_rows(sharded_app, source, 'tracks') == 0
+    assert shard_rows(sharded_app, source, 'playlist_tracks') == 0
+    assert shard_rows(sharded_app, target, 'play_events') == 2
+    after = client.get(f'/api/playlists/{playlist_id}', headers=headers).json
+    assert [t['id'] for t in after['tracks']] == [t['id'] for t in before['tracks']] == track_ids
+    add_track(client, headers, "Three") # Written to the target too
+
+    with sharded_app.app_context(): # Otherwise the CLI runs in the session-wide app's context
+        assert shard_map.counts()[target] == {'users': 2, 'tracks': 3, 'playlists': 1} # Alice joins bob
+        result = sharded_app.test_cli_runner().invoke(args=['shards', 'stats'])
+    assert f"{target}: " in result.output
+
+def test_move_syncs_writes_made_while_copying(sharded_app, users, monkeypatch):
+    """Test that changes made during the copy reach the target, reading only the changed rows."""
+    client = sharded_app.test_client()
+    user_id, headers = users['alice']
+    track_ids = [add_track(client, headers, title) for title in ("One", "Two", "Three")]
+    playlist_id = client.post('/api/playlists', json={"name": "Mix"}, headers=headers).json['id']
+    for track_id in track_ids:
+        client.post(f'/api/playlists/{playlist_id}/tracks', json={"track_id": track_id}, headers=headers)
+    other_id = client.post('/api/playlists', json={"name": "Untouched"}, headers=headers).json['id']
+    client.post(f'/api/playlists/{other_id}/tracks', json={"track_id": track_ids[0]}, headers=headers)
+    client.post('/api/plays', json={"events": [{"track_id": track_ids[0]}]}, headers=headers)
+
+    def writes():
+        assert client.put(f'/api/tracks/{track_ids[1]}', json={"title": "Two (Live)"}, headers=headers).status_code == 200
+        assert client.delete(f'/api/playlists/{playlist_id}/tracks/{track_ids[2]}', headers=headers).status_code == 200
+        add_track(client, headers, "Four")
+        client.post('/api/plays', json={"events": [{"track_id": track_ids[1]}]}, headers=headers)
+        play_buffer.flush()
+
+    copy_table, shards_diff = shards._copy_table, shards._diff
+    written, compared = [], []
+    def copy_and_write(src, dest, table, where, batch_size):
+        if table.name == 'play_events' and not written: # Every other table is copied by now
+            written.append(writes())
+        return copy_table(src, dest, table, where, batch_size)
+    def diff(src, dest, table, where):
+        gone, rows = shards_diff(src, dest, table, where)
+        compared.append((table.name, len(rows)))
+        return gone, rows
+    monkeypatch.setattr(shards, '_copy_table', copy_and_write)
+    monkeypatch.setattr(shards, '_diff', diff)
+
+    with sharded_app.app_context():
+        play_buffer.flush()
+        target = next(name for name in SHARDS if name != shard_map.shard_for(user_id))
+        moved = move_user(user_id, target, batch_size=1)
+        assert shard_map.shard_for(user_id) == target
+    assert moved['synced'] == 6 # Two tracks, the playlist, its removed entry, the artist's count, one play
+    assert ('tracks', 2) in compared and ('playlists', 1) in compared
+
+    titles = sorted(track['title'] for track in client.get('/api/tracks', headers=headers).json)
+    assert titles == ["Four", "One", "Three", "Two (Live)"]
+    mix = client.get(f'/api/playlists/{playlist_id}', headers=headers).json
+    assert [track['id'] for track in mix['tracks']] == track_ids[:2]
+    assert [track['id'] for track in client.get(f'/api/playlists/{other_id}', headers=headers).json['tracks']] == track_ids[:1]
+    assert shard_rows(sharded_app, target, 'play_events') == 2
+
+def test_locked_user_is_read_only(sharded_app, users):
+    """Test that writes get 503 with Retry-After while a user is being moved."""
+    client = sharded_app.test_client()
+    user_id, headers = users['alice']
+    with sharded_app.app_context():
+        _db.session.get(UserShard, user_id).locked_at = datetime.utcnow()
+        _db.session.commit()
+        shard_map.clear()
+    response = client.post('/api/playlists', json={"name": "Mix"}, headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert client.get('/api/playlists', headers=headers).status_code == 200
+
+def test_move_refuses_linked_libraries(sharded_app, users):
+    """Test that a user whose playlists hold another user's tracks can't be moved alone."""
+    client = sharded_app.test_client()
+    with sharded_app.app_context():
+        by_shard = {}
+        for name, (user_id, _) in users.items():
+            by_shard.setdefault(shard_map.shard_for(user_id), []).append(name)
+    owner, editor = next(names for names in by_shard.values() if len(names) > 1)[:2]
+    playlist_id = client.post('/api/playlists', json={"name": "Ours"}, headers=users[owner][1]).json['id']
+    client.put(f'/api/playlists/{playlist_id}/members/{users[editor][0]}', json={"role": "editor"},
+               headers=users[owner][1])
+    track_id = add_track(client, users[editor][1], "Editor's Song")
+    assert client.post(f'/api/playlists/{playlist_id}/tracks', json={"track_id": track_id},
+                       headers=users[editor][1]).status_code == 201
+
+    with sharded_app.app_context():
+        source = shard_map.shard_for(users[owner][0])
+        with pytest.raises(ShardMoveError):
+            move_user(users[owner][0], next(name for name in shard_map.names if name != source))
+        assert shard_map.shard_for(users[owner][0]) == source
+        assert _db.session.get(UserShard, users[owner][0]).locked_at is None
@@ -0,0 +1,144 @@
+from sqlalchemy import event
+from app.models import Playlist, PlaylistMember
+from app.services.events import change_broker
+
+def auth(tokens, user='user_a', **extra):
+    return {'Authorization': f"Bearer {tokens['tokens'][user]}", **extra}
+
+def share(client, tokens, playlist_id, role, user='user_b'):
+    return client.put(f"/api/playlists/{playlist_id}/members/{tokens['ids'][user]}", json={"role": role},
+                      headers=auth(tokens))
+
+def count_selects(engine):
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements, lambda: event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def test_viewer_can_read_but_not_edit(client, auth_tokens, add_playlist, add_track, add_track_to_playlist_db):
+    """Test that a viewer sees the playlist and its tracks but gets 403 on writes."""
+    user_id = auth_tokens['ids']['user_a']
+    playlist = add_playlist(user_id, "Mix")
+    add_track_to_playlist_db(playlist.id, add_track(user_id, "Song").id, 0)
+    assert client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens, 'user_b')).status_code == 404
+
+    assert share(client, auth_tokens, playlist.id, 'viewer').status_code == 201
+    response = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens, 'user_b'))
+    assert response.status_code == 200
+    assert response.json['role'] == 'viewer'
+    assert [t['title'] for t in response.json['tracks']] == ["Song"]
+
+    response = client.put(f'/api/playlists/{playlist.id}', json={"name": "Mine now"}, headers=auth(auth_tokens, 'user_b'))
+    assert response.status_code == 403
+    assert client.delete(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens, 'user_b')).status_code == 403
+
+def test_editor_can_edit(client, db, auth_tokens, add_playlist, add_track):
+    """Test that an editor can rename and add their own tracks, but not delete the playlist."""
+    owner_id, editor_id = auth_tokens['ids']['user_a'], auth_tokens['ids']['user_b']
+    playlist = add_playlist(owner_id, "Mix")
+    track = add_track(editor_id, "Editor's Song")
+    share(client, auth_tokens, playlist.id, 'editor')
+    headers = auth(auth_tokens, 'user_b')
+
+    assert client.put(f'/api/playlists/{playlist.id}', json={"name": "Ours"}, headers=headers).status_code == 200
+    response = client.post(f'/api/playlists/{playlist.id}/tracks', json={"track_id": track.id}, headers=headers)
+    assert response.status_code == 201
+    assert client.delete(f'/api/playlists/{playlist.id}', headers=headers).status_code == 403 # Owner only
+
+    details = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens)).json
+    assert details['name'] == "Ours"
+    assert details['role'] == 'owner'
+    assert [t['title'] for t in details['tracks']] == ["Editor's Song"]
+
+def test_member_management(client, auth_tokens, add_playlist):
+    """Test changing a role, listing members and leaving a shared playlist."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    share(client, auth_tokens, playlist.id, 'viewer')
+    response = share(client, auth_tokens, playlist.id, 'editor')
+    assert response.status_code == 200
+    assert response.json['role'] == 'editor'
+    assert share(client, auth_tokens, playlist.id, 'owner').status_code == 400
+
+    members = client.get(f'/api/playlists/{playlist.id}/members', headers=auth(auth_tokens, 'user_b')).json
+    assert [(m['user_id'], m['role']) for m in members] == [(auth_tokens['ids']['user_b'], 'editor')]
+    shared = client.get('/api/playlists/shared', headers=auth(auth_tokens, 'user_b')).json
+    assert [(p['name'], p['role']) for p in shared] == [("Mix", 'editor')]
+
+    url = f"/api/playlists/{playlist.id}/members/{auth_tokens['ids']['user_b']}"
+    assert client.delete(url, headers=auth(auth_tokens, 'user_b')).status_code == 200 # Leaving
+    assert PlaylistMember.query.count() == 0
+    assert client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens, 'user_b')).status_code == 404
+
+def test_only_owner_manages_members(client, auth_tokens, add_playlist):
+    """Test that members can't share the playlist onwards."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    share(client, auth_tokens, playlist.id, 'editor')
+    response = client.put(f"/api/playlists/{playlist.id}/members/{auth_tokens['ids']['user_a']}",
+                          json={"role": 'viewer'}, headers=auth(auth_tokens, 'user_b'))
+    assert response.status_code == 404
+
+def test_public_share_link(client, auth_tokens, add_playlist):
+    """Test that a share link gives read-only access without logging in, until revoked."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Party")
+    token = client.post(f'/api/playlists/{playlist.id}/share', headers=auth(auth_tokens)).json['share_token']
+    assert client.post(f'/api/playlists/{playlist.id}/share', headers=auth(auth_tokens)).json['share_token'] == token
+
+    response = client.get(f'/api/playlists/shared/{token}')
+    assert response.status_code == 200
+    assert response.json['name'] == "Party"
+    assert 'share_token' not in response.json
+
+    client.delete(f'/api/playlists/{playlist.id}/share', headers=auth(auth_tokens))
+    assert client.get(f'/api/playlists/shared/{token}').status_code == 404
+
+def test_details_served_from_version_cache(client, db, auth_tokens, add_playlist, add_track, add_track_to_playlist_db):
+    """Test that repeat reads of an unchanged playlist don't load its tracks again."""
+    user_id = auth_tokens['ids']['user_a']
+    playlist = add_playlist(user_id, "Popular")
+    track = add_track(user_id, "Hit")
+    add_track_to_playlist_db(playlist.id, track.id, 0)
+    share(client, auth_tokens, playlist.id, 'viewer')
+    client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens)) # Warms the cache
+
+    selects, stop = count_selects(db.engine)
+    try:
+        response = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens, 'user_b'))
+    finally:
+        stop()
+    assert response.json['tracks'][0]['title'] == "Hit"
+    assert not any('FROM tracks' in s for s in selects)
+    assert sum('FROM playlists' in s for s in selects) == 1 # The permission check, nothing else
+
+    # Editing a track in it moves the playlist on to a new version
+    client.put(f'/api/tracks/{track.id}', json={"title": "Remix"}, headers=auth(auth_tokens))
+    response = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens, 'user_b'))
+    assert response.json['tracks'][0]['title'] == "Remix"
+
+def test_conditional_get(client, auth_tokens, add_playlist):
+    """Test that If-None-Match with the current version gets 304."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    etag = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens)).headers['ETag']
+    response = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+def test_changes_reach_members(client, auth_tokens, add_playlist, monkeypatch):
+    """Test that an edit is published to every member's event stream."""
+    monkeypatch.setattr(change_broker, 'max_stream_seconds', 0.05)
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    share(client, auth_tokens, playlist.id, 'editor')
+    last_id = change_broker.backend.head(auth_tokens['ids']['user_b'])
+    client.put(f'/api/playlists/{playlist.id}', json={"name": "Renamed"}, headers=auth(auth_tokens))
+    body = client.get('/api/events', headers=auth(auth_tokens, 'user_b', **{'Last-Event-ID': last_id})).get_data(as_text=True)
+    assert 'event: playlist.updated' in body
+
+def test_deleting_playlist_removes_members(db, auth_tokens, add_playlist):
+    """Test that memberships go with the playlist through ON DELETE CASCADE."""
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Mix")
+    db.session.add(PlaylistMember(playlist_id=playlist.id, user_id=auth_tokens['ids']['user_b'], role='viewer'))
+    db.session.commit()
+    db.session.delete(playlist)
+    db.session.commit()
+    assert PlaylistMember.query.count() == 0
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app.models import Track
+from app.services.smart_playlists import compile_rules, refresh_smart_playlists
+
+def auth(tokens, user='user_a'):
+    return {'Authorization': f"Bearer {tokens['tokens'][user]}"}
+
+def post_track(client, tokens, title, **fields):
+    track = {"title": title, "manifest_url": f"http://example.com/{title}.m3u8", "manifest_type": "HLS", **fields}
+    response = client.post('/api/tracks', json=track, headers=auth(tokens))
+    assert response.status_code == 201
+    return response.json['id']
+
+def titles(client, tokens, playlist_id):
+    return [t['title'] for t in client.get(f'/api/playlists/{playlist_id}', headers=auth(tokens)).json['tracks']]
+
+def create_smart(client, tokens, *conditions, match='all'):
+    response = client.post('/api/playlists', json={"name": "Smart", "rules": {"match": match, "conditions": list(conditions)}},
+                           headers=auth(tokens))
+    assert response.status_code == 201
+    return response.json['id']
+
+def test_smart_playlist_starts_with_matching_tracks(client, auth_tokens, add_track):
+    """Test that a new smart playlist holds the owner's matching tracks, in the order they were added."""
+    add_track(auth_tokens['ids']['user_a'], "One", artist="X")
+    add_track(auth_tokens['ids']['user_a'], "Two", artist="Y")
+    add_track(auth_tokens['ids']['user_a'], "Three", artist="X")
+    add_track(auth_tokens['ids']['user_b'], "Not mine", artist="X")
+    playlist_id = create_smart(client, auth_tokens, {"field": "artist", "op": "eq", "value": "X"})
+    assert titles(client, auth_tokens, playlist_id) == ["One", "Three"]
+
+    response = client.get(f'/api/playlists/{playlist_id}', headers=auth(auth_tokens))
+    assert response.json['rules']['conditions'] == [{"field": "artist", "op": "eq", "value": "X"}]
+
+def test_track_writes_update_membership(client, auth_tokens):
+    """Test that adding, changing, deleting and restoring tracks keeps smart playlists current."""
+    playlist_id = create_smart(client, auth_tokens, {"field": "artist", "op": "eq", "value": "X"},
+                               {"field": "duration_ms", "op": "lt", "value": 180000})
+    etag = client.get(f'/api/playlists/{playlist_id}', headers=auth(auth_tokens)).headers['ETag']
+    short = post_track(client, auth_tokens, "Short", artist="X", duration_ms=120000)
+    post_track(client, auth_tokens, "Long", artist="X", duration_ms=300000)
+    response = client.get(f'/api/playlists/{playlist_id}', headers=auth(auth_tokens))
+    assert [t['title'] for t in response.json['tracks']] == ["Short"]
+    assert response.headers['ETag'] != etag # Cached payloads move on
+
+    client.put(f'/api/tracks/{short}', json={"artist": "Y"}, headers=auth(auth_tokens))
+    assert titles(client, auth_tokens, playlist_id) == []
+    client.put(f'/api/tracks/{short}', json={"artist": "X"}, headers=auth(auth_tokens))
+    assert titles(client, auth_tokens, playlist_id) == ["Short"]
+
+    client.delete(f'/api/tracks/{short}', headers=auth(auth_tokens))
+    assert titles(client, auth_tokens, playlist_id) == []
+    client.post(f'/api/tracks/{short}/restore', headers=auth(auth_tokens))
+    assert titles(client, auth_tokens, playlist_id) == ["Short"]
+
+def test_one_query_checks_every_smart_playlist(client, db, auth_tokens):
+    """Test that a track write checks all the owner's smart playlists in a single statement."""
+    for artist in ("X", "Y", "Z"):
+        create_smart(client, auth_tokens, {"field": "artist", "op": "eq", "value": artist})
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'CASE WHEN' in statement:
+            statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        post_track(client, auth_tokens, "Song", artist="Y")
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert len(statements) == 1
+
+def test_rule_operators(app, db, auth_tokens, add_track):
+    """Test the text, number, date and match=any conditions."""
+    user_id = auth_tokens['ids']['user_a']
+    old = add_track(user_id, "Old Song", artist="The Band")
+    old.added_at = datetime.utcnow() - timedelta(days=60)
+    old.duration_ms = 200000
+    add_track(user_id, "New 100% Song", artist=None)
+    db.session.commit()
+
+    def matching(*conditions, match='all'):
+        rules = {"match": match, "conditions": list(conditions)}
+        return sorted(t.title for t in Track.query.filter(Track.user_id == user_id, compile_rules(rules)))
+
+    assert matching({"field": "added_at", "op": "in_last_days", "value": 30}) == ["New 100% Song"]
+    assert matching({"field": "added_at", "op": "before", "value": (datetime.utcnow() - timedelta(days=30)).isoformat()}) == ["Old Song"]
+    assert matching({"field": "artist", "op": "ne", "value": "The Band"}) == ["New 100% Song"]
+    assert matching({"field": "title", "op": "contains", "value": "100%"}) == ["New 100% Song"]
+    assert matching({"field": "artist", "op": "starts_with", "value": "the"}) == ["Old Song"]
+    assert matching({"field": "duration_ms", "op": "gte", "value": 200000},
+                    {"field": "manifest_type", "op": "eq", "value": "DASH"}, match='any') == ["Old Song"]
+
+def test_invalid_rules_rejected(client, auth_tokens):
+    """Test that unknown fields, mismatched operators and bad values get 400."""
+    for condition in ({"field": "genre", "op": "eq", "value": "Jazz"},
+                      {"field": "artist", "op": "lt", "value": "X"},
+                      {"field": "duration_ms", "op": "lt", "value": "short"},
+                      {"field": "added_at", "op": "after", "value": "yesterday"}):
+        response = client.post('/api/playlists', json={"name": "Bad", "rules": {"conditions": [condition]}},
+                               headers=auth(auth_tokens))
+        assert response.status_code == 400
+
+def test_manual_track_edits_refused(client, auth_tokens):
+    """Test that tracks can't be added to or removed from a smart playlist by hand."""
+    track_id = post_track(client, auth_tokens, "Song", artist="X")
+    playlist_id = create_smart(client, auth_tokens, {"field": "artist", "op": "eq", "value": "X"})
+    assert client.post(f'/api/playlists/{playlist_id}/tracks', json={"track_id": track_id},
+                       headers=auth(auth_tokens)).status_code == 409
+    assert client.delete(f'/api/playlists/{playlist_id}/tracks/{track_id}', headers=auth(auth_tokens)).status_code == 409
+    assert client.get(f'/api/playlists/{playlist_id}', headers=auth(auth_tokens)).json['version'] == 1 # Bumps rolled back
+
+    # Other users can't tell it's a smart playlist, or that it exists
+    assert client.delete(f'/api/playlists/{playlist_id}/tracks/{track_id}',
+                         headers=auth(auth_tokens, 'user_b')).status_code == 404
+
+def test_changing_rules_reevaluates(client, auth_tokens):
+    """Test that new rules replace the tracks, and removing them leaves a normal playlist."""
+    post_track(client, auth_tokens, "One", artist="X")
+    post_track(client, auth_tokens, "Two", artist="Y")
+    playlist_id = create_smart(client, auth_tokens, {"field": "artist", "op": "eq", "value": "X"})
+    response = client.put(f'/api/playlists/{playlist_id}', headers=auth(auth_tokens), json={
+        "rules": {"conditions": [{"field": "artist", "op": "eq", "value": "Y"}]}})
+    assert response.status_code == 200
+    assert titles(client, auth_tokens, playlist_id) == ["Two"]
+
+    client.put(f'/api/playlists/{playlist_id}', json={"rules": None}, headers=auth(auth_tokens))
+    post_track(client, auth_tokens, "Three", artist="Y")
+    assert titles(client, auth_tokens, playlist_id) == ["Two"]
+
+def test_refresh_job_catches_time_windows(client, runner, db, auth_tokens):
+    """Test that the full re-evaluation drops tracks that aged out of an "added in the last N days" rule."""
+    track_id = post_track(client, auth_tokens, "Song")
+    playlist_id = create_smart(client, auth_tokens, {"field": "added_at", "op": "in_last_days", "value": 30})
+    assert titles(client, auth_tokens, playlist_id) == ["Song"]
+
+    db.session.get(Track, track_id).added_at = datetime.utcnow() - timedelta(days=31)
+    db.session.commit() # Not through the API, like time passing
+    assert refresh_smart_playlists() == (1, 1)
+    assert titles(client, auth_tokens, playlist_id) == []
+    result = runner.invoke(args=['refresh-smart-playlists'])
+    assert "Refreshed 1 smart playlists, 0 changed" in result.output
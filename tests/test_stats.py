@@ -0,0 +1,112 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app.models import PlayEvent, TrackPlayRollup, RollupWatermark
+from app.services.rollups import aggregate_plays, backfill_rollups
+
+def add_plays(db, user_id, track_id, count, played_at=None, ms_played=60000):
+    played_at = played_at or datetime.utcnow()
+    db.session.execute(insert(PlayEvent), [
+        {"user_id": user_id, "track_id": track_id, "played_at": played_at, "ms_played": ms_played}
+        for _ in range(count)
+    ])
+    db.session.commit()
+
+@pytest.mark.parametrize('on_conflict', [True, False])
+def test_aggregate_plays_is_incremental(db, auth_tokens, add_track, monkeypatch, on_conflict):
+    """Test that each run only folds events past the watermark, with or without ON CONFLICT."""
+    if not on_conflict:
+        monkeypatch.setattr('app.services.upserts.ON_CONFLICT_DIALECTS', {})
+    user_id = auth_tokens['ids']['user_a']
+    track = add_track(user_id, "Song", artist="Artist")
+    add_plays(db, user_id, track.id, 3)
+    assert aggregate_plays(chunk_size=2) == 3
+    add_plays(db, user_id, track.id, 2)
+    assert aggregate_plays() == 2
+    assert aggregate_plays() == 0
+
+    daily = TrackPlayRollup.query.filter_by(granularity='day', track_id=track.id).one()
+    assert daily.plays == 5
+    assert daily.ms_played == 5 * 60000
+    assert db.session.get(RollupWatermark, 'play_rollups').last_event_id == PlayEvent.query.count()
+
+def test_top_tracks_and_artists(client, db, auth_tokens, add_track):
+    """Test the stats endpoints rank by plays within the period."""
+    user_id = auth_tokens['ids']['user_a']
+    token = auth_tokens['tokens']['user_a']
+    hit = add_track(user_id, "Hit", artist="Band")
+    deep_cut = add_track(user_id, "Deep Cut", artist="band") # Same artist, different case
+    other = add_track(user_id, "Other", artist="Solo")
+    old = add_track(user_id, "Old Favourite", artist="Oldies")
+    add_plays(db, user_id, hit.id, 5)
+    add_plays(db, user_id, deep_cut.id, 1)
+    add_plays(db, user_id, other.id, 3)
+    add_plays(db, user_id, old.id, 10, played_at=datetime.utcnow() - timedelta(days=60))
+    aggregate_plays()
+
+    response = client.get('/api/stats/top-tracks?period=week', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert [(i['title'], i['plays']) for i in response.json['items']] == [("Hit", 5), ("Other", 3), ("Deep Cut", 1)]
+
+    response = client.get('/api/stats/top-artists?period=week', headers={'Authorization': f'Bearer {token}'})
+    assert [(i['artist'], i['plays']) for i in response.json['items']] == [("Band", 6), ("Solo", 3)]
+
+    response = client.get('/api/stats/top-tracks?period=all&limit=1', headers={'Authorization': f'Bearer {token}'})
+    assert [i['title'] for i in response.json['items']] == ["Old Favourite"]
+
+def test_stats_are_per_user(client, db, auth_tokens, add_track):
+    """Test that users only see their own listening stats."""
+    user_a_id = auth_tokens['ids']['user_a']
+    track = add_track(user_a_id, "Song")
+    add_plays(db, user_a_id, track.id, 2)
+    aggregate_plays()
+    response = client.get('/api/stats/top-tracks', headers={'Authorization': f"Bearer {auth_tokens['tokens']['user_b']}"})
+    assert response.json['items'] == []
+
+def test_stats_invalid_period(client, auth_tokens):
+    """Test that unknown periods are rejected."""
+    response = client.get('/api/stats/top-tracks?period=decade', headers={'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"})
+    assert response.status_code == 400
+
+def test_backfill_rollups_rebuilds_without_double_counting(runner, db, auth_tokens, add_track):
+    """Test that a backfill matches the incremental result and leaves newer events alone."""
+    user_id = auth_tokens['ids']['user_a']
+    track = add_track(user_id, "Song", artist="Artist")
+    add_plays(db, user_id, track.id, 4)
+    aggregate_plays()
+    add_plays(db, user_id, track.id, 1) # Not yet aggregated
+
+    result = runner.invoke(args=['backfill-rollups'])
+    assert result.exit_code == 0
+    assert "Rebuilt rollups from 4 play events" in result.output
+    assert TrackPlayRollup.query.filter_by(granularity='day').one().plays == 4
+
+    result = runner.invoke(args=['aggregate-plays'])
+    assert "Aggregated 1 play events" in result.output
+    assert TrackPlayRollup.query.filter_by(granularity='day').one().plays == 5
+
+def test_late_commits_are_folded_once(db, auth_tokens, add_track):
+    """Test that an event committed after a newer id was aggregated still counts, exactly once."""
+    user_id = auth_tokens['ids']['user_a']
+    track = add_track(user_id, "Song", artist="Artist")
+    played_at = datetime.utcnow()
+    row = {"user_id": user_id, "track_id": track.id, "played_at": played_at, "ms_played": 60000}
+    db.session.execute(insert(PlayEvent), [dict(row, id=event_id) for event_id in (1, 2, 5, 6)])
+    db.session.commit()
+    assert aggregate_plays() == 4
+    assert [gap[:2] for gap in db.session.get(RollupWatermark, 'play_rollups').gaps] == [[3, 4]]
+
+    db.session.execute(insert(PlayEvent), [dict(row, id=4)]) # Took its id before 5, committed after
+    db.session.commit()
+    assert backfill_rollups() == 4 # Left for aggregate_plays
+    assert aggregate_plays() == 1
+    assert aggregate_plays() == 0
+    assert TrackPlayRollup.query.filter_by(granularity='day').one().plays == 5
+    assert [gap[:2] for gap in db.session.get(RollupWatermark, 'play_rollups').gaps] == [[3, 3]]
+
+    watermark = db.session.get(RollupWatermark, 'play_rollups')
+    watermark.gaps = [[3, 3, (played_at - timedelta(hours=1)).isoformat()]] # Rolled back long ago
+    db.session.commit()
+    assert aggregate_plays() == 0
+    assert db.session.get(RollupWatermark, 'play_rollups').gaps is None
+    assert backfill_rollups() == 5
@@ -1,5 +1,6 @@
 import pytest
-from app.models import Track, ManifestType
+from app.models import Track, ManifestType, ManifestHealth
+from app.services.manifests import UnsafeURLError, upstream_guard
 
 # --- Add Track Tests ---
 
@@ -199,11 +200,11 @@ def test_delete_track_success(client, db, auth_tokens, add_track):
 
     response = client.delete(f'/api/tracks/{track_id}', headers={'Authorization': f'Bearer {token}'})
     assert response.status_code == 200
-    assert b"Track deleted successfully" in response.data
+    assert b"Track moved to trash" in response.data
 
-    # Verify DB
-    db_track = db.session.get(Track, track_id) # Use db.session.get for primary key lookup
-    assert db_track is None
+    # Verify DB: soft deleted, so hidden from queries but still restorable
+    assert Track.query.filter_by(id=track_id).first() is None
+    assert db.session.get(Track, track_id).deleted_at is not None
 
 def test_delete_track_not_found(client, auth_tokens):
     """Test deleting a non-existent track."""
@@ -224,3 +225,96 @@ def test_delete_track_wrong_user(client, db, auth_tokens, add_track):
     # Verify track A still exists
     db_track_a = db.session.get(Track, track_a.id)
     assert db_track_a is not None
+
+# --- Manifest Proxy Tests ---
+
+def test_get_track_manifest_success(client, auth_tokens, add_track, stub_origin):
+    """Test proxying a track's manifest from its origin."""
+    user_id = auth_tokens['ids']['user_a']
+    token = auth_tokens['tokens']['user_a']
+    stub_origin.add('/song.m3u8', "#EXTM3U\n#EXT-X-ENDLIST\n")
+    track = add_track(user_id, "Proxied Song", manifest_url=stub_origin.url('/song.m3u8'))
+
+    response = client.get(f'/api/tracks/{track.id}/manifest', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/vnd.apple.mpegurl'
+    assert response.data.startswith(b"#EXTM3U")
+
+def test_get_track_manifest_upstream_error(client, auth_tokens, add_track, stub_origin):
+    """Test that an unreachable or failing origin gives a 502."""
+    user_id = auth_tokens['ids']['user_a']
+    token = auth_tokens['tokens']['user_a']
+    track = add_track(user_id, "Broken Song", manifest_url=stub_origin.url('/missing.m3u8'))
+
+    response = client.get(f'/api/tracks/{track.id}/manifest', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 502
+    assert b"Upstream returned 404" in response.data
+
+def test_get_track_manifest_wrong_user(client, auth_tokens, add_track):
+    """Test proxying another user's manifest."""
+    user_a_id = auth_tokens['ids']['user_a']
+    token_b = auth_tokens['tokens']['user_b']
+    track_a = add_track(user_a_id, "User A's Song")
+
+    response = client.get(f'/api/tracks/{track_a.id}/manifest', headers={'Authorization': f'Bearer {token_b}'})
+    assert response.status_code == 404
+
+def test_add_track_rejects_non_http_manifest_url(client, auth_tokens):
+    """Test that only http(s) manifest URLs are accepted."""
+    headers = {'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"}
+    for url in ("file:///etc/passwd", "ftp://example.com/a.m3u8", "http:///a.m3u8"):
+        response = client.post('/api/tracks', json={"title": "X", "manifest_url": url, "manifest_type": "HLS"},
+                               headers=headers)
+        assert response.status_code == 400
+        assert 'manifest_url' in response.json
+
+def test_get_track_manifest_refuses_internal_addresses(client, auth_tokens, add_track, stub_origin, monkeypatch):
+    """Test that manifests on loopback/private hosts, or redirects off http(s), aren't fetched."""
+    headers = {'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"}
+    stub_origin.add('/song.m3u8', "#EXTM3U\n")
+    stub_origin.add('/moved.m3u8', "", status=302, headers={'Location': 'file:///etc/passwd'})
+    moved = add_track(auth_tokens['ids']['user_a'], "Moved", manifest_url=stub_origin.url('/moved.m3u8'))
+    assert client.get(f'/api/tracks/{moved.id}/manifest', headers=headers).status_code == 502
+
+    monkeypatch.setattr(upstream_guard, 'allow_private', False)
+    track = add_track(auth_tokens['ids']['user_a'], "Local", manifest_url=stub_origin.url('/song.m3u8'))
+    response = client.get(f'/api/tracks/{track.id}/manifest', headers=headers)
+    assert response.status_code == 502
+    assert b"isn't public" in response.data
+    assert [path for _, path, _ in stub_origin.requests] == ['/moved.m3u8']
+
+def test_upstream_addresses():
+    """Test which addresses the upstream guard lets fetches reach."""
+    for address in ('127.0.0.1', '10.1.2.3', '192.168.0.1', '169.254.169.254', '100.64.0.1', '0.0.0.0',
+                    '::1', 'fe80::1%eth0', 'fd00::1', '::ffff:127.0.0.1'):
+        with pytest.raises(UnsafeURLError):
+            upstream_guard.check_address(address)
+    upstream_guard.check_address('93.184.216.34')
+    upstream_guard.check_address('2606:2800:220:1:248:1893:25c8:1946')
+    with pytest.raises(UnsafeURLError):
+        upstream_guard.check_url('file:///etc/passwd')
+    with pytest.raises(UnsafeURLError):
+        upstream_guard.check_url('http://localhost:8080/admin', resolve=False)
+
+# --- Broken Tracks Tests ---
+
+def test_get_broken_tracks(client, db, auth_tokens, add_track):
+    """Test listing the user's tracks whose last health check failed."""
+    user_a_id = auth_tokens['ids']['user_a']
+    user_b_id = auth_tokens['ids']['user_b']
+    token_a = auth_tokens['tokens']['user_a']
+    ok = add_track(user_a_id, "Fine")
+    broken = add_track(user_a_id, "Broken")
+    other = add_track(user_b_id, "Someone Else's Broken")
+    db.session.add_all([
+        ManifestHealth(track_id=ok.id, status='ok', http_status=200),
+        ManifestHealth(track_id=broken.id, status='broken', http_status=404, error="Upstream returned 404"),
+        ManifestHealth(track_id=other.id, status='broken', http_status=500),
+    ])
+    db.session.commit()
+
+    response = client.get('/api/tracks/broken', headers={'Authorization': f'Bearer {token_a}'})
+    assert response.status_code == 200
+    assert [t['id'] for t in response.json] == [broken.id]
+    assert response.json[0]['health']['http_status'] == 404
+    assert 'etag' not in response.json[0]['health']
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event, select
+from app.models import Track, Playlist, Artist, playlist_tracks
+from app.services.trash import purge_trash
+
+def auth(tokens, user='user_a'):
+    return {'Authorization': f"Bearer {tokens['tokens'][user]}"}
+
+def test_trash_and_restore_track(client, auth_tokens):
+    """Test that a trashed track is hidden until restored."""
+    headers = auth(auth_tokens)
+    track = client.post('/api/tracks', json={
+        "title": "Song", "artist": "Band", "manifest_url": "http://example.com/s.m3u8", "manifest_type": "HLS"
+    }, headers=headers).json
+
+    assert client.delete(f"/api/tracks/{track['id']}", headers=headers).status_code == 200
+    assert client.get('/api/tracks', headers=headers).json == []
+    assert client.get(f"/api/tracks/{track['id']}", headers=headers).status_code == 404
+    assert [t['id'] for t in client.get('/api/tracks/trash', headers=headers).json] == [track['id']]
+    assert Artist.query.count() == 0 # Counts only cover live tracks
+
+    response = client.post(f"/api/tracks/{track['id']}/restore", headers=headers)
+    assert response.status_code == 200
+    assert response.json['deleted_at'] is None
+    assert [t['id'] for t in client.get('/api/tracks', headers=headers).json] == [track['id']]
+    assert client.get('/api/tracks/trash', headers=headers).json == []
+    assert Artist.query.one().track_count == 1
+
+def test_restore_requires_trashed_own_track(client, auth_tokens, add_track):
+    """Test restoring a live track or another user's track."""
+    track = add_track(auth_tokens['ids']['user_a'], "Live")
+    assert client.post(f'/api/tracks/{track.id}/restore', headers=auth(auth_tokens)).status_code == 404
+    client.delete(f'/api/tracks/{track.id}', headers=auth(auth_tokens))
+    assert client.post(f'/api/tracks/{track.id}/restore', headers=auth(auth_tokens, 'user_b')).status_code == 404
+
+def test_trashed_track_hidden_from_playlists(client, auth_tokens, add_track, add_playlist, add_track_to_playlist_db):
+    """Test that relationship loads skip trashed tracks too."""
+    user_id = auth_tokens['ids']['user_a']
+    kept, trashed = add_track(user_id, "Kept"), add_track(user_id, "Trashed")
+    playlist = add_playlist(user_id, "Mix")
+    add_track_to_playlist_db(playlist.id, kept.id, 0)
+    add_track_to_playlist_db(playlist.id, trashed.id, 1)
+
+    client.delete(f'/api/tracks/{trashed.id}', headers=auth(auth_tokens))
+    response = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens))
+    assert [t['title'] for t in response.json['tracks']] == ["Kept"]
+
+def test_restored_track_keeps_a_unique_position(client, db, auth_tokens, add_track, add_playlist):
+    """Test that tracks added while another is trashed go after it, so a restore doesn't duplicate positions."""
+    user_id = auth_tokens['ids']['user_a']
+    first, trashed, added = (add_track(user_id, title) for title in ("First", "Trashed", "Added"))
+    playlist = add_playlist(user_id, "Mix")
+    for track in (first, trashed):
+        client.post(f'/api/playlists/{playlist.id}/tracks', json={"track_id": track.id}, headers=auth(auth_tokens))
+    client.delete(f'/api/tracks/{trashed.id}', headers=auth(auth_tokens))
+    client.post(f'/api/playlists/{playlist.id}/tracks', json={"track_id": added.id}, headers=auth(auth_tokens))
+    client.post(f'/api/tracks/{trashed.id}/restore', headers=auth(auth_tokens))
+
+    orders = db.session.scalars(select(playlist_tracks.c.track_order).where(playlist_tracks.c.playlist_id == playlist.id))
+    assert sorted(orders) == [0, 1, 2]
+    tracks = client.get(f'/api/playlists/{playlist.id}', headers=auth(auth_tokens)).json['tracks']
+    assert [t['title'] for t in tracks] == ["First", "Trashed", "Added"]
+
+def test_trash_and_restore_playlist(client, auth_tokens, add_playlist):
+    """Test the playlist trash endpoints."""
+    headers = auth(auth_tokens)
+    playlist = add_playlist(auth_tokens['ids']['user_a'], "Old Mix")
+    client.delete(f'/api/playlists/{playlist.id}', headers=headers)
+    assert client.get('/api/playlists', headers=headers).json == []
+    assert [p['name'] for p in client.get('/api/playlists/trash', headers=headers).json] == ["Old Mix"]
+
+    response = client.post(f'/api/playlists/{playlist.id}/restore', headers=headers)
+    assert response.status_code == 200
+    assert [p['name'] for p in client.get('/api/playlists', headers=headers).json] == ["Old Mix"]
+
+def test_purge_trash(db, auth_tokens, add_track, add_playlist, add_track_to_playlist_db):
+    """Test that only rows past the retention period are hard-deleted."""
+    user_id = auth_tokens['ids']['user_a']
+    old, recent, live = (add_track(user_id, title) for title in ("Old", "Recent", "Live"))
+    playlist = add_playlist(user_id, "Mix")
+    add_track_to_playlist_db(playlist.id, old.id, 0)
+    old.deleted_at = datetime.utcnow() - timedelta(days=31)
+    recent.deleted_at = datetime.utcnow() - timedelta(days=1)
+    playlist.deleted_at = datetime.utcnow() - timedelta(days=40)
+    db.session.commit()
+
+    assert purge_trash(retention_days=30, batch_size=1) == {'playlists': 1, 'tracks': 1}
+    remaining = Track.query.execution_options(include_deleted=True).order_by(Track.title).all()
+    assert [t.title for t in remaining] == ["Live", "Recent"]
+    assert Playlist.query.execution_options(include_deleted=True).count() == 0
+    assert db.session.execute(select(playlist_tracks)).first() is None
+
+def test_purge_trash_command(runner, db, auth_tokens, add_track):
+    """Test the scheduled purge CLI."""
+    track = add_track(auth_tokens['ids']['user_a'], "Old")
+    track.deleted_at = datetime.utcnow() - timedelta(days=365)
+    db.session.commit()
+    result = runner.invoke(args=['purge-trash'])
+    assert result.exit_code == 0
+    assert "Purged 1 tracks and 0 playlists" in result.output
+
+def test_live_track_queries_use_partial_index(db, auth_tokens):
+    """Test that the library listing gets the criteria and is served by ix_tracks_user_live."""
+    executed = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        Track.query.filter_by(user_id=auth_tokens['ids']['user_a']).order_by(
+            Track.artist, Track.album, Track.track_number, Track.title
+        ).all()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    statement, parameters = executed[-1]
+    assert 'tracks.deleted_at IS NULL' in statement
+    plan = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+    assert any('ix_tracks_user_live' in row[-1] for row in plan)
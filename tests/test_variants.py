@@ -0,0 +1,98 @@
+from app.models import ManifestType
+from app.services.playback import playback_urls
+from app.services.variants import variant_filter
+
+MASTER = """#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="en",URI="audio.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,CODECS="avc1.4d401e,mp4a.40.2",AUDIO="aud"
+360p.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720,CODECS="avc1.4d401f,mp4a.40.2",AUDIO="aud"
+720p.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080,CODECS="avc1.640028,mp4a.40.2",AUDIO="aud"
+1080p.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=1800000,RESOLUTION=1280x720,CODECS="hvc1.1.6.L93.B0,mp4a.40.2",AUDIO="aud"
+720p-hevc.m3u8
+#EXT-X-I-FRAME-STREAM-INF:BANDWIDTH=300000,RESOLUTION=1920x1080,CODECS="avc1.640028",URI="1080p-iframes.m3u8"
+"""
+
+MPD = """<?xml version="1.0"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static">
+  <Period>
+    <AdaptationSet contentType="video" codecs="hev1.1.6.L93.B0">
+      <Representation id="h720" bandwidth="1800000" width="1280" height="720"/>
+    </AdaptationSet>
+    <AdaptationSet contentType="video">
+      <Representation id="v360" bandwidth="800000" codecs="avc1.4d401e" width="640" height="360"/>
+      <Representation id="v720" bandwidth="2500000" codecs="avc1.4d401f" width="1280" height="720"/>
+      <Representation id="v1080" bandwidth="5000000" codecs="avc1.640028" width="1920" height="1080"/>
+    </AdaptationSet>
+    <AdaptationSet contentType="audio" codecs="opus">
+      <Representation id="a" bandwidth="128000"/>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+def filtered(body, manifest_type, **args):
+    return variant_filter.apply(body.encode(), manifest_type, variant_filter.profile(args)).decode()
+
+def variant_uris(body):
+    return [line for line in body.splitlines() if line and not line.startswith('#')]
+
+def test_hls_variants_pruned_and_reordered(app):
+    """Test that unplayable and unsustainable variants go and the rest are listed best first."""
+    body = filtered(MASTER, ManifestType.HLS, max_bandwidth=3000000, codecs=["avc1", "mp4a"])
+    assert variant_uris(body) == ["720p.m3u8", "360p.m3u8"]
+    assert '#EXT-X-MEDIA:TYPE=AUDIO' in body
+    assert 'URI="1080p-iframes.m3u8"' in body
+    assert body.splitlines()[2].startswith('#EXT-X-STREAM-INF:BANDWIDTH=2500000')
+
+    body = filtered(MASTER, ManifestType.HLS, max_height=720)
+    assert variant_uris(body) == ["720p.m3u8", "720p-hevc.m3u8", "360p.m3u8"]
+    assert 'I-FRAME' not in body
+    # Nothing fits: the lowest variant still plays
+    assert variant_uris(filtered(MASTER, ManifestType.HLS, max_bandwidth=1000)) == ["360p.m3u8"]
+    media = "#EXTM3U\n#EXTINF:4.0,\nseg1.ts\n"
+    assert filtered(media, ManifestType.HLS, max_bandwidth=1000) == media
+
+def test_dash_representations_pruned(app):
+    """Test that Representations over the limits go, as do AdaptationSets in codecs another set covers."""
+    body = filtered(MPD, ManifestType.DASH, max_height=720, codecs=["avc1", "opus"])
+    assert 'id="h720"' not in body
+    assert 'id="v360"' in body and 'id="v720"' in body
+    assert 'id="v1080"' not in body
+    assert 'id="a"' in body
+
+    body = filtered(MPD, ManifestType.DASH, codecs=["avc1"]) # No opus, but no other audio either
+    assert 'id="a"' in body
+
+def test_filtered_manifests_are_cached(app):
+    """Test that a (manifest, profile) pair is only filtered once."""
+    variant_filter.cache.clear()
+    profile = variant_filter.profile({"max_height": 720, "codecs": ["mp4a", "avc1"]})
+    first = variant_filter.apply(MASTER.encode(), ManifestType.HLS, profile)
+    same = variant_filter.apply(MASTER.encode(), ManifestType.HLS,
+                                variant_filter.profile({"codecs": ["avc1", "mp4a"], "max_height": 720}))
+    assert same is first
+    assert len(variant_filter.cache) == 1
+    variant_filter.apply(MASTER.encode() + b"\n", ManifestType.HLS, profile) # A new version of the source
+    assert len(variant_filter.cache) == 2
+    assert variant_filter.apply(MASTER.encode(), ManifestType.HLS, None) == MASTER.encode()
+
+def test_manifest_routes_take_a_profile(client, auth_tokens, add_track, stub_origin):
+    """Test the query string on the authenticated and the signed manifest routes."""
+    stub_origin.add('/master.m3u8', MASTER)
+    track = add_track(auth_tokens['ids']['user_a'], "Song", manifest_url=stub_origin.url('/master.m3u8'))
+    headers = {'Authorization': f"Bearer {auth_tokens['tokens']['user_a']}"}
+
+    response = client.get(f'/api/tracks/{track.id}/manifest?max_bandwidth=1000000', headers=headers)
+    assert response.status_code == 200
+    assert variant_uris(response.get_data(as_text=True)) == ["360p.m3u8"]
+    response = client.get(f'/api/tracks/{track.id}/manifest?max_bandwidth=lots', headers=headers)
+    assert response.status_code == 400
+
+    token = playback_urls.sign(track.id, track.manifest_url, ManifestType.HLS)
+    assert client.get(f'/api/play/{token}').status_code == 302
+    response = client.get(f'/api/play/{token}?codecs=avc1,mp4a&max_height=720') # Served, to be filtered
+    assert response.status_code == 200
+    assert variant_uris(response.get_data(as_text=True)) == ["720p.m3u8", "360p.m3u8"]
@@ -0,0 +1,76 @@
+import subprocess
+import sys
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT
+from app import create_app, db as _db
+from app.models import User, Playlist
+from app.warmup import after_fork, warmup
+
+@pytest.fixture(scope='function')
+def cold_app(app, tmp_path):
+    """App over a file-backed SQLite DB (warmup disposes the pool, which would lose :memory:)."""
+    flask_app = create_app(config_class=type('WarmupTestConfig', (object,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'warmup.db'}",
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'JWT_SECRET_KEY': 'test-jwt-secret-key',
+        'PLAY_FLUSH_INTERVAL': None,
+        'MIGRATIONS_ENABLED': False,
+        'WARMUP_POOL_CONNECTIONS': 2,
+    }))
+    with flask_app.app_context():
+        _db.create_all()
+    yield flask_app
+    with flask_app.app_context():
+        _db.session.remove()
+        _db.drop_all()
+
+def test_warmup_compiles_hot_route_sql(cold_app):
+    """Test that the first requests after warmup only hit the compiled SQL cache."""
+    with cold_app.app_context():
+        user = User(username='warm', email='warm@test.com', password_hash='x')
+        _db.session.add(user)
+        _db.session.flush()
+        playlist = Playlist(user_id=user.id, name="Mix")
+        _db.session.add(playlist)
+        _db.session.commit()
+        token, playlist_id = create_access_token(identity=str(user.id)), playlist.id
+        _db.session.remove()
+
+    assert set(warmup(cold_app)) == {'sql'}
+    misses = []
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context.cache_hit != CACHE_HIT:
+            misses.append(statement)
+    with cold_app.app_context():
+        event.listen(_db.engine, 'after_cursor_execute', after_cursor_execute)
+    try:
+        client = cold_app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        assert client.get('/api/tracks', headers=headers).status_code == 200
+        assert client.get('/api/playlists', headers=headers).status_code == 200
+        assert client.get(f'/api/playlists/{playlist_id}', headers=headers).status_code == 200
+    finally:
+        with cold_app.app_context():
+            event.remove(_db.engine, 'after_cursor_execute', after_cursor_execute)
+    assert misses == []
+
+def test_after_fork_primes_pool(cold_app):
+    """Test that each worker starts with WARMUP_POOL_CONNECTIONS idle connections."""
+    warmup(cold_app)
+    after_fork(cold_app)
+    with cold_app.app_context():
+        assert _db.engine.pool.checkedin() == 2
+
+def test_serve_config_skips_flask_migrate(cold_app):
+    """Test that Flask-Migrate is only set up when migrations are enabled."""
+    assert 'migrate' not in cold_app.extensions
+
+def test_import_skips_optional_subsystems():
+    """Test that importing the app doesn't pull in numpy, scipy or alembic."""
+    result = subprocess.run([sys.executable, '-c', (
+        "import sys, app; print(sorted(m for m in ('numpy', 'scipy', 'alembic') if m in sys.modules))"
+    )], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
@@ -0,0 +1,23 @@
+import time
+_started = time.perf_counter()
+
+import logging
+from config import ServeConfig
+from app import create_app
+from app.warmup import warmup
+
+_imported = time.perf_counter()
+app = create_app(ServeConfig)
+startup_timings = {'import': _imported - _started, 'create_app': time.perf_counter() - _imported}
+startup_timings.update(warmup(app))
+
+logging.getLogger(__name__).info(
+    "Started in %.0f ms (%s)", sum(startup_timings.values()) * 1000,
+    ', '.join(f'{phase} {seconds * 1000:.0f} ms' for phase, seconds in startup_timings.items())
+)
+
+# Production entry point, run with gunicorn:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# The config preloads this module in the master process, so the imports and
+# warmup above happen once and every worker is forked already warm. Use
+# run.py for development and `flask db upgrade` (default Config) for migrations.